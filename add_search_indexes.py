@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Add indexes for admin/manager user lists
+
+- pg_trgm GIN индексы для поиска ILIKE '%...%' по email, имени и телефону
+  пользователей и менеджеров (admin_users, admin_managers);
+- users(assigned_manager_id) и deals(manager_id, id) для списков клиентов
+  и сделок менеджера с keyset-пагинацией.
+
+Для новых баз b-tree индексы создает db.create_all(); скрипт нужен для
+существующих таблиц. Trigram индексы есть только в PostgreSQL.
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+BTREE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_users_assigned_manager ON users (assigned_manager_id)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_manager_id ON deals (manager_id, id)",
+]
+
+TRIGRAM_INDEXES = [
+    ('idx_users_email_trgm', 'users', 'email'),
+    ('idx_users_full_name_trgm', 'users', 'full_name'),
+    ('idx_users_phone_trgm', 'users', 'phone'),
+    ('idx_managers_email_trgm', 'managers', 'email'),
+    ('idx_managers_first_name_trgm', 'managers', 'first_name'),
+    ('idx_managers_last_name_trgm', 'managers', 'last_name'),
+]
+
+
+def add_search_indexes():
+    """Create list/search indexes if they do not exist"""
+
+    with app.app_context():
+        try:
+            print("Adding user list indexes...")
+            for statement in BTREE_INDEXES:
+                db.session.execute(text(statement))
+                print(f"  {statement}")
+
+            if db.engine.dialect.name == 'postgresql':
+                db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                for name, table, column in TRIGRAM_INDEXES:
+                    db.session.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS {name} ON {table} "
+                        f"USING gin ({column} gin_trgm_ops)"
+                    ))
+                    print(f"  {name} ON {table} ({column})")
+            else:
+                print("  Trigram indexes skipped (PostgreSQL only)")
+
+            db.session.commit()
+            print("✅ Search indexes added successfully!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error adding search indexes: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    add_search_indexes()
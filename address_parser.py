@@ -0,0 +1,220 @@
+"""
+Разбор адресов объектов пачкой
+
+parse_address_components был определен в app.py дважды: второе определение
+(регион/город/район по ключевым словам) перекрывало первое (страна, регион,
+город, район, улица, дом по позициям), и импорт Excel, читавший
+parsed['country'], падал на каждой строке. update_parsed_addresses и
+update_properties_with_regions разбирали адрес каждой строки заново, на
+каждую строку искали регион и город отдельными запросами и обновляли
+объекты по одному. Здесь:
+
+- parse_address_components — одно определение: регион, город и район по
+  ключевым словам (как работало перекрывавшее определение), страна, улица и
+  дом по позициям; результат мемоизирован по строке адреса;
+- parse_addresses() разбирает только уникальные строки — у квартир одного
+  ЖК адрес обычно один и тот же;
+- RegionCityMap загружает регионы и города одним запросом на таблицу и
+  создает недостающие пачкой;
+- bulk_update_parsed() пишет результат одним UPDATE ... FROM (VALUES ...)
+  на пачку уникальных адресов: строки excel_properties сопоставляются по
+  address_display_name.
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import text
+
+PARSE_CACHE_SIZE = 50000
+VALUES_CHUNK = 500
+# Колонки excel_properties, которые приводятся к integer (в PostgreSQL
+# столбец VALUES из одних NULL иначе получает тип text) и не затираются NULL
+INTEGER_COLUMNS = ('region_id', 'city_id')
+
+_REGION_WORDS = ('край', 'область', 'республика', 'федерация')
+_STREET_WORDS = ('ул', 'улица', 'проспект', 'пр-т', 'переулок', 'пер', 'м-н', 'лит', 'стр', 'корп', 'д.')
+_DISTRICT_WORDS = ('м-н', 'р-н', 'район', 'микрорайон', 'мкр')
+_HOUSE_WORDS = ('ул', 'улица', 'проспект', 'пр-т', 'лит', 'стр', 'корп', 'дом', 'д.')
+_PSEUDO_CITY = re.compile(r'^[а-яё]+\s+\d+$')
+
+
+def _strip_letters(value, letters):
+    for letter in letters:
+        value = value.replace(letter, '')
+    return value
+
+
+def _keyword_components(parts):
+    """Регион, город и район по ключевым словам"""
+    region = next((part for part in parts if any(word in part.lower() for word in _REGION_WORDS)), None)
+
+    city = None
+    if region:
+        for part in parts[parts.index(region) + 1:]:
+            if part == 'Россия' or part == region or any(word in part.lower() for word in _STREET_WORDS):
+                continue
+            # Не номер дома и не псевдо-город вида "Краснодар 6"
+            if not _strip_letters(part, ' абвг').isdigit() and not _PSEUDO_CITY.match(part.lower()):
+                city = part
+                break
+
+    district = None
+    if city:
+        for part in parts[parts.index(city) + 1:]:
+            if part == city:
+                continue
+            lower = part.lower()
+            if any(word in lower for word in _DISTRICT_WORDS):
+                district = part
+                break
+            # Название района без суффиксов — первое после города, не улица и не дом
+            if not any(word in lower for word in _HOUSE_WORDS):
+                house = _strip_letters(part.replace('стр', ''), '/к абвг')
+                if not (house.isdigit() or len(part) <= 5):
+                    district = part
+                    break
+    return region, city, district
+
+
+def _positional_street(parts):
+    """Улица и дом по позициям: "Россия, край, город, [район,] улица, дом" """
+    remaining = parts[3:]
+    if len(remaining) == 1:
+        part = remaining[0]
+        if any(marker in part for marker in ('м-н', 'микрорайон', 'ЖК', 'жилой комплекс')):
+            return None, None
+        return part, None
+    if len(remaining) == 2:
+        if any(marker in remaining[0] for marker in ('м-н', 'микрорайон')):
+            return remaining[1], None
+        return remaining[0], remaining[1]
+    if len(remaining) >= 3:
+        return remaining[1], ', '.join(remaining[2:])
+    return None, None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(address):
+    parts = [part.strip() for part in address.split(',')]
+    region, city, district = _keyword_components(parts)
+    street, house_number = _positional_street(parts)
+    return parts[0] or None, region, city, district, street, house_number
+
+
+def parse_address_components(address_display_name):
+    """
+    Парсит адрес вида "Россия, Краснодарский край, Сочи, Кудепста м-н, Искры, 88 лит7"
+    -> {'country', 'region', 'city', 'district', 'street', 'house_number'}
+    """
+    if not address_display_name:
+        return dict.fromkeys(('country', 'region', 'city', 'district', 'street', 'house_number'))
+    country, region, city, district, street, house_number = _parse(address_display_name)
+    return {'country': country, 'region': region, 'city': city, 'district': district,
+            'street': street, 'house_number': house_number}
+
+
+def parse_addresses(addresses):
+    """{адрес: компоненты} — каждая уникальная строка разбирается один раз"""
+    return {address: parse_address_components(address) for address in set(addresses) if address}
+
+
+def _region_slug(name):
+    return name.lower().replace(' ', '-').replace('ский', '').replace('край', 'krai')
+
+
+def _city_slug(name):
+    return name.lower().replace(' ', '-')
+
+
+class RegionCityMap:
+    """Регионы и города в памяти: id по названию, недостающие создаются пачкой"""
+
+    def __init__(self, session):
+        self.session = session
+        self.regions = {}
+        self.cities = {}
+        self._load()
+
+    def _load(self):
+        self.regions = dict(self.session.execute(text("SELECT name, id FROM regions")).fetchall())
+        self.cities = {(region_id, name): city_id for city_id, region_id, name in
+                       self.session.execute(text("SELECT id, region_id, name FROM cities")).fetchall()}
+
+    def ensure(self, pairs):
+        """Создать недостающие регионы и города для пар (регион, город)"""
+        now = datetime.utcnow()
+        region_slugs = set(self.session.execute(text("SELECT slug FROM regions")).scalars())
+        new_regions = []
+        for name in sorted({region for region, _ in pairs if region and region not in self.regions}):
+            slug = _region_slug(name)
+            if slug in region_slugs:
+                print(f"Error creating region {name}: slug {slug} already exists")
+                continue
+            region_slugs.add(slug)
+            new_regions.append({'name': name, 'slug': slug, 'is_default': name == 'Краснодарский край'})
+        if new_regions:
+            self.session.execute(text("""
+                INSERT INTO regions (name, slug, is_active, is_default, zoom_level, created_at, updated_at)
+                VALUES (:name, :slug, TRUE, :is_default, 8, :now, :now)
+            """), [{**region, 'now': now} for region in new_regions])
+            self._load()
+            print(f"Created regions: {len(new_regions)}")
+
+        city_slugs = {tuple(row) for row in self.session.execute(text("SELECT region_id, slug FROM cities"))}
+        new_cities = []
+        for region, city in sorted({pair for pair in pairs if pair[0] in self.regions and pair[1]}):
+            region_id = self.regions[region]
+            slug = _city_slug(city)
+            if (region_id, city) in self.cities:
+                continue
+            if (region_id, slug) in city_slugs:
+                print(f"Error creating city {city}: slug {slug} already exists in {region}")
+                continue
+            city_slugs.add((region_id, slug))
+            new_cities.append({'name': city, 'slug': slug, 'region_id': region_id, 'is_default': city == 'Краснодар'})
+        if new_cities:
+            self.session.execute(text("""
+                INSERT INTO cities (name, slug, region_id, is_active, is_default, zoom_level, created_at, updated_at)
+                VALUES (:name, :slug, :region_id, TRUE, :is_default, 12, :now, :now)
+            """), [{**city, 'now': now} for city in new_cities])
+            self._load()
+            print(f"Created cities: {len(new_cities)}")
+
+    def ids(self, region, city):
+        """-> (region_id, city_id) или None вместо неизвестных"""
+        region_id = self.regions.get(region) if region else None
+        city_id = self.cities.get((region_id, city)) if region_id and city else None
+        return region_id, city_id
+
+
+def bulk_update_parsed(session, values, columns):
+    """Записать значения columns в excel_properties по address_display_name.
+
+    values — [{'address': адрес, колонка: значение, ...}], по одному на
+    уникальный адрес. Возвращает количество обновленных объектов.
+    """
+    updated = 0
+    assignments = ', '.join(
+        f"{column} = COALESCE(CAST(v.{column} AS INTEGER), excel_properties.{column})"
+        if column in INTEGER_COLUMNS else f"{column} = v.{column}"
+        for column in columns
+    )
+    names = ', '.join(f'column{position + 1} AS {column}' for position, column in enumerate(('address',) + tuple(columns)))
+    for start in range(0, len(values), VALUES_CHUNK):
+        chunk = values[start:start + VALUES_CHUNK]
+        params = {}
+        rows = []
+        for index, row in enumerate(chunk):
+            params[f'a{index}'] = row['address']
+            for position, column in enumerate(columns):
+                params[f'v{index}_{position}'] = row[column]
+            rows.append('(' + ', '.join([f':a{index}'] + [f':v{index}_{position}' for position in range(len(columns))]) + ')')
+        # VALUES без списка имен колонок: column1, column2... и в PostgreSQL, и в SQLite
+        result = session.execute(text(f"""
+            UPDATE excel_properties SET {assignments}
+            FROM (SELECT {names} FROM (VALUES {', '.join(rows)}) AS t) AS v
+            WHERE excel_properties.address_display_name = v.address
+        """), params)
+        updated += result.rowcount or 0
+    return updated
@@ -6,28 +6,28 @@
 import os
 import json
 import time
-import requests
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, asdict
 from urllib.parse import urljoin, urlparse
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from bs4 import BeautifulSoup
-import undetected_chromedriver as uc
 
 from openai import OpenAI
 
+import crawl_store
+from ai_extraction_cache import ExtractionCache, run_limited, schema_version, strip_boilerplate
+from crawler import Crawler, ValidatorCache, needs_js_rendering
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+AI_MODEL = "gpt-4o"  # Используем новейшую модель GPT-4o
+# Увеличить при изменении текста промпта — старые результаты кэша перестанут подходить
+PROMPT_VERSION = 1
+
 @dataclass
 class DeveloperInfo:
     """Структура данных застройщика"""
@@ -79,6 +79,15 @@ class AIWebScraper:
     def __init__(self):
         self.openai_client = None
         self.driver = None
+        # Результаты GPT по (хэш текста, версия схемы, модель); AI_EXTRACTION_MODE=replay —
+        # прогон без сети: страницы из кэша crawler, извлечение из кэша извлечения
+        self.extraction_cache = ExtractionCache('instance/extraction_cache/ai_developer_parser.json')
+        # Статические страницы качаются через общий пул соединений (crawler.py),
+        # Selenium запускается только для страниц, которым нужен JS
+        self.crawler = Crawler(per_host=2, delay=1.0, offline=self.extraction_cache.offline,
+                               cache=ValidatorCache('instance/crawler_cache/ai_developer_parser.json',
+                                                    store_all=True))
+        self._prefetched = {}
         self.setup_openai()
         
     def setup_openai(self):
@@ -93,6 +102,10 @@ class AIWebScraper:
     def setup_selenium(self):
         """Настройка Selenium WebDriver"""
         try:
+            # Selenium импортируется только когда действительно нужен браузер
+            from selenium.webdriver.chrome.options import Options
+            import undetected_chromedriver as uc
+            
             chrome_options = Options()
             chrome_options.add_argument('--headless')
             chrome_options.add_argument('--no-sandbox')
@@ -119,12 +132,14 @@ class AIWebScraper:
                 time.sleep(2)  # Ждем загрузки
                 return self.driver.page_source
             else:
-                # Fallback на requests
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
+                if url in self._prefetched:
+                    response = self._prefetched.pop(url)
+                else:
+                    response = self.crawler.fetch(url)
+                if response is None or not response.ok:
+                    logger.error(f"Ошибка получения страницы {url}: "
+                                 f"{response.status_code if response is not None else 'нет ответа'}")
+                    return ""
                 return response.text
                 
         except Exception as e:
@@ -132,26 +147,27 @@ class AIWebScraper:
             return ""
     
     def extract_with_ai(self, html_content: str, extraction_schema: Dict) -> Dict:
-        """Извлечение данных с помощью OpenAI GPT"""
+        """Извлечение данных с помощью OpenAI GPT (с кэшем по содержимому страницы)"""
+        # Очищаем HTML от служебной разметки: по этому тексту считается ключ кэша,
+        # он же уходит в промпт
+        clean_html = strip_boilerplate(html_content)
+        
+        # Ограничиваем размер для экономии токенов (макс 8000 символов)
+        if len(clean_html) > 8000:
+            clean_html = clean_html[:8000] + "..."
+        
+        result = self.extraction_cache.extract(
+            clean_html, schema_version(extraction_schema, PROMPT_VERSION), AI_MODEL,
+            lambda: self._request_extraction(clean_html, extraction_schema))
+        return result or {}
+    
+    def _request_extraction(self, clean_html: str, extraction_schema: Dict) -> Dict:
+        """Запрос к OpenAI GPT"""
         if not self.openai_client:
             logger.warning("OpenAI клиент недоступен")
             return {}
         
         try:
-            # Очищаем HTML от лишнего для экономии токенов
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Удаляем скрипты, стили, комментарии
-            for script in soup(["script", "style", "noscript"]):
-                script.decompose()
-            
-            # Оставляем только текстовый контент с основными тегами
-            clean_html = soup.get_text(separator=' ', strip=True)
-            
-            # Ограничиваем размер для экономии токенов (макс 8000 символов)
-            if len(clean_html) > 8000:
-                clean_html = clean_html[:8000] + "..."
-            
             system_prompt = f"""
 Ты эксперт по извлечению структурированных данных с веб-страниц.
 Извлеки информацию о застройщике согласно следующей схеме:
@@ -166,7 +182,7 @@ class AIWebScraper:
             user_prompt = f"Извлеки данные из следующего HTML-контента:\n\n{clean_html}"
             
             response = self.openai_client.chat.completions.create(
-                model="gpt-4o",  # Используем новейшую модель GPT-4o
+                model=AI_MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
@@ -217,8 +233,21 @@ class AIWebScraper:
         
         return result
     
+    def prefetch(self, urls):
+        """Параллельно загрузить страницы для последующих get_page_content(use_selenium=False)"""
+        self._prefetched.update(self.crawler.fetch_all(urls))
+    
+    def prefetched(self, url):
+        """Заранее загруженный ответ (FetchResult или None), не забирая его"""
+        return self._prefetched.get(url)
+    
     def close(self):
         """Закрытие ресурсов"""
+        self.crawler.close()
+        self.extraction_cache.save()
+        stats = self.extraction_cache.stats
+        logger.info(f"Кэш извлечения: попаданий {stats['hits']}, промахов {stats['misses']}, "
+                    f"запросов к API {stats['calls']}")
         if self.driver:
             self.driver.quit()
 
@@ -236,51 +265,27 @@ class DeveloperScraper:
         
         url = "https://krasnodar.domclick.ru/zastroishchiki"
         
-        # Пробуем разные методы доступа к сайту
+        # Статическая загрузка (пул соединений, повторы с джиттером, условный GET)
         html_content = None
+        headers = {
+            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Upgrade-Insecure-Requests': '1',
+            'Cache-Control': 'max-age=0'
+        }
+        response = self.scraper.crawler.fetch(url, headers=headers)
+        if response is not None:
+            logger.info(f"Статус ответа: {response.status_code}")
+            if response.ok and not needs_js_rendering(response.text):
+                html_content = response.text
+                logger.info("✅ Получили контент без браузера")
+            else:
+                logger.warning(f"Страница без JS пустая или ответ плохой: статус {response.status_code}, "
+                               f"размер {len(response.content)}")
         
-        # Метод 1: Trafilatura (обходит многие защиты)
-        try:
-            import trafilatura
-            logger.info("Пробуем trafilatura...")
-            downloaded = trafilatura.fetch_url(url)
-            if downloaded and len(downloaded) > 10000:  # Минимальный размер страницы
-                html_content = downloaded
-                logger.info("✅ Получили контент через trafilatura")
-        except Exception as e:
-            logger.warning(f"Trafilatura не сработал: {e}")
-        
-        # Метод 2: Обычный requests с продвинутыми заголовками
-        if not html_content:
-            try:
-                logger.info("Пробуем requests с заголовками...")
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                    'Sec-Fetch-Dest': 'document',
-                    'Sec-Fetch-Mode': 'navigate',
-                    'Cache-Control': 'max-age=0'
-                }
-                
-                response = requests.get(url, headers=headers, timeout=15, allow_redirects=True)
-                logger.info(f"Статус ответа: {response.status_code}")
-                
-                if response.status_code == 200 and len(response.text) > 10000:
-                    html_content = response.text
-                    logger.info("✅ Получили контент через requests")
-                else:
-                    logger.warning(f"Плохой ответ: статус {response.status_code}, размер {len(response.text)}")
-                    
-            except Exception as e:
-                logger.warning(f"Requests не сработал: {e}")
-        
-        # Метод 3: Selenium как последняя попытка
-        if not html_content:
+        # Selenium — только если контенту нужен JS-рендеринг (в режиме replay браузер не нужен)
+        if not html_content and not self.scraper.extraction_cache.offline:
             try:
                 logger.info("Пробуем Selenium...")
                 if self.scraper.setup_selenium():
@@ -377,11 +382,12 @@ class DeveloperScraper:
         
         return {"developers": developers}
     
-    def parse_developer_details(self, developer_url: str) -> DeveloperInfo:
-        """Парсинг детальной информации о застройщике"""
+    def parse_developer_details(self, developer_url: str, html_content: str = None) -> DeveloperInfo:
+        """Парсинг детальной информации о застройщике (html_content — уже загруженная страница)"""
         logger.info(f"Парсинг застройщика: {developer_url}")
         
-        html_content = self.scraper.get_page_content(developer_url, use_selenium=False)
+        if html_content is None:
+            html_content = self.scraper.get_page_content(developer_url, use_selenium=False)
         
         if not html_content:
             logger.warning(f"Не удалось получить контент для {developer_url}")
@@ -463,31 +469,72 @@ class DeveloperScraper:
         logger.info(f"Начинаем парсинг застройщиков (лимит: {limit})")
         
         developers_list = self.get_developers_list()
-        parsed_developers = []
         
+        # Загружаются только устаревшие страницы застройщиков (crawl_store.py),
+        # параллельно с ограничением на хост; для свежих — данные прошлого разбора
+        store = crawl_store.for_source('ai_developer_parser')
+        urls = [dev_info.get('url') for dev_info in developers_list[:limit]]
+        to_fetch, reused = store.plan(urls) if store else (urls, {})
+        self.scraper.prefetch(to_fetch)
+        
+        # Страницы загружаются в основном потоке (crawler и сессия БД однопоточные),
+        # запросы к GPT — параллельно, не больше AI_MAX_CONCURRENCY одновременно
+        results = {}
+        jobs = []
         for i, dev_info in enumerate(developers_list[:limit]):
             try:
                 logger.info(f"Парсинг {i+1}/{min(limit, len(developers_list))}: {dev_info.get('name', 'Неизвестно')}")
                 
-                developer_details = self.parse_developer_details(dev_info['url'])
+                url = dev_info['url']
+                stored = reused.get(url)
+                if store and stored is None:
+                    response = self.scraper.prefetched(url)
+                    changed = store.record_fetch(url, response, kind='developer')
+                    if not changed or response is None or not response.ok:
+                        stored = store.entities('developer', group_key=url) or None
                 
-                # Дополняем базовыми данными из списка
-                if not developer_details.name and dev_info.get('name'):
-                    developer_details.name = dev_info['name']
-                if not developer_details.phone and dev_info.get('phone'):
-                    developer_details.phone = dev_info['phone']
-                if not developer_details.logo_url and dev_info.get('logo_url'):
-                    developer_details.logo_url = dev_info['logo_url']
+                if stored:
+                    logger.info(f"Страница не изменилась, используем сохраненные данные: {url}")
+                    results[i] = DeveloperInfo(**stored[0])
+                    continue
                 
-                parsed_developers.append(developer_details)
-                
-                # Пауза между запросами
-                time.sleep(1)
+                jobs.append((i, dev_info, self.scraper.get_page_content(url, use_selenium=False)))
                 
             except Exception as e:
                 logger.error(f"Ошибка парсинга застройщика {dev_info.get('name', 'Неизвестно')}: {e}")
                 continue
         
+        def parse_job(job):
+            i, dev_info, html_content = job
+            try:
+                return self.parse_developer_details(dev_info['url'], html_content)
+            except Exception as e:
+                logger.error(f"Ошибка парсинга застройщика {dev_info.get('name', 'Неизвестно')}: {e}")
+                return None
+        
+        for (i, dev_info, _), developer_details in zip(jobs, run_limited(parse_job, jobs)):
+            if developer_details is None:
+                continue
+            
+            # Дополняем базовыми данными из списка
+            if not developer_details.name and dev_info.get('name'):
+                developer_details.name = dev_info['name']
+            if not developer_details.phone and dev_info.get('phone'):
+                developer_details.phone = dev_info['phone']
+            if not developer_details.logo_url and dev_info.get('logo_url'):
+                developer_details.logo_url = dev_info['logo_url']
+            
+            results[i] = developer_details
+            if store:
+                store.record_entities('developer', [asdict(developer_details)],
+                                      key=lambda data: data['source_url'] or data['url'],
+                                      group_key=dev_info['url'])
+        
+        parsed_developers = [results[i] for i in sorted(results)]
+        
+        if store:
+            store.commit()
+        
         logger.info(f"Парсинг завершен. Успешно спарсено: {len(parsed_developers)} застройщиков")
         return parsed_developers
     
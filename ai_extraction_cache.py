@@ -0,0 +1,155 @@
+"""
+Кэш результатов GPT-извлечения для ИИ-парсеров
+
+AIWebScraper.extract_with_ai и DomclickGPTVisionParser на каждом прогоне
+заново отправляли в OpenAI страницы, которые не менялись с прошлого раза.
+Здесь результат извлечения запоминается по ключу
+(хэш содержимого, версия схемы, модель):
+
+- HTML перед хэшированием очищается от служебной разметки (strip_boilerplate):
+  скрипты, стили, меню и счетчики меняются на каждой загрузке, текст — нет;
+- версия схемы — хэш схемы извлечения и версии промпта, поэтому изменение
+  схемы или промпта само инвалидирует старые результаты;
+- кэш хранится в JSON файле (instance/extraction_cache/), как ValidatorCache;
+- режим AI_EXTRACTION_MODE: online (по умолчанию) — промах идет в API,
+  replay — только кэш, без сети и токенов (промах -> None),
+  refresh — всегда API, кэш перезаписывается;
+- run_limited выполняет извлечения параллельно, не больше AI_MAX_CONCURRENCY
+  одновременных запросов к API.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MODES = ('online', 'replay', 'refresh')
+DEFAULT_MAX_CONCURRENCY = 4
+# header/footer не удаляются: в них бывают телефоны и адреса застройщика
+BOILERPLATE_TAGS = ['script', 'style', 'noscript', 'svg', 'iframe', 'template', 'nav']
+
+
+def strip_boilerplate(html):
+    """Видимый текст страницы без служебной разметки, с нормализованными пробелами"""
+    if not html:
+        return ''
+    from bs4 import BeautifulSoup, Comment
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+    return re.sub(r'\s+', ' ', soup.get_text(separator=' ', strip=True)).strip()
+
+
+def schema_version(schema, prompt_version=1):
+    """Короткий хэш схемы извлечения и версии промпта"""
+    payload = json.dumps({'schema': schema, 'prompt': prompt_version}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def max_concurrency():
+    try:
+        return max(1, int(os.environ.get('AI_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)))
+    except ValueError:
+        return DEFAULT_MAX_CONCURRENCY
+
+
+def run_limited(func, items, limit=None):
+    """[func(item)] в исходном порядке, не больше limit вызовов одновременно"""
+    items = list(items)
+    limit = min(limit or max_concurrency(), len(items))
+    if limit <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=limit) as executor:
+        return list(executor.map(func, items))
+
+
+class ExtractionCache:
+    """Результаты извлечения по (хэш содержимого, версия схемы, модель)"""
+
+    def __init__(self, path=None, mode=None):
+        self.path = path
+        self.mode = mode or os.environ.get('AI_EXTRACTION_MODE', 'online')
+        if self.mode not in MODES:
+            logger.warning(f"Неизвестный AI_EXTRACTION_MODE={self.mode}, используем online")
+            self.mode = 'online'
+        self.entries = {}
+        self.stats = {'hits': 0, 'misses': 0, 'calls': 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Кэш извлечения {path} не прочитан: {e}")
+
+    @property
+    def offline(self):
+        return self.mode == 'replay'
+
+    @staticmethod
+    def key(content, version, model):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        return f'{model}:{version}:{digest}'
+
+    def get(self, key):
+        if self.mode == 'refresh':
+            return None
+        entry = self.entries.get(key)
+        return entry['result'] if entry else None
+
+    def put(self, key, result):
+        with self._lock:
+            self.entries[key] = {'result': result, 'created_at': datetime.now().isoformat()}
+            self._dirty = True
+
+    def cached(self, content, version, model):
+        """Результат из кэша или None (промах учитывается в stats)"""
+        result = self.get(self.key(content, version, model))
+        with self._lock:
+            self.stats['hits' if result is not None else 'misses'] += 1
+        return result
+
+    def call(self, content, version, model, request):
+        """Выполнить request() и запомнить непустой результат.
+
+        Пустой результат не кэшируется, чтобы ошибку API можно было повторить.
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+        result = request()
+        if result:
+            self.put(self.key(content, version, model), result)
+        return result
+
+    def extract(self, content, version, model, request):
+        """Результат из кэша или request() (None — нет в кэше в режиме replay)"""
+        result = self.cached(content, version, model)
+        if result is not None:
+            return result
+        if self.offline:
+            logger.info(f"Нет в кэше извлечения (replay), {model}/{version}")
+            return None
+        return self.call(content, version, model, request)
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
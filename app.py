@@ -3,8 +3,11 @@ import json
 import logging
 import requests
 
-# Configure logging for debugging PDF generation
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Structured logging: per-module levels (LOG_LEVEL/LOG_LEVELS), non-blocking queue handler,
+# request-id correlation and sampled DEBUG output (see logging_config.py)
+from logging_config import configure_logging, init_request_logging
+configure_logging()
+logger = logging.getLogger(__name__)
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, abort, Blueprint, send_from_directory, send_file, make_response
 from sqlalchemy import text
@@ -17,10 +20,15 @@ from werkzeug.exceptions import BadRequest
 
 # Import smart search
 from smart_search import smart_search
+from data_export import property_filters_from_args
+import crawl_store
+from keyset_pagination import keyset_paginate, search_filter, page_size, bulk_set_role, bulk_toggle_active, bulk_delete_users
+from property_photos import PHOTO_COLUMNS_SQL, normalize_photos, photo_set, sync_property_photos
 from urllib.parse import unquote, quote
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm.attributes import set_committed_value
 from werkzeug.middleware.proxy_fix import ProxyFix
 import secrets
 import re
@@ -30,76 +38,12 @@ import qrcode
 import io
 import base64
 from PIL import Image
+from address_parser import RegionCityMap, bulk_update_parsed, parse_address_components, parse_addresses
 
-# Models will be imported after db initialization to avoid circular imports
+PARSED_COLUMNS = ('parsed_country', 'parsed_region', 'parsed_city', 'parsed_district', 'parsed_street',
+                  'parsed_house_number')
 
-def parse_address_components(address_display_name):
-    """
-    ИСПРАВЛЕННАЯ ФУНКЦИЯ: Парсит адрес в формате: Россия, Краснодарский край, Сочи, Кудепста м-н, Искры, 88 лит7
-    Возвращает словарь с компонентами адреса
-    """
-    # ПОЛНАЯ ИНИЦИАЛИЗАЦИЯ РЕЗУЛЬТАТА
-    result = {
-        'country': None,
-        'region': None, 
-        'city': None,
-        'district': None,
-        'street': None,
-        'house_number': None
-    }
-    
-    if not address_display_name:
-        return result
-    
-    # РАЗБИВАЕМ АДРЕС ПО ЗАПЯТЫМ
-    parts = [part.strip() for part in address_display_name.split(',')]
-    
-    # ПРЯМОЕ ЗАПОЛНЕНИЕ ОСНОВНЫХ ЧАСТЕЙ
-    if len(parts) >= 1:
-        result['country'] = parts[0]  # Россия
-        
-    if len(parts) >= 2:
-        result['region'] = parts[1]   # Краснодарский край
-        
-    if len(parts) >= 3:
-        result['city'] = parts[2]     # Сочи
-        
-    # ОБРАБАТЫВАЕМ ОСТАВШИЕСЯ ЧАСТИ (район, улица, дом)
-    if len(parts) >= 4:
-        remaining_parts = parts[3:]  # ['Дагомыс', 'Российская', '26г стр']
-        
-        if len(remaining_parts) == 1:
-            # Одна часть: может быть район или улица
-            part = remaining_parts[0]
-            if any(marker in part for marker in ['м-н', 'микрорайон', 'ЖК', 'жилой комплекс']):
-                result['district'] = part
-            else:
-                result['street'] = part
-                
-        elif len(remaining_parts) == 2:
-            # Две части: район+улица или улица+дом
-            first_part, second_part = remaining_parts[0], remaining_parts[1]
-            
-            if any(marker in first_part for marker in ['м-н', 'микрорайон']):
-                result['district'] = first_part
-                result['street'] = second_part
-            else:
-                result['street'] = first_part
-                result['house_number'] = second_part
-                
-        elif len(remaining_parts) == 3:
-            # Три части: район, улица, дом
-            result['district'] = remaining_parts[0]
-            result['street'] = remaining_parts[1]
-            result['house_number'] = remaining_parts[2]
-            
-        elif len(remaining_parts) >= 4:
-            # Больше трех частей: район, улица, дом (остальное объединяем в дом)
-            result['district'] = remaining_parts[0]
-            result['street'] = remaining_parts[1]
-            result['house_number'] = ', '.join(remaining_parts[2:])
-    
-    return result
+# Models will be imported after db initialization to avoid circular imports
 
 def update_parsed_addresses():
     """
@@ -108,53 +52,26 @@ def update_parsed_addresses():
     """
     print("Starting COMPLETE address parsing update...")
     
-    # Получаем все записи с адресами
-    result = db.session.execute(text("""
-        SELECT inner_id, address_display_name
+    # Каждый уникальный адрес разбирается один раз
+    addresses = db.session.execute(text("""
+        SELECT DISTINCT address_display_name
         FROM excel_properties 
         WHERE address_display_name IS NOT NULL
-    """))
+    """)).scalars().all()
+    parsed = parse_addresses(addresses)
+    
+    updated_count = bulk_update_parsed(db.session, [{
+        'address': address,
+        'parsed_country': parts['country'],
+        'parsed_region': parts['region'],
+        'parsed_city': parts['city'],
+        'parsed_district': parts['district'],
+        'parsed_street': parts['street'],
+        'parsed_house_number': parts['house_number'],
+    } for address, parts in parsed.items()], PARSED_COLUMNS)
     
-    records = result.fetchall()
-    updated_count = 0
-    
-    for record in records:
-        property_id, address = record
-        
-        # Парсим адрес ПОЛНОСТЬЮ
-        parsed = parse_address_components(address)
-        
-        # Обновляем ВСЕ поля парсинга
-        db.session.execute(text("""
-            UPDATE excel_properties 
-            SET 
-                parsed_country = :country,
-                parsed_region = :region,
-                parsed_city = :city,
-                parsed_district = :district,
-                parsed_street = :street,
-                parsed_house_number = :house_number
-            WHERE inner_id = :property_id
-        """), {
-            'property_id': property_id,
-            'country': parsed.get('country'),
-            'region': parsed.get('region'),
-            'city': parsed.get('city'),
-            'district': parsed.get('district'),
-            'street': parsed.get('street'),
-            'house_number': parsed.get('house_number')
-        })
-        
-        updated_count += 1
-        
-        # Коммитим пачками
-        if updated_count % 50 == 0:
-            db.session.commit()
-            print(f"Updated {updated_count} records...")
-    
-    # Финальный коммит
     db.session.commit()
-    print(f"Address parsing complete! Updated {updated_count} records.")
+    print(f"Address parsing complete! Updated {updated_count} records ({len(parsed)} unique addresses).")
     return updated_count
 
 class Base(DeclarativeBase):
@@ -166,6 +83,7 @@ db = SQLAlchemy(model_class=Base)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+init_request_logging(app)
 
 # Initialize CSRF protection after app creation - ENABLED FOR SECURITY
 csrf = CSRFProtect(app)
@@ -278,6 +196,49 @@ with app.app_context():
     db.create_all()
     print("Database tables created successfully!")
 
+# Buffered presentation view tracking (async writes + deduplication)
+from presentation_tracking import presentation_view_tracker
+presentation_view_tracker.init_app(app, db)
+
+# Buffered blog/job view counters and user activity log (periodic batched writes)
+from view_counters import view_counters
+view_counters.init_app(app, db)
+
+# Background PDF/ZIP generation with persistent progress
+from pdf_jobs import ACTIVE_STAGES, pdf_job_service
+pdf_job_service.init_app(app)
+
+# Disk LRU cache for QR codes and rendered property cards
+from asset_cache import asset_cache
+asset_cache.init_app(app)
+
+# Resized/WebP copies of external listing photos served from /img/<hash>/<size>
+from image_proxy import image_proxy
+image_proxy.init_app(app, asset_cache)
+
+# Per-request + short-TTL shared cache of user/manager identities
+from identity_cache import CachedIdentity, get_principal, identity_cache, invalidate_principal
+identity_cache.init_app(app, cache)
+
+# Incrementally maintained manager dashboard counters and activity timeline
+from manager_rollups import manager_rollups
+manager_rollups.init_app(app, db)
+
+# Cashback applications aggregated by month and status
+from cashback_analytics import cashback_analytics
+cashback_analytics.init_app(app, db)
+
+# Full-text blog search index maintained on publish/edit
+from blog_search import blog_search
+blog_search.init_app(app, db)
+
+# District assignment and per-district aggregates (refreshed after imports)
+from district_stats import assign_districts, district_listing, district_page, refresh_district_stats
+from complex_pages import (complex_page_index, complex_pages_version, load_complex_page, refresh_complex_pages,
+                           resolve_complex_page)
+from developer_profiles import (developer_listing, developer_profile, find_unprofiled_developer,
+                                refresh_developer_profiles)
+
 # Add Jinja2 helper for creating slugs
 @app.template_filter('slug')
 def create_slug_filter(name):
@@ -439,6 +400,11 @@ def from_json_filter(json_string):
     except (json.JSONDecodeError, TypeError):
         return []
 
+@app.template_filter('img_proxy')
+def img_proxy_filter(src, size='card'):
+    """Адрес уменьшенной копии внешнего фото через /img/<hash>/<size>"""
+    return image_proxy.url(src, size)
+
 def format_room_display(rooms):
     """Format room count for display"""
     if rooms == 0:
@@ -483,8 +449,8 @@ def load_properties():
     
     try:
         # Load from excel_properties table using raw SQL - EXPANDED FIELDS
-        sql_query = """
-            SELECT inner_id, complex_name, developer_name, object_rooms, object_area, 
+        sql_query = f"""
+            SELECT ep.inner_id, complex_name, developer_name, object_rooms, object_area, 
                    price, object_min_floor, object_max_floor, address_display_name, 
                    address_position_lat, address_position_lon, address_locality_display_name,
                    photos, complex_object_class_display_name,
@@ -492,8 +458,12 @@ def load_properties():
                    complex_building_end_build_year, complex_building_end_build_quarter,
                    complex_building_name, address_subways, trade_in, deal_type,
                    square_price, mortgage_price, object_is_apartment, max_price, min_price,
-                   complex_has_green_mortgage, placement_type, description
-            FROM excel_properties 
+                   complex_has_green_mortgage, placement_type, description,
+                   complex_end_build_year, complex_building_accreditation,
+                   complex_has_accreditation, complex_has_government_program,
+                   {PHOTO_COLUMNS_SQL}
+            FROM excel_properties ep
+            LEFT JOIN property_photos pp ON pp.inner_id = ep.inner_id
             WHERE price > 0 AND address_position_lat IS NOT NULL
         """
         
@@ -506,29 +476,9 @@ def load_properties():
             for prop in excel_properties:
                 prop_dict = dict(prop._mapping)
                 
-                # Parse photos field (JSON array format)
-                photos_raw = prop_dict.get('photos', '')
-                main_image = '/static/images/no-photo.jpg'
-                
-                if photos_raw and photos_raw.strip():
-                    try:
-                        # Try to parse as JSON array first (current database format)
-                        if photos_raw.startswith('[') and photos_raw.endswith(']'):
-                            images = json.loads(photos_raw)
-                            if images and isinstance(images, list) and len(images) > 0:
-                                main_image = images[0].strip() if images[0] else '/static/images/no-photo.jpg'
-                        # Fallback: PostgreSQL array format {url1,url2,url3}
-                        elif photos_raw.startswith('{') and photos_raw.endswith('}'):
-                            images_str = photos_raw[1:-1]  # Remove braces
-                            if images_str:
-                                images = [img.strip().strip('"') for img in images_str.split(',') if img.strip()]
-                                main_image = images[0] if images else '/static/images/no-photo.jpg'
-                        # Single image URL
-                        else:
-                            main_image = photos_raw.strip()
-                    except (json.JSONDecodeError, ValueError, IndexError) as e:
-                        print(f"Error parsing photos for property {prop_dict.get('inner_id')}: {e}")
-                        main_image = '/static/images/no-photo.jpg'
+                # Фото уже разобраны при импорте (property_photos)
+                photos = photo_set(prop_dict)
+                main_image = photos['main_image'] or '/static/images/no-photo.jpg'
                 
                 # Get correct total floors for the complex
                 complex_total_floors = prop_dict.get('object_max_floor', 1)
@@ -597,6 +547,8 @@ def load_properties():
                     'residential_complex': prop_dict.get('complex_name', 'ЖК Без названия'),
                     'district': prop_dict.get('address_locality_display_name', 'Район не указан'),
                     'main_image': main_image,
+                    'gallery': photos['gallery'],
+                    'floor_plans': photos['floor_plans'],
                     'url': f"/object/{prop_dict.get('inner_id')}",
                     'complex_name': prop_dict.get('complex_name', 'ЖК Без названия'),
                     'type': 'property',
@@ -615,7 +567,12 @@ def load_properties():
                     'green_mortgage_available': bool(prop_dict.get('complex_has_green_mortgage', False)),
                     'placement_type': prop_dict.get('placement_type', ''),
                     'description': prop_dict.get('description', ''),
-                    'complex_with_renovation': bool(prop_dict.get('complex_with_renovation', False))
+                    'complex_with_renovation': bool(prop_dict.get('complex_with_renovation', False)),
+                    # Для фасетов фильтров (property_facets)
+                    'completion_year': prop_dict.get('complex_building_end_build_year'),
+                    'complex_completion_year': prop_dict.get('complex_end_build_year'),
+                    'accreditation': bool(prop_dict.get('complex_building_accreditation') or prop_dict.get('complex_has_accreditation')),
+                    'government_program': bool(prop_dict.get('complex_has_government_program'))
                 }
                 db_properties.append(formatted_prop)
             
@@ -636,6 +593,102 @@ def load_properties():
     # No properties found
     return []
 
+# id → property map over the load_properties() snapshot, rebuilt when the snapshot changes
+_properties_index = None
+_properties_index_source = None
+
+def get_properties_index():
+    """Return {str(id): property} built over the cached load_properties() list"""
+    global _properties_index, _properties_index_source
+    properties = load_properties()
+    if _properties_index is None or _properties_index_source is not properties:
+        _properties_index = {str(prop.get('id')): prop for prop in properties}
+        _properties_index_source = properties
+    return _properties_index
+
+# Facet bitsets for the /properties filters over the same snapshot
+_facet_index = None
+
+def get_facet_index():
+    """Return the FacetIndex built over the cached load_properties() list"""
+    global _facet_index
+    from property_facets import FacetIndex
+    properties = load_properties()
+    if _facet_index is None or _facet_index.source is not properties:
+        _facet_index = FacetIndex(properties)
+    return _facet_index
+
+def property_facet_counts(args):
+    """Facet counts for the filter selection in a /properties query string"""
+    filters = property_filters_from_args(args)
+    filters['renovation'] = args.getlist('renovation')
+    return get_facet_index().counts(filters)
+
+def get_properties_by_ids(property_ids):
+    """Resolve property ids through the snapshot index, preserving the input order.
+    Ids that are not in the snapshot resolve to None so callers can render fallbacks in place."""
+    index = get_properties_index()
+    return [index.get(str(property_id)) for property_id in property_ids]
+
+def fetch_excel_properties_by_ids(property_ids, columns):
+    """Fetch excel_properties rows for many ids with one batched query.
+    Returns {str(inner_id): row}; callers keep their own ordering."""
+    from sqlalchemy import bindparam
+
+    ids = []
+    for property_id in property_ids:
+        try:
+            ids.append(int(property_id))
+        except (ValueError, TypeError):
+            continue
+    if not ids:
+        return {}
+
+    stmt = text(f"""
+        SELECT inner_id, {', '.join(columns)}
+        FROM excel_properties
+        WHERE inner_id IN :ids
+    """).bindparams(bindparam('ids', expanding=True))
+
+    rows = db.session.execute(stmt, {'ids': list(set(ids))}).fetchall()
+    return {str(row.inner_id): row for row in rows}
+
+def load_excel_complexes_by_real_id():
+    """Aggregate excel_properties per complex once and key rows by the dynamic id
+    used on /residential-complexes (rc.id or ROW_NUMBER() + 1000)"""
+    result = db.session.execute(text("""
+        SELECT
+            ep.complex_name,
+            COUNT(*) as apartments_count,
+            MIN(ep.price) as price_from,
+            MAX(ep.price) as price_to,
+            MAX(ep.developer_name) as developer_name,
+            MAX(ep.address_display_name) as address_display_name,
+            MAX(ep.complex_object_class_display_name) as complex_class,
+            MAX(ep.renovation_display_name) as renovation_display_name,
+            MAX(ep.complex_building_end_build_year) as end_build_year,
+            MAX(ep.complex_building_end_build_quarter) as end_build_quarter,
+            MIN(ep.object_min_floor) as floors_min,
+            MAX(ep.object_max_floor) as floors_max,
+            COALESCE(rc.id, ROW_NUMBER() OVER (ORDER BY ep.complex_name) + 1000) as real_id,
+            CASE
+                WHEN COUNT(DISTINCT ep.complex_building_id) > 0
+                THEN COUNT(DISTINCT ep.complex_building_id)
+                WHEN COUNT(DISTINCT NULLIF(ep.complex_building_name, '')) > 0
+                THEN COUNT(DISTINCT NULLIF(ep.complex_building_name, ''))
+                ELSE GREATEST(1, CEIL(COUNT(*) / 3.0))
+            END as buildings_count,
+            (SELECT photos FROM excel_properties p2
+             WHERE p2.complex_name = ep.complex_name
+             AND p2.photos IS NOT NULL
+             ORDER BY p2.price DESC LIMIT 1) as photos
+        FROM excel_properties ep
+        LEFT JOIN residential_complexes rc ON rc.name = ep.complex_name
+        GROUP BY ep.complex_name, rc.id
+        ORDER BY ep.complex_name
+    """))
+    return {int(row.real_id): row for row in result}
+
 def load_residential_complexes():
     """Load residential complexes from database with JSON fallback"""
     try:
@@ -796,48 +849,9 @@ def get_article_by_slug(slug):
             return article
     return None
 
-def search_articles(query, category=None):
-    """Search articles by title, excerpt, content, and tags"""
-    articles = load_blog_articles()
-    if not query and not category:
-        return articles
-    
-    filtered_articles = []
-    for article in articles:
-        # Filter by category if specified
-        if category and article['category'].lower() != category.lower():
-            continue
-        
-        # If no search query, return all articles in category
-        if not query:
-            filtered_articles.append(article)
-            continue
-        
-        # Search in title, excerpt, content, and tags
-        query_lower = query.lower()
-        if (query_lower in article['title'].lower() or 
-            query_lower in article['excerpt'].lower() or 
-            query_lower in article['content'].lower() or 
-            any(query_lower in tag.lower() for tag in article['tags'])):
-            filtered_articles.append(article)
-    
-    return filtered_articles
-
 def _extract_first_photo(photos_json):
     """Extract first photo from photos JSON string"""
-    if not photos_json:
-        return None
-    
-    try:
-        import json
-        if isinstance(photos_json, str):
-            photos_list = json.loads(photos_json)
-        else:
-            photos_list = photos_json
-            
-        return photos_list[0] if photos_list and len(photos_list) > 0 else None
-    except:
-        return None
+    return normalize_photos(photos_json)['main_image']
 
 def calculate_cashback(price, complex_id=None, complex_name=None):
     """Calculate cashback amount based on property price and complex cashback rate"""
@@ -872,15 +886,17 @@ def get_property_by_id(property_id):
     """Get a single property by ID from Excel database with all photos"""
     try:
         # Use SQLAlchemy session like other functions in this file
-        result = db.session.execute(text("""
+        result = db.session.execute(text(f"""
         SELECT 
-            inner_id, price, object_area, object_rooms, object_min_floor, object_max_floor, 
+            ep.inner_id, price, object_area, object_rooms, object_min_floor, object_max_floor, 
             address_display_name, renovation_display_name, min_rate, square_price, mortgage_price, 
             complex_object_class_display_name, photos, developer_name, complex_name, 
             complex_end_build_year, complex_end_build_quarter, complex_building_end_build_year, complex_building_end_build_quarter,
-            address_position_lat, address_position_lon, description, address_locality_name
-        FROM excel_properties 
-        WHERE inner_id = :property_id
+            address_position_lat, address_position_lon, description, address_locality_name,
+            {PHOTO_COLUMNS_SQL}
+        FROM excel_properties ep
+        LEFT JOIN property_photos pp ON pp.inner_id = ep.inner_id
+        WHERE ep.inner_id = :property_id
         """), {'property_id': property_id})
         
         row = result.fetchone()
@@ -889,42 +905,16 @@ def get_property_by_id(property_id):
             return None
             
         # Parse the row data into property format
-        inner_id, price, area, rooms, min_floor, max_floor, address, renovation, min_rate, square_price, mortgage_price, class_type, photos, developer_name, complex_name, complex_end_year, complex_end_quarter, building_end_year, building_end_quarter, lat, lon, description, district_name = row
+        inner_id, price, area, rooms, min_floor, max_floor, address, renovation, min_rate, square_price, mortgage_price, class_type, photos, developer_name, complex_name, complex_end_year, complex_end_quarter, building_end_year, building_end_quarter, lat, lon, description, district_name = row[:23]
         
-        # Parse photos JSON
-        images = []
-        floor_plan = None
-        complex_photos = []
-        
-        try:
-            if photos:
-                photos_data = json.loads(photos)
-                if isinstance(photos_data, list):
-                    # If it's a simple list of photo URLs (like in this case)
-                    images = photos_data
-                    # Use first photo as main image, rest as gallery
-                    if len(images) > 0:
-                        # For floor plan, look for images that might be floor plans
-                        # (typically contain words like "plan", "layout" or are architectural)
-                        for img_url in images:
-                            if any(keyword in img_url.lower() for keyword in ['plan', 'layout', 'scheme', 'планировка']):
-                                floor_plan = img_url
-                                break
-                        # If no specific floor plan found, use the last image as floor plan
-                        if not floor_plan and len(images) > 1:
-                            floor_plan = images[-1]  # Last image often is floor plan
-                elif isinstance(photos_data, dict):
-                    # Get apartment gallery photos from dict structure
-                    images = photos_data.get('apartment_gallery', [])
-                    # Get floor plan 
-                    floor_plans = photos_data.get('floor_plans', [])
-                    if floor_plans and len(floor_plans) > 0:
-                        floor_plan = floor_plans[0]  # Take first floor plan
-                    # Get complex photos
-                    complex_photos = photos_data.get('complex_gallery', [])
-        except Exception as e:
-            print(f"Error parsing photos for property {property_id}: {e}")
-            pass
+        # Фото разобраны при импорте (property_photos)
+        photos = photo_set(row._mapping)
+        images = photos['gallery']
+        complex_photos = photos['complex_gallery']
+        floor_plan = photos['floor_plans'][0] if photos['floor_plans'] else None
+        # If no specific floor plan found, use the last image as floor plan
+        if not floor_plan and len(images) > 1:
+            floor_plan = images[-1]  # Last image often is floor plan
         
         # Build completion date
         completion_date = 'Уточняется'
@@ -1303,14 +1293,10 @@ def index():
             main_photo = '/static/images/no-photo.jpg'
             photos_list = [main_photo]
             
-            if row[13]:  # photos column
-                try:
-                    photos_raw = json.loads(row[13])
-                    if photos_raw and isinstance(photos_raw, list):
-                        photos_list = photos_raw[:2]  # Первые 2 фото для карточки
-                        main_photo = photos_list[0] if photos_list else main_photo
-                except:
-                    pass
+            gallery = normalize_photos(row[13])['gallery']  # photos column
+            if gallery:
+                photos_list = gallery[:2]  # Первые 2 фото для карточки
+                main_photo = photos_list[0]
             
             # Определение статуса и типа комнат
             current_year = 2025
@@ -1452,13 +1438,15 @@ def index():
         
         # Получаем объекты напрямую из базы со ВСЕМИ нужными полями
         from sqlalchemy import text
-        result = db.session.execute(text("""
-            SELECT inner_id, price, object_area, object_rooms, 
+        result = db.session.execute(text(f"""
+            SELECT ep.inner_id, price, object_area, object_rooms, 
                    object_min_floor, object_max_floor,
                    address_display_name, complex_name, developer_name, photos,
                    complex_end_build_quarter, complex_end_build_year,
-                   complex_building_end_build_quarter, complex_building_end_build_year
-            FROM excel_properties
+                   complex_building_end_build_quarter, complex_building_end_build_year,
+                   {PHOTO_COLUMNS_SQL}
+            FROM excel_properties ep
+            LEFT JOIN property_photos pp ON pp.inner_id = ep.inner_id
             WHERE price > 0 AND photos IS NOT NULL AND photos != '' AND photos != '[]'
                 AND address_position_lat IS NOT NULL 
                 AND address_position_lon IS NOT NULL
@@ -1475,14 +1463,10 @@ def index():
                 main_image = 'https://via.placeholder.com/400x300?text=Фото+скоро'
                 gallery = [main_image]
                 
-                if row.photos:
-                    try:
-                        photos_raw = json.loads(row.photos)
-                        if photos_raw and isinstance(photos_raw, list) and len(photos_raw) > 0:
-                            main_image = photos_raw[0]
-                            gallery = photos_raw[:5]
-                    except:
-                        pass
+                photos = photo_set(row._mapping)
+                if photos['gallery']:
+                    main_image = photos['gallery'][0]
+                    gallery = photos['gallery'][:5]
                 
                 # ✅ ИСПРАВЛЕНИЯ: Правильное форматирование всех полей
                 rooms = int(row.object_rooms or 0)
@@ -1631,13 +1615,11 @@ def properties():
         floor_from = request.args.get('floor_from', '').strip()
         floor_to = request.args.get('floor_to', '').strip()
         
-        from models import ExcelProperty, Developer, ResidentialComplex
-        
         # Get ALL properties directly from excel_properties table using raw SQL
         try:
             from sqlalchemy import text
-            result = db.session.execute(text("""
-                SELECT inner_id, price, object_area, object_rooms, object_min_floor, object_max_floor,
+            result = db.session.execute(text(f"""
+                SELECT ep.inner_id, price, object_area, object_rooms, object_min_floor, object_max_floor,
                        address_display_name, renovation_display_name, min_rate, square_price, 
                        mortgage_price, complex_object_class_display_name, photos,
                        developer_name, complex_name, complex_end_build_year, complex_end_build_quarter,
@@ -1645,8 +1627,10 @@ def properties():
                        address_position_lat, address_position_lon, description, address_locality_name,
                        complex_building_name, parsed_city, parsed_region, renovation_type,
                        placement_type, deal_type, complex_building_accreditation,
-                       complex_building_has_green_mortgage, complex_has_green_mortgage
-                FROM excel_properties
+                       complex_building_has_green_mortgage, complex_has_green_mortgage,
+                       {PHOTO_COLUMNS_SQL}
+                FROM excel_properties ep
+                LEFT JOIN property_photos pp ON pp.inner_id = ep.inner_id
             """))
             
             excel_properties = result.fetchall()
@@ -1655,42 +1639,8 @@ def properties():
             print(f"Error loading excel properties: {e}")
             return render_template('error.html', error="Ошибка загрузки данных объектов")
         
-        # ✅ ИСПРАВЛЕНО: Поддержка всех форматов параметров цены
-        filters = {}
-        filters['price_min'] = request.args.get('price_min', request.args.get('priceFrom', request.args.get('price_from', '')))
-        filters['price_max'] = request.args.get('price_max', request.args.get('priceTo', request.args.get('price_to', '')))
-        # Обработка комнат (может прийти как "1,2,3" или как список)
-        rooms_param = request.args.get('rooms', '')
-        if rooms_param:
-            filters['rooms'] = rooms_param.split(',') if ',' in rooms_param else [rooms_param]
-        else:
-            filters['rooms'] = request.args.getlist('rooms') or []
-        filters['districts'] = request.args.getlist('districts') or []  # Добавляем поддержку районов
-        filters['developers'] = request.args.getlist('developers') or []  # Добавляем поддержку застройщиков
-        filters['completion'] = request.args.getlist('completion') or []  # Добавляем поддержку лет сдачи
-        filters['developer'] = request.args.get('developer', '')
-        filters['district'] = request.args.get('district', '')  # Добавляем район
-        filters['residential_complex'] = request.args.get('residential_complex', '')
-        filters['building'] = request.args.get('building', '')  # Добавляем поддержку фильтра по зданию/корпусу
-        
-        # Расширенные фильтры из секции "Еще"
-        filters['area_min'] = request.args.get('area_from', request.args.get('areaFrom', ''))
-        filters['area_max'] = request.args.get('area_to', request.args.get('areaTo', ''))
-        filters['floor_min'] = request.args.get('floor_from', request.args.get('floorFrom', ''))
-        filters['floor_max'] = request.args.get('floor_to', request.args.get('floorTo', ''))
-        filters['building_types'] = request.args.getlist('building_types') or []
-        filters['delivery_years'] = request.args.getlist('delivery_years') or []
-        filters['features'] = request.args.getlist('features') or []
-        filters['object_classes'] = request.args.getlist('object_classes') or []
-        
-        # Региональные фильтры
-        filters['regions'] = request.args.getlist('regions') or []
-        filters['cities'] = request.args.getlist('cities') or []
-        filters['region'] = request.args.get('region', '')
-        filters['city'] = request.args.get('city', '')
-        
-        # Поисковый запрос
-        filters['search'] = request.args.get('search', '')
+        # ✅ ИСПРАВЛЕНО: Поддержка всех форматов параметров цены (тот же словарь, что у выгрузки)
+        filters = property_filters_from_args(request.args)
         
         # Filters applied
         
@@ -1707,7 +1657,7 @@ def properties():
         for row in excel_properties:
             try:
                 # Get data from SQL row tuple with all fields
-                inner_id, price, area, rooms, min_floor, max_floor, address, renovation, min_rate, square_price, mortgage_price, class_type, photos, developer_name, complex_name, complex_end_year, complex_end_quarter, building_end_year, building_end_quarter, lat, lon, description, district_name, building_name, parsed_city, parsed_region, renovation_type, placement_type, deal_type, building_accreditation, building_green_mortgage, complex_green_mortgage = row
+                inner_id, price, area, rooms, min_floor, max_floor, address, renovation, min_rate, square_price, mortgage_price, class_type, photos, developer_name, complex_name, complex_end_year, complex_end_quarter, building_end_year, building_end_quarter, lat, lon, description, district_name, building_name, parsed_city, parsed_region, renovation_type, placement_type, deal_type, building_accreditation, building_green_mortgage, complex_green_mortgage = row[:32]
                 
                 price = price or 0
                 area = area or 0
@@ -2040,22 +1990,8 @@ def properties():
                     if not search_match:
                         continue
                 
-                # Обработка фотографий из PostgreSQL array format {url1,url2,url3}
-                images = []
-                if photos:
-                    try:
-                        # Убираем фигурные скобки и разделяем по запятым
-                        if photos.startswith('{') and photos.endswith('}'):
-                            photos_clean = photos[1:-1]  # убираем { и }
-                            if photos_clean:
-                                images = [url.strip() for url in photos_clean.split(',')]
-                        else:
-                            # Если это JSON формат, пробуем парсить как JSON
-                            import json
-                            photos_list = json.loads(photos)
-                            images = photos_list if photos_list else []
-                    except:
-                        images = []
+                # Фото уже разобраны при импорте (property_photos)
+                images = photo_set(row._mapping)['gallery']
                 
                 # Create title with detailed floor info
                 if rooms == 0:
@@ -2209,64 +2145,8 @@ def properties():
             # No manager auth
             pass
         
-        # Load data for filters
-        developers = [d.name for d in Developer.query.all()]
-        
-        # Загружаем ЖК с фотографиями из Excel
-        complexes_query = db.session.execute(text("""
-            SELECT 
-                complex_name,
-                COUNT(*) as apartments_count,
-                MIN(price) as price_from,
-                MAX(price) as price_to,
-                MAX(developer_name) as developer_name
-            FROM excel_properties 
-            GROUP BY complex_name
-            ORDER BY complex_name
-            LIMIT 11
-        """))
-        
-        residential_complexes_with_photos = []
-        for idx, row in enumerate(complexes_query.fetchall()):
-            complex_dict = {
-                'id': idx + 1,
-                'name': row[0],
-                'available_apartments': row[1],
-                'price_from': row[2] or 0,
-                'price_to': row[3] or 0,
-                'district': 'Краснодарский край',
-                'developer': row[4] or 'Не указан'
-            }
-            
-            # Загружаем фото ЖК из самой дорогой квартиры (как репрезентативное для ЖК)
-            photos_query = db.session.execute(text("""
-                SELECT photos FROM excel_properties 
-                WHERE complex_name = :complex_name 
-                AND photos IS NOT NULL 
-                ORDER BY price DESC, object_area DESC
-                LIMIT 1
-            """), {'complex_name': complex_dict['name']})
-            
-            photos_row = photos_query.fetchone()
-            if photos_row and photos_row[0]:
-                try:
-                    import json
-                    photos_list = json.loads(photos_row[0])
-                    # Пропускаем первые фото (интерьеры квартир) и берем фото ЖК
-                    start_index = min(len(photos_list) // 4, 5) if len(photos_list) > 8 else 1
-                    complex_dict['image'] = photos_list[start_index] if len(photos_list) > start_index else photos_list[0]
-                    # Для слайдера берем фото ЖК (пропускаем первые интерьеры)
-                    complex_dict['images'] = photos_list[start_index:] if len(photos_list) > start_index else photos_list
-                except:
-                    complex_dict['image'] = 'https://via.placeholder.com/400x300/0088CC/FFFFFF?text=' + complex_dict['name']
-                    complex_dict['images'] = []
-            else:
-                complex_dict['image'] = 'https://via.placeholder.com/400x300/0088CC/FFFFFF?text=' + complex_dict['name']
-                complex_dict['images'] = []
-            
-            residential_complexes_with_photos.append(complex_dict)
-        
-        # Complexes loaded with photos
+        # Счетчики для фильтров — из битовых масок над снимком, без запросов
+        facets = property_facet_counts(request.args)
         
         # Rendering template
         
@@ -2274,9 +2154,7 @@ def properties():
                              properties=properties_page,  # Объекты для текущей страницы
                              pagination=pagination,  # Информация о пагинации
                              filters=filters,
-                             developers=developers,
-                             districts=[],  # TODO: implement districts
-                             residential_complexes=residential_complexes_with_photos,
+                             facets=facets,
                              results_text=results_text,  # ✅ Правильный текст результатов 
                              total_properties=total_properties,  # ✅ Общее количество найденных
                              current_sort=sort_type,  # Текущая сортировка
@@ -2296,8 +2174,8 @@ def property_detail(property_id):
     try:
         # Get property from excel_properties table
         from sqlalchemy import text
-        result = db.session.execute(text("""
-            SELECT inner_id, price, object_area, object_rooms, object_min_floor, object_max_floor,
+        result = db.session.execute(text(f"""
+            SELECT ep.inner_id, price, object_area, object_rooms, object_min_floor, object_max_floor,
                    address_display_name, renovation_display_name, min_rate, square_price, 
                    mortgage_price, complex_object_class_display_name, photos,
                    developer_name, complex_name, complex_end_build_year, complex_end_build_quarter,
@@ -2307,9 +2185,11 @@ def property_detail(property_id):
                    complex_sales_address, complex_sales_phone, complex_with_renovation,
                    complex_has_accreditation, complex_has_green_mortgage, complex_has_mortgage_subsidy,
                    trade_in, deal_type, object_is_apartment, published_dt, placement_type,
-                   complex_building_name, complex_building_released, complex_id
-            FROM excel_properties 
-            WHERE inner_id = :property_id
+                   complex_building_name, complex_building_released, complex_id,
+                   {PHOTO_COLUMNS_SQL}
+            FROM excel_properties ep
+            LEFT JOIN property_photos pp ON pp.inner_id = ep.inner_id
+            WHERE ep.inner_id = :property_id
         """), {"property_id": property_id})
         
         row = result.fetchone()
@@ -2318,22 +2198,10 @@ def property_detail(property_id):
             return redirect(url_for('properties'))
         
         # Parse row data - добавляем все новые поля включая complex_id
-        inner_id, price, area, rooms, min_floor, max_floor, address, renovation, min_rate, square_price, mortgage_price, class_type, photos, developer_name, complex_name, complex_end_year, complex_end_quarter, building_end_year, building_end_quarter, lat, lon, description, locality_name, short_address, sales_address, sales_phone, with_renovation, has_accreditation, has_green_mortgage, has_mortgage_subsidy, trade_in, deal_type, is_apartment, published_dt, placement_type, building_name, building_released, complex_id = row
+        inner_id, price, area, rooms, min_floor, max_floor, address, renovation, min_rate, square_price, mortgage_price, class_type, photos, developer_name, complex_name, complex_end_year, complex_end_quarter, building_end_year, building_end_quarter, lat, lon, description, locality_name, short_address, sales_address, sales_phone, with_renovation, has_accreditation, has_green_mortgage, has_mortgage_subsidy, trade_in, deal_type, is_apartment, published_dt, placement_type, building_name, building_released, complex_id = row[:38]
         
-        # Parse photos
-        images = []
-        if photos:
-            try:
-                if photos.startswith('{') and photos.endswith('}'):
-                    photos_clean = photos[1:-1]
-                    if photos_clean:
-                        images = [url.strip() for url in photos_clean.split(',')]
-                else:
-                    import json
-                    photos_list = json.loads(photos)
-                    images = photos_list if photos_list else []
-            except:
-                images = []
+        # Фото уже разобраны при импорте (property_photos)
+        images = photo_set(row._mapping)['gallery']
         
         # Create completion date
         completion_date = 'Уточняется'
@@ -2512,17 +2380,7 @@ def property_detail(property_id):
                 # Парсим фотографии
                 apt_images = []
                 if apt_photos:
-                    try:
-                        if apt_photos.startswith('{') and apt_photos.endswith('}'):
-                            photos_clean = apt_photos[1:-1]
-                            if photos_clean:
-                                apt_images = [url.strip() for url in photos_clean.split(',')]
-                        else:
-                            import json
-                            photos_list = json.loads(apt_photos)
-                            apt_images = photos_list if photos_list else []
-                    except:
-                        apt_images = []
+                    apt_images = normalize_photos(apt_photos)['gallery']
                 
                 # Формируем тип комнат
                 room_type = f"{apt_rooms}-комн" if apt_rooms > 0 else "Студия"
@@ -2593,6 +2451,27 @@ def create_slug(name):
     
     return slug.lower().strip('-')
 
+COMPLEX_PAGE_INDEX_KEY = 'complex_page_index'
+COMPLEX_PAGE_INDEX_TIMEOUT = 300
+
+
+def get_complex_page_index(reload=False):
+    """(версия, индекс slug/id/название -> страница ЖК), одно чтение кэша"""
+    cached = None if reload else cache.get(COMPLEX_PAGE_INDEX_KEY)
+    if cached is None:
+        cached = (complex_pages_version(db.session), complex_page_index(db.session))
+        cache.set(COMPLEX_PAGE_INDEX_KEY, cached, timeout=COMPLEX_PAGE_INDEX_TIMEOUT)
+    return cached
+
+
+def refresh_complex_page_cache(names=None):
+    """Пересобрать страницы ЖК (все или только names), закоммитить и сбросить индекс"""
+    pages = refresh_complex_pages(db.session, create_slug, names=names)
+    db.session.commit()
+    cache.delete(COMPLEX_PAGE_INDEX_KEY)
+    return pages
+
+
 @app.route('/residential_complex/<int:complex_id>')
 @app.route('/residential-complex/<int:complex_id>')  # Support both formats
 @app.route('/residential-complex/<complex_name>')  # Support name-based routing
@@ -2600,505 +2479,21 @@ def create_slug(name):
 def residential_complex_detail(complex_id=None, complex_name=None, slug=None):
     """Individual residential complex page"""
     try:
-        # Загружаем данные ЖК из базы данных - поддержка поиска по имени, ID и slug
-        if slug:
-            # Поиск по slug - ищем ЖК, чей slug соответствует переданному
-            complexes_query = db.session.execute(text("""
-                SELECT rc.*
-                FROM residential_complexes rc
-            """))
-            complex_row = None
-            for row in complexes_query.fetchall():
-                if create_slug(row.name) == slug:
-                    complex_row = row
-                    break
-            # Если не найден в таблице, пробуем найти в Excel
-            if not complex_row:
-                excel_complexes = db.session.execute(text("""
-                    SELECT DISTINCT complex_name
-                    FROM excel_properties
-                """)).fetchall()
-                for excel_row in excel_complexes:
-                    if create_slug(excel_row[0]) == slug:
-                        complex_name = excel_row[0]
-                        break
-        elif complex_name:
-            complex_query = db.session.execute(text("""
-                SELECT rc.*
-                FROM residential_complexes rc
-                WHERE rc.name = :complex_name
-            """), {'complex_name': complex_name})
-            complex_row = complex_query.fetchone()
-        elif complex_id:
-            complex_query = db.session.execute(text("""
-                SELECT rc.*
-                FROM residential_complexes rc
-                WHERE rc.complex_id = :complex_id_str OR rc.id = :complex_id
-            """), {'complex_id': complex_id, 'complex_id_str': str(complex_id)})
-            complex_row = complex_query.fetchone()
-        else:
-            complex_row = None
-        if not complex_row:
+        # Страница ЖК собрана после импорта: поиск по индексу и один запрос
+        def find_page(index):
+            page_id = resolve_complex_page(index, complex_id=complex_id, complex_name=complex_name, slug=slug)
+            return load_complex_page(db.session, page_id, complex_id=complex_id) if page_id else None
+        
+        version, index = get_complex_page_index()
+        page = find_page(index)
+        if not page and complex_pages_version(db.session) != version:
+            # Страницы пересобраны другим процессом (импорт, rebuild_complex_pages.py): индекс устарел
+            page = find_page(get_complex_page_index(reload=True)[1])
+        if not page:
             print(f"Complex {complex_id or complex_name or slug} not found in database")
-            # Создаем заглушку на основе Excel данных
-            if complex_name:
-                excel_query = db.session.execute(text("""
-                    SELECT complex_name, COUNT(*) as apartments_count
-                    FROM excel_properties 
-                    WHERE complex_name = :complex_name
-                    GROUP BY complex_name
-                """), {'complex_name': complex_name})
-                excel_row = excel_query.fetchone()
-                if excel_row:
-                    complex_data = {
-                        'id': 1,
-                        'name': excel_row[0],
-                        'apartments_count': excel_row[1],
-                        'description': f'ЖК {excel_row[0]} с {excel_row[1]} квартирами'
-                    }
-                else:
-                    return redirect(url_for('properties'))
-            else:
-                return redirect(url_for('properties'))
-        else:
-            # Безопасно конвертируем complex_row в словарь
-            try:
-                complex_data = dict(complex_row._mapping)
-            except (AttributeError, TypeError) as e:
-                print(f"Error converting complex_row to dict: {e}")
-                return redirect(url_for('properties'))
-        
-        # Загружаем реальные данные из Excel для этого ЖК включая количество корпусов
-        excel_data_query = db.session.execute(text("""
-            SELECT 
-                COUNT(*) as total_apartments,
-                MIN(price) as min_price,
-                MAX(price) as max_price,
-                AVG(price) as avg_price,
-                MIN(object_area) as min_area,
-                MAX(object_area) as max_area,
-                MIN(object_min_floor) as min_floor,
-                MAX(object_max_floor) as max_floor_in_complex,
-                MAX(address_short_display_name) as address_display_name,
-                MAX(complex_sales_address) as sales_address,
-                CASE 
-                    WHEN COUNT(DISTINCT complex_building_name) > 0 THEN COUNT(DISTINCT complex_building_name)
-                    ELSE 1 
-                END as buildings_count,
-                MAX(complex_start_build_year) as complex_start_year,
-                MAX(complex_start_build_quarter) as complex_start_quarter,
-                MAX(complex_object_class_display_name) as object_class,
-                bool_or(complex_with_renovation) as with_renovation
-            FROM excel_properties ep
-            WHERE ep.complex_name = :complex_name
-        """), {'complex_name': complex_data['name']})
-        
-        excel_data = excel_data_query.fetchone()
-        if excel_data and excel_data[0]:
-            # Обновляем данные комплекса реальными данными из Excel
-            complex_data['apartments_count'] = excel_data[0]
-            complex_data['price_from'] = int(excel_data[1]) if excel_data[1] else 3000000
-            complex_data['price_to'] = int(excel_data[2]) if excel_data[2] else 15000000
-            complex_data['real_price_from'] = complex_data['price_from']
-            complex_data['real_price_to'] = complex_data['price_to']
-            complex_data['real_area_from'] = excel_data[4] if excel_data[4] else 35
-            complex_data['real_area_to'] = excel_data[5] if excel_data[5] else 135
-            complex_data['real_floors_min'] = excel_data[6] if excel_data[6] else 1
-            complex_data['real_floors_max'] = excel_data[7] if excel_data[7] else 25
-            complex_data['total_floors_in_complex'] = excel_data[7] if excel_data[7] else 25
-            complex_data['full_address'] = excel_data[8] if excel_data[8] else complex_data.get('sales_address', '')
-            complex_data['sales_address'] = excel_data[9] if excel_data[9] else complex_data.get('sales_address', '')
-            # Новые поля
-            complex_data['buildings_count'] = excel_data[10] if excel_data[10] else 1
-            complex_data['complex_start_year'] = excel_data[11] if excel_data[11] else 2020
-            complex_data['complex_start_quarter'] = excel_data[12] if excel_data[12] else 1
-            complex_data['object_class_display_name'] = excel_data[13] if excel_data[13] else 'Комфорт'
-            complex_data['with_renovation'] = excel_data[14] if excel_data[14] else False
-            
-            # Добавляем информацию о застройщике из Excel данных
-            developer_query = db.session.execute(text("""
-                SELECT DISTINCT developer_name 
-                FROM excel_properties 
-                WHERE complex_name = :complex_name 
-                AND developer_name IS NOT NULL
-                LIMIT 1
-            """), {'complex_name': complex_data['name']})
-            
-            developer_row = developer_query.fetchone()
-            if developer_row:
-                complex_data['developer_name'] = developer_row[0]
-                # Developer set
-            else:
-                # No developer found
-                pass
-                
-            # Загружаем координаты для карты
-            coordinates_query = db.session.execute(text("""
-                SELECT address_position_lat, address_position_lon 
-                FROM excel_properties 
-                WHERE complex_name = :complex_name 
-                AND address_position_lat IS NOT NULL 
-                AND address_position_lon IS NOT NULL
-                LIMIT 1
-            """), {'complex_name': complex_data['name']})
-            
-            coordinates_row = coordinates_query.fetchone()
-            if coordinates_row:
-                complex_data['coordinates'] = [coordinates_row[0], coordinates_row[1]]
-                # Coordinates set
-            else:
-                complex_data['coordinates'] = [45.0355, 38.9753]  # Краснодар по умолчанию
-                # Using default coordinates
-            
-            # Загружаем фотографии ЖК из самой дорогой квартиры (как репрезентативные для ЖК)
-            first_apartment_query = db.session.execute(text("""
-                SELECT photos FROM excel_properties 
-                WHERE complex_name = :complex_name 
-                AND photos IS NOT NULL 
-                ORDER BY price DESC, object_area DESC
-                LIMIT 1
-            """), {'complex_name': complex_data['name']})
-            
-            first_apartment = first_apartment_query.fetchone()
-            if first_apartment and first_apartment[0]:
-                try:
-                    photos_raw = first_apartment[0]
-                    # Парсим PostgreSQL array формат {url1,url2,url3}
-                    if photos_raw.startswith('{') and photos_raw.endswith('}'):
-                        photos_clean = photos_raw[1:-1]  # убираем { и }
-                        if photos_clean:
-                            photos_list = [url.strip() for url in photos_clean.split(',')]
-                    else:
-                        # Если это JSON формат, парсим как JSON
-                        import json
-                        photos_list = json.loads(photos_raw)
-                    
-                    # Пропускаем первые фото планировок и берем фото ЖК
-                    start_index = min(len(photos_list) // 4, 5) if len(photos_list) > 8 else 1
-                    complex_images = photos_list[start_index:] if len(photos_list) > start_index else photos_list
-                    complex_data['images'] = complex_images[:10]  # Берем до 10 фото ЖК для слайдера
-                    complex_data['image'] = complex_images[0] if complex_images else photos_list[0]
-                except Exception as e:
-                    print(f"Error parsing photos for complex {complex_data['name']}: {e}")
-                    complex_data['images'] = []
-                    complex_data['image'] = None
-            else:
-                complex_data['images'] = []
-                complex_data['image'] = None
-                
-            print(f"Updated complex data with Excel: {complex_data['apartments_count']} apartments, price from {complex_data['price_from']}, address: {complex_data['full_address']}, photos: {len(complex_data.get('images', []))}")
-        
-        if not complex_data:
-            print(f"Complex {complex_id} not found")
             return redirect(url_for('properties'))
         
-        # Ensure required fields exist
-        if 'price_from' not in complex_data:
-            complex_data['price_from'] = 3000000
-        if 'real_price_from' not in complex_data:
-            complex_data['real_price_from'] = complex_data['price_from']
-        if 'cashback_percent' not in complex_data:
-            complex_data['cashback_percent'] = 3.5
-        
-        # Add developer_id for link functionality
-        if 'developer_id' not in complex_data:
-            developer_mapping = {
-                'ГК «Инвестстройкуб»': 1,
-                'ЖК Девелопмент': 2,
-                'Краснодар Строй': 3,
-                'Южный Дом': 4,
-                'Кубань Девелопмент': 5
-            }
-            developer_name = complex_data.get('developer', '')
-            complex_data['developer_id'] = developer_mapping.get(developer_name, 1)
-        
-        # Загружаем квартиры этого ЖК из Excel данных
-        apartments_query = db.session.execute(text("""
-            SELECT *
-            FROM excel_properties ep
-            WHERE ep.complex_name = :complex_name
-            ORDER BY ep.price ASC
-        """), {'complex_name': complex_data['name']})
-        
-        complex_properties = []
-        for i, prop_row in enumerate(apartments_query):
-            prop_dict = dict(prop_row._mapping)
-            # Добавляем вычисленные поля
-            prop_dict['id'] = prop_dict.get('inner_id', i + 1)  # Используем inner_id из Excel для ссылок
-            prop_dict['cashback_amount'] = int(prop_dict['price'] * 0.035) if prop_dict.get('price') else 0
-            prop_dict['type'] = f"{prop_dict.get('object_rooms', 1)}-комн"
-            prop_dict['residential_complex_id'] = complex_id
-            prop_dict['residential_complex'] = complex_data['name']
-            
-            # Правильно показываем этаж квартиры из общего количества этажей в комплексе
-            apartment_floor = prop_dict.get('object_min_floor', 1)  # Этаж конкретной квартиры
-            total_floors = complex_data.get('total_floors_in_complex', 25)  # Общее количество этажей в комплексе
-            # Правильное отображение типа квартиры
-            rooms = prop_dict.get('object_rooms', 1)
-            if rooms == 0:
-                room_type = "Студия"
-            else:
-                room_type = f"{rooms}-комнатная квартира"
-            prop_dict['title'] = f"{room_type}, {prop_dict.get('object_area', 0)} м², {apartment_floor}/{total_floors} эт."
-            prop_dict['apartment_floor'] = apartment_floor
-            prop_dict['total_floors_in_complex'] = total_floors
-            
-            # Используем реальные фотографии из Excel (PostgreSQL array формат)
-            photos_raw = prop_dict.get('photos', '')
-            try:
-                if photos_raw and photos_raw.startswith('{') and photos_raw.endswith('}'):
-                    # PostgreSQL array формат {url1,url2,url3}
-                    photos_clean = photos_raw[1:-1]  # убираем { и }
-                    if photos_clean:
-                        photos_list = [url.strip() for url in photos_clean.split(',')]
-                else:
-                    # Если это JSON формат, парсим как JSON
-                    import json
-                    photos_list = json.loads(photos_raw) if photos_raw else []
-                
-                prop_dict['image'] = photos_list[0] if photos_list else 'https://via.placeholder.com/400x300/0088CC/FFFFFF?text=Квартира'
-                prop_dict['photos_list'] = photos_list  # Все фото для галереи
-            except Exception as e:
-                print(f"Error parsing photos for apartment {prop_dict.get('inner_id', 'unknown')}: {e}")
-                prop_dict['image'] = 'https://via.placeholder.com/400x300/0088CC/FFFFFF?text=Квартира'
-                prop_dict['photos_list'] = []
-                
-            prop_dict['property_type'] = 'Квартира'
-            complex_properties.append(prop_dict)
-        
-        # Group properties by room count and calculate statistics for each type
-        properties_by_rooms = {}
-        room_stats = {}
-        for prop in complex_properties:
-            rooms = prop.get('object_rooms', 1)
-            # Правильное определение типа квартиры
-            if rooms == 0:
-                room_key = 'Студия'
-                room_type = 'Студия'
-            else:
-                room_key = f'{rooms}-комн'
-                room_type = f'{rooms}-комн'
-            
-            if room_key not in properties_by_rooms:
-                properties_by_rooms[room_key] = []
-                room_stats[room_key] = {
-                    'count': 0,
-                    'prices': [],
-                    'areas': [],
-                    'name': room_type
-                }
-            
-            properties_by_rooms[room_key].append(prop)
-            room_stats[room_key]['count'] += 1
-            if prop.get('price'):
-                room_stats[room_key]['prices'].append(prop['price'])
-            if prop.get('object_area'):
-                room_stats[room_key]['areas'].append(prop['object_area'])
-        
-        # Calculate min/max for each room type
-        for room_key in room_stats:
-            stats = room_stats[room_key]
-            if stats['prices']:
-                stats['price_from'] = min(stats['prices'])
-                stats['price_to'] = max(stats['prices'])
-            else:
-                stats['price_from'] = 0
-                stats['price_to'] = 0
-            
-            if stats['areas']:
-                stats['area_from'] = min(stats['areas'])
-                stats['area_to'] = max(stats['areas'])
-            else:
-                stats['area_from'] = 0
-                stats['area_to'] = 0
-        
-        complex_data['room_stats'] = room_stats
-        
-        # Группировка квартир по корпусам/литерам с сортировкой
-        properties_by_building_unsorted = {}
-        for prop in complex_properties:
-            building_name = prop.get('complex_building_name', 'Основной корпус')
-            if building_name not in properties_by_building_unsorted:
-                properties_by_building_unsorted[building_name] = []
-            properties_by_building_unsorted[building_name].append(prop)
-        
-        # Сортируем корпуса по числовому порядку
-        def sort_buildings(building_name):
-            import re
-            # Проверяем на None или пустую строку
-            if not building_name:
-                return 999  # None/пустые в конце
-            # Ищем числа в названии корпуса
-            match = re.search(r'([0-9]+)', str(building_name))
-            if match:
-                return int(match.group(1))
-            else:
-                return 999  # Остальные в конце
-        
-        # Создаем отсортированный словарь корпусов
-        properties_by_building = {}
-        sorted_building_names = sorted(properties_by_building_unsorted.keys(), key=sort_buildings)
-        for building_name in sorted_building_names:
-            properties_by_building[building_name] = properties_by_building_unsorted[building_name]
-        
-        # Загружаем данные о корпусах из Excel с максимумом информации
-        buildings_data = {}
-        try:
-            # Получаем расширенные данные о корпусах из Excel с автоматическим статусом
-            buildings_query = db.session.execute(text("""
-                SELECT 
-                    ep.complex_building_name as building_name,
-                    ep.complex_building_end_build_year as end_build_year,
-                    ep.complex_building_end_build_quarter as end_build_quarter,
-                    ep.complex_start_build_year as start_build_year,  
-                    ep.complex_start_build_quarter as start_build_quarter,
-                    ep.complex_object_class_display_name as object_class,
-                    COUNT(*) as total_apartments,
-                    MAX(ep.complex_building_end_build_year) as max_end_build_year,
-                    MAX(ep.complex_building_end_build_quarter) as max_end_build_quarter,
-                    MAX(ep.object_max_floor) as total_floors,
-                    999 as sort_order
-                FROM excel_properties ep
-                WHERE ep.complex_name = :complex_name 
-                AND ep.complex_building_name IS NOT NULL
-                GROUP BY ep.complex_building_name, ep.complex_building_end_build_year, 
-                         ep.complex_building_end_build_quarter, ep.complex_start_build_year,
-                         ep.complex_start_build_quarter, ep.complex_object_class_display_name
-                ORDER BY sort_order, ep.complex_building_name
-            """), {
-                'complex_name': complex_data.get('name', '')
-            })
-            
-            # Получаем текущую дату в Python для кросс-платформенности
-            from datetime import datetime
-            import re
-            current_date = datetime.now()
-            current_year = current_date.year
-            current_quarter = (current_date.month - 1) // 3 + 1
-            
-            # Сначала собираем все данные
-            buildings_list = []
-            for building_row in buildings_query:
-                building_dict = dict(building_row._mapping)
-                
-                # Вычисляем статус корпуса в Python 
-                end_year = building_dict.get('max_end_build_year')
-                end_quarter = building_dict.get('max_end_build_quarter')
-                
-                if end_year and end_quarter:
-                    if (end_year < current_year or 
-                        (end_year == current_year and end_quarter <= current_quarter)):
-                        building_dict['building_status'] = 'Сдан'
-                    else:
-                        building_dict['building_status'] = 'Строится'
-                    # Добавляем данные в правильном формате для шаблона
-                    building_dict['end_build_year'] = end_year
-                    building_dict['end_build_quarter'] = end_quarter
-                else:
-                    building_dict['building_status'] = 'Не указан'
-                
-                # Вычисляем sort_order в Python (кросс-платформенно)
-                building_name = building_dict.get('building_name', '')
-                match = re.search(r'([0-9]+)', building_name)
-                if match:
-                    building_dict['sort_order'] = int(match.group(1))
-                else:
-                    building_dict['sort_order'] = 999
-                    
-                buildings_list.append(building_dict)
-            
-            # Сортируем по sort_order в Python
-            buildings_list.sort(key=lambda x: (x['sort_order'], x.get('building_name', '')))
-            
-            # Создаем итоговый словарь
-            for building_dict in buildings_list:
-                buildings_data[building_dict['building_name']] = building_dict
-            
-            print(f"Loaded {len(buildings_data)} buildings for complex {complex_data.get('name')}")
-        except Exception as e:
-            print(f"Error loading buildings data: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        complex_data['buildings'] = buildings_data
-        
-        # Добавляем текущую дату для определения статуса корпусов
-        from datetime import datetime
-        current_date = datetime.now()
-        complex_data['current_year'] = current_date.year
-        complex_data['current_quarter'] = (current_date.month - 1) // 3 + 1
-        
-        # Найти похожие ЖК - упрощенная версия без сложных запросов
-        similar_complexes = []
-        try:
-            # Простой запрос для получения 3 других ЖК
-            current_complex_name = complex_data.get('name', '')
-            
-            with db.engine.connect() as connection:
-                # Используем отдельное соединение для избежания проблем с транзакциями
-                result = connection.execute(text("""
-                    SELECT DISTINCT 
-                        ep.complex_name,
-                        rc.id,
-                        MIN(ep.price) as price_from,
-                        MAX(ep.price) as price_to,
-                        COUNT(*) as apartments_count,
-                        MAX(ep.developer_name) as developer_name,
-                        MAX(ep.address_short_display_name) as location,
-                        MAX(ep.photos) as photos
-                    FROM excel_properties ep
-                    LEFT JOIN residential_complexes rc ON rc.name = ep.complex_name
-                    WHERE ep.complex_name != :current_complex_name
-                    AND ep.price IS NOT NULL
-                    GROUP BY ep.complex_name, rc.id
-                    ORDER BY MIN(ep.price) ASC
-                    LIMIT 3
-                """), {'current_complex_name': current_complex_name})
-                
-                for row in result.fetchall():
-                    # Парсим фото
-                    image_url = 'https://via.placeholder.com/300x200'
-                    if row[7]:  # photos field
-                        try:
-                            import json
-                            photos_raw = row[7]
-                            # Фото хранятся в JSON формате
-                            photos_list = json.loads(photos_raw)
-                            if photos_list:
-                                # Пропускаем первые фото (интерьеры) и берем фото ЖК
-                                start_index = min(len(photos_list) // 4, 5) if len(photos_list) > 8 else 1
-                                image_url = photos_list[start_index] if len(photos_list) > start_index else photos_list[0]
-                        except:
-                            pass
-                    
-                    similar_complex = {
-                        'id': row[1] or 999,
-                        'name': row[0],
-                        'price_from': int(row[2]) if row[2] else 0,
-                        'price_to': int(row[3]) if row[3] else 0,
-                        'apartments_count': row[4],
-                        'developer': row[5] or 'Не указан',
-                        'location': row[6] or 'Адрес не указан',
-                        'image': image_url,
-                        'completion_date': '2025 г.',
-                        'cashback_percent': 5.0,
-                        'url': f'/residential-complex/{row[1]}' if row[1] else '#'
-                    }
-                    similar_complexes.append(similar_complex)
-                    
-        except Exception as e:
-            print(f"Error finding similar complexes: {e}")
-            # Если все упало, просто оставляем пустой список
-            similar_complexes = []
-        
-        print(f"Found {len(similar_complexes)} similar complexes for {complex_data.get('name', 'Unknown')}")
-        print(f"Rendering complex {complex_id}: {complex_data.get('name', 'Unknown')}")
-        return render_template('residential_complex_detail.html', 
-                             complex=complex_data,
-                             properties=complex_properties,
-                             properties_by_rooms=properties_by_rooms,
-                             properties_by_building=properties_by_building,
-                             similar_complexes=similar_complexes)
+        return render_template('residential_complex_detail.html', **page)
                              
     except Exception as e:
         print(f"ERROR in complex detail route: {e}")
@@ -3123,7 +2518,12 @@ def developer_detail(developer_id):
         
         if not developer:
             return "Застройщик не найден", 404
-        
+
+        # Застройщик есть в базе — та же страница, что и /developer/<slug>, из профиля
+        page = developer_profile(db.session, name=developer['name'])
+        if page:
+            return render_template('developer_detail.html', **page)
+
         # Add missing template fields for new developers
         if 'total_apartments_sold' not in developer:
             developer['total_apartments_sold'] = 150
@@ -3165,7 +2565,7 @@ def developer_detail(developer_id):
 
 def generate_qr_code(url):
     """Generate QR code for given URL and return as base64 string"""
-    try:
+    def build_png():
         # Create QR code instance
         qr = qrcode.QRCode(
             version=1,
@@ -3181,16 +2581,49 @@ def generate_qr_code(url):
         # Create image
         qr_image = qr.make_image(fill_color="black", back_color="white")
         
-        # Convert to base64
         buffer = io.BytesIO()
         qr_image.save(buffer, format='PNG')
-        qr_base64 = base64.b64encode(buffer.getvalue()).decode()
+        return buffer.getvalue()
+    
+    try:
+        # QR код детерминирован для URL — берем готовый PNG из кэша
+        png = asset_cache.get_or_create('qr', asset_cache.make_key('qr-v1', url), build_png)
+        
+        # Convert to base64
+        qr_base64 = base64.b64encode(png).decode()
         
         return qr_base64
     except Exception as e:
         print(f"Error generating QR code: {e}")
         return None
 
+@app.route('/img/<string:image_hash>/<string:size>')
+def proxied_image(image_hash, size):
+    """Уменьшенная копия внешнего фото (WebP/JPEG) из дискового кэша"""
+    from image_proxy import IMAGE_SIZES
+    
+    if size not in IMAGE_SIZES or not re.fullmatch(r'[0-9a-f]{32}', image_hash):
+        abort(404)
+    
+    src = image_proxy.source_url(image_hash)
+    if not src:
+        abort(404)
+    
+    fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+    try:
+        data = image_proxy.get_variant(image_hash, size, fmt)
+    except Exception as e:
+        print(f"Error building image variant {image_hash}/{size}: {e}")
+        # Исходник недоступен или битый — отдаем браузеру оригинальную ссылку
+        return redirect(src)
+    
+    response = make_response(data)
+    response.headers['Content-Type'] = f'image/{fmt}'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept'
+    response.set_etag(f"{image_hash}-{size}-{fmt}")
+    return response.make_conditional(request)
+
 @app.route('/object/<int:property_id>/pdf')
 def property_pdf(property_id):
     """Property PDF card page with QR code"""
@@ -3227,13 +2660,22 @@ def property_pdf(property_id):
         'title': 'InBack.ru - Кэшбек при покупке недвижимости'
     }
     
-    return render_template('property_pdf.html', 
-                         property=property_data,
-                         presentation=presentation,
-                         cashback=cashback,
-                         current_date=current_date,
-                         qr_code=qr_code_base64,
-                         object_url=object_url)
+    # Карточка полностью определяется данными объекта и версией шаблона
+    cache_key = asset_cache.make_key(
+        asset_cache.template_version('property_pdf.html'),
+        property_data, presentation, cashback, current_date, object_url
+    )
+    html_content = asset_cache.get_or_create('property-card', cache_key, lambda: render_template(
+        'property_pdf.html',
+        property=property_data,
+        presentation=presentation,
+        cashback=cashback,
+        current_date=current_date,
+        qr_code=qr_code_base64,
+        object_url=object_url
+    ).encode('utf-8'))
+    
+    return html_content.decode('utf-8')
 
 @app.route('/about')
 def about():
@@ -3314,13 +2756,13 @@ def blog():
     # Применяем фильтры
     filtered_articles = all_articles.copy()
     
-    # Поиск по тексту
+    # Поиск по тексту (индекс blog_search)
     if search_query:
+        found = set(blog_search.matching_keys(search_query))
+        sources = {'BlogPost': 'post', 'BlogArticle': 'article'}
         filtered_articles = [
             article for article in filtered_articles
-            if search_query.lower() in article['title'].lower() or 
-               search_query.lower() in (article['excerpt'] or '').lower() or
-               search_query.lower() in (article['content'] or '').lower()
+            if (sources[article['source']], article['id']) in found
         ]
     
     # Фильтр по категории
@@ -3508,7 +2950,7 @@ def street_detail(street_name):
                     'lng': 38.9760
                 }
                 
-            app.logger.debug(f"Found street in database: {street['name']} with coordinates: {coordinates}")
+            app.logger.debug("Found street in database: %s with coordinates: %s", street['name'], coordinates)
             
             # Загружаем данные о свойствах для этой улицы (если есть)
             properties_on_street = []
@@ -3539,7 +2981,7 @@ def street_detail(street_name):
             street = None
             
             # Логируем для отладки
-            app.logger.debug(f"Looking for street: {street_name} -> {street_name_decoded}")
+            app.logger.debug("Looking for street: %s -> %s", street_name, street_name_decoded)
         
         # Функция транслитерации для поиска старых URL
         def translit_to_latin(text):
@@ -3573,7 +3015,7 @@ def street_detail(street_name):
                 s['name'].lower() == street_name_decoded.lower() or
                 s['name'].lower().replace(' ул.', '').replace(' ул', '') == street_name_decoded.lower().replace(' ул.', '').replace(' ул', '')):
                 street = s
-                app.logger.debug(f"Found street: {s['name']} with slug: {street_slug_generated}, translit: {translit_slug}")
+                app.logger.debug("Found street: %s with slug: %s, translit: %s", s['name'], street_slug_generated, translit_slug)
                 break
         
         if not street:
@@ -3586,7 +3028,7 @@ def street_detail(street_name):
                     street_db_clean in street_name_clean or
                     street_name_decoded.lower() in s['name'].lower()):
                     street = s
-                    app.logger.debug(f"Found street by partial match: {s['name']}")
+                    app.logger.debug("Found street by partial match: %s", s['name'])
                     break
         
         if not street:
@@ -3780,27 +3222,13 @@ def api_complex_detail(complex_id):
         # Parse photos if available - start from 2nd photo as requested  
         image_url = '/static/images/no-image.jpg'
         photos_list = []
-        if apartments_data and apartments_data[5]:  # photos field
-            try:
-                photos_raw = apartments_data[5]
-                if photos_raw.startswith('[') and photos_raw.endswith(']'):
-                    import json
-                    photos_list = json.loads(photos_raw)
-                    # Use 2nd photo as main image (index 1), fallback to 1st if only one
-                    if len(photos_list) > 1:
-                        image_url = photos_list[1]  # Start from 2nd photo as requested
-                    elif len(photos_list) > 0:
-                        image_url = photos_list[0]  # Fallback to first if only one exists
-                elif photos_raw.startswith('{') and photos_raw.endswith('}'):
-                    photos_clean = photos_raw[1:-1]
-                    if photos_clean:
-                        photos_list = [url.strip() for url in photos_clean.split(',')]
-                        if len(photos_list) > 1:
-                            image_url = photos_list[1]  # Start from 2nd photo
-                        elif len(photos_list) > 0:
-                            image_url = photos_list[0]
-            except Exception as e:
-                print(f"Error parsing photos for complex {complex_name}: {e}")
+        if apartments_data:  # photos field
+            photos_list = normalize_photos(apartments_data[5])['gallery']
+            # Use 2nd photo as main image (index 1), fallback to 1st if only one
+            if len(photos_list) > 1:
+                image_url = photos_list[1]  # Start from 2nd photo as requested
+            elif len(photos_list) > 0:
+                image_url = photos_list[0]  # Fallback to first if only one exists
         
         # Convert to dictionary with all necessary fields for comparison
         complex_data = {
@@ -4105,13 +3533,12 @@ def api_apply_cashback():
         
         db.session.add(cashback_app)
         
-        # Record user activity
-        UserActivity.record_activity(
+        # Record user activity (buffered)
+        UserActivity.log_activity(
             user_id=current_user.id,
-            action_type='cashback_application',
-            description=f'Подана заявка на кешбек {int(cashback_amount):,} ₽ по объекту в {complex_name}'.replace(',', ' '),
-            item_type='cashback',
-            item_id=str(complex_id) if complex_id else None
+            activity_type='cashback_application',
+            description=f'Подана заявка на кешбек {int(cashback_amount):,} ₽ по объекту в {complex_name}'.replace(',', ' ')[:200],
+            extra_data={'item_type': 'cashback', 'item_id': str(complex_id) if complex_id else None}
         )
         
         # Create callback request for manager
@@ -4676,19 +4103,9 @@ def residential_complexes():
                 """), {'complex_name': complex_dict['name']})
                 
                 photos_row = photos_query.fetchone()
-                if photos_row and photos_row[0]:
+                photos_list = normalize_photos(photos_row[0])['gallery'] if photos_row else []
+                if photos_list:
                     try:
-                        photos_raw = photos_row[0]
-                        # Парсим PostgreSQL array формат {url1,url2,url3}
-                        if photos_raw.startswith('{') and photos_raw.endswith('}'):
-                            photos_clean = photos_raw[1:-1]  # убираем { и }
-                            if photos_clean:
-                                photos_list = [url.strip() for url in photos_clean.split(',')]
-                        else:
-                            # Если это JSON формат, парсим как JSON
-                            import json
-                            photos_list = json.loads(photos_raw)
-                        
                         # Пропускаем первые фото (интерьеры квартир) и берем фото ЖК
                         start_index = min(len(photos_list) // 4, 5) if len(photos_list) > 8 else 1
                         complex_dict['image'] = photos_list[start_index] if len(photos_list) > start_index else photos_list[0]
@@ -4806,8 +4223,10 @@ def map_view():
     
     try:
         # Загружаем реальные объекты из Excel данных
-        properties_query = db.session.execute(text("""
-            SELECT * FROM excel_properties 
+        properties_query = db.session.execute(text(f"""
+            SELECT ep.*, {PHOTO_COLUMNS_SQL}
+            FROM excel_properties ep
+            LEFT JOIN property_photos pp ON pp.inner_id = ep.inner_id
             WHERE address_position_lat IS NOT NULL AND address_position_lon IS NOT NULL
             ORDER BY price ASC
         """))
@@ -4852,24 +4271,15 @@ def map_view():
                 'complex_building_end_build_quarter': prop_dict.get('complex_building_end_build_quarter', None)
             }
             
-            # Парсим фотографии для превью (PostgreSQL array формат)
-            photos_raw = prop_dict.get('photos', '')
-            try:
-                if photos_raw and photos_raw.startswith('{') and photos_raw.endswith('}'):
-                    photos_clean = photos_raw[1:-1]  # убираем { и }
-                    if photos_clean:
-                        photos_list = [url.strip() for url in photos_clean.split(',') if url.strip()]
-                        property_data['main_image'] = photos_list[0] if photos_list else 'https://via.placeholder.com/400x300'
-                        # Photos parsed
-                    else:
-                        property_data['main_image'] = 'https://via.placeholder.com/400x300'
-                elif photos_raw:
-                    property_data['main_image'] = photos_raw
-                else:
-                    property_data['main_image'] = 'https://via.placeholder.com/400x300'
-            except Exception as e:
-                print(f"ERROR MAP: Failed to parse photos for {prop_dict.get('inner_id', 'unknown')}: {e}")
-                property_data['main_image'] = 'https://via.placeholder.com/400x300'
+            # Фото для превью уже разобраны при импорте (property_photos)
+            photos = photo_set(prop_dict)
+            property_data['main_image'] = photos['main_image'] or 'https://via.placeholder.com/400x300'
+            property_data['gallery'] = photos['gallery']
+            
+            # Уменьшенная копия для карточки на карте вместо полноразмерного фото
+            thumbnail = image_proxy.url(property_data['main_image'], 'thumb')
+            if thumbnail != property_data['main_image']:
+                property_data['thumbnail'] = thumbnail
             
             properties.append(property_data)
         
@@ -4935,43 +4345,21 @@ def map_view():
 
 def extract_main_image_from_photos(photos_raw):
     """Извлекает основное изображение из поля photos, предпочитая внешние виды зданий"""
-    if not photos_raw or not photos_raw.strip():
-        return '/static/images/no-photo.jpg'
+    photos = photos_raw if isinstance(photos_raw, dict) else normalize_photos(photos_raw)
     
-    try:
-        import json
-        # Попробуем парсить как JSON массив
-        if photos_raw.startswith('[') and photos_raw.endswith(']'):
-            images = json.loads(photos_raw)
-            if not images:
-                return '/static/images/no-photo.jpg'
-            
-            # Фильтруем изображения, предпочитая внешние виды
-            # Берем последние изображения, так как первые часто планировки
-            if len(images) > 5:
-                # Берем из середины/конца массива, где обычно фото зданий
-                return images[len(images)//2]
-            elif len(images) > 2:
-                return images[-1]  # Последнее фото
-            else:
-                return images[0]
-        
-        # PostgreSQL array format: {url1,url2,url3}
-        elif photos_raw.startswith('{') and photos_raw.endswith('}'):
-            images_str = photos_raw[1:-1]  # Remove braces
-            if images_str:
-                images = [img.strip().strip('"') for img in images_str.split(',') if img.strip()]
-                return images[0] if images else '/static/images/no-photo.jpg'
-            else:
-                return '/static/images/no-photo.jpg'
-        
-        # Одиночная ссылка
-        else:
-            return photos_raw
-            
-    except (json.JSONDecodeError, IndexError) as e:
-        print(f"Error parsing photos: {e}, raw data: {photos_raw[:100]}")
+    # Фото ЖК — лучшая обложка, иначе берем из середины/конца галереи квартиры
+    if photos['complex_gallery']:
+        return photos['complex_gallery'][0]
+    
+    images = photos['gallery']
+    if not images:
         return '/static/images/no-photo.jpg'
+    if len(images) > 5:
+        # Берем из середины/конца массива, где обычно фото зданий
+        return images[len(images)//2]
+    elif len(images) > 2:
+        return images[-1]  # Последнее фото
+    return images[0]
 
 @app.route('/complexes-map')
 def complexes_map():
@@ -5059,9 +4447,9 @@ def complexes_map():
         all_developers = sorted(list(set(complex.get('developer', 'Не указан') for complex in residential_complexes)))
         all_statuses = ['Все', 'Сдан', 'Строится']
         
-        print(f"DEBUG: Found {len(residential_complexes)} complexes for map")
+        logger.debug("Found %s complexes for map", len(residential_complexes))
         if residential_complexes:
-            print(f"DEBUG: First complex: {residential_complexes[0]}")
+            logger.debug("First complex: %s", residential_complexes[0])
         
         return render_template('complexes_map.html', 
                              residential_complexes=residential_complexes,
@@ -5081,8 +4469,10 @@ def api_properties():
     """API endpoint for properties from Excel data with real coordinates"""
     try:
         # Загружаем реальные объекты из Excel данных с координатами
-        properties_query = db.session.execute(text("""
-            SELECT * FROM excel_properties 
+        properties_query = db.session.execute(text(f"""
+            SELECT ep.*, {PHOTO_COLUMNS_SQL}
+            FROM excel_properties ep
+            LEFT JOIN property_photos pp ON pp.inner_id = ep.inner_id
             WHERE address_position_lat IS NOT NULL AND address_position_lon IS NOT NULL
             ORDER BY price ASC
         """))
@@ -5119,30 +4509,12 @@ def api_properties():
                 'property_type': 'Квартира'
             }
             
-            # Парсим фотографии (PostgreSQL array формат)
-            photos_raw = prop_dict.get('photos', '')
-            try:
-                if photos_raw and photos_raw.startswith('{') and photos_raw.endswith('}'):
-                    photos_clean = photos_raw[1:-1]  # убираем { и }
-                    if photos_clean:
-                        photos_list = [url.strip() for url in photos_clean.split(',')]
-                        property_data['main_image'] = photos_list[0] if photos_list else 'https://via.placeholder.com/400x300'
-                    else:
-                        property_data['main_image'] = 'https://via.placeholder.com/400x300'
-                elif photos_raw:
-                    # Если это JSON формат, парсим как JSON
-                    import json
-                    photos_list = json.loads(photos_raw)
-                    property_data['main_image'] = photos_list[0] if photos_list else 'https://via.placeholder.com/400x300'
-                else:
-                    property_data['main_image'] = 'https://via.placeholder.com/400x300'
-            except Exception as e:
-                print(f"Error parsing photos for API property {prop_dict.get('inner_id', 'unknown')}: {e}")
-                property_data['main_image'] = 'https://via.placeholder.com/400x300'
+            # Фото уже разобраны при импорте (property_photos)
+            property_data['main_image'] = photo_set(prop_dict)['main_image'] or 'https://via.placeholder.com/400x300'
             
             properties.append(property_data)
         
-        print(f"DEBUG: API returned {len(properties)} properties with real coordinates")
+        logger.debug("API returned %s properties with real coordinates", len(properties))
         return jsonify({
             'properties': properties,
             'total': len(properties),
@@ -5279,6 +4651,28 @@ def download_property_pdf(property_id):
         </html>
         """
         
+        try:
+            import weasyprint
+        except ImportError:
+            weasyprint = None
+        
+        if weasyprint is not None:
+            import hashlib
+            
+            def build(output_path, progress):
+                weasyprint.HTML(string=html_content, url_fetcher=image_proxy.weasyprint_url_fetcher).write_pdf(output_path)
+            
+            # Конвертация в PDF выполняется фоновой задачей; одинаковая карточка → один и тот же файл
+            job_id = pdf_job_service.submit(
+                'single-property-pdf',
+                f"{property_id}:{hashlib.sha256(html_content.encode('utf-8')).hexdigest()}",
+                build,
+                filename=f'property-{property_id}.pdf',
+                mimetype='application/pdf',
+                base_url=request.host_url
+            )
+            return job_response(job_id)
+        
         # Return HTML for PDF conversion (browser will handle PDF generation)
         # Create ASCII-safe filename
         ascii_filename = f'property-{property_id}.html'
@@ -5295,89 +4689,26 @@ def download_property_pdf(property_id):
         print(f"Error generating PDF for property {property_id}: {e}")
         return jsonify({'error': 'Failed to generate PDF'}), 500
 
+def load_developer_profile(slug):
+    """Контекст страницы застройщика по slug; профиль строится при первом обращении, если его еще нет"""
+    page = developer_profile(db.session, slug=slug)
+    if page is None:
+        found = find_unprofiled_developer(db.session, slug, developer_slug)
+        if found is None:
+            return None
+        developer_id, name = found
+        refresh_developer_profiles(db.session, developer_slug, [developer_id])
+        db.session.commit()
+        page = developer_profile(db.session, name=name)
+    return page
+
+
 @app.route('/developers')
-@cache.cached(timeout=3600)  # Кэш на 1 час
 def developers():
     """Developers listing page with real database data"""
     try:
-        print("Loading developers from database...")
-        
-        from models import Developer, ResidentialComplex, Property
-        from sqlalchemy import func
-        
-        # Получаем застройщиков из базы данных с статистикой
-        developers_list = (
-            db.session.query(Developer, 
-                            func.count(ResidentialComplex.id).label('complexes_count'),
-                            func.count(Property.id).label('properties_count'))
-            .outerjoin(ResidentialComplex, Developer.id == ResidentialComplex.developer_id)
-            .outerjoin(Property, Developer.id == Property.developer_id)
-            .group_by(Developer.id)
-            .order_by(func.count(Property.id).desc())
-            .all()
-        )
-        
-        # Формируем список застройщиков с данными
-        developers_data = []
-        for developer, complexes_count, properties_count in developers_list:
-            developer_dict = {
-                'id': developer.id,
-                'name': developer.name,
-                'slug': developer.slug,
-                'description': developer.description or f"Застройщик {developer.name}",
-                'logo_url': developer.logo_url or f"https://via.placeholder.com/200x100/3B82F6/FFFFFF?text={developer.name.replace(' ', '+')}",
-                'website': developer.website,
-                'phone': developer.phone,
-                'email': developer.email,
-                'address': developer.address,
-                'complexes_count': complexes_count,
-                'properties_count': properties_count,
-                'established_year': developer.established_year,
-                # Нужные поля для шаблона
-                'max_cashback': 10,  # По умолчанию 10%
-                'max_cashback_percent': 10,
-                # Статистика для отображения
-                'stats': {
-                    'total_projects': complexes_count,
-                    'total_apartments': properties_count,
-                    'avg_price': None  # Добавим позже
-                }
-            }
-            
-            # Получаем статистику из Excel данных по имени застройщика
-            excel_stats = db.session.execute(text("""
-                SELECT 
-                    COUNT(*) as total_properties,
-                    AVG(ep.price) as avg_price,
-                    MIN(ep.price) as min_price,
-                    MAX(ep.price) as max_price,
-                    COUNT(DISTINCT ep.complex_name) as total_complexes
-                FROM excel_properties ep
-                WHERE UPPER(TRIM(ep.developer_name)) = UPPER(TRIM(:developer_name))
-            """), {'developer_name': developer.name}).fetchone()
-            
-            if excel_stats and excel_stats[0]:  # Check if we have data
-                total_props, avg_price, min_price, max_price, total_complexes = excel_stats
-                developer_dict['properties_count'] = total_props or properties_count
-                developer_dict['complexes_count'] = total_complexes or complexes_count
-                developer_dict['stats'] = {
-                    'total_projects': total_complexes or complexes_count,
-                    'total_apartments': total_props or properties_count,
-                    'avg_price': int(avg_price) if avg_price else None,
-                    'min_price': int(min_price) if min_price else None,
-                    'max_price': int(max_price) if max_price else None
-                }
-            else:
-                # Fallback to basic database stats
-                developer_dict['stats'] = {
-                    'total_projects': complexes_count,
-                    'total_apartments': properties_count,
-                    'avg_price': None
-                }
-            
-            developers_data.append(developer_dict)
-        
-        print(f"Found {len(developers_data)} developers in database")
+        # Статистика застройщиков собрана после импорта (developer_profiles) — один запрос
+        developers_data = developer_listing(db.session)
         
         return render_template('developers.html', developers=developers_data)
         
@@ -5389,202 +4720,16 @@ def developers():
 def developer_page(developer_slug):
     """Individual developer page by slug"""
     try:
-        # No redirect logic needed - browser will handle encoding
-        
-        # Create variations of the developer name to search for
-        # Convert slug back to possible name formats  
-        developer_name_from_slug = developer_slug.replace('-', ' ')
-        
-        # Try to find developer in database using multiple search strategies
-        developer = db.session.execute(
-            text("""
-            SELECT * FROM developers WHERE 
-            LOWER(TRANSLATE(REPLACE(name, ' ', '-'), '«»"().,;:', '')) = LOWER(:slug)
-            OR LOWER(name) LIKE LOWER(:name_pattern)
-            OR LOWER(REPLACE(name, ' ', '-')) = LOWER(:slug)
-            OR slug = :slug
-            LIMIT 1
-            """),
-            {
-                "slug": developer_slug, 
-                "name_pattern": f"%{developer_name_from_slug}%"
-            }
-        ).fetchone()
-        
-        if not developer:
+        # ЖК, комнатность, статистика и доступные квартиры — из профиля, данные застройщика — актуальные
+        page = load_developer_profile(developer_slug)
+        if not page:
             print(f"Developer not found in database: {developer_slug}")
             return redirect(url_for('developers'))
         
-        # Convert row to dict-like object for template
-        developer_dict = dict(developer._mapping)
-        
-        # Получаем ЖК этого застройщика из Excel данных с фотографиями и реальными данными
-        developer_complexes_query = db.session.execute(text("""
-            SELECT 
-                ep.complex_name as name,
-                ep.complex_name as id,
-                COALESCE(MAX(ep.address_short_display_name), 'Адрес не указан') as location,
-                COUNT(ep.inner_id) as apartments_count,
-                COUNT(DISTINCT ep.complex_building_id) as buildings_count,
-                MIN(ep.price) as min_price,
-                MAX(ep.price) as max_price,
-                AVG(ep.price) as avg_price,
-                MAX(ep.address_position_lat) as lat,
-                MAX(ep.address_position_lon) as lng,
-                MAX(ep.complex_sales_address) as sales_address,
-                -- Получаем все фотографии из JSON массива формата ["url1","url2","url3"]
-                CASE 
-                    WHEN MAX(ep.photos) IS NOT NULL AND MAX(ep.photos) != '' AND MAX(ep.photos) != '[]' 
-                        THEN ARRAY(SELECT json_array_elements_text(MAX(ep.photos)::json))
-                    ELSE ARRAY['https://images.unsplash.com/photo-1545324418-cc1a3fa10c00?w=800']
-                END as images,
-                -- Получаем первую фотографию для совместимости  
-                CASE 
-                    WHEN MAX(ep.photos) IS NOT NULL AND MAX(ep.photos) != '' AND MAX(ep.photos) != '[]' 
-                        THEN (MAX(ep.photos)::json->>0)
-                    ELSE 'https://images.unsplash.com/photo-1545324418-cc1a3fa10c00?w=800'
-                END as image,
-                CASE 
-                    WHEN MAX(ep.complex_end_build_quarter) IS NOT NULL AND MAX(ep.complex_end_build_year) IS NOT NULL 
-                        THEN COALESCE(MAX(ep.complex_end_build_quarter)::text, 'IV') || ' кв. ' || COALESCE(MAX(ep.complex_end_build_year)::text, '2024')
-                    ELSE 'Сдан'
-                END as completion_date,
-                MIN(ep.price) as real_price_from,
-                COUNT(DISTINCT ep.object_rooms) as room_types_count
-            FROM excel_properties ep
-            WHERE UPPER(TRIM(ep.developer_name)) = UPPER(TRIM(:developer_name))
-            GROUP BY ep.complex_name
-            ORDER BY apartments_count DESC
-        """), {'developer_name': developer.name})
-        
-        developer_complexes = []
-        for complex_row in developer_complexes_query:
-            complex_dict = dict(complex_row._mapping)
-            
-            # Получаем распределение квартир по комнатности для этого ЖК
-            room_distribution_query = db.session.execute(text("""
-                SELECT 
-                    CASE 
-                        WHEN object_rooms = 0 THEN 'Студия'
-                        WHEN object_rooms = 1 THEN '1-комн.'
-                        WHEN object_rooms = 2 THEN '2-комн.'
-                        WHEN object_rooms = 3 THEN '3-комн.'
-                        WHEN object_rooms = 4 THEN '4-комн.'
-                        ELSE CAST(object_rooms AS TEXT) || '-комн.'
-                    END as room_type,
-                    COUNT(*) as count,
-                    MIN(price) as price_from,
-                    MAX(price) as price_to,
-                    MIN(object_area) as area_from,
-                    MAX(object_area) as area_to
-                FROM excel_properties 
-                WHERE UPPER(TRIM(complex_name)) = UPPER(TRIM(:complex_name))
-                  AND UPPER(TRIM(developer_name)) = UPPER(TRIM(:developer_name))
-                GROUP BY object_rooms
-                ORDER BY object_rooms
-            """), {'complex_name': complex_dict['name'], 'developer_name': developer.name})
-            
-            # Формируем данные о комнатности
-            real_room_distribution = {}
-            room_details = {}
-            
-            for room_row in room_distribution_query:
-                room_data = dict(room_row._mapping)
-                room_type = room_data['room_type']
-                real_room_distribution[room_type] = room_data['count']
-                room_details[room_type] = {
-                    'price_from': room_data['price_from'],
-                    'price_to': room_data['price_to'],
-                    'area_from': room_data['area_from'],
-                    'area_to': room_data['area_to']
-                }
-            
-            complex_dict['real_room_distribution'] = real_room_distribution
-            complex_dict['room_details'] = room_details
-            developer_complexes.append(complex_dict)
-        
-        # Получаем квартиры этого застройщика из Excel данных
-        excel_properties_query = db.session.execute(text("""
-            SELECT *
-            FROM excel_properties ep
-            WHERE UPPER(TRIM(ep.developer_name)) = UPPER(TRIM(:developer_name))
-            ORDER BY ep.price ASC
-        """), {'developer_name': developer.name})
-        
-        developer_properties = []
-        for prop_row in excel_properties_query:
-            prop_dict = dict(prop_row._mapping)
-            developer_properties.append(prop_dict)
-        
-        properties_count = len(developer_properties)
-        min_price = min([p['price'] for p in developer_properties]) if developer_properties else 0
-        
-        # Parse features and infrastructure if they exist
-        import json as json_lib
-        features = []
-        infrastructure = []
-        
-        if developer_dict.get('features'):
-            try:
-                features = json_lib.loads(developer_dict['features'])
-            except:
-                features = []
-        
-        if developer_dict.get('infrastructure'):
-            try:
-                infrastructure = json_lib.loads(developer_dict['infrastructure'])
-            except:
-                infrastructure = []
-        
-        # Получаем общую статистику из Excel
-        excel_stats = db.session.execute(text("""
-            SELECT 
-                COUNT(*) as total_properties,
-                AVG(ep.price) as avg_price,
-                MIN(ep.price) as min_price,
-                MAX(ep.price) as max_price,
-                COUNT(DISTINCT ep.complex_name) as total_complexes
-            FROM excel_properties ep
-            WHERE UPPER(TRIM(ep.developer_name)) = UPPER(TRIM(:developer_name))
-        """), {'developer_name': developer.name}).fetchone()
-        
-        # Обновляем статистику с правильными данными
-        if excel_stats and excel_stats[0]:
-            total_props, avg_price, min_price_excel, max_price_excel, total_complexes = excel_stats
-            developer_dict['properties_count'] = total_props
-            developer_dict['complexes_count'] = total_complexes
-            developer_dict['min_price'] = int(min_price_excel) if min_price_excel else 12000000
-            developer_dict['max_price'] = int(max_price_excel) if max_price_excel else 0
-            developer_dict['avg_price'] = int(avg_price) if avg_price else 0
-            print(f"DEBUG: Excel stats for {developer.name}: min_price={min_price_excel}, total_props={total_props}")
-        else:
-            print(f"DEBUG: No Excel stats found for {developer.name}")
-        
-        # Добавляем дефолтные значения для полей, которые могут отсутствовать
-        developer_dict['total_projects'] = developer_dict.get('completed_projects', 0) or developer_dict.get('complexes_count', 0)
-        developer_dict['rating'] = developer_dict.get('rating') or 4.2
-        developer_dict['founded_year'] = developer_dict.get('founded_year') or 2015
-        developer_dict['detailed_description'] = developer_dict.get('description') or 'Надёжный застройщик с многолетним опытом строительства качественного жилья в регионе.'
-        developer_dict['description'] = developer_dict.get('description') or developer_dict['detailed_description']
-        developer_dict['advantages'] = developer_dict.get('advantages') or [
-            'Собственное строительство без субподряда',
-            'Сдача объектов точно в срок', 
-            'Качественные материалы и технологии',
-            'Полный пакет документов и сервисов'
-        ]
-        
-        return render_template('developer_detail.html', 
-                             developer=developer_dict,
-                             developer_name=developer_dict['name'],
-                             complexes=developer_complexes,
-                             apartments=developer_properties,
-                             total_properties=properties_count,
-                             min_price=min_price,
-                             features=features,
-                             infrastructure=infrastructure)
+        return render_template('developer_detail.html', **page)
         
     except Exception as e:
-        print(f"Error loading developer page for {developer_name}: {e}")
+        print(f"Error loading developer page for {developer_slug}: {e}")
         import traceback
         traceback.print_exc()
         return redirect(url_for('developers'))
@@ -5593,35 +4738,8 @@ def developer_page(developer_slug):
 @app.route('/districts')
 def districts():
     """Districts listing page"""
-    # Импорт модели
-    from models import District
-    import json
-    
-    # Получаем все районы из базы данных
-    districts_query = District.query.order_by(District.name).all()
-    
-    # Подготавливаем данные с парсингом JSON
-    districts_list = []
-    for district in districts_query:
-        district_data = {
-            'id': district.id,
-            'name': district.name,
-            'slug': district.slug,
-            'description': district.description,
-            'latitude': district.latitude,
-            'longitude': district.longitude,
-            'distance_to_center': district.distance_to_center,
-            'infrastructure_data': {}
-        }
-        
-        # Парсим JSON данные инфраструктуры
-        if district.infrastructure_data:
-            try:
-                district_data['infrastructure_data'] = json.loads(district.infrastructure_data)
-            except:
-                district_data['infrastructure_data'] = {}
-        
-        districts_list.append(district_data)
+    # Районы со сводкой и разобранной инфраструктурой (district_stats) одним запросом
+    districts_list = district_listing(db.session)
     
     return render_template('districts.html', 
                          districts=districts_list,
@@ -5712,20 +4830,8 @@ def district_skhi_redirect():
 def district_detail(district):
     """Individual district page"""
     try:
-        # Import District model
-        from models import District
-        
-        # Get properties and complexes in this district
-        properties = load_properties()
-        complexes = load_residential_complexes()
-        
-        # Filter by district (simplified district matching)
-        district_properties = [p for p in properties if district.replace('-', ' ').lower() in p.get('address', '').lower()]
-        district_complexes = [c for c in complexes if district.replace('-', ' ').lower() in c.get('district', '').lower()]
-        
-        # Add cashback calculations
-        for prop in district_properties:
-            prop['cashback'] = calculate_cashback(prop['price'])
+        # Район и его сводка (district_stats) — одна строка
+        district_db = district_page(db.session, district)
         
         # District info mapping - all 54 districts
         district_names = {
@@ -5781,45 +4887,34 @@ def district_detail(district):
             'zip-zhukova': 'ЗИП Жукова'
         }
         
-        # Get district data from database with coordinates
-        district_db = District.query.filter_by(slug=district).first()
-        
         # Use district name from database if available, otherwise fallback to mapping
-        if district_db and district_db.name:
-            district_name = district_db.name
+        if district_db and district_db['name']:
+            district_name = district_db['name']
         else:
             district_name = district_names.get(district, district.replace('-', ' ').title())
         
-        # Prepare district data for template
-        infrastructure_data = None
-        if district_db and district_db.infrastructure_data:
-            try:
-                import json
-                if isinstance(district_db.infrastructure_data, str):
-                    infrastructure_data = json.loads(district_db.infrastructure_data)
-                else:
-                    infrastructure_data = district_db.infrastructure_data
-            except Exception as e:
-                print(f"Infrastructure parsing error: {e}")
-                infrastructure_data = None
+        stats = district_db or {'properties_count': 0, 'complexes': [], 'sample_property_ids': []}
+        # Самые доступные объекты района из снимка; пропавшие из снимка пропускаем
+        district_properties = [prop for prop in get_properties_by_ids(stats['sample_property_ids']) if prop]
         
         district_data = {
             'name': district_name,
             'slug': district,
-            'latitude': district_db.latitude if district_db and district_db.latitude else None,
-            'longitude': district_db.longitude if district_db and district_db.longitude else None,
-            'zoom_level': district_db.zoom_level if district_db and district_db.zoom_level else 13,
-            'description': district_db.description if district_db else None,
-            'distance_to_center': getattr(district_db, 'distance_to_center', None) if district_db else None,
-            'infrastructure_data': infrastructure_data
+            'latitude': district_db['latitude'] if district_db else None,
+            'longitude': district_db['longitude'] if district_db else None,
+            'zoom_level': (district_db['zoom_level'] if district_db else None) or 13,
+            'description': district_db['description'] if district_db else None,
+            'distance_to_center': district_db['distance_to_center'] if district_db else None,
+            'infrastructure_data': (district_db['infrastructure_data'] if district_db else None) or None
         }
         
         return render_template('district_detail.html', 
                              district=district,
                              district_name=district_name,
                              district_data=district_data,
+                             district_stats=stats,
                              properties=district_properties,
-                             complexes=district_complexes,
+                             complexes=stats['complexes'],
                              yandex_api_key=os.environ.get('YANDEX_MAPS_API_KEY', ''))
     except Exception as e:
         # Log detailed error for debugging
@@ -6035,37 +5130,34 @@ def handle_unauthorized():
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User, Manager
-    
     # Check if this is a manager ID (with prefix 'm_')
     if user_id.startswith('m_'):
-        manager_id = int(user_id[2:])  # Remove 'm_' prefix
-        manager = Manager.query.get(manager_id)
-        if manager:
-            return manager
+        principal = get_principal('manager', user_id[2:])  # Remove 'm_' prefix
     else:
         # Regular user ID
-        try:
-            user = User.query.get(int(user_id))
-            if user:
-                return user
-        except ValueError:
-            pass
+        principal = get_principal('user', user_id)
     
-    return None
+    # Полный объект загружается только при обращении к полям вне principal
+    return CachedIdentity(principal) if principal else None
+
+def active_session_manager():
+    """Principal менеджера из сессии, если он существует и не деактивирован (иначе None)"""
+    manager_id = session.get('manager_id')
+    if not manager_id or not session.get('is_manager'):
+        return None
+    manager = get_principal('manager', manager_id)
+    if not manager or not manager['is_active']:
+        return None
+    return manager
 
 def manager_required(f):
     """Decorator to require manager authentication via session"""
     from functools import wraps
-    from models import Manager
     
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        print(f"DEBUG: manager_required - checking session authentication")
-        print(f"DEBUG: manager_required - request.path: {request.path}")
-        print(f"DEBUG: manager_required - request.method: {request.method}")
-        print(f"DEBUG: manager_required - session.get('manager_id'): {session.get('manager_id')}")
-        print(f"DEBUG: manager_required - session.get('is_manager'): {session.get('is_manager')}")
+        logger.debug("manager_required: %s %s manager_id=%s is_manager=%s",
+                     request.method, request.path, session.get('manager_id'), session.get('is_manager'))
         
         # Check if this is an AJAX or JSON request
         is_ajax = (request.headers.get('X-Requested-With') == 'XMLHttpRequest' or 
@@ -6077,16 +5169,15 @@ def manager_required(f):
         is_manager = session.get('is_manager')
         
         if not manager_id or not is_manager:
-            print(f"DEBUG: manager_required - Manager not authenticated via session")
+            logger.debug("manager_required - Manager not authenticated via session")
             if is_ajax:
                 return jsonify({'success': False, 'error': 'Authentication required'}), 401
             return redirect(url_for('manager_login'))
         
-        # Verify manager still exists in database
+        # Verify manager still exists in database (principal cache, no full row load)
         try:
-            manager = Manager.query.get(manager_id)
-            if not manager:
-                print(f"DEBUG: manager_required - Manager ID {manager_id} not found in database")
+            if active_session_manager() is None:
+                logger.debug("manager_required - Manager ID %s not found or inactive", manager_id)
                 # Clear invalid session
                 session.pop('manager_id', None)
                 session.pop('is_manager', None)
@@ -6094,12 +5185,12 @@ def manager_required(f):
                     return jsonify({'success': False, 'error': 'Authentication required'}), 401
                 return redirect(url_for('manager_login'))
         except Exception as e:
-            print(f"DEBUG: manager_required - Database error: {e}")
+            logger.debug("manager_required - Database error: %s", e)
             if is_ajax:
                 return jsonify({'success': False, 'error': 'Authentication error'}), 500
             return redirect(url_for('manager_login'))
         
-        print(f"DEBUG: manager_required - Success! Manager {manager.email} authenticated via session")
+        logger.debug("manager_required - Manager %s authenticated via session", manager_id)
         return f(*args, **kwargs)
     return decorated_function
 
@@ -7222,9 +6313,11 @@ def remove_from_favorites(property_id):
             db.session.rollback()
             return jsonify({'success': False, 'error': str(e)}), 400
 
-def send_view_notification_to_manager(presentation, view):
-    """Отправляет уведомление менеджеру о новом просмотре презентации"""
+def send_view_notification_to_manager(presentation, view, url_root=None):
+    """Отправляет уведомление менеджеру о новом просмотре презентации.
+    url_root передается явно, когда уведомление отправляется вне запроса (из трекера просмотров)"""
     try:
+        url_root = url_root or request.url_root
         manager = presentation.created_by
         if not manager:
             print(f"Manager not found for presentation {presentation.id}")
@@ -7247,8 +6340,8 @@ def send_view_notification_to_manager(presentation, view):
 🌐 IP: {view.view_ip}
 📱 Устройство: {view.user_agent[:50] + '...' if view.user_agent and len(view.user_agent) > 50 else view.user_agent or 'Неизвестно'}
 
-👀 Ссылка на презентацию: {request.url_root}presentation/modern/{presentation.unique_url}
-🎯 Панель менеджера: {request.url_root}manager/dashboard"""
+👀 Ссылка на презентацию: {url_root}presentation/modern/{presentation.unique_url}
+🎯 Панель менеджера: {url_root}manager/dashboard"""
 
         # TODO: Интеграция с Telegram Bot API
         # if hasattr(manager, 'telegram_chat_id') and manager.telegram_chat_id:
@@ -7270,6 +6363,16 @@ def send_view_notification_to_manager(presentation, view):
     except Exception as e:
         print(f"Error in send_view_notification_to_manager: {e}")
 
+def presentation_version_key(presentation):
+    """Версия презентации для кэшей и фоновых задач: id, updated_at и состав объектов с комментариями"""
+    import hashlib
+    version_source = '|'.join(
+        f"{cp.property_id}:{cp.order_index}:{cp.property_price}:{cp.manager_note or ''}"
+        for cp in presentation.properties
+    )
+    updated_at = presentation.updated_at.timestamp() if presentation.updated_at else 0
+    return f"{presentation.id}:{updated_at}:{hashlib.md5(version_source.encode('utf-8')).hexdigest()}"
+
 @app.route('/presentation/<string:unique_url>')
 def redirect_old_presentation_url(unique_url):
     """Редирект со старого формата URL на новый для обратной совместимости"""
@@ -7278,10 +6381,7 @@ def redirect_old_presentation_url(unique_url):
 @app.route('/presentation/view/<string:unique_id>')
 def view_presentation(unique_id):
     """Публичная страница просмотра презентации по уникальной ссылке"""
-    print(f"🔥 ROUTE HIT: /presentation/view/{unique_id}")
-    print(f"🔥 CLIENT IP: {request.remote_addr}")
-    print(f"🔥 USER AGENT: {request.headers.get('User-Agent', 'Unknown')}")
-    from models import Collection, CollectionProperty, PresentationView
+    from models import Collection, CollectionProperty, ExcelProperty
     
     # Находим презентацию по уникальной ссылке
     presentation = Collection.query.filter_by(
@@ -7294,59 +6394,63 @@ def view_presentation(unique_id):
                              error="Презентация не найдена", 
                              message="Возможно, ссылка устарела или была удалена"), 404
     
-    # Записываем просмотр
-    try:
-        view = PresentationView(
-            collection_id=presentation.id,
-            view_ip=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            referer=request.headers.get('Referer')
-        )
-        db.session.add(view)
-        
-        # Увеличиваем счетчик просмотров (без автокоммита)
-        presentation.increment_view_count()
-        db.session.commit()  # Контролируем транзакцию на уровне view
-        
-        # Отправляем уведомление менеджеру о новом просмотре
-        try:
-            send_view_notification_to_manager(presentation, view)
-        except Exception as e:
-            print(f"Error sending view notification: {e}")
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error recording presentation view: {e}")
+    # Записываем просмотр через буферизованный трекер: запись в БД и уведомление менеджеру
+    # выполняются в фоне, повторные открытия с того же IP/браузера не учитываются
+    presentation_view_tracker.track(
+        presentation.id,
+        view_ip=request.remote_addr,
+        user_agent=request.headers.get('User-Agent'),
+        referer=request.headers.get('Referer'),
+        url_root=request.url_root,
+        notifier=send_view_notification_to_manager
+    )
     
-    print("DEBUG: Starting data loading phase...")
+    # Отрисованная презентация кэшируется по версии: updated_at + состав и комментарии объектов
+    collection_properties = list(presentation.properties)
+    cache_key = f"presentation_view:{presentation_version_key(presentation)}"
+    cached_html = cache.get(cache_key)
+    if cached_html is not None:
+        return cached_html
     
     # Load properties data to enrich the collection properties
     try:
-        print("DEBUG: Loading properties data...")
-        properties_data = load_properties()
-        print(f"DEBUG: Loaded {len(properties_data)} properties")
-        
-        print("DEBUG: Loading complexes data...")
+        properties_index = get_properties_index()
         complexes_data = load_residential_complexes()
-        print(f"DEBUG: Loaded {len(complexes_data) if complexes_data else 0} complexes")
     except Exception as e:
         print(f"ERROR: Failed to load data: {e}")
         import traceback
         traceback.print_exc()
         # Instead of returning 500, use empty data to allow page to render
-        print("FALLBACK: Using empty data to allow page rendering")
-        properties_data = []
+        properties_index = {}
         complexes_data = []
     
+    # Полные данные объектов из excel_properties одним запросом
+    property_details = {}
+    detail_ids = []
+    for cp in collection_properties:
+        try:
+            detail_ids.append(int(cp.property_id))
+        except (ValueError, TypeError):
+            continue
+    if detail_ids:
+        try:
+            for detail in ExcelProperty.query.filter(ExcelProperty.inner_id.in_(detail_ids)).all():
+                property_details[str(detail.inner_id)] = detail
+        except Exception as e:
+            print(f"Warning: Could not load enhanced property data for presentation {presentation.id}: {e}")
+    
+    # Индексы ЖК по названию и id вместо перебора списка для каждого объекта
+    complexes_by_name = {}
+    complexes_by_id = {}
+    for complex_data in complexes_data or []:
+        complexes_by_name.setdefault(complex_data.get('name'), complex_data)
+        complexes_by_id.setdefault(complex_data.get('id'), complex_data)
+    
     # Enrich collection properties with full property data (same logic as manager version)
     enriched_properties = []
-    for prop in presentation.properties:
+    for prop in collection_properties:
         # Find the property in the main properties data
-        property_data = None
-        for p in properties_data:
-            if str(p.get('id')) == str(prop.property_id):
-                property_data = p
-                break
+        property_data = properties_index.get(str(prop.property_id))
         
         if property_data:
             # Get complex name from property_data
@@ -7360,7 +6464,6 @@ def view_presentation(unique_id):
             photos_raw = property_data.get('photos') or property_data.get('gallery') or property_data.get('images')
             if photos_raw:
                 try:
-                    import json
                     if isinstance(photos_raw, str) and photos_raw.startswith('['):
                         images = json.loads(photos_raw)
                     elif isinstance(photos_raw, list):
@@ -7384,46 +6487,29 @@ def view_presentation(unique_id):
             latitude = property_data.get('address_position_lat') or property_data.get('lat') or 0
             longitude = property_data.get('address_position_lon') or property_data.get('lon') or 0
             
-            # Get full property details from the database
-            try:
-                from models import ExcelProperty
-                property_detail = ExcelProperty.query.filter_by(inner_id=str(prop.property_id)).first()
-                
-                # Enhanced property data with full details
-                enhanced_images = images
-                enhanced_main_image = main_image
-                enhanced_layout = property_data.get('layout_image')
-                enhanced_address = property_data.get('address_display_name', '')
-                enhanced_description = property_data.get('description', '')
-                enhanced_features = property_data.get('features', [])
-                enhanced_developer = property_data.get('developer_name', 'Не указан')
-                
-                # Use property_detail database data if available for richer content
-                if property_detail:
-                    enhanced_address = property_detail.address_display_name or enhanced_address
-                    enhanced_developer = property_detail.developer_name or enhanced_developer
-                    
-                    # Get photos from database
-                    if property_detail.photos:
-                        try:
-                            import json
-                            if property_detail.photos.startswith('['):
-                                db_images = json.loads(property_detail.photos)
-                                if db_images and isinstance(db_images, list):
-                                    enhanced_images = db_images
-                                    enhanced_main_image = db_images[0] if db_images else enhanced_main_image
-                        except:
-                            pass
+            # Enhanced property data with full details
+            enhanced_images = images
+            enhanced_main_image = main_image
+            enhanced_layout = property_data.get('layout_image')
+            enhanced_address = property_data.get('address_display_name', '')
+            enhanced_description = property_data.get('description', '')
+            enhanced_features = property_data.get('features', [])
+            enhanced_developer = property_data.get('developer_name', 'Не указан')
+            
+            # Use property_detail database data if available for richer content
+            property_detail = property_details.get(str(prop.property_id))
+            if property_detail:
+                enhanced_address = property_detail.address_display_name or enhanced_address
+                enhanced_developer = property_detail.developer_name or enhanced_developer
                 
-            except Exception as e:
-                print(f"Warning: Could not load enhanced property data for {prop.property_id}: {e}")
+                # Get photos from database
+                db_images = normalize_photos(property_detail.photos)['gallery']
+                if db_images:
+                    enhanced_images = db_images
+                    enhanced_main_image = db_images[0]
             
             # Find complex data for this property
-            complex_info = None
-            for complex_data in complexes_data:
-                if complex_data.get('name') == complex_name or complex_data.get('id') == property_data.get('complex_id'):
-                    complex_info = complex_data
-                    break
+            complex_info = complexes_by_name.get(complex_name) or complexes_by_id.get(property_data.get('complex_id'))
             
             # If no complex found, create basic complex info
             if not complex_info:
@@ -7487,10 +6573,6 @@ def view_presentation(unique_id):
     # Sort by order_index (handle None values)
     enriched_properties.sort(key=lambda x: x['order_index'] if x['order_index'] is not None else 999)
     
-    print(f"DEBUG: About to render template with {len(enriched_properties)} enriched properties")
-    print(f"DEBUG: Presentation object: {presentation}")
-    print(f"DEBUG: First property sample: {enriched_properties[0] if enriched_properties else 'No properties'}")
-    
     # Format presentation data for template (same structure as manager version)
     presentation_data = {
         'id': presentation.id,
@@ -7508,15 +6590,11 @@ def view_presentation(unique_id):
     }
     
     try:
-        print(f"🔥 RENDERING: presentation_view.html with {len(enriched_properties)} properties")
-        print(f"🔥 PRESENTATION: {presentation_data['title']}")
-        print(f"🔥 VIEW COUNT: {presentation_data['view_count']}")
-        
         template_result = render_template('presentation_view.html', 
                                         presentation=presentation_data,
                                         properties=enriched_properties,
                                         manager=presentation.created_by)
-        print("🔥 TEMPLATE RENDERED: presentation_view.html success!")
+        cache.set(cache_key, template_result)
         return template_result
     except Exception as e:
         print(f"ERROR in view_presentation template rendering: {e}")
@@ -7524,6 +6602,42 @@ def view_presentation(unique_id):
         traceback.print_exc()
         return f"Template rendering error: {str(e)}", 500
 
+def create_presentation_view_notification(presentation, view, url_root=None):
+    """Создает уведомление в кабинете менеджера о просмотре современной версии презентации"""
+    from models import ManagerNotification
+    
+    client_name = presentation.client_name or 'Неизвестный клиент'
+    presentation_title = presentation.title or 'Презентация'
+    view_ip = view.view_ip or 'Неизвестный IP'
+    
+    # Формируем текст уведомления
+    notification_title = f"Просмотр презентации: {presentation_title}"
+    notification_message = f"Клиент {client_name} просмотрел презентацию \"{presentation_title}\". IP адрес: {view_ip}"
+    
+    # Дополнительная информация в JSON
+    extra_data = {
+        'client_name': client_name,
+        'presentation_title': presentation_title,
+        'view_ip': view_ip,
+        'user_agent': view.user_agent or '',
+        'referer': view.referer or '',
+        'presentation_url': f"/presentation/modern/{presentation.unique_url}",
+        'view_count': presentation.view_count
+    }
+    
+    notification = ManagerNotification(
+        manager_id=presentation.created_by_manager_id,
+        title=notification_title,
+        message=notification_message,
+        notification_type='presentation_view',
+        presentation_id=presentation.id
+    )
+    notification.set_extra_data(extra_data)
+    
+    db.session.add(notification)
+    view.notification_sent = True
+    db.session.commit()
+
 @app.route('/presentation/modern/<string:unique_id>')
 def view_modern_presentation(unique_id):
     """Современная версия публичной страницы просмотра презентации"""
@@ -7540,80 +6654,39 @@ def view_modern_presentation(unique_id):
                              error="Презентация не найдена", 
                              message="Возможно, ссылка устарела или была удалена"), 404
     
-    # Записываем просмотр
-    try:
-        view = PresentationView(
-            collection_id=presentation.id,
-            view_ip=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            referer=request.headers.get('Referer')
-        )
-        db.session.add(view)
-        presentation.increment_view_count()
-        
-        # Создаем уведомление для менеджера
-        manager_id = presentation.created_by_manager_id
-        client_name = presentation.client_name or 'Неизвестный клиент'
-        presentation_title = presentation.title or 'Презентация'
-        view_ip = request.remote_addr or 'Неизвестный IP'
-        
-        # Формируем текст уведомления
-        notification_title = f"Просмотр презентации: {presentation_title}"
-        notification_message = f"Клиент {client_name} просмотрел презентацию \"{presentation_title}\". IP адрес: {view_ip}"
-        
-        # Дополнительная информация в JSON
-        extra_data = {
-            'client_name': client_name,
-            'presentation_title': presentation_title,
-            'view_ip': view_ip,
-            'user_agent': request.headers.get('User-Agent', ''),
-            'referer': request.headers.get('Referer', ''),
-            'presentation_url': f"/presentation/modern/{presentation.unique_url}",
-            'view_count': presentation.view_count + 1  # +1 так как еще не сохранили
-        }
-        
-        # Создаем уведомление
-        notification = ManagerNotification(
-            manager_id=manager_id,
-            title=notification_title,
-            message=notification_message,
-            notification_type='presentation_view',
-            presentation_id=presentation.id
-        )
-        notification.set_extra_data(extra_data)
-        
-        db.session.add(notification)
-        db.session.commit()
-        
-        print(f"✅ Created notification for manager {manager_id}: {notification_title}")
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error recording presentation view or creating notification: {e}")
-        import traceback
-        traceback.print_exc()
+    # Записываем просмотр через буферизованный трекер, уведомление менеджеру создается в фоне
+    presentation_view_tracker.track(
+        presentation.id,
+        view_ip=request.remote_addr,
+        user_agent=request.headers.get('User-Agent'),
+        referer=request.headers.get('Referer'),
+        notifier=create_presentation_view_notification
+    )
     
     # Получаем данные объектов из базы данных
     enriched_properties = []
     all_complexes = {}  # Словарь для хранения всех уникальных ЖК
     
-    for prop in presentation.properties:
+    # Полные данные всех объектов из excel_properties одним запросом
+    collection_properties = list(presentation.properties)
+    detail_ids = []
+    for prop in collection_properties:
+        try:
+            detail_ids.append(int(prop.property_id))
+        except (ValueError, TypeError):
+            continue
+    property_details = {}
+    if detail_ids:
+        for detail in ExcelProperty.query.filter(ExcelProperty.inner_id.in_(detail_ids)).all():
+            property_details[str(detail.inner_id)] = detail
+    
+    for prop in collection_properties:
         # Находим полные данные объекта в excel_properties
-        property_detail = ExcelProperty.query.filter_by(inner_id=int(prop.property_id)).first()
+        property_detail = property_details.get(str(prop.property_id))
         
         if property_detail:
             # Парсим фотографии
-            photos = []
-            if property_detail.photos:
-                try:
-                    import json
-                    if property_detail.photos.startswith('['):
-                        photos = json.loads(property_detail.photos)
-                    elif property_detail.photos.startswith('http'):
-                        # Если фотографии разделены запятыми
-                        photos = [url.strip() for url in property_detail.photos.split(',') if url.strip()]
-                except Exception as e:
-                    photos = []
+            photos = normalize_photos(property_detail.photos)['gallery']
             
             # Формируем заголовок объекта
             rooms_text = ""
@@ -7672,30 +6745,18 @@ def view_modern_presentation(unique_id):
     for complex_name in all_complexes.keys():
         # Находим объекты этого комплекса с фотографиями
         complex_photos = []
-        complex_properties = ExcelProperty.query.filter_by(complex_name=complex_name).limit(10).all()
-        
-        for prop in complex_properties:
-            if prop.photos:
-                try:
-                    import json
-                    prop_photos = []
-                    if prop.photos.startswith('['):
-                        prop_photos = json.loads(prop.photos)
-                    elif prop.photos.startswith('http'):
-                        prop_photos = [url.strip() for url in prop.photos.split(',') if url.strip()]
-                    
-                    # Добавляем уникальные фотографии
-                    for photo in prop_photos:
-                        if photo not in complex_photos:
-                            complex_photos.append(photo)
-                            if len(complex_photos) >= 10:  # Максимум 10 фотографий на комплекс
-                                break
-                    
-                    if len(complex_photos) >= 10:
+        complex_properties = ExcelProperty.query.filter_by(complex_name=complex_name).limit(10).all()
+        
+        for prop in complex_properties:
+            # Добавляем уникальные фотографии
+            for photo in normalize_photos(prop.photos)['gallery']:
+                if photo not in complex_photos:
+                    complex_photos.append(photo)
+                    if len(complex_photos) >= 10:  # Максимум 10 фотографий на комплекс
                         break
-                        
-                except Exception as e:
-                    continue
+            
+            if len(complex_photos) >= 10:
+                break
         
         # Обновляем фотографии комплекса
         all_complexes[complex_name]['photos'] = complex_photos
@@ -7727,29 +6788,30 @@ def share_presentation(presentation_id):
     from flask_login import current_user
     import urllib.parse
     
-    print(f"DEBUG: share_presentation - presentation_id: {presentation_id}")
-    print(f"DEBUG: share_presentation - current_user: {current_user}")
-    print(f"DEBUG: share_presentation - session manager_id: {session.get('manager_id')}")
-    print(f"DEBUG: share_presentation - request.method: {request.method}")
-    print(f"DEBUG: share_presentation - request.content_type: {request.content_type}")
+    logger.debug("share_presentation - presentation_id: %s", presentation_id)
+    logger.debug("share_presentation - current_user: %s", current_user)
+    logger.debug("share_presentation - session manager_id: %s", session.get('manager_id'))
+    logger.debug("share_presentation - request.method: %s", request.method)
+    logger.debug("share_presentation - request.content_type: %s", request.content_type)
     
     try:
         data = request.get_json() or {}  # Пустой JSON валиден
-        print(f"DEBUG: share_presentation - request data: {data}")
+        logger.debug("share_presentation - request data: %s", data)
     except Exception as e:
-        print(f"DEBUG: share_presentation - JSON parsing error: {e}")
+        logger.debug("share_presentation - JSON parsing error: %s", e)
         return jsonify({'success': False, 'error': f'Invalid JSON: {str(e)}'}), 400
         
     # Строгая проверка владения презентацией через Flask-Login и session
     manager_id = session.get('manager_id')
     if not manager_id:
-        print(f"DEBUG: share_presentation - No manager_id in session")
+        logger.debug("share_presentation - No manager_id in session")
         return jsonify({'success': False, 'error': 'Не авторизован как менеджер'}), 401
     
     # Безопасное логирование после проверки аутентификации
-    print(f"DEBUG: share_presentation - current_user.email: {getattr(current_user, 'email', 'Not authenticated')}")
+    if logger.isEnabledFor(logging.DEBUG):  # email не в principal — загрузит пользователя из БД
+        logger.debug("share_presentation - current_user.email: %s", getattr(current_user, 'email', 'Not authenticated'))
     
-    print(f"DEBUG: share_presentation - Looking for presentation {presentation_id} by manager {manager_id}")
+    logger.debug("share_presentation - Looking for presentation %s by manager %s", presentation_id, manager_id)
     
     presentation = Collection.query.filter_by(
         id=presentation_id,
@@ -7757,7 +6819,7 @@ def share_presentation(presentation_id):
         collection_type='presentation'
     ).first()
     
-    print(f"DEBUG: share_presentation - Found presentation: {presentation}")
+    logger.debug("share_presentation - Found presentation: %s", presentation)
     
     if not presentation:
         # Try to find presentation regardless of owner for debugging
@@ -7765,28 +6827,28 @@ def share_presentation(presentation_id):
             id=presentation_id,
             collection_type='presentation'
         ).first()
-        print(f"DEBUG: share_presentation - Any presentation with this ID: {any_presentation}")
+        logger.debug("share_presentation - Any presentation with this ID: %s", any_presentation)
         if any_presentation:
-            print(f"DEBUG: share_presentation - Presentation exists but belongs to manager {any_presentation.created_by_manager_id}")
+            logger.debug("share_presentation - Presentation exists but belongs to manager %s", any_presentation.created_by_manager_id)
         return jsonify({'success': False, 'error': 'Презентация не найдена или у вас нет прав доступа'}), 404
     
     client_name = data.get('client_name', presentation.client_name)
-    print(f"DEBUG: share_presentation - Client name: {client_name}")
+    logger.debug("share_presentation - Client name: %s", client_name)
     
     # Обновляем имя клиента если передано
     if client_name and client_name != presentation.client_name:
-        print(f"DEBUG: share_presentation - Updating client name from '{presentation.client_name}' to '{client_name}'")
+        logger.debug("share_presentation - Updating client name from '%s' to '%s'", presentation.client_name, client_name)
         presentation.client_name = client_name
         db.session.commit()
     
     # Формируем ссылку
     base_url = request.url_root.rstrip('/')
     presentation_url = f"{base_url}/presentation/modern/{presentation.unique_url}"
-    print(f"DEBUG: share_presentation - Presentation URL: {presentation_url}")
+    logger.debug("share_presentation - Presentation URL: %s", presentation_url)
     
     # Формируем сообщение для отправки
     properties_count = len(presentation.properties) if presentation.properties else 0
-    print(f"DEBUG: share_presentation - Properties count: {properties_count}")
+    logger.debug("share_presentation - Properties count: %s", properties_count)
     
     message_text = f"""🏠 Презентация недвижимости от InBack
 
@@ -7814,7 +6876,7 @@ def share_presentation(presentation_id):
         }
     }
     
-    print(f"DEBUG: share_presentation - Returning response: {response_data}")
+    logger.debug("share_presentation - Returning response: %s", response_data)
     return jsonify(response_data)
 
 @app.route('/api/favorites/toggle', methods=['POST'])
@@ -7829,8 +6891,8 @@ def toggle_favorite():
     if not property_id:
         return jsonify({'success': False, 'error': 'property_id required'}), 400
     
-    print(f"DEBUG: Favorites toggle called by user {getattr(current_user, 'id', 'not_authenticated')} for property {property_id}")
-    print(f"DEBUG: Request data: {data}")
+    logger.debug("Favorites toggle called by user %s for property %s", getattr(current_user, 'id', 'not_authenticated'), property_id)
+    logger.debug("Request data: %s", data)
     
     # Check if already in favorites
     existing = FavoriteProperty.query.filter_by(
@@ -8248,14 +7310,7 @@ def get_manager_favorite_properties():
                  renovation_type, deal_type, complex_has_green_mortgage) = row
                 
                 # Handle photos from JSON string to first image
-                photos_data = []
-                if photos:
-                    try:
-                        photos_data = json.loads(photos) if isinstance(photos, str) else photos
-                    except:
-                        photos_data = []
-                
-                first_image = photos_data[0] if photos_data else '/static/images/no-photo.jpg'
+                first_image = normalize_photos(photos)['main_image'] or '/static/images/no-photo.jpg'
                 
                 # Format room text for display
                 rooms_count = object_rooms or 0
@@ -8366,12 +7421,12 @@ def manager_dashboard():
     from models import Manager, User, CashbackApplication, Document
     
     manager_id = session.get('manager_id')
-    print(f"DEBUG: Manager dashboard - manager_id: {manager_id}")
+    logger.debug("Manager dashboard - manager_id: %s", manager_id)
     current_manager = Manager.query.get(manager_id)
-    print(f"DEBUG: Manager dashboard - current_manager: {current_manager}")
+    logger.debug("Manager dashboard - current_manager: %s", current_manager)
     
     if not current_manager:
-        print("DEBUG: Manager not found, redirecting to login")
+        logger.debug("Manager not found, redirecting to login")
         return redirect(url_for('manager_login'))
     
     # Get statistics
@@ -8436,7 +7491,7 @@ def manager_dashboard():
     districts = get_districts_list()
     developers = get_developers_list()
     
-    print(f"DEBUG: Rendering dashboard with manager: {current_manager.full_name}")
+    logger.debug("Rendering dashboard with manager: %s", current_manager.full_name)
     try:
         response = make_response(render_template('auth/manager_dashboard.html',
                              current_manager=current_manager,
@@ -8459,7 +7514,7 @@ def manager_dashboard():
         response.headers['Expires'] = '0'
         return response
     except Exception as e:
-        print(f"DEBUG: Error rendering dashboard: {e}")
+        logger.warning(f"Error rendering dashboard: {e}")
         import traceback
         traceback.print_exc()
         return f"Error rendering dashboard: {e}", 500
@@ -8487,11 +7542,11 @@ def manager_presentation_view(presentation_id):
     from models import Collection, CollectionProperty, Manager
     
     manager_id = session.get('manager_id')
-    print(f"DEBUG: Presentation view - manager_id: {manager_id}, presentation_id: {presentation_id}")
+    logger.debug("Presentation view - manager_id: %s, presentation_id: %s", manager_id, presentation_id)
     
     current_manager = Manager.query.get(manager_id)
     if not current_manager:
-        print("DEBUG: Manager not found, redirecting to login")
+        logger.debug("Manager not found, redirecting to login")
         return redirect(url_for('manager_login'))
     
     # Get presentation data
@@ -8502,7 +7557,7 @@ def manager_presentation_view(presentation_id):
     ).first()
     
     if not presentation:
-        print(f"DEBUG: Presentation {presentation_id} not found or access denied")
+        logger.debug("Presentation %s not found or access denied", presentation_id)
         flash('Презентация не найдена или у вас нет доступа к ней', 'error')
         return redirect(url_for('manager_dashboard'))
     
@@ -8511,21 +7566,14 @@ def manager_presentation_view(presentation_id):
         collection_id=presentation_id
     ).order_by(CollectionProperty.order_index).all()
     
-    print(f"DEBUG: Found {len(collection_properties)} properties in presentation")
+    logger.debug("Found %s properties in presentation", len(collection_properties))
     
-    # Load properties data to enrich the collection properties
-    properties_data = load_properties()  # This function already exists in the app
     complexes_data = load_residential_complexes()  # This function already exists in the app
     
-    # Enrich collection properties with full property data
+    # Enrich collection properties with full property data, resolved through the id index in presentation order
+    resolved_properties = get_properties_by_ids([cp.property_id for cp in collection_properties])
     enriched_properties = []
-    for cp in collection_properties:
-        # Find the property in the main properties data
-        property_data = None
-        for prop in properties_data:
-            if str(prop.get('id')) == str(cp.property_id):
-                property_data = prop
-                break
+    for cp, property_data in zip(collection_properties, resolved_properties):
         
         if property_data:
             # Get complex name directly from property_data (load_properties already includes it)
@@ -8572,9 +7620,9 @@ def manager_presentation_view(presentation_id):
             }
             enriched_properties.append(enriched_property)
         else:
-            print(f"DEBUG: Property {cp.property_id} not found in main data")
+            logger.debug("Property %s not found in main data", cp.property_id)
     
-    print(f"DEBUG: Enriched {len(enriched_properties)} properties")
+    logger.debug("Enriched %s properties", len(enriched_properties))
     
     # Format presentation data for template
     presentation_data = {
@@ -8597,7 +7645,7 @@ def manager_presentation_view(presentation_id):
                              manager=current_manager,
                              presentation=presentation_data)
     except Exception as e:
-        print(f"DEBUG: Error rendering presentation view: {e}")
+        logger.warning(f"Error rendering presentation view: {e}")
         import traceback
         traceback.print_exc()
         flash('Ошибка при загрузке презентации', 'error')
@@ -8613,15 +7661,32 @@ def get_manager_clients_unified():
     manager_id = session.get('manager_id')
     
     try:
-        print(f"DEBUG: Getting clients for manager {manager_id}")
-        # Get ALL users assigned to this manager (regardless of role)
-        clients = User.query.filter_by(assigned_manager_id=manager_id).all()
-        print(f"DEBUG: Found {len(clients)} assigned clients for manager {manager_id}")
+        logger.debug("Getting clients for manager %s", manager_id)
+        # Get ALL users assigned to this manager (regardless of role);
+        # с ?limit=/&after= — постранично по id (next_cursor в ответе)
+        query = User.query.filter_by(assigned_manager_id=manager_id)
+        page = None
+        if request.args.get('limit') or request.args.get('after'):
+            page = keyset_paginate(query, User.id, per_page=page_size(request.args.get('limit'), 50),
+                                   after=request.args.get('after'))
+            clients = page.items
+        else:
+            clients = query.order_by(User.id.desc()).all()
+        logger.debug("Found %s assigned clients for manager %s", len(clients), manager_id)
         clients_data = []
         
+        # Последний сохраненный поиск всех клиентов одним запросом вместо запроса на клиента
+        latest_searches = {}
+        if clients:
+            searches = SavedSearch.query.filter(
+                SavedSearch.user_id.in_([client.id for client in clients])
+            ).order_by(SavedSearch.user_id, SavedSearch.last_used.desc()).all()
+            for saved_search in searches:
+                latest_searches.setdefault(saved_search.user_id, saved_search)
+        
         for client in clients:
             # Get latest search as preference indicator
-            latest_search = SavedSearch.query.filter_by(user_id=client.id).order_by(SavedSearch.last_used.desc()).first()
+            latest_search = latest_searches.get(client.id)
             
             client_data = {
                 'id': client.id,
@@ -8652,11 +7717,15 @@ def get_manager_clients_unified():
             
             clients_data.append(client_data)
         
-        print(f"DEBUG: Returning {len(clients_data)} clients data")
-        return jsonify({
+        logger.debug("Returning %s clients data", len(clients_data))
+        result = {
             'success': True,
             'clients': clients_data
-        })
+        }
+        if page is not None:
+            result['next_cursor'] = page.next_cursor
+            result['has_more'] = page.has_next
+        return jsonify(result)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
@@ -9128,7 +8197,7 @@ def api_manager_send_recommendation():
     category_name = data.get('category_name', '').strip()  # For creating new category
     
     # Debug logging (removing verbose logs for production)
-    print(f"DEBUG: Recommendation sent - type={recommendation_type}, item_id={item_id}, client_id={client_id}")
+    logger.debug("Recommendation sent - type=%s, item_id=%s, client_id=%s", recommendation_type, item_id, client_id)
     
     # Validation
     missing_fields = []
@@ -9353,6 +8422,15 @@ def api_manager_get_clients_list():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/properties/facets')
+def api_property_facets():
+    """Live counts per filter option for the current /properties selection"""
+    try:
+        return jsonify({'success': True, **property_facet_counts(request.args)})
+    except Exception as e:
+        print(f"Error counting property facets: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/properties/search', methods=['POST'])
 @login_required
 def api_search_properties():
@@ -9823,9 +8901,8 @@ def dashboard():
         for rec in recommendations:
             if rec.recommendation_type == 'property' and rec.item_id:
                 try:
-                    properties = load_properties()
                     complexes = load_residential_complexes()
-                    property_data = next((p for p in properties if str(p.get('id')) == str(rec.item_id)), None)
+                    property_data = get_properties_index().get(str(rec.item_id))
                     if property_data:
                         # Create a simple object to store property details
                         class PropertyDetails:
@@ -10232,16 +9309,20 @@ def admin_dashboard():
     if not current_admin:
         return redirect(url_for('admin_login'))
     
+    # Cashback aggregates from precomputed month/status buckets
+    from cashback_analytics import get_status_totals
+    cashback_totals = get_status_totals()
+    
     # Analytics data
     stats = {
         'total_users': User.query.count(),
         'total_managers': Manager.query.count(),
-        'total_applications': CashbackApplication.query.count(),
-        'pending_applications': CashbackApplication.query.filter_by(status='На рассмотрении').count(),
-        'approved_applications': CashbackApplication.query.filter_by(status='Одобрена').count(),
-        'paid_applications': CashbackApplication.query.filter_by(status='Выплачена').count(),
-        'total_cashback_approved': sum(app.cashback_amount for app in CashbackApplication.query.filter_by(status='Одобрена').all()),
-        'total_cashback_paid': sum(app.cashback_amount for app in CashbackApplication.query.filter_by(status='Выплачена').all()),
+        'total_applications': sum(count for count, _ in cashback_totals.values()),
+        'pending_applications': cashback_totals.get('На рассмотрении', (0, 0))[0],
+        'approved_applications': cashback_totals.get('Одобрена', (0, 0))[0],
+        'paid_applications': cashback_totals.get('Выплачена', (0, 0))[0],
+        'total_cashback_approved': cashback_totals.get('Одобрена', (0, 0))[1],
+        'total_cashback_paid': cashback_totals.get('Выплачена', (0, 0))[1],
         'active_users': User.query.filter_by(is_active=True).count(),
         'active_managers': Manager.query.filter_by(is_active=True).count(),
         'cashback_requests': CallbackRequest.query.filter(CallbackRequest.notes.contains('кешбек')).count(),
@@ -10335,29 +9416,13 @@ def get_favorites_list():
     
     try:
         favorites = db.session.query(FavoriteProperty).filter_by(user_id=current_user.id).order_by(FavoriteProperty.created_at.desc()).all()
-        print(f"Found {len(favorites)} favorites in database for user {current_user.id}")
-        
-        # Load properties data
-        properties_data = load_properties()
-        print(f"Loaded {len(properties_data)} properties from database")
-        
-        # Debug: show first few property IDs
-        if properties_data:
-            ids = [str(p.get('id')) for p in properties_data[:5]]
-            print(f"First 5 property IDs from JSON: {ids}")
-        
+
+        # Resolve all favorites through the id index in favorites order
+        resolved = get_properties_by_ids([fav.property_id for fav in favorites])
+
         favorites_list = []
-        for fav in favorites:
-            print(f"Looking for property_id {fav.property_id} (type: {type(fav.property_id)})")
-            # Get property data from JSON files - compare as integers
-            property_data = None
-            for prop in properties_data:
-                if int(prop.get('id')) == int(fav.property_id):
-                    property_data = prop
-                    break
-            
+        for fav, property_data in zip(favorites, resolved):
             if property_data:
-                print(f"Found property data for ID {fav.property_id}")
                 # Add to favorites list with complete data including timestamp
                 favorites_list.append({
                     'id': property_data.get('id'),
@@ -10519,6 +9584,7 @@ def get_complex_favorites_list():
     try:
         favorites = db.session.query(FavoriteComplex).filter_by(user_id=current_user.id).order_by(FavoriteComplex.created_at.desc()).all()
         
+        excel_complexes = None
         favorites_list = []
         for fav in favorites:
             # ✅ ИСПРАВЛЕНИЕ: Ищем реальные данные в excel_properties используя тот же SQL что и для менеджеров
@@ -10530,57 +9596,25 @@ def get_complex_favorites_list():
             real_max_price = fav.max_price or 0
             real_image = fav.complex_image or ''
             
-            print(f"DEBUG: Searching for user complex with fav.complex_id: {fav.complex_id}")
-            
             if fav.complex_id:
                 try:
-                    # ✅ НОВОЕ: Ищем в excel_properties используя тот же SQL что и /residential-complexes
-                    excel_complex_query = db.session.execute(text("""
-                        SELECT 
-                            ep.complex_name,
-                            COUNT(*) as apartments_count,
-                            MIN(ep.price) as price_from,
-                            MAX(ep.price) as price_to,
-                            MAX(ep.developer_name) as developer_name,
-                            MAX(ep.address_display_name) as address_display_name,
-                            COALESCE(rc.id, ROW_NUMBER() OVER (ORDER BY ep.complex_name) + 1000) as real_id,
-                            (SELECT photos FROM excel_properties p2 
-                             WHERE p2.complex_name = ep.complex_name 
-                             AND p2.photos IS NOT NULL 
-                             ORDER BY p2.price DESC LIMIT 1) as photos
-                        FROM excel_properties ep
-                        LEFT JOIN residential_complexes rc ON rc.name = ep.complex_name
-                        GROUP BY ep.complex_name, rc.id
-                        ORDER BY ep.complex_name
-                    """))
+                    # ✅ Комплексы из excel_properties агрегируются один раз на запрос
+                    if excel_complexes is None:
+                        excel_complexes = load_excel_complexes_by_real_id()
                     
-                    # Находим комплекс с нужным ID
-                    target_id = int(fav.complex_id)
-                    for row in excel_complex_query:
-                        if int(row.real_id) == target_id:
-                            real_complex_name = row.complex_name
-                            real_developer_name = row.developer_name or real_developer_name
-                            real_address = row.address_display_name or real_address
-                            real_min_price = int(row.price_from) if row.price_from else 0
-                            real_max_price = int(row.price_to) if row.price_to else 0
-                            
-                            # Парсим фото
-                            if row.photos:
-                                try:
-                                    import json
-                                    photos = json.loads(row.photos) if isinstance(row.photos, str) else row.photos
-                                    if photos and isinstance(photos, list) and len(photos) > 0:
-                                        real_image = photos[0]  # Берем первое фото
-                                except:
-                                    pass
-                            
-                            print(f"DEBUG: ✅ Found user complex in excel_properties: {real_complex_name}")
-                            break
-                    else:
-                        print(f"DEBUG: ❌ User complex with ID {fav.complex_id} not found in excel_properties")
+                    row = excel_complexes.get(int(fav.complex_id))
+                    if row is not None:
+                        real_complex_name = row.complex_name
+                        real_developer_name = row.developer_name or real_developer_name
+                        real_address = row.address_display_name or real_address
+                        real_min_price = int(row.price_from) if row.price_from else 0
+                        real_max_price = int(row.price_to) if row.price_to else 0
+                        
+                        # Парсим фото
+                        real_image = normalize_photos(row.photos)['main_image'] or real_image  # Берем первое фото
                 
                 except Exception as e:
-                    print(f"DEBUG: Error searching user excel_properties: {e}")
+                    logger.warning(f"Error searching user excel_properties: {e}")
             
             favorites_list.append({
                 'id': fav.complex_id,
@@ -10735,8 +9769,8 @@ def manager_toggle_favorite():
     if not manager_id:
         return jsonify({'success': False, 'error': 'Manager ID not found'}), 401
     
-    print(f"DEBUG: Manager favorites toggle called by manager {manager_id} for property {property_id}")
-    print(f"DEBUG: Request data: {data}")
+    logger.debug("Manager favorites toggle called by manager %s for property %s", manager_id, property_id)
+    logger.debug("Request data: %s", data)
     
     # Check if already in favorites
     existing = ManagerFavoriteProperty.query.filter_by(
@@ -10885,15 +9919,7 @@ def manager_get_favorites_list():
                 title = ", ".join([part for part in title_parts if part]) or 'Квартира'
                 
                 # Парсим фото из JSON строки
-                photos_list = []
-                if property_data.get('photos'):
-                    try:
-                        import json
-                        photos_list = json.loads(property_data.get('photos')) if isinstance(property_data.get('photos'), str) else property_data.get('photos')
-                    except:
-                        photos_list = []
-                
-                main_image = photos_list[0] if photos_list and isinstance(photos_list, list) else '/static/images/no-photo.jpg'
+                main_image = normalize_photos(property_data.get('photos'))['main_image'] or '/static/images/no-photo.jpg'
                 
                 favorites_list.append({
                     'id': property_data.get('id'),
@@ -11088,14 +10114,7 @@ def manager_toggle_complex_favorite():
                     real_max_price = int(row[5]) if row[5] else 0
                     
                     # Парсим фото из JSON
-                    if row[6]:
-                        try:
-                            import json
-                            photos = json.loads(row[6]) if isinstance(row[6], str) else row[6]
-                            if photos and isinstance(photos, list) and len(photos) > 0:
-                                real_image = photos[0]  # Первое фото как основное
-                        except:
-                            pass
+                    real_image = normalize_photos(row[6])['main_image'] or real_image  # Первое фото как основное
                     
                     # Определяем статус по году сдачи
                     from datetime import datetime
@@ -11175,35 +10194,22 @@ def manager_get_complex_favorites_list():
                 pass
         
         # BYPASSING broken favorites data - use direct ResidentialComplex lookup since FK is broken
-        # Get complex names from ResidentialComplex table using favorites complex_id (if exists)
+        # Get complex names from ResidentialComplex table using favorites complex_id (one batched query)
+        complexes_by_id = {}
+        if complex_ids_int:
+            for rc in ResidentialComplex.query.filter(ResidentialComplex.id.in_(complex_ids_int)).all():
+                complexes_by_id[rc.id] = rc
+        
         complex_names = []
-        for fav in favorites:
-            if fav.complex_id:
-                try:
-                    complex_int_id = int(fav.complex_id)
-                    rc = ResidentialComplex.query.get(complex_int_id)
-                    if rc and rc.name:
-                        complex_names.append(rc.name)
-                except (ValueError, TypeError):
-                    pass
+        for cid in complex_ids_int:
+            rc = complexes_by_id.get(cid)
+            if rc and rc.name and rc.name not in complex_names:
+                complex_names.append(rc.name)
         
         # Fallback: If no matches found, use all residential complexes for demo
         if not complex_names:
             all_complexes = ResidentialComplex.query.limit(10).all()
             complex_names = [rc.name for rc in all_complexes if rc.name]
-        
-        # ENSURE we include ALL favorite complex names even if not in excel_data
-        # This prevents missing complexes in comparison
-        for fav in favorites:
-            if fav.complex_id:
-                try:
-                    complex_int_id = int(fav.complex_id)
-                    rc = ResidentialComplex.query.get(complex_int_id)
-                    if rc and rc.name and rc.name not in complex_names:
-                        complex_names.append(rc.name)
-                        print(f"DEBUG: Added missing favorite complex to search: {rc.name}")
-                except (ValueError, TypeError):
-                    pass
         excel_data = {}
         
         if complex_names:
@@ -11241,8 +10247,9 @@ def manager_get_complex_favorites_list():
                         }
                         break
             
-            print(f"DEBUG: Searched {len(normalized_names)} names, found {len(excel_data)} matches")
-            print(f"DEBUG: excel_data keys: {list(excel_data.keys())[:2]}")  # First 2 keys
+            logger.debug("Searched %s names, found %s matches", len(normalized_names), len(excel_data))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("excel_data keys: %s", list(excel_data.keys())[:2])  # First 2 keys
         
         
         # Загружаем все комплексы сразу с joined данными  
@@ -11264,6 +10271,7 @@ def manager_get_complex_favorites_list():
                 if complex_data.complex_id:
                     complexes_data[str(complex_data.complex_id)] = complex_data
         
+        excel_complexes = None
         favorites_list = []
         for fav in favorites:
             # ✅ ИСПРАВЛЕНИЕ: Ищем данные по ResidentialComplex таблице и excel_properties
@@ -11282,14 +10290,12 @@ def manager_get_complex_favorites_list():
                 # ✅ ИСПРАВЛЕНИЕ: Используем тот же SQL что и /residential-complexes для поиска по динамическим ID
             try:
                 complex_db = None
-                print(f"DEBUG: Searching for complex with fav.complex_id: {fav.complex_id}")
+                logger.debug("Searching for complex with fav.complex_id: %s", fav.complex_id)
                 
                 if fav.complex_id:
                     # Сначала пробуем найти в residential_complexes (для старых записей)
                     try:
-                        complex_int_id = int(fav.complex_id)
-                        complex_db = ResidentialComplex.query.get(complex_int_id)
-                        print(f"DEBUG: Found by id {complex_int_id}: {complex_db.name if complex_db else 'None'}")
+                        complex_db = complexes_by_id.get(int(fav.complex_id))
                     except (ValueError, TypeError):
                         pass
                 
@@ -11300,59 +10306,28 @@ def manager_get_complex_favorites_list():
                     real_district = complex_db.district.name if complex_db.district else real_district
                     real_address = complex_db.address or real_address
                     real_image = complex_db.main_image or real_image
-                    print(f"DEBUG: ✅ Using residential_complexes data: {real_complex_name}")
+                    logger.debug("✅ Using residential_complexes data: %s", real_complex_name)
                 else:
                     # ✅ НОВОЕ: Ищем в excel_properties используя тот же SQL что и /residential-complexes
-                    print(f"DEBUG: Searching in excel_properties for ID {fav.complex_id}")
                     try:
-                        # Воссоздаем тот же запрос что генерирует ID на странице /residential-complexes
-                        excel_complex_query = db.session.execute(text("""
-                            SELECT 
-                                ep.complex_name,
-                                COUNT(*) as apartments_count,
-                                MIN(ep.price) as price_from,
-                                MAX(ep.price) as price_to,
-                                MAX(ep.developer_name) as developer_name,
-                                MAX(ep.address_display_name) as address_display_name,
-                                COALESCE(rc.id, ROW_NUMBER() OVER (ORDER BY ep.complex_name) + 1000) as real_id,
-                                (SELECT photos FROM excel_properties p2 
-                                 WHERE p2.complex_name = ep.complex_name 
-                                 AND p2.photos IS NOT NULL 
-                                 ORDER BY p2.price DESC LIMIT 1) as photos
-                            FROM excel_properties ep
-                            LEFT JOIN residential_complexes rc ON rc.name = ep.complex_name
-                            GROUP BY ep.complex_name, rc.id
-                            ORDER BY ep.complex_name
-                        """))
+                        # Тот же набор динамических ID, что и на /residential-complexes, агрегируется один раз
+                        if excel_complexes is None:
+                            excel_complexes = load_excel_complexes_by_real_id()
                         
-                        # Находим комплекс с нужным ID
-                        target_id = int(fav.complex_id)
-                        for row in excel_complex_query:
-                            if int(row.real_id) == target_id:
-                                real_complex_name = row.complex_name
-                                real_developer_name = row.developer_name or real_developer_name
-                                real_address = row.address_display_name or real_address
-                                real_min_price = int(row.price_from) if row.price_from else 0
-                                real_max_price = int(row.price_to) if row.price_to else 0
-                                real_apartments_count = int(row.apartments_count) if row.apartments_count else 0
-                                
-                                # Парсим фото
-                                if row.photos:
-                                    try:
-                                        import json
-                                        photos = json.loads(row.photos) if isinstance(row.photos, str) else row.photos
-                                        if photos and isinstance(photos, list) and len(photos) > 0:
-                                            real_image = photos[0]  # Берем первое фото
-                                    except:
-                                        pass
-                                
-                                print(f"DEBUG: ✅ Found complex in excel_properties: {real_complex_name}")
-                                break
-                        else:
-                            print(f"DEBUG: ❌ Complex with ID {fav.complex_id} not found in excel_properties")
+                        row = excel_complexes.get(int(fav.complex_id))
+                        if row is not None:
+                            real_complex_name = row.complex_name
+                            real_developer_name = row.developer_name or real_developer_name
+                            real_address = row.address_display_name or real_address
+                            real_min_price = int(row.price_from) if row.price_from else 0
+                            real_max_price = int(row.price_to) if row.price_to else 0
+                            real_apartments_count = int(row.apartments_count) if row.apartments_count else 0
+                            
+                            # Парсим фото
+                            real_image = normalize_photos(row.photos)['main_image'] or real_image  # Берем первое фото
                     
                     except Exception as e:
-                        print(f"DEBUG: Error searching excel_properties: {e}")
+                        logger.warning(f"Error searching excel_properties: {e}")
                     
                     # Теперь ищем данные в excel_properties по названию ЖК
                     if real_complex_name != 'ЖК без названия':
@@ -11386,16 +10361,11 @@ def manager_get_complex_favorites_list():
                             real_buildings_count = max(int(row[3]) if row[3] else 1, 1)
                             
                             # Парсим фото из JSON
-                            if row[6]:
-                                try:
-                                    import json
-                                    photos = json.loads(row[6]) if isinstance(row[6], str) else row[6]
-                                    if photos and isinstance(photos, list) and len(photos) > 0:
-                                        # Берем фото ЖК, пропуская интерьеры квартир
-                                        start_index = min(len(photos) // 4, 5) if len(photos) > 8 else 1
-                                        real_image = photos[start_index] if len(photos) > start_index else photos[0]
-                                except:
-                                    pass
+                            photos = normalize_photos(row[6])['gallery']
+                            if photos:
+                                # Берем фото ЖК, пропуская интерьеры квартир
+                                start_index = min(len(photos) // 4, 5) if len(photos) > 8 else 1
+                                real_image = photos[start_index] if len(photos) > start_index else photos[0]
                             
                             # Определяем статус и дату сдачи
                             if row[4] and row[5]:  # end_build_year и end_build_quarter
@@ -11483,14 +10453,13 @@ def admin_users():
             flash('Админ не найден', 'error')
             return redirect(url_for('admin_login'))
         
-        page = request.args.get('page', 1, type=int)
         search = request.args.get('search', '', type=str)
         status = request.args.get('status', '', type=str)
         
         query = User.query
         
         if search:
-            query = query.filter(User.email.contains(search) | User.full_name.contains(search))
+            query = query.filter(search_filter((User.email, User.full_name, User.phone), search))
         
         if status == 'active':
             query = query.filter_by(is_active=True)
@@ -11501,9 +10470,11 @@ def admin_users():
         elif status == 'unverified':
             query = query.filter_by(is_verified=False)
         
-        users = query.order_by(User.created_at.desc()).paginate(
-            page=page, per_page=20, error_out=False
-        )
+        # Keyset по id вместо OFFSET: любая страница читает только свои 20 строк
+        users = keyset_paginate(query, User.id, per_page=20,
+                                after=request.args.get('after'),
+                                before=request.args.get('before'),
+                                with_total=True)
         
         # Обработка пользователей для безопасного отображения дат
         from datetime import datetime
@@ -11512,7 +10483,7 @@ def admin_users():
                 # Устанавливаем текущую дату для пользователей без даты создания
                 user.created_at = datetime.now()
         
-        print(f"DEBUG: Loading admin_users page - Found {users.total} users")
+        logger.debug("Loading admin_users page - Found %s users", users.total)
         
         return render_template('admin/users.html', 
                              admin=current_admin, 
@@ -11555,6 +10526,7 @@ def admin_edit_user(user_id):
         
         try:
             db.session.commit()
+            invalidate_principal('user', user.id)
             flash('Пользователь успешно обновлен', 'success')
             return redirect(url_for('admin_users'))
         except Exception as e:
@@ -11577,6 +10549,7 @@ def admin_delete_user(user_id):
     try:
         db.session.delete(user)
         db.session.commit()
+        invalidate_principal('user', user_id)
         flash('Пользователь успешно удален', 'success')
     except Exception as e:
         db.session.rollback()
@@ -11633,6 +10606,7 @@ def admin_toggle_user_role(user_id):
         old_role = user.role or 'Не назначена'
         user.role = new_role
         db.session.commit()
+        invalidate_principal('user', user.id)
         
         new_role_display = new_role or 'Не назначена'
         flash(f'Роль пользователя {user.email} изменена с "{old_role}" на "{new_role_display}"', 'success')
@@ -11664,15 +10638,11 @@ def admin_bulk_assign_role():
         return redirect(url_for('admin_users'))
     
     try:
-        users = User.query.filter(User.id.in_(user_ids)).all()
         role_display = new_role or 'Не назначена'
-        updated_count = 0
-        
-        for user in users:
-            user.role = new_role
-            updated_count += 1
+        updated_count, updated_ids = bulk_set_role(db.session, user_ids, new_role)
         
         db.session.commit()
+        invalidate_principal('user', *updated_ids)
         flash(f'Роль "{role_display}" назначена для {updated_count} пользователей', 'success')
         
     except Exception as e:
@@ -11694,19 +10664,10 @@ def admin_bulk_toggle_status():
         return redirect(url_for('admin_users'))
     
     try:
-        users = User.query.filter(User.id.in_(user_ids)).all()
-        activated_count = 0
-        deactivated_count = 0
-        
-        for user in users:
-            if user.is_active:
-                user.is_active = False
-                deactivated_count += 1
-            else:
-                user.is_active = True
-                activated_count += 1
+        activated_count, deactivated_count, updated_ids = bulk_toggle_active(db.session, user_ids)
         
         db.session.commit()
+        invalidate_principal('user', *updated_ids)
         
         if activated_count > 0 and deactivated_count > 0:
             flash(f'Активировано: {activated_count}, деактивировано: {deactivated_count} пользователей', 'success')
@@ -11734,13 +10695,10 @@ def admin_bulk_delete_users():
         return redirect(url_for('admin_users'))
     
     try:
-        users = User.query.filter(User.id.in_(user_ids)).all()
-        deleted_count = len(users)
-        
-        for user in users:
-            db.session.delete(user)
+        deleted_count, deleted_ids = bulk_delete_users(db.session, user_ids)
         
         db.session.commit()
+        invalidate_principal('user', *deleted_ids)
         flash(f'Удалено {deleted_count} пользователей', 'success')
         
     except Exception as e:
@@ -11832,7 +10790,7 @@ def admin_create_user():
             db.session.add(user)
             db.session.commit()
             
-            print(f"DEBUG: Successfully created user {user.id}: {user.full_name} by admin")
+            logger.debug("Successfully created user %s: %s by admin", user.id, user.full_name)
             
             # Send credentials if requested
             if 'send_credentials' in request.form:
@@ -11904,6 +10862,7 @@ def admin_toggle_user_status(user_id):
     
     try:
         db.session.commit()
+        invalidate_principal('user', user.id)
         status = 'активирован' if user.is_active else 'заблокирован'
         flash(f'Пользователь {status}', 'success')
     except Exception as e:
@@ -12022,23 +10981,23 @@ def admin_managers():
     admin_id = session.get('admin_id')
     current_admin = Admin.query.get(admin_id)
     
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
     status = request.args.get('status', '', type=str)
     
     query = Manager.query
     
     if search:
-        query = query.filter(Manager.email.contains(search) | Manager.first_name.contains(search) | Manager.last_name.contains(search))
+        query = query.filter(search_filter((Manager.email, Manager.first_name, Manager.last_name), search))
     
     if status == 'active':
         query = query.filter_by(is_active=True)
     elif status == 'inactive':
         query = query.filter_by(is_active=False)
     
-    managers = query.order_by(Manager.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    managers = keyset_paginate(query, Manager.id, per_page=20,
+                               after=request.args.get('after'),
+                               before=request.args.get('before'),
+                               with_total=True)
     
     return render_template('admin/managers.html', 
                          admin=current_admin, 
@@ -12061,7 +11020,7 @@ def admin_edit_manager(manager_id):
             flash(f'Менеджер с ID {manager_id} не найден', 'error')
             return redirect(url_for('admin_managers'))
             
-        print(f"DEBUG: Found manager {manager_id}: {manager.email}")
+        logger.debug("Found manager %s: %s", manager_id, manager.email)
     except Exception as e:
         print(f"ERROR in admin_edit_manager: {e}")
         flash('Ошибка при загрузке менеджера', 'error')
@@ -12081,6 +11040,7 @@ def admin_edit_manager(manager_id):
         
         try:
             db.session.commit()
+            invalidate_principal('manager', manager.id)
             flash('Менеджер успешно обновлен', 'success')
             return redirect(url_for('admin_managers'))
         except Exception as e:
@@ -12349,7 +11309,7 @@ def admin_delete_post(post_id):
 def admin_cashback_analytics():
     """Cashback analytics page"""
     from models import Admin, CashbackApplication
-    from sqlalchemy import func
+    from cashback_analytics import get_monthly_stats, get_status_stats
     
     admin_id = session.get('admin_id')
     current_admin = Admin.query.get(admin_id)
@@ -12357,21 +11317,11 @@ def admin_cashback_analytics():
     if not current_admin:
         return redirect(url_for('admin_login'))
     
-    # Monthly cashback stats
-    monthly_stats = db.session.query(
-        func.date_trunc('month', CashbackApplication.created_at).label('month'),
-        func.count(CashbackApplication.id).label('count'),
-        func.sum(CashbackApplication.cashback_amount).label('total_amount')
-    ).group_by(func.date_trunc('month', CashbackApplication.created_at)).order_by('month').all()
-    
-    # Status breakdown
-    status_stats = db.session.query(
-        CashbackApplication.status,
-        func.count(CashbackApplication.id).label('count'),
-        func.sum(CashbackApplication.cashback_amount).label('total_amount')
-    ).group_by(CashbackApplication.status).all()
-    
-    # Recent large cashbacks
+    # Monthly cashback stats and status breakdown (precomputed buckets)
+    monthly_stats = get_monthly_stats()
+    status_stats = get_status_stats()
+    
+    # Recent large cashbacks (walks idx_cashback_applications_created)
     large_cashbacks = CashbackApplication.query.filter(
         CashbackApplication.cashback_amount >= 100000
     ).order_by(CashbackApplication.created_at.desc()).limit(10).all()
@@ -12634,12 +11584,13 @@ def admin_create_complex_cashback():
             db.session.add(complex)
             db.session.commit()
             
-            flash('ЖК успешно создан', 'success')
-            return redirect(url_for('admin_complex_cashback'))
-            
         except Exception as e:
             db.session.rollback()
             flash('Ошибка при создании ЖК', 'error')
+        else:
+            refresh_admin_complex_pages(name)
+            flash('ЖК успешно создан', 'success')
+            return redirect(url_for('admin_complex_cashback'))
     
     # Load data for form
     developers = Developer.query.filter_by(is_active=True).order_by(Developer.name).all()
@@ -12650,6 +11601,14 @@ def admin_create_complex_cashback():
                          developers=developers,
                          districts=districts)
 
+def refresh_admin_complex_pages(*names):
+    """Пересобрать страницы ЖК после правки в админке; ошибка не отменяет сохраненную правку"""
+    try:
+        refresh_complex_page_cache(names=names)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Error refreshing complex pages for %s: %s", names, e)
+
 @app.route('/admin/complexes/cashback/<int:complex_id>/edit', methods=['GET', 'POST'])
 @admin_required
 def admin_edit_complex_cashback(complex_id):
@@ -12661,6 +11620,7 @@ def admin_edit_complex_cashback(complex_id):
     complex = ResidentialComplex.query.get_or_404(complex_id)
     
     if request.method == 'POST':
+        old_name = complex.name
         complex.name = request.form.get('name')
         complex.developer_id = int(request.form.get('developer_id')) if request.form.get('developer_id') else None
         complex.district_id = int(request.form.get('district_id')) if request.form.get('district_id') else None
@@ -12670,11 +11630,15 @@ def admin_edit_complex_cashback(complex_id):
         
         try:
             db.session.commit()
-            flash('ЖК успешно обновлен', 'success')
-            return redirect(url_for('admin_complex_cashback'))
         except Exception as e:
             db.session.rollback()
             flash('Ошибка при обновлении ЖК', 'error')
+        else:
+            # Кэшбек и описание страница берет из residential_complexes; пересборка нужна только при смене названия
+            if complex.name != old_name:
+                refresh_admin_complex_pages(old_name, complex.name)
+            flash('ЖК успешно обновлен', 'success')
+            return redirect(url_for('admin_complex_cashback'))
     
     # Load data for form
     developers = Developer.query.filter_by(is_active=True).order_by(Developer.name).all()
@@ -12693,14 +11657,17 @@ def admin_delete_complex_cashback(complex_id):
     from models import ResidentialComplex
     
     complex = ResidentialComplex.query.get_or_404(complex_id)
+    name = complex.name
     
     try:
         db.session.delete(complex)
         db.session.commit()
-        flash('ЖК успешно удален', 'success')
     except Exception as e:
         db.session.rollback()
         flash('Ошибка при удалении ЖК', 'error')
+    else:
+        refresh_admin_complex_pages(name)
+        flash('ЖК успешно удален', 'success')
     
     return redirect(url_for('admin_complex_cashback'))
 
@@ -12780,6 +11747,7 @@ def admin_delete_manager(manager_id):
     try:
         db.session.delete(manager)
         db.session.commit()
+        invalidate_principal('manager', manager_id)
         flash('Менеджер успешно удален', 'success')
     except Exception as e:
         db.session.rollback()
@@ -12798,6 +11766,7 @@ def admin_toggle_manager_status(manager_id):
     
     try:
         db.session.commit()
+        invalidate_principal('manager', manager.id)
         status = 'активирован' if manager.is_active else 'заблокирован'
         flash(f'Менеджер {status}', 'success')
     except Exception as e:
@@ -13006,7 +11975,7 @@ def save_collection():
 @manager_required
 def manager_analytics():
     """Manager analytics page"""
-    from models import Manager, User, Collection, CashbackApplication
+    from models import Manager, User, Collection
     from sqlalchemy import func
     
     manager_id = session.get('manager_id')
@@ -13015,18 +11984,16 @@ def manager_analytics():
     if not current_manager:
         return redirect(url_for('manager_login'))
     
-    # Manager stats
+    from manager_rollups import get_manager_totals, get_monthly_counts
+    
+    # Manager stats (pre-aggregated counters)
     clients_count = User.query.filter_by(assigned_manager_id=current_manager.id).count()
-    collections_count = Collection.query.filter_by(created_by_manager_id=current_manager.id).count()
-    sent_collections = Collection.query.filter_by(created_by_manager_id=current_manager.id, status='Отправлена').count()
+    totals = get_manager_totals(current_manager.id)
+    collections_count = totals['collections_created']
+    sent_collections = totals['collections_sent']
     
-    # Monthly collection stats
-    monthly_collections = db.session.query(
-        func.date_trunc('month', Collection.created_at).label('month'),
-        func.count(Collection.id).label('count')
-    ).filter_by(created_by_manager_id=current_manager.id).group_by(
-        func.date_trunc('month', Collection.created_at)
-    ).order_by('month').all()
+    # Monthly collection stats (from daily counters)
+    monthly_collections = get_monthly_counts(current_manager.id, 'collections_created')
     
     # Client activity stats
     client_stats = db.session.query(
@@ -13157,36 +12124,36 @@ def create_manager_saved_search():
     from models import ManagerSavedSearch
     import json
     
-    print(f"DEBUG: ===== create_manager_saved_search API CALLED =====")
-    print(f"DEBUG: Method: {request.method}")
-    print(f"DEBUG: Path: {request.path}")
+    logger.debug("===== create_manager_saved_search API CALLED =====")
+    logger.debug("Method: %s", request.method)
+    logger.debug("Path: %s", request.path)
     # Log safe headers only (no cookies/tokens)
     safe_headers = {k: v for k, v in request.headers.items() if k.lower() not in ['cookie', 'authorization']}
-    print(f"DEBUG: Headers: {safe_headers}")
+    logger.debug("Headers: %s", safe_headers)
     
     manager_id = session.get('manager_id')
-    print(f"DEBUG: Manager ID from session: {manager_id}")
+    logger.debug("Manager ID from session: %s", manager_id)
     
     data = request.get_json()
-    print(f"DEBUG: Raw request JSON: {data}")
-    print(f"DEBUG: JSON type: {type(data)}")
+    logger.debug("Raw request JSON: %s", data)
+    logger.debug("JSON type: %s", type(data))
     
     try:
         # Extract filters from the request
         filters = data.get('filters', {})
-        print(f"DEBUG: Creating manager search with filters: {filters}")
-        print(f"DEBUG: Full request data: {data}")
-        print(f"DEBUG: Filters type: {type(filters)}")
-        print(f"DEBUG: Filters empty check: {bool(filters)}")
+        logger.debug("Creating manager search with filters: %s", filters)
+        logger.debug("Full request data: %s", data)
+        logger.debug("Filters type: %s", type(filters))
+        logger.debug("Filters empty check: %s", bool(filters))
         
         # Test if filters is actually empty - force some test data if needed
         if not filters or not any(filters.values()):
-            print("DEBUG: Filters are empty, checking raw JSON...")
+            logger.debug("Filters are empty, checking raw JSON...")
             raw_json = request.get_data(as_text=True)
-            print(f"DEBUG: Raw request body: {raw_json}")
+            logger.debug("Raw request body: %s", raw_json)
         
         filters_json = json.dumps(filters) if filters else None
-        print(f"DEBUG: Filters JSON: {filters_json}")
+        logger.debug("Filters JSON: %s", filters_json)
         
         # Create new search
         search = ManagerSavedSearch(
@@ -13200,11 +12167,11 @@ def create_manager_saved_search():
         
         db.session.add(search)
         db.session.commit()
-        print(f"DEBUG: Saved search with ID: {search.id}, additional_filters: {search.additional_filters}")
+        logger.debug("Saved search with ID: %s, additional_filters: %s", search.id, search.additional_filters)
         
         # Verify the saved data
         db.session.refresh(search)
-        print(f"DEBUG: Refreshed search additional_filters: {search.additional_filters}")
+        logger.debug("Refreshed search additional_filters: %s", search.additional_filters)
         
         return jsonify({
             'success': True,
@@ -13678,7 +12645,7 @@ def save_search():
     try:
         client_email = data.get('client_email')  # For managers
         
-        print(f"DEBUG: Saving search with raw data: {data}")
+        logger.debug("Saving search with raw data: %s", data)
         
         # Create filter object from submitted data
         filters = {}
@@ -13728,7 +12695,7 @@ def save_search():
         if 'areaTo' in filter_data and filter_data['areaTo'] and str(filter_data['areaTo']) not in ['0', '']:
             filters['areaTo'] = str(filter_data['areaTo'])
             
-        print(f"DEBUG: Extracted filters from {filter_data}: {filters}")
+        logger.debug("Extracted filters from %s: %s", filter_data, filters)
 
         # Create search with new format
         search = SavedSearch(
@@ -14083,9 +13050,9 @@ def apply_saved_search(search_id):
         if search.additional_filters:
             try:
                 filters = json.loads(search.additional_filters)
-                print(f"DEBUG: Loaded filters from additional_filters: {filters}")
+                logger.debug("Loaded filters from additional_filters: %s", filters)
             except json.JSONDecodeError as e:
-                print(f"DEBUG: Error parsing additional_filters: {e}")
+                logger.warning(f"Error parsing additional_filters: {e}")
                 pass
         
         # Include legacy fields as filters if not already in additional_filters
@@ -14107,12 +13074,12 @@ def apply_saved_search(search_id):
         if search.size_max and 'areaTo' not in filters:
             filters['areaTo'] = str(search.size_max)
         
-        print(f"DEBUG: Применяем поиск '{search.name}' с фильтрами: {filters}")
+        logger.debug("Применяем поиск '%s' с фильтрами: %s", search.name, filters)
         
         try:
             search_dict = search.to_dict()
         except Exception as e:
-            print(f"DEBUG: Error in search.to_dict(): {e}")
+            logger.warning(f"Error in search.to_dict(): {e}")
             search_dict = {
                 'id': search.id,
                 'name': search.name,
@@ -14636,7 +13603,7 @@ def get_presentation_data(presentation_id):
     from models import Collection, CollectionProperty, Manager
     
     manager_id = session.get('manager_id')
-    print(f"DEBUG: Get presentation data - manager_id: {manager_id}, presentation_id: {presentation_id}")
+    logger.debug("Get presentation data - manager_id: %s, presentation_id: %s", manager_id, presentation_id)
     
     current_manager = Manager.query.get(manager_id)
     if not current_manager:
@@ -14657,20 +13624,12 @@ def get_presentation_data(presentation_id):
         collection_id=presentation_id
     ).order_by(CollectionProperty.order_index).all()
     
-    print(f"DEBUG: Found {len(collection_properties)} properties in presentation")
-    
-    # Load properties data to enrich the collection properties
-    properties_data = load_properties()
+    logger.debug("Found %s properties in presentation", len(collection_properties))
     
-    # Enrich collection properties with full property data
+    # Enrich collection properties with full property data, resolved through the id index in presentation order
+    resolved_properties = get_properties_by_ids([cp.property_id for cp in collection_properties])
     enriched_properties = []
-    for cp in collection_properties:
-        # Find the property in the main properties data
-        property_data = None
-        for prop in properties_data:
-            if str(prop.get('id')) == str(cp.property_id):
-                property_data = prop
-                break
+    for cp, property_data in zip(collection_properties, resolved_properties):
         
         if property_data:
             # Get complex name directly from property_data
@@ -14716,9 +13675,9 @@ def get_presentation_data(presentation_id):
             }
             enriched_properties.append(enriched_property)
         else:
-            print(f"DEBUG: Property {cp.property_id} not found in main data")
+            logger.debug("Property %s not found in main data", cp.property_id)
     
-    print(f"DEBUG: Enriched {len(enriched_properties)} properties")
+    logger.debug("Enriched %s properties", len(enriched_properties))
     
     # Format presentation data for JSON response
     presentation_data = {
@@ -14779,13 +13738,7 @@ def add_property_to_presentation(presentation_id):
     
     try:
         # Получаем информацию о квартире из JSON
-        properties = load_properties()
-        property_info = None
-        
-        for prop in properties:
-            if str(prop.get('id')) == str(property_id):
-                property_info = prop
-                break
+        property_info = get_properties_index().get(str(property_id))
         
         if not property_info:
             return jsonify({'success': False, 'error': 'Квартира не найдена'}), 404
@@ -14866,13 +13819,7 @@ def add_property_to_presentation_fixed(presentation_id):
     
     try:
         # Получаем информацию об объекте
-        properties = load_properties()
-        property_info = None
-        
-        for prop in properties:
-            if str(prop.get('id')) == str(property_id):
-                property_info = prop
-                break
+        property_info = get_properties_index().get(str(property_id))
         
         if not property_info:
             return jsonify({'success': False, 'error': 'Объект не найден'}), 404
@@ -15048,18 +13995,13 @@ def fetch_pdf_context(property_id, presentation_id=None):
         # Convert to dictionary using _mapping for SQLAlchemy compatibility
         property_data = dict(property_row._mapping)
         
-        # Parse photos JSON with safe error handling
+        # Parse photos with safe error handling
         property_images = {'photos': [], 'plans': []}
-        if property_data.get('photos'):
-            try:
-                photos_list = json.loads(property_data['photos'])
-                if photos_list and isinstance(photos_list, list):
-                    # First 6 images as main photos, 6-8 as plans (fixed logic)
-                    property_images['photos'] = photos_list[:6]
-                    property_images['plans'] = photos_list[6:8] if len(photos_list) > 6 else []
-            except (json.JSONDecodeError, TypeError, ValueError):
-                property_images['photos'] = []
-                property_images['plans'] = []
+        photos = normalize_photos(property_data.get('photos'))
+        photos_list = photos['gallery']
+        # First 6 images as main photos, 6-8 as plans (fixed logic)
+        property_images['photos'] = photos_list[:6]
+        property_images['plans'] = photos['floor_plans'][:2] or (photos_list[6:8] if len(photos_list) > 6 else [])
         
         # Get residential complex data if available
         complex_data = {}
@@ -15093,19 +14035,10 @@ def fetch_pdf_context(property_id, presentation_id=None):
                 photos_row = photos_result.fetchone()
                 
                 if photos_row and photos_row[0]:
-                    try:
-                        photos_data = json.loads(photos_row[0])
-                        if isinstance(photos_data, list):
-                            complex_photos = photos_data[:9]  # Take first 9 photos for 3x3 grid
-                        elif isinstance(photos_data, dict):
-                            # If photos are organized by categories  
-                            all_photos = []
-                            for category, photos_list in photos_data.items():
-                                if isinstance(photos_list, list):
-                                    all_photos.extend(photos_list)
-                            complex_photos = all_photos[:9]  # Take first 9 photos for 3x3 grid
-                    except (json.JSONDecodeError, TypeError):
-                        complex_photos = []
+                    photos = normalize_photos(photos_row[0])
+                    # Photos organized by categories are merged, first 9 for 3x3 grid
+                    all_photos = photos['gallery'] + photos['floor_plans'] + photos['complex_gallery']
+                    complex_photos = list(dict.fromkeys(all_photos))[:9]
                         
             except Exception as e:
                 print(f"Error loading complex data: {e}")
@@ -15232,25 +14165,211 @@ def print_property(presentation_id, property_id):
         return "Property data not found", 404
     
     # Render print template with full context
-    return render_template('print_property.html', 
-                         property=context['property'],
-                         property_images=context['property_images'],
-                         complex=context['complex'],
-                         complex_images=context['complex_images'],
-                         manager=context['manager'],
-                         presentation=presentation,
-                         manager_note=getattr(property_obj, 'manager_note', None),
-                         context=context)  # Full context for backwards compatibility
+    return render_print_property_html(presentation, property_obj, context)
+
+def print_property_cache_key(presentation, property_obj, context, for_pdf=False):
+    """Ключ карточки объекта: хэш данных объекта/ЖК/менеджера + версия шаблона"""
+    return asset_cache.make_key(
+        asset_cache.template_version('print_property.html'),
+        context,
+        getattr(presentation, 'name', None),
+        getattr(property_obj, 'manager_note', None),
+        for_pdf
+    )
+
+def render_print_property_html(presentation, property_obj, context, for_pdf=False):
+    """Отрисовать print_property.html (из кэша, если объект не менялся)"""
+    def render():
+        return render_template('print_property.html', 
+                             property=context['property'],
+                             property_images=context['property_images'],
+                             complex=context['complex'],
+                             complex_images=context['complex_images'],
+                             manager=context['manager'],
+                             presentation=presentation,
+                             manager_note=getattr(property_obj, 'manager_note', None),
+                             context=context,  # Full context for backwards compatibility
+                             for_pdf=for_pdf).encode('utf-8')
+    
+    cache_key = print_property_cache_key(presentation, property_obj, context, for_pdf)
+    return asset_cache.get_or_create('print-card', cache_key, render).decode('utf-8')
+
+def render_presentation_property_pdf(presentation, property_obj):
+    """Отрисовать PDF одного объекта презентации (print_property.html → WeasyPrint)"""
+    # Get comprehensive context using new function
+    context = fetch_pdf_context(property_obj.property_id, presentation.id)
+    if not context:
+        return None
+    
+    def render_pdf():
+        from weasyprint import HTML
+        html_content = render_print_property_html(presentation, property_obj, context, for_pdf=True)
+        return HTML(string=html_content, base_url=request.host_url,
+                    url_fetcher=image_proxy.weasyprint_url_fetcher).write_pdf()
+    
+    # Повторная печать той же квартиры не запускает верстку WeasyPrint заново
+    cache_key = asset_cache.make_key(
+        print_property_cache_key(presentation, property_obj, context, for_pdf=True),
+        request.host_url
+    )
+    return asset_cache.get_or_create('print-pdf', cache_key, render_pdf)
+
+def build_presentation_zip(presentation_id, output_path, progress):
+    """Фоновая задача: собрать ZIP со всеми объектами презентации, отчитываясь о прогрессе"""
+    import zipfile
+    from models import Collection, CollectionProperty
+    
+    presentation = Collection.query.get(presentation_id)
+    properties = CollectionProperty.query.filter_by(
+        collection_id=presentation_id
+    ).order_by(CollectionProperty.order_index).all()
+    total_properties = len(properties)
+    
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for current_index, prop in enumerate(properties, 1):
+            progress(
+                progress=int((current_index / total_properties) * 85),  # Leave 15% for ZIP creation
+                current=current_index,
+                total=total_properties,
+                message=f'Создаю PDF для квартиры {current_index} из {total_properties}...'
+            )
+            
+            pdf_bytes = render_presentation_property_pdf(presentation, prop)
+            if pdf_bytes is None:
+                print(f"Failed to get context for property {prop.property_id}")
+                continue
+            
+            zip_file.writestr(f'property_{prop.property_id}.pdf', pdf_bytes)
+        
+        progress(stage='completing', progress=95, message='Создаю архив...')
+
+def submit_presentation_zip_job(presentation):
+    """Поставить (или переиспользовать) задачу сборки ZIP для текущей версии презентации"""
+    title = (presentation.title or 'presentation').replace(' ', '_')
+    return pdf_job_service.submit(
+        'presentation-zip',
+        presentation_version_key(presentation),
+        lambda output_path, progress: build_presentation_zip(presentation.id, output_path, progress),
+        filename=f'presentation_{title}_all_properties.zip',
+        mimetype='application/zip',
+        base_url=request.host_url,
+        total=len(presentation.properties)
+    )
+
+def wants_job_json():
+    """Клиент умеет работать с фоновой задачей (fetch/XHR с Accept: application/json)"""
+    return (request.accept_mimetypes.best == 'application/json'
+            or request.headers.get('X-Requested-With') == 'XMLHttpRequest')
+
+def send_job_artefact(job_id, status):
+    return send_file(
+        pdf_job_service.artefact_path(job_id),
+        as_attachment=True,
+        download_name=status.get('filename'),
+        mimetype=status.get('mimetype'),
+        conditional=True
+    )
+
+def job_response(job_id, timeout=300):
+    """Ответ эндпоинта скачивания, который поставил фоновую задачу.
+
+    Готовый файл отдается сразу, JSON-клиенты получают 202 с адресами задачи.
+    Ждать задачу в запросе (до timeout секунд) остается только для старых
+    прямых ссылок, которые не умеют следить за задачей.
+    """
+    status = pdf_job_service.get_status(job_id)
+    if status and status.get('stage') == 'complete':
+        return send_job_artefact(job_id, status)
+    if wants_job_json():
+        return job_accepted_response(job_id)
+    return wait_for_job_result(job_id, timeout=timeout)
+
+def wait_for_job_result(job_id, timeout=300):
+    """Запасной блокирующий путь для прямых ссылок: дождаться задачи и отдать файл"""
+    pdf_job_service.wait(job_id, timeout=timeout)
+    status = pdf_job_service.get_status(job_id)
+    if status and status.get('stage') == 'complete':
+        return send_job_artefact(job_id, status)
+    if status and status.get('stage') in ACTIVE_STAGES:
+        # Задача продолжает работать: вернуть ее адреса вместо ошибки
+        return job_accepted_response(job_id)
+    message = (status or {}).get('message', 'Ошибка при создании файла')
+    return jsonify({'success': False, 'error': message, 'job_id': job_id}), 500
+
+def job_accepted_response(job_id):
+    """202-ответ с адресами статуса, SSE и скачивания фоновой задачи"""
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id),
+        'download_url': url_for('download_job_result', job_id=job_id)
+    }), 202
+
+def _job_event_payload(status, download_url):
+    """Формат события прогресса, который понимают шаблоны презентаций"""
+    payload = {
+        'stage': 'starting' if status.get('stage') == 'queued' else status.get('stage'),
+        'progress': status.get('progress', 0),
+        'current': status.get('current'),
+        'total': status.get('total'),
+        'message': status.get('message')
+    }
+    if status.get('stage') == 'complete':
+        payload['download_url'] = download_url
+    elif status.get('stage') == 'error':
+        payload['error'] = status.get('message')
+    return payload
+
+def _job_event_stream(job_id, timeout=600):
+    from flask import Response
+    
+    download_url = url_for('download_job_result', job_id=job_id)
+    
+    def generator():
+        for status in pdf_job_service.iter_events(job_id, timeout=timeout):
+            yield f"data: {json.dumps(_job_event_payload(status, download_url), ensure_ascii=False)}\n\n"
+    
+    return Response(
+        generator(),
+        content_type='text/event-stream; charset=utf-8',
+        headers={
+            'Cache-Control': 'no-cache, no-store, must-revalidate',
+            'Connection': 'keep-alive',
+            'X-Accel-Buffering': 'no'  # Disable nginx buffering
+        }
+    )
+
+@app.route('/api/jobs/<string:job_id>')
+def job_status(job_id):
+    """Состояние фоновой задачи генерации файла"""
+    status = pdf_job_service.get_status(job_id)
+    if not status:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    return jsonify({'success': True, **_job_event_payload(status, url_for('download_job_result', job_id=job_id))})
+
+@app.route('/api/jobs/<string:job_id>/events')
+def job_events(job_id):
+    """SSE поток прогресса фоновой задачи"""
+    if not pdf_job_service.get_status(job_id):
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    return _job_event_stream(job_id)
+
+@app.route('/api/jobs/<string:job_id>/download')
+def download_job_result(job_id):
+    """Скачать готовый результат фоновой задачи (с поддержкой Range)"""
+    status = pdf_job_service.get_status(job_id)
+    if not status:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    if status.get('stage') != 'complete' or not os.path.exists(pdf_job_service.artefact_path(job_id)):
+        return jsonify({'success': False, 'error': 'Файл еще не готов', 'stage': status.get('stage')}), 409
+    return send_job_artefact(job_id, status)
 
 @app.route('/api/presentation/<int:presentation_id>/property/<string:property_id>/download')
 @manager_required
 def download_presentation_property_pdf(presentation_id, property_id):
     """Скачать объект в PDF формате"""
     from models import Collection, CollectionProperty
-    from weasyprint import HTML, CSS
-    from io import BytesIO
-    import tempfile
-    import os
     
     try:
         # Find presentation and property
@@ -15263,35 +14382,23 @@ def download_presentation_property_pdf(presentation_id, property_id):
         if not property_obj:
             return "Property not found in presentation", 404
         
-        # Get comprehensive context using new function
-        context = fetch_pdf_context(property_id, presentation_id)
-        
-        if not context:
-            return "Property data not found", 404
-        
-        # Render HTML for PDF with full context
-        html_content = render_template('print_property.html', 
-                                     property=context['property'],
-                                     property_images=context['property_images'],
-                                     complex=context['complex'],
-                                     complex_images=context['complex_images'],
-                                     manager=context['manager'],
-                                     presentation=presentation,
-                                     manager_note=property_obj.manager_note,
-                                     context=context,
-                                     for_pdf=True)
-        
-        # Generate PDF
-        pdf_buffer = BytesIO()
-        HTML(string=html_content, base_url=request.host_url).write_pdf(pdf_buffer)
-        pdf_buffer.seek(0)
-        
-        return send_file(
-            pdf_buffer,
-            as_attachment=True,
-            download_name=f'property_{property_id}.pdf',
-            mimetype='application/pdf'
+        def build(output_path, progress):
+            pdf_bytes = render_presentation_property_pdf(Collection.query.get(presentation_id), 
+                                                         CollectionProperty.query.get(property_obj.id))
+            if pdf_bytes is None:
+                raise ValueError("Property data not found")
+            with open(output_path, 'wb') as f:
+                f.write(pdf_bytes)
+        
+        job_id = pdf_job_service.submit(
+            'property-pdf',
+            f"{presentation_version_key(presentation)}:{property_id}",
+            build,
+            filename=f'property_{property_id}.pdf',
+            mimetype='application/pdf',
+            base_url=request.host_url
         )
+        return job_response(job_id)
         
     except Exception as e:
         print(f"Error generating PDF: {e}")
@@ -15301,11 +14408,7 @@ def download_presentation_property_pdf(presentation_id, property_id):
 @manager_required
 def download_all_properties(presentation_id):
     """Скачать все объекты презентации в ZIP архиве"""
-    from models import Collection, CollectionProperty
-    from weasyprint import HTML, CSS
-    import zipfile
-    from io import BytesIO
-    import tempfile
+    from models import Collection
     
     try:
         # Find presentation
@@ -15316,115 +14419,10 @@ def download_all_properties(presentation_id):
         if presentation.created_by_manager_id != manager_id:
             return jsonify({'success': False, 'error': 'Access denied'}), 403
         
-        # Get all properties in presentation
-        properties = CollectionProperty.query.filter_by(
-            collection_id=presentation_id
-        ).all()
-        
-        print(f"DEBUG: Found {len(properties)} properties in presentation {presentation_id}")
-        for prop in properties:
-            print(f"DEBUG: Property ID: {prop.property_id}")
-        
-        if not properties:
+        if not presentation.properties:
             return jsonify({'success': False, 'error': 'No properties in presentation'}), 400
         
-        # Create ZIP archive
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for prop in properties:
-                # Get property details from database using raw SQL for compatibility
-                try:
-                    query = text("""
-                        SELECT 
-                            ep.inner_id AS id,
-                            CAST(ep.object_area AS FLOAT) AS area,
-                            CAST(ep.price AS INTEGER) AS price,
-                            CAST(ep.object_min_floor AS INTEGER) AS floor,
-                            CAST(ep.object_max_floor AS INTEGER) AS total_floors,
-                            CAST(ep.object_rooms AS INTEGER) AS rooms,
-                            'Квартира' AS property_type,
-                            ep.address_display_name AS address,
-                            ep.complex_name AS jk_name,
-                            ep.developer_name AS developer_name,
-                            NULL AS completion_date
-                        FROM excel_properties ep
-                        WHERE ep.inner_id = :prop_id
-                    """)
-                    
-                    # Convert property_id to int for inner_id lookup
-                    try:
-                        prop_id_int = int(prop.property_id)
-                    except ValueError:
-                        print(f"Invalid property ID format: {prop.property_id}")
-                        continue
-                        
-                    result = db.session.execute(query, {'prop_id': prop_id_int}).fetchone()
-                    
-                    if not result:
-                        print(f"Property {prop.property_id} not found in database")
-                        continue  # Skip if property not found
-                        
-                    # Convert row to object and compute safe values
-                    from types import SimpleNamespace
-                    row_dict = dict(result._mapping)
-                    
-                    # Ensure safe types and compute price per sqm
-                    row_dict['price'] = int(row_dict['price'] or 0)
-                    row_dict['area'] = float(row_dict['area'] or 0)
-                    row_dict['rooms'] = int(row_dict['rooms'] or 0)
-                    
-                    # Compute price per sqm safely
-                    if row_dict['area'] and row_dict['area'] > 0:
-                        row_dict['price_per_sqm'] = int(row_dict['price'] / row_dict['area'])
-                    else:
-                        row_dict['price_per_sqm'] = 0
-                        
-                    property_item = SimpleNamespace(**row_dict)
-                    property_data = [property_item]
-                except Exception as e:
-                    print(f"Database error for property {prop.property_id}: {e}")
-                    continue
-                
-                if property_data:
-                    property_item = property_data[0]
-                    
-                    # Use fetch_pdf_context to get all necessary data
-                    context = fetch_pdf_context(prop.property_id, presentation_id)
-                    if not context:
-                        print(f"Failed to get context for property {prop.property_id}")
-                        continue
-                    
-                    # Generate HTML for PDF with complete context
-                    html_content = render_template('print_property.html', 
-                                                 property=context['property'],
-                                                 property_images=context['property_images'],
-                                                 complex=context['complex'],
-                                                 complex_images=context['complex_images'],
-                                                 manager=context['manager'],
-                                                 presentation=presentation,
-                                                 manager_note=getattr(prop, 'manager_note', None),
-                                                 context=context,
-                                                 for_pdf=True)
-                    
-                    # Generate PDF
-                    pdf_buffer = BytesIO()
-                    HTML(string=html_content, base_url=request.host_url).write_pdf(pdf_buffer)
-                    
-                    # Add to ZIP
-                    filename = f'property_{prop.property_id}.pdf'
-                    zip_file.writestr(filename, pdf_buffer.getvalue())
-                    print(f"DEBUG: Added {filename} to ZIP (size: {len(pdf_buffer.getvalue())} bytes)")
-        
-        zip_buffer.seek(0)
-        print(f"DEBUG: ZIP created with total size: {len(zip_buffer.getvalue())} bytes")
-        
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=f'presentation_{presentation_id}_all_properties.zip',
-            mimetype='application/zip'
-        )
+        return job_response(submit_presentation_zip_job(presentation), timeout=600)
         
     except Exception as e:
         print(f"Error creating ZIP: {e}")
@@ -15432,184 +14430,48 @@ def download_all_properties(presentation_id):
 
 @app.route('/presentation/view/<string:unique_id>/download-all')
 def download_all_properties_public(unique_id):
-    """Публичное скачивание всех объектов презентации в ZIP архиве"""
-    from models import Collection, CollectionProperty
-    from weasyprint import HTML, CSS
-    import zipfile
-    from io import BytesIO
-    import tempfile
+    """Публичное скачивание всех объектов презентации в ZIP архиве.
+    Архив собирается фоновой задачей; повторные запросы той же версии презентации получают готовый файл."""
+    from models import Collection
     
     try:
         # Find presentation by unique_id instead of presentation_id
-        presentation = Collection.query.filter_by(
-            unique_url=unique_id,
-            collection_type='presentation'
-        ).first()
-        
-        if not presentation:
-            return "Презентация не найдена", 404
-        
-        # Get all properties in presentation
-        properties = CollectionProperty.query.filter_by(
-            collection_id=presentation.id
-        ).all()
-        
-        print(f"DEBUG: Found {len(properties)} properties in presentation {presentation.id}")
-        for prop in properties:
-            print(f"DEBUG: Property ID: {prop.property_id}")
-        
-        if not properties:
-            return "Нет объектов в презентации", 400
-        
-        # Initialize progress tracking
-        progress_key = f"presentation_{unique_id}"
-        total_properties = len(properties)
-        
-        # Create ZIP archive with real progress tracking
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for current_index, prop in enumerate(properties, 1):
-                # Update progress
-                progress = int((current_index / total_properties) * 85)  # Leave 15% for ZIP creation
-                progress_storage[progress_key] = {
-                    'stage': 'processing',
-                    'progress': progress,
-                    'current': current_index,
-                    'total': total_properties,
-                    'message': f'Создаю PDF для квартиры {current_index} из {total_properties}...'
-                }
-                
-                # Get property details from database using raw SQL for compatibility
-                try:
-                    query = text("""
-                        SELECT 
-                            ep.inner_id AS id,
-                            CAST(ep.object_area AS FLOAT) AS area,
-                            CAST(ep.price AS INTEGER) AS price,
-                            CAST(ep.object_min_floor AS INTEGER) AS floor,
-                            CAST(ep.object_max_floor AS INTEGER) AS total_floors,
-                            CAST(ep.object_rooms AS INTEGER) AS rooms,
-                            'Квартира' AS property_type,
-                            ep.address_display_name AS address,
-                            ep.complex_name AS jk_name,
-                            ep.developer_name AS developer_name,
-                            NULL AS completion_date
-                        FROM excel_properties ep
-                        WHERE ep.inner_id = :prop_id
-                    """)
-                    
-                    # Convert property_id to int for inner_id lookup
-                    try:
-                        prop_id_int = int(prop.property_id)
-                    except ValueError:
-                        print(f"Invalid property ID format: {prop.property_id}")
-                        continue
-                        
-                    result = db.session.execute(query, {'prop_id': prop_id_int}).fetchone()
-                    
-                    if not result:
-                        print(f"Property {prop.property_id} not found in database")
-                        continue  # Skip if property not found
-                        
-                    # Convert row to object and compute safe values
-                    from types import SimpleNamespace
-                    row_dict = dict(result._mapping)
-                    
-                    # Ensure safe types and compute price per sqm
-                    row_dict['price'] = int(row_dict['price'] or 0)
-                    row_dict['area'] = float(row_dict['area'] or 0)
-                    row_dict['rooms'] = int(row_dict['rooms'] or 0)
-                    
-                    # Compute price per sqm safely
-                    if row_dict['area'] and row_dict['area'] > 0:
-                        row_dict['price_per_sqm'] = int(row_dict['price'] / row_dict['area'])
-                    else:
-                        row_dict['price_per_sqm'] = 0
-                        
-                    property_item = SimpleNamespace(**row_dict)
-                    property_data = [property_item]
-                except Exception as e:
-                    print(f"Database error for property {prop.property_id}: {e}")
-                    continue
-                
-                if property_data:
-                    property_item = property_data[0]
-                    
-                    # Use fetch_pdf_context to get all necessary data
-                    context = fetch_pdf_context(prop.property_id, presentation.id)
-                    if not context:
-                        print(f"Failed to get context for property {prop.property_id}")
-                        continue
-                    
-                    # Generate HTML for PDF with complete context
-                    html_content = render_template('print_property.html', 
-                                                 property=context['property'],
-                                                 property_images=context['property_images'],
-                                                 complex=context['complex'],
-                                                 complex_images=context['complex_images'],
-                                                 manager=context['manager'],
-                                                 presentation=presentation,
-                                                 manager_note=getattr(prop, 'manager_note', None),
-                                                 context=context,
-                                                 for_pdf=True)
-                    
-                    # Generate PDF
-                    pdf_buffer = BytesIO()
-                    HTML(string=html_content, base_url=request.host_url).write_pdf(pdf_buffer)
-                    
-                    # Add to ZIP
-                    filename = f'property_{prop.property_id}.pdf'
-                    zip_file.writestr(filename, pdf_buffer.getvalue())
-                    print(f"DEBUG: Added {filename} to ZIP (size: {len(pdf_buffer.getvalue())} bytes)")
-        
-        # Final progress - creating archive
-        progress_storage[progress_key] = {
-            'stage': 'completing',
-            'progress': 95,
-            'message': 'Создаю архив...'
-        }
+        presentation = Collection.query.filter_by(
+            unique_url=unique_id,
+            collection_type='presentation'
+        ).first()
         
-        zip_buffer.seek(0)
-        print(f"DEBUG: ZIP created with total size: {len(zip_buffer.getvalue())} bytes")
+        if not presentation:
+            return "Презентация не найдена", 404
         
-        # Mark as complete
-        progress_storage[progress_key] = {
-            'stage': 'complete',
-            'progress': 100,
-            'message': 'Готово! Скачивание началось.'
-        }
+        if not presentation.properties:
+            return "Нет объектов в презентации", 400
         
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=f'presentation_{presentation.title.replace(" ", "_")}_all_properties.zip',
-            mimetype='application/zip'
-        )
+        return job_response(submit_presentation_zip_job(presentation), timeout=600)
         
     except Exception as e:
         print(f"Error creating ZIP: {e}")
-        
-        # Update progress with error
-        progress_key = f"presentation_{unique_id}"
-        progress_storage[progress_key] = {
-            'stage': 'error',
-            'progress': 0,
-            'message': f'Ошибка при создании архива: {str(e)}'
-        }
-        
         return f"Ошибка при создании архива: {str(e)}", 500
 
-# Global progress storage for tracking real-time PDF generation
-progress_storage = {}
-
 @app.route('/presentation/view/<string:unique_id>/progress')
 def download_progress_stream(unique_id):
-    """SSE endpoint для отслеживания реального прогресса создания PDF файлов"""
+    """SSE endpoint для отслеживания реального прогресса создания PDF файлов.
+    Запускает (или переиспользует) фоновую задачу сборки архива и транслирует ее состояние."""
     from flask import Response
-    import json
-    import time
-    from models import Collection, CollectionProperty
+    from models import Collection
+    
+    def error_response(message):
+        def error_stream():
+            yield f"data: {json.dumps({'error': message})}\n\n"
+        return Response(
+            error_stream(),
+            content_type='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache, no-store, must-revalidate',
+                'Connection': 'keep-alive',
+                'X-Accel-Buffering': 'no'
+            }
+        )
     
     try:
         # Find presentation by unique_id
@@ -15619,114 +14481,15 @@ def download_progress_stream(unique_id):
         ).first()
         
         if not presentation:
-            def error_stream():
-                yield f"data: {json.dumps({'error': 'Презентация не найдена'})}\n\n"
-            return Response(
-                error_stream(),
-                content_type='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache, no-store, must-revalidate',
-                    'Connection': 'keep-alive',
-                    'X-Accel-Buffering': 'no'
-                }
-            )
+            return error_response('Презентация не найдена')
         
-        # Get properties count
-        properties = CollectionProperty.query.filter_by(
-            collection_id=presentation.id
-        ).all()
-        
-        if not properties:
-            def error_stream():
-                yield f"data: {json.dumps({'error': 'Нет объектов в презентации'})}\n\n"
-            return Response(
-                error_stream(),
-                content_type='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache, no-store, must-revalidate',
-                    'Connection': 'keep-alive',
-                    'X-Accel-Buffering': 'no'
-                }
-            )
-            
-        def progress_generator():
-            try:
-                total = len(properties)
-                progress_key = f"presentation_{unique_id}"
-                
-                # Initialize progress
-                progress_storage[progress_key] = {
-                    'stage': 'starting',
-                    'progress': 0,
-                    'current': 0,
-                    'total': total,
-                    'message': 'Начинаю создание PDF файлов...'
-                }
-                
-                # Начальное сообщение
-                yield f"data: {json.dumps(progress_storage[progress_key])}\n\n"
-                time.sleep(1)
-                
-                # Wait for real progress updates from download endpoint
-                last_progress = 0
-                timeout_counter = 0
-                
-                while True:
-                    if progress_key in progress_storage:
-                        current_progress = progress_storage[progress_key]
-                        
-                        # Only send updates when progress changes
-                        if current_progress['progress'] != last_progress or current_progress['stage'] != 'processing':
-                            yield f"data: {json.dumps(current_progress)}\n\n"
-                            last_progress = current_progress['progress']
-                        
-                        # Check if completed
-                        if current_progress['stage'] == 'complete':
-                            break
-                            
-                        # Check if error occurred
-                        if current_progress['stage'] == 'error':
-                            break
-                    
-                    time.sleep(0.5)
-                    timeout_counter += 1
-                    
-                    # Timeout after 2 minutes
-                    if timeout_counter > 240:
-                        progress_storage[progress_key] = {
-                            'stage': 'error',
-                            'message': 'Превышено время ожидания',
-                            'progress': 0
-                        }
-                        yield f"data: {json.dumps(progress_storage[progress_key])}\n\n"
-                        break
-                
-                # Cleanup
-                if progress_key in progress_storage:
-                    del progress_storage[progress_key]
-                    
-            except Exception as e:
-                yield f"data: {json.dumps({'error': f'Ошибка: {str(e)}'})}\n\n"
+        if not presentation.properties:
+            return error_response('Нет объектов в презентации')
         
-        return Response(
-            progress_generator(),
-            content_type='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache',
-                'Expires': '0',
-                'Connection': 'keep-alive',
-                'X-Accel-Buffering': 'no',  # Disable nginx buffering
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Cache-Control',
-                'Content-Type': 'text/event-stream; charset=utf-8'
-            }
-        )
+        return _job_event_stream(submit_presentation_zip_job(presentation))
         
     except Exception as e:
-        def error_stream():
-            yield f"data: {json.dumps({'error': f'Ошибка сервера: {str(e)}'})}\n\n"
-        return Response(error_stream(), content_type='text/plain')
+        return error_response(f'Ошибка сервера: {str(e)}')
 
 @app.route('/api/manager/presentation/<int:presentation_id>/send-email', methods=['POST'])
 @manager_required
@@ -16148,7 +14911,8 @@ def property_download_pdf(presentation_id, property_id):
         # Генерировать PDF
         try:
             pdf_buffer = io.BytesIO()
-            weasyprint.HTML(string=html_content, base_url=request.url_root).write_pdf(pdf_buffer)
+            weasyprint.HTML(string=html_content, base_url=request.url_root,
+                            url_fetcher=image_proxy.weasyprint_url_fetcher).write_pdf(pdf_buffer)
             pdf_buffer.seek(0)
             
             # Создать ASCII-safe имя файла для headers
@@ -16497,14 +15261,14 @@ def api_user_get_recommendations():
     from datetime import datetime
     
     try:
-        print(f"DEBUG: Loading recommendations for user ID: {current_user.id}")
+        logger.debug("Loading recommendations for user ID: %s", current_user.id)
         
         # Get traditional recommendations
         recommendations = Recommendation.query.filter_by(
             client_id=current_user.id
         ).order_by(Recommendation.sent_at.desc()).all()
         
-        print(f"DEBUG: Found {len(recommendations)} recommendations for user {current_user.id}")
+        logger.debug("Found %s recommendations for user %s", len(recommendations), current_user.id)
         
         recommendations_data = []
         for rec in recommendations:
@@ -17236,8 +16000,7 @@ def api_manager_welcome_message():
 @manager_required
 def api_manager_dashboard_stats():
     """Get manager dashboard statistics"""
-    from models import User, Recommendation
-    from sqlalchemy import func
+    from models import User
     
     # Check if user is authenticated as manager
     manager_id = session.get('manager_id')
@@ -17245,22 +16008,22 @@ def api_manager_dashboard_stats():
         return jsonify({'success': False, 'error': 'Требуется авторизация менеджера'}), 401
     
     try:
+        from manager_rollups import get_manager_totals, get_manager_period_totals
+        
         # Count clients assigned to this manager
         clients_count = User.query.filter_by(assigned_manager_id=manager_id).count()
         
-        # Count recommendations sent by this manager
-        recommendations_count = Recommendation.query.filter_by(manager_id=manager_id).count()
+        # Recommendations sent by this manager (pre-aggregated counters)
+        totals = get_manager_totals(manager_id)
+        recommendations_count = totals['recommendations_sent']
         
-        # Count recommendations sent this month
+        # Recommendations sent this month (sum of daily counters)
         from datetime import datetime
-        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_recommendations = Recommendation.query.filter(
-            Recommendation.manager_id == manager_id,
-            Recommendation.sent_at >= month_start
-        ).count()
+        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        monthly_recommendations = get_manager_period_totals(manager_id, month_start)['recommendations_sent']
         
-        # Collections count (placeholder for now)
-        collections_count = 5
+        # Collections created by this manager
+        collections_count = totals['collections_created']
         
         return jsonify({
             'success': True,
@@ -17277,8 +16040,7 @@ def api_manager_dashboard_stats():
 @manager_required
 def api_manager_activity_feed():
     """Get manager activity feed"""
-    from models import Recommendation, User, ManagerNotification
-    from datetime import datetime, timedelta
+    from datetime import datetime
     
     # Check if user is authenticated as manager
     manager_id = session.get('manager_id')
@@ -17286,15 +16048,7 @@ def api_manager_activity_feed():
         return jsonify({'success': False, 'error': 'Требуется авторизация менеджера'}), 401
     
     try:
-        # Get recent activities (recommendations sent)
-        recent_recommendations = Recommendation.query.filter_by(
-            manager_id=manager_id
-        ).order_by(Recommendation.sent_at.desc()).limit(10).all()
-        
-        # Получаем последние уведомления менеджера
-        recent_notifications = ManagerNotification.query.filter_by(
-            manager_id=manager_id
-        ).order_by(ManagerNotification.created_at.desc()).limit(15).all()
+        from manager_rollups import get_activity_feed
         
         # Функция для форматирования времени
         def format_time_ago(timestamp):
@@ -17306,42 +16060,21 @@ def api_manager_activity_feed():
             else:
                 return f"{time_diff.seconds // 60} мин. назад"
         
-        # Создаем общий список с временными метками для сортировки
-        all_activities = []
-        
-        # Добавляем уведомления
-        for notification in recent_notifications:
-            all_activities.append({
-                'timestamp': notification.created_at,
-                'activity': {
-                    'title': notification.title,
-                    'description': notification.message,
-                    'time_ago': format_time_ago(notification.created_at),
-                    'icon': 'eye' if notification.notification_type == 'presentation_view' else 'bell',
-                    'color': 'purple' if notification.notification_type == 'presentation_view' else 'gray',
-                    'is_read': notification.is_read,
-                    'notification_id': notification.id,
-                    'type': 'notification'
-                }
-            })
-        
-        # Добавляем рекомендации
-        for rec in recent_recommendations:
-            all_activities.append({
-                'timestamp': rec.sent_at,
-                'activity': {
-                    'title': f'Отправлена рекомендация',
-                    'description': f'{rec.title} для {rec.client.full_name}',
-                    'time_ago': format_time_ago(rec.sent_at),
-                    'icon': 'paper-plane',
-                    'color': 'blue',
-                    'type': 'recommendation'
-                }
-            })
-        
-        # Сортируем по времени и берем только активности
-        all_activities.sort(key=lambda x: x['timestamp'], reverse=True)
-        activities = [item['activity'] for item in all_activities[:10]]  # Берем топ 10
+        # Лента уже собрана и отсортирована в manager_activity (уведомления + рекомендации)
+        activities = []
+        for item in get_activity_feed(manager_id, limit=10):
+            activity = {
+                'title': item.title,
+                'description': item.description,
+                'time_ago': format_time_ago(item.occurred_at),
+                'icon': item.icon,
+                'color': item.color,
+                'type': item.source_type
+            }
+            if item.source_type == 'notification':
+                activity['is_read'] = item.is_read
+                activity['notification_id'] = item.source_id
+            activities.append(activity)
         
         # Добавляем демо активности только если реальных активностей мало
         if len(activities) < 2:
@@ -17375,8 +16108,6 @@ def api_manager_activity_feed():
 @manager_required
 def api_manager_top_clients():
     """Get top clients by interactions"""
-    from models import User, Recommendation
-    from sqlalchemy import func
     
     # Check if user is authenticated as manager
     manager_id = session.get('manager_id')
@@ -17384,17 +16115,10 @@ def api_manager_top_clients():
         return jsonify({'success': False, 'error': 'Требуется авторизация менеджера'}), 401
     
     try:
+        from manager_rollups import get_top_clients
+        
         # Get clients with most interactions (recommendations received)
-        top_clients = db.session.query(
-            User,
-            func.count(Recommendation.id).label('interactions_count')
-        ).join(
-            Recommendation, User.id == Recommendation.client_id
-        ).filter(
-            Recommendation.manager_id == manager_id
-        ).group_by(User.id).order_by(
-            func.count(Recommendation.id).desc()
-        ).limit(5).all()
+        top_clients = get_top_clients(manager_id, limit=5)
         
         clients_data = []
         for user, count in top_clients:
@@ -17795,9 +16519,10 @@ def blog_article_new(slug):
     try:
         article = BlogArticle.query.filter_by(slug=slug, status='published').first_or_404()
         
-        # Increment view count
-        article.views_count += 1
-        db.session.commit()
+        # Increment view count (buffered) and show it with not yet flushed views
+        view_counters.increment('blog_articles', article.id)
+        set_committed_value(article, 'views_count',
+                            view_counters.value('blog_articles', article.id, article.views_count))
         
         # Get related articles from same category
         related_articles = BlogArticle.query.filter_by(
@@ -17873,17 +16598,9 @@ def blog_post(slug):
             'author_name': result[9] or 'InBack'
         }
         
-        # Increment view count
-        try:
-            db.session.execute(text("""
-                UPDATE blog_posts 
-                SET views_count = COALESCE(views_count, 0) + 1 
-                WHERE id = :id
-            """), {'id': post['id']})
-            db.session.commit()
-            post['views_count'] += 1
-        except Exception as e:
-            db.session.rollback()
+        # Increment view count (buffered, written in batches by view_counters)
+        view_counters.increment('blog_posts', post['id'])
+        post['views_count'] = view_counters.value('blog_posts', post['id'], post['views_count'])
         
         # Get related posts from same category
         related_results = db.session.execute(text("""
@@ -18035,8 +16752,8 @@ def admin_create_blog_post():
         category.articles_count = BlogPost.query.filter_by(category=category.name, status='published').count()
         db.session.commit()
         
-        print(f'DEBUG: Created article "{title}" in category "{category.name}" with status "{status}"')
-        print(f'DEBUG: Updated category "{category.name}" article count to {category.articles_count}')
+        logger.debug('Created article "%s" in category "%s" with status "%s"', title, category.name, status)
+        logger.debug('Updated category "%s" article count to %s', category.name, category.articles_count)
         
         flash('Статья успешно создана!', 'success')
         return redirect(url_for('admin_blog_management'))
@@ -18631,9 +17348,9 @@ def job_detail(job_slug):
     try:
         job = Job.query.filter(Job.slug == job_slug, Job.is_active == True, Job.status == 'active').first_or_404()
         
-        # Increment views count
-        job.views_count = (job.views_count or 0) + 1
-        db.session.commit()
+        # Increment views count (buffered) and show it with not yet flushed views
+        view_counters.increment('jobs', job.id)
+        set_committed_value(job, 'views_count', view_counters.value('jobs', job.id, job.views_count))
         
         return render_template('vacancy_details.html', vacancy=job)
         
@@ -19276,8 +17993,11 @@ def manager_clients():
     if not manager:
         return redirect(url_for('manager_login'))
     
-    # Get clients assigned to this manager
-    clients = User.query.filter_by(assigned_manager_id=manager_id).order_by(User.created_at.desc()).all()
+    # Get clients assigned to this manager (keyset по id, по индексу assigned_manager_id)
+    clients = keyset_paginate(User.query.filter_by(assigned_manager_id=manager_id), User.id,
+                              per_page=page_size(request.args.get('per_page'), 50),
+                              after=request.args.get('after'),
+                              before=request.args.get('before'))
     
     return render_template('manager/clients.html', 
                          manager=manager,
@@ -19345,27 +18065,28 @@ def manager_add_client():
     import re
     
     manager_id = session.get('manager_id')
-    print(f"DEBUG: Add client endpoint called by manager {manager_id}")
-    print(f"DEBUG: Request method: {request.method}, Content-Type: {request.content_type}")
-    print(f"DEBUG: Request is_json: {request.is_json}")
+    logger.debug("Add client endpoint called by manager %s", manager_id)
+    logger.debug("Request method: %s, Content-Type: %s", request.method, request.content_type)
+    logger.debug("Request is_json: %s", request.is_json)
     
     try:
         # Accept both JSON and form data
         if request.is_json:
             data = request.get_json()
-            print(f"DEBUG: Received JSON data: {data}")
+            logger.debug("Received JSON data: %s", data)
             full_name = data.get('full_name', '').strip()
             email = data.get('email', '').strip().lower()
             phone = data.get('phone', '').strip() if data.get('phone') else None
             is_active = data.get('is_active', True)
         else:
-            print(f"DEBUG: Received form data: {dict(request.form)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Received form data: %s", dict(request.form))
             full_name = request.form.get('full_name', '').strip()
             email = request.form.get('email', '').strip().lower()
             phone = request.form.get('phone', '').strip() if request.form.get('phone') else None
             is_active = 'is_active' in request.form
         
-        print(f"DEBUG: Parsed data - name: {full_name}, email: {email}, phone: {phone}, active: {is_active}")
+        logger.debug("Parsed data - name: %s, email: %s, phone: %s, active: %s", full_name, email, phone, is_active)
         
         # Validation
         if not full_name or len(full_name) < 2:
@@ -19408,7 +18129,7 @@ def manager_add_client():
         db.session.add(user)
         db.session.commit()
         
-        print(f"DEBUG: Successfully created client {user.id}: {user.full_name}")
+        logger.debug("Successfully created client %s: %s", user.id, user.full_name)
         
         # Send welcome email and SMS with credentials
         try:
@@ -19442,7 +18163,7 @@ def manager_add_client():
                 content=email_content,
                 template_name='notification'
             )
-            print(f"DEBUG: Welcome email with credentials sent to {email}")
+            logger.debug("Welcome email with credentials sent to %s", email)
             
             # Send SMS if phone number provided
             if phone:
@@ -19458,15 +18179,15 @@ def manager_add_client():
                     )
                     
                     if sms_sent:
-                        print(f"DEBUG: SMS sent successfully to {phone}")
+                        logger.debug("SMS sent successfully to %s", phone)
                     else:
-                        print(f"DEBUG: SMS sending failed for {phone}")
+                        logger.debug("SMS sending failed for %s", phone)
                     
                 except Exception as sms_e:
-                    print(f"DEBUG: Failed to send SMS: {sms_e}")
+                    logger.debug("Failed to send SMS: %s", sms_e)
                     
         except Exception as e:
-            print(f"DEBUG: Failed to send welcome email: {e}")
+            logger.debug("Failed to send welcome email: %s", e)
         
         return jsonify({
             'success': True, 
@@ -19650,8 +18371,21 @@ def api_get_deals():
             if status_list:
                 deals_query = deals_query.filter(Deal.status.in_(status_list))
         
-        # Order by creation date (newest first)
-        deals = deals_query.order_by(Deal.created_at.desc()).all()
+        # Клиент, менеджер и ЖК подгружаются вместе со сделками, а не запросом на каждую
+        from sqlalchemy.orm import joinedload
+        deals_query = deals_query.options(
+            joinedload(Deal.client), joinedload(Deal.manager), joinedload(Deal.residential_complex)
+        )
+        
+        # ?limit=/&after= — постранично по id (новые сверху), иначе весь список
+        page = None
+        if request.args.get('limit') or request.args.get('after'):
+            page = keyset_paginate(deals_query, Deal.id, per_page=page_size(request.args.get('limit'), 50),
+                                   after=request.args.get('after'))
+            deals = page.items
+        else:
+            # Order by creation date (newest first)
+            deals = deals_query.order_by(Deal.created_at.desc()).all()
         
         # Format response
         deals_data = []
@@ -19681,18 +18415,91 @@ def api_get_deals():
                 'can_edit': deal.can_edit(manager_id if is_manager else current_user.id, is_manager)
             })
         
-        return jsonify({
+        result = {
             'success': True,
             'deals': deals_data,
             'total': len(deals_data),
             'is_manager': is_manager
-        })
+        }
+        if page is not None:
+            result['next_cursor'] = page.next_cursor
+            result['has_more'] = page.has_next
+        return jsonify(result)
         
     except Exception as e:
         print(f"Error getting deals: {e}")
         return jsonify({'success': False, 'error': 'Ошибка сервера при получении сделок'}), 500
 
 
+def export_access_required(f):
+    """Выгрузки доступны менеджерам и администраторам (по сессии)"""
+    from functools import wraps
+    
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        is_admin = bool(session.get('is_admin') and session.get('admin_id'))
+        is_manager = active_session_manager() is not None
+        if not is_admin and not is_manager:
+            return jsonify({'success': False, 'error': 'Требуется авторизация менеджера'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def export_scope_manager_id():
+    """Менеджер выгружает только своих клиентов и сделки, администратор — все"""
+    if session.get('is_admin') and session.get('admin_id'):
+        return None
+    return session.get('manager_id')
+
+@app.route('/api/export/properties.<fmt>', methods=['GET'])
+@export_access_required
+def export_properties(fmt):
+    """Streaming export of listings with the /properties filters"""
+    from data_export import EXPORT_FORMATS, PROPERTY_COLUMNS, export_response, property_export_rows
+    
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Формат должен быть csv или xlsx'}), 400
+    try:
+        rows = property_export_rows(db.session, property_filters_from_args(request.args))
+        return export_response(rows, PROPERTY_COLUMNS, fmt, 'properties', 'Объекты')
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Error exporting properties: {e}")
+        return jsonify({'success': False, 'error': 'Ошибка выгрузки объектов'}), 500
+
+@app.route('/api/export/clients.<fmt>', methods=['GET'])
+@export_access_required
+def export_clients(fmt):
+    """Streaming export of the manager's clients (all buyers for admins)"""
+    from data_export import EXPORT_FORMATS, CLIENT_COLUMNS, client_export_rows, export_response
+    
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Формат должен быть csv или xlsx'}), 400
+    try:
+        rows = client_export_rows(db.session, export_scope_manager_id())
+        return export_response(rows, CLIENT_COLUMNS, fmt, 'clients', 'Клиенты')
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Error exporting clients: {e}")
+        return jsonify({'success': False, 'error': 'Ошибка выгрузки клиентов'}), 500
+
+@app.route('/api/export/deals.<fmt>', methods=['GET'])
+@export_access_required
+def export_deals(fmt):
+    """Streaming export of deals, ?status=new,reserved as in /api/deals"""
+    from data_export import EXPORT_FORMATS, DEAL_COLUMNS, deal_export_rows, export_response
+    
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Формат должен быть csv или xlsx'}), 400
+    try:
+        status_filter = request.args.get('status', '')
+        statuses = [s.strip() for s in status_filter.split(',') if s.strip()]
+        rows = deal_export_rows(db.session, export_scope_manager_id(), statuses)
+        return export_response(rows, DEAL_COLUMNS, fmt, 'deals', 'Сделки')
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Error exporting deals: {e}")
+        return jsonify({'success': False, 'error': 'Ошибка выгрузки сделок'}), 500
+
 @app.route('/api/deals/<int:deal_id>', methods=['GET'])
 @login_required
 def api_get_deal(deal_id):
@@ -19911,14 +18718,14 @@ def api_delete_deal(deal_id):
     
     try:
         manager_id = session.get('manager_id')
-        print(f"DEBUG: Get client {client_id}, manager_id: {manager_id}")
+        logger.debug("Get client %s, manager_id: %s", client_id, manager_id)
         
         # Try to find client assigned to this manager first, then any buyer
         client = User.query.filter_by(id=client_id, assigned_manager_id=manager_id).first()
         if not client:
             client = User.query.filter_by(id=client_id, role='buyer').first()
         
-        print(f"DEBUG: Found client: {client}")
+        logger.debug("Found client: %s", client)
         
         if not client:
             return jsonify({'success': False, 'error': 'Клиент не найден'}), 404
@@ -19931,11 +18738,11 @@ def api_delete_deal(deal_id):
             'phone': client.phone or '',
             'is_active': client.is_active if hasattr(client, 'is_active') else True
         }
-        print(f"DEBUG: Returning client data: {response_data}")
+        logger.debug("Returning client data: %s", response_data)
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"DEBUG: Exception in get_client: {str(e)}")
+        logger.warning(f"Exception in get_client: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/manager/edit-client', methods=['POST'])
@@ -20140,69 +18947,31 @@ def send_callback_notification_telegram(callback_req, manager):
 
 @app.route('/api/blog/search')
 def blog_search_api():
-    """API endpoint for instant blog search and suggestions"""
-    from models import BlogPost, Category
-    from sqlalchemy import or_, func
-    
+    """API endpoint for instant blog search and suggestions (blog_search index)"""
     try:
         query = request.args.get('q', '').strip()
-        category = request.args.get('category', '').strip()
+        category = request.args.get('category', '').strip() or None
         suggestions_only = request.args.get('suggestions', '').lower() == 'true'
-        
-        # Start with base query - use BlogPost (where data actually is)
-        search_query = BlogPost.query.filter(BlogPost.status == 'published')
-        
-        # Apply search filter
-        if query:
-            search_query = search_query.filter(
-                or_(
-                    BlogPost.title.ilike(f'%{query}%'),
-                    BlogPost.content.ilike(f'%{query}%'),
-                    BlogPost.excerpt.ilike(f'%{query}%')
-                )
-            )
-        
-        # Apply category filter
-        if category:
-            search_query = search_query.filter(BlogPost.category == category)
-        
-        # For suggestions, limit to title matches only
+
         if suggestions_only:
-            if query:
-                suggestions = search_query.filter(
-                    BlogPost.title.ilike(f'%{query}%')
-                ).limit(5).all()
-                
-                return jsonify({
-                    'suggestions': [{
-                        'title': post.title,
-                        'slug': post.slug,
-                        'category': post.category or 'Общее'
-                    } for post in suggestions]
-                })
-            else:
-                return jsonify({'suggestions': []})
-        
-        # For full search, return formatted articles
-        articles = search_query.order_by(BlogPost.created_at.desc()).limit(20).all()
-        
-        formatted_articles = []
-        for article in articles:
-            formatted_articles.append({
-                'title': article.title,
-                'slug': article.slug,
-                'excerpt': article.excerpt or '',
-                'featured_image': article.featured_image or '',
-                'category': article.category or 'Общее',
-                'date': article.created_at.strftime('%d.%m.%Y'),
-                'reading_time': getattr(article, 'reading_time', 5),
-                'views': getattr(article, 'views', 0)
+            suggestions = blog_search.suggest(query, category) if query else []
+            return jsonify({
+                'suggestions': [{
+                    'title': post['title'],
+                    'slug': post['slug'],
+                    'category': post['category']
+                } for post in suggestions]
             })
+
+        if query:
+            articles = blog_search.search(query, category, limit=20)
+        else:
+            articles = blog_search.latest(category, limit=20)
         return jsonify({
-            'articles': formatted_articles,
-            'total': len(formatted_articles)
+            'articles': articles,
+            'total': len(articles)
         })
-        
+
     except Exception as e:
         print(f"ERROR in blog search API: {e}")
         import traceback
@@ -20321,69 +19090,48 @@ def scraper_statistics():
             'message': f'Ошибка получения статистики: {str(e)}'
         }), 500
 
-@app.route('/admin/scraper/files')
+@app.route('/admin/scraper/datasets')
 @admin_required
-def scraper_files():
-    """List scraped data files"""
+def scraper_datasets():
+    """Scraped datasets stored in crawl_entities (source / entity type)"""
     try:
-        import glob
-        import os
-        from datetime import datetime
-        
-        files = glob.glob('scraped_developers_*.json')
-        file_info = []
-        
-        for file in files:
-            stat = os.stat(file)
-            file_info.append({
-                'name': file,
-                'size': stat.st_size,
-                'created': datetime.fromtimestamp(stat.st_ctime).strftime('%d.%m.%Y %H:%M'),
-                'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%d.%m.%Y %H:%M')
-            })
-        
-        # Sort by creation time, newest first
-        file_info.sort(key=lambda x: x['modified'], reverse=True)
+        datasets = crawl_store.dataset_summary(db.session)
+        for dataset in datasets:
+            for field in ('last_seen', 'last_changed', 'last_fetched'):
+                value = dataset[field]
+                dataset[field] = value.strftime('%d.%m.%Y %H:%M') if value else None
         
         return jsonify({
             'success': True,
-            'files': file_info
+            'datasets': datasets
         })
         
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Ошибка при получении списка файлов: {str(e)}'
+            'message': f'Ошибка при получении наборов данных: {str(e)}'
         }), 500
 
-@app.route('/admin/scraper/view-file/<filename>')
+@app.route('/admin/scraper/datasets/<source>/<entity_type>')
 @admin_required
-def view_scraped_file(filename):
-    """View scraped data file content"""
+def view_scraper_dataset(source, entity_type):
+    """View entities of one scraped dataset"""
     try:
-        import json
-        import os
-        
-        # Security check - only allow scraped files
-        if not filename.startswith('scraped_developers_') or not filename.endswith('.json'):
-            return jsonify({'success': False, 'message': 'Недопустимое имя файла'}), 400
-        
-        if not os.path.exists(filename):
-            return jsonify({'success': False, 'message': 'Файл не найден'}), 404
-        
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        limit = min(request.args.get('limit', 1000, type=int), 5000)
+        entities = crawl_store.dataset_entities(db.session, source, entity_type, limit=limit)
+        if not entities:
+            return jsonify({'success': False, 'message': 'Набор данных не найден'}), 404
         
         return jsonify({
             'success': True,
-            'data': data,
-            'filename': filename
+            'data': entities,
+            'dataset': f'{source}:{entity_type}'
         })
         
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Ошибка при чтении файла: {str(e)}'
+            'message': f'Ошибка при чтении набора данных: {str(e)}'
         }), 500
 
 @app.route('/admin/upload-excel', methods=['POST'])
@@ -20520,175 +19268,42 @@ def admin_check_import_status(task_id):
 
 # ================== REGIONAL FUNCTIONS ==================
 
-def parse_address_components(address_display_name):
-    """
-    Парсит полный адрес и извлекает регион, город и район
-    Пример: "Россия, Краснодарский край, Сочи, Кудепста м-н, Искры, 88 лит7"
-    Возвращает: {'region': 'Краснодарский край', 'city': 'Сочи', 'district': 'Кудепста м-н'}
-    """
-    if not address_display_name:
-        return {'region': None, 'city': None, 'district': None}
-    
-    # Разделяем адрес по запятым
-    parts = [part.strip() for part in address_display_name.split(',')]
-    
-    result = {'region': None, 'city': None, 'district': None}
-    
-    # Ищем регион (обычно содержит "край", "область", "республика")
-    for part in parts:
-        if any(keyword in part.lower() for keyword in ['край', 'область', 'республика', 'федерация']):
-            result['region'] = part
-            break
-    
-    # Ищем город (после региона, обычно не содержит специальных суффиксов)
-    region_found = False
-    for part in parts:
-        if result['region'] and part == result['region']:
-            region_found = True
-            continue
-        
-        if region_found and part != 'Россия':
-            # Проверяем что это не улица или дом
-            if not any(keyword in part.lower() for keyword in ['ул', 'улица', 'проспект', 'пр-т', 'переулок', 'пер', 'м-н', 'лит', 'стр', 'корп', 'д.']):
-                # Проверяем что это не номер и не псевдо-город типа "Краснодар 6"
-                if not part.replace(' ', '').replace('а', '').replace('б', '').replace('в', '').replace('г', '').isdigit():
-                    # Дополнительная проверка на псевдо-города (название + пробел + число)
-                    import re
-                    if not re.match(r'^[а-яё]+\s+\d+$', part.lower()):
-                        result['city'] = part
-                        break
-    
-    # Ищем район/микрорайон (обычно содержит "м-н", "р-н" или идет после города)
-    city_found = False
-    for part in parts:
-        if result['city'] and part == result['city']:
-            city_found = True
-            continue
-            
-        if city_found:
-            # Если это район/микрорайон
-            if any(keyword in part.lower() for keyword in ['м-н', 'р-н', 'район', 'микрорайон', 'мкр']):
-                result['district'] = part
-                break
-            # Или если это название района без суффиксов (первое после города)
-            elif not any(keyword in part.lower() for keyword in ['ул', 'улица', 'проспект', 'пр-т', 'лит', 'стр', 'корп', 'дом', 'д.']):
-                # Проверяем что это не номер дома (содержит только цифры и буквы типа 2А, 10, 36 и т.д.)
-                if not (part.replace('/', '').replace('к', '').replace('стр', '').replace('а', '').replace('б', '').replace('в', '').replace('г', '').replace(' ', '').isdigit() or len(part) <= 5):
-                    result['district'] = part
-                    break
-    
-    return result
-
-def get_or_create_region(region_name):
-    """Получить или создать регион в базе данных"""
-    if not region_name:
-        return None
-        
-    from models import Region
-    
-    # Ищем существующий регион
-    region = Region.query.filter_by(name=region_name).first()
-    
-    if not region:
-        # Создаем новый регион
-        slug = region_name.lower().replace(' ', '-').replace('ский', '').replace('край', 'krai')
-        region = Region(
-            name=region_name,
-            slug=slug,
-            is_active=True,
-            is_default=(region_name == 'Краснодарский край')  # Краснодарский край по умолчанию
-        )
-        db.session.add(region)
-        try:
-            db.session.commit()
-            print(f"Created new region: {region_name}")
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error creating region {region_name}: {e}")
-            return None
-    
-    return region
-
-def get_or_create_city(city_name, region):
-    """Получить или создать город в регионе"""
-    if not city_name or not region:
-        return None
-        
-    from models import City
-    
-    # Ищем существующий город в этом регионе
-    city = City.query.filter_by(name=city_name, region_id=region.id).first()
-    
-    if not city:
-        # Создаем новый город
-        slug = city_name.lower().replace(' ', '-')
-        city = City(
-            name=city_name,
-            slug=slug,
-            region_id=region.id,
-            is_active=True,
-            is_default=(city_name == 'Краснодар')  # Краснодар по умолчанию
-        )
-        db.session.add(city)
-        try:
-            db.session.commit()
-            print(f"Created new city: {city_name} in {region.name}")
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error creating city {city_name}: {e}")
-            return None
-    
-    return city
-
 def update_properties_with_regions():
     """Обновить все объекты недвижимости с региональной привязкой"""
-    from models import ExcelProperty
-    
-    properties = ExcelProperty.query.all()
-    updated_count = 0
-    
-    print(f"Updating {len(properties)} properties with regional data...")
+    addresses = db.session.execute(text("""
+        SELECT DISTINCT address_display_name
+        FROM excel_properties
+        WHERE address_display_name IS NOT NULL
+    """)).scalars().all()
+    parsed = parse_addresses(addresses)
     
-    for prop in properties:
-        if prop.address_display_name:
-            # Парсим адрес
-            address_parts = parse_address_components(prop.address_display_name)
-            
-            # Обновляем парсеные поля
-            prop.parsed_region = address_parts['region']
-            prop.parsed_city = address_parts['city'] 
-            prop.parsed_district = address_parts['district']
-            
-            # Создаем/находим регион и город
-            if address_parts['region']:
-                region = get_or_create_region(address_parts['region'])
-                if region:
-                    prop.region_id = region.id
-                    
-                    if address_parts['city']:
-                        city = get_or_create_city(address_parts['city'], region)
-                        if city:
-                            prop.city_id = city.id
-            
-            updated_count += 1
-            
-            # Сохраняем по частям для избежания таймаутов
-            if updated_count % 50 == 0:
-                try:
-                    db.session.commit()
-                    print(f"Updated {updated_count} properties...")
-                except Exception as e:
-                    db.session.rollback()
-                    print(f"Error updating properties: {e}")
-                    break
+    print(f"Updating properties with regional data ({len(parsed)} unique addresses)...")
     
-    # Финальное сохранение
     try:
+        # Регионы и города загружаются один раз, недостающие создаются пачкой
+        regions = RegionCityMap(db.session)
+        regions.ensure({(parts['region'], parts['city']) for parts in parsed.values()})
+        
+        values = []
+        for address, parts in parsed.items():
+            region_id, city_id = regions.ids(parts['region'], parts['city'])
+            values.append({
+                'address': address,
+                'parsed_region': parts['region'],
+                'parsed_city': parts['city'],
+                'parsed_district': parts['district'],
+                'region_id': region_id,
+                'city_id': city_id,
+            })
+        updated_count = bulk_update_parsed(db.session, values, ('parsed_region', 'parsed_city', 'parsed_district',
+                                                                'region_id', 'city_id'))
         db.session.commit()
         print(f"Successfully updated {updated_count} properties with regional data")
+        return updated_count
     except Exception as e:
         db.session.rollback()
-        print(f"Error in final commit: {e}")
+        print(f"Error updating properties with regional data: {e}")
+        return 0
 
 # ================== EXCEL IMPORT FUNCTIONS ==================
 
@@ -20717,6 +19332,7 @@ def import_excel_to_database(file_path):
             return {"success": False, "message": f"Отсутствуют обязательные колонки: {', '.join(missing_columns)}", "imported": 0}
         
         imported_count = 0
+        imported_photos = []
         developers_created = set()
         complexes_created = set()
         errors_count = 0
@@ -20863,6 +19479,7 @@ def import_excel_to_database(file_path):
                     excel_property.parsed_house_number = parsed['house_number']
                 
                 db.session.add(excel_property)
+                imported_photos.append((excel_property.inner_id, excel_property.photos))
                 imported_count += 1
                 
                 # Commit in batches to avoid memory issues
@@ -20878,6 +19495,20 @@ def import_excel_to_database(file_path):
         # Final commit
         db.session.commit()
         
+        # Разбираем фото новых объектов один раз при импорте
+        sync_property_photos(db.session, imported_photos)
+        db.session.commit()
+        
+        # Район определяется только для новых и переехавших объектов, сводка районов пересчитывается
+        assign_districts(db.session)
+        refresh_district_stats(db.session)
+        db.session.commit()
+        
+        # Страницы ЖК и профили застройщиков собираются заново по новым квартирам
+        refresh_complex_page_cache()
+        refresh_developer_profiles(db.session, developer_slug)
+        db.session.commit()
+        
         message_parts = [f"Файл обработан успешно"]
         if developers_created:
             message_parts.append(f"Создано застройщиков: {len(developers_created)}")
@@ -21058,6 +19689,7 @@ def import_domclick_to_database():
         
         # Импортируем квартиры в excel_properties
         apartments_created = 0
+        imported_photos = []
         for apt_data in data.get('apartments', []):
             # Проверяем, что квартира не существует
             existing_apt = ExcelProperty.query.filter_by(inner_id=apt_data['inner_id']).first()
@@ -21099,6 +19731,7 @@ def import_domclick_to_database():
             )
             
             db.session.add(property_obj)
+            imported_photos.append((property_obj.inner_id, property_obj.photos))
             apartments_created += 1
             
             # Сохраняем по частям
@@ -21109,10 +19742,29 @@ def import_domclick_to_database():
         # Финальное сохранение
         db.session.commit()
         
+        # Разбираем фото новых объектов один раз при импорте
+        sync_property_photos(db.session, imported_photos)
+        
+        # Новые/изменившиеся квартиры из хранилища парсера забраны импортом
+        crawl_store.mark_imported(db.session, crawl_store.pending_changes(db.session, 'domclick', 'apartment'))
+        db.session.commit()
+        
+        # Район определяется только для новых и переехавших объектов, сводка районов пересчитывается
+        assign_districts(db.session)
+        refresh_district_stats(db.session)
+        db.session.commit()
+        
+        # Страницы ЖК и профили застройщиков собираются заново по новым квартирам
+        refresh_complex_page_cache()
+        refresh_developer_profiles(db.session, developer_slug)
+        db.session.commit()
+        
         print(f"✅ Импорт завершен:")
         print(f"   • Застройщиков: {developers_created}")
         print(f"   • ЖК: {complexes_created}")
         print(f"   • Квартир: {apartments_created}")
+        if data.get('changes'):
+            print(f"   • Изменения парсера: {data['changes']}")
         
         return {
             'success': True,
@@ -22378,14 +21030,11 @@ def generate_comparison_pdf():
         </html>
         """
         
-        logging.info("🎨 HTML content generated, converting to PDF with WeasyPrint...")
-        
-        # Generate PDF using WeasyPrint
-        pdf_bytes = weasyprint.HTML(string=html_content).write_pdf()
-        logging.info(f"📄 PDF generated successfully! Size: {len(pdf_bytes)} bytes")
+        logging.info("🎨 HTML content generated, converting to PDF with WeasyPrint in background job...")
         
         # Create completely ASCII-safe filename (avoid Unicode issues)
         import re
+        import hashlib
         import unidecode
         try:
             # Remove all non-ASCII characters completely
@@ -22398,19 +21047,23 @@ def generate_comparison_pdf():
         
         safe_filename = f'comparison-{safe_name}-{datetime.now().strftime("%Y%m%d-%H%M")}.pdf'
         
-        # Return PDF file
-        from flask import Response
-        response = Response(
-            pdf_bytes,
+        def build(output_path, progress):
+            progress(message='Создаю PDF сравнения...')
+            weasyprint.HTML(string=html_content, url_fetcher=image_proxy.weasyprint_url_fetcher).write_pdf(output_path)
+        
+        # Generate PDF using WeasyPrint as a background job (same document → same job)
+        job_id = pdf_job_service.submit(
+            'comparison-pdf',
+            f"{manager_id}:{hashlib.sha256(html_content.encode('utf-8')).hexdigest()}",
+            build,
+            filename=safe_filename,
             mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename="{safe_filename}"',
-                'Content-Length': str(len(pdf_bytes))
-            }
+            base_url=request.host_url
         )
         
-        logging.info(f"✅ PDF successfully generated and returned for {recipient_name}")
-        return response
+        logging.info(f"✅ PDF job {job_id} submitted for {recipient_name}")
+        # Клиенты, принимающие JSON, получают 202 и следят за задачей через SSE
+        return job_response(job_id)
     
     except Exception as e:
         logging.error(f"❌ Error generating PDF: {str(e)}")
@@ -22563,14 +21216,14 @@ def manager_save_comparison_complex():
         data = request.get_json()
         manager_id = session.get('manager_id')
         
-        print(f"🏢 DEBUG save-complex: manager_id={manager_id}, data={data}")
+        logger.debug("🏢 save-complex: manager_id=%s, data=%s", manager_id, data)
         
         complex_id = data.get('complex_id')
         if not complex_id:
-            print("❌ DEBUG save-complex: Complex ID missing")
+            logger.warning("❌ save-complex: Complex ID missing")
             return jsonify({'success': False, 'error': 'Complex ID required'})
         
-        print(f"🏢 DEBUG save-complex: complex_id={complex_id}")
+        logger.debug("🏢 save-complex: complex_id=%s", complex_id)
         
         # Get REAL data from excel_properties for buildings_count, apartments_count, and PRICES
         complex_name = data.get('complex_name', '')
@@ -22603,16 +21256,16 @@ def manager_save_comparison_complex():
                     real_buildings_count = int(real_data[1] or 1)
                     real_min_price = int(real_data[2] or 0)
                     real_max_price = int(real_data[3] or 0)
-                    print(f"🏢 DEBUG save-complex: Found REAL data - apartments: {real_apartments_count}, buildings: {real_buildings_count}, price: {real_min_price}-{real_max_price}")
+                    logger.debug("🏢 save-complex: Found REAL data - apartments: %s, buildings: %s, price: %s-%s", real_apartments_count, real_buildings_count, real_min_price, real_max_price)
                 else:
-                    print(f"🏢 DEBUG save-complex: No real data found for complex: {complex_name}")
+                    logger.debug("🏢 save-complex: No real data found for complex: %s", complex_name)
                     # Fallback to passed data
                     real_apartments_count = data.get('apartments_count', 0)
                     real_buildings_count = data.get('buildings_count', 0)
                     real_min_price = data.get('min_price', 0)
                     real_max_price = data.get('max_price', 0)
             except Exception as e:
-                print(f"⚠️ DEBUG save-complex: Error getting real data: {e}")
+                logger.warning(f"⚠️ save-complex: Error getting real data: {e}")
                 # Fallback to passed data
                 real_apartments_count = data.get('apartments_count', 0)
                 real_buildings_count = data.get('buildings_count', 0)
@@ -22626,7 +21279,7 @@ def manager_save_comparison_complex():
         ).first()
         
         if not comparison:
-            print("🏢 DEBUG save-complex: Creating new comparison")
+            logger.debug("🏢 save-complex: Creating new comparison")
             comparison = ManagerComparison(
                 manager_id=manager_id,
                 name='Сравнение для клиента',
@@ -22635,7 +21288,7 @@ def manager_save_comparison_complex():
             db.session.add(comparison)
             db.session.flush()
         
-        print(f"🏢 DEBUG save-complex: comparison_id={comparison.id}")
+        logger.debug("🏢 save-complex: comparison_id=%s", comparison.id)
         
         # Check if complex already exists
         existing = ComparisonComplex.query.filter_by(
@@ -22644,7 +21297,7 @@ def manager_save_comparison_complex():
         ).first()
         
         if existing:
-            print(f"🏢 DEBUG save-complex: Complex {complex_id} already exists")
+            logger.debug("🏢 save-complex: Complex %s already exists", complex_id)
             return jsonify({'success': True, 'message': 'Complex already in comparison'})
         
         # Get next order index
@@ -22652,7 +21305,7 @@ def manager_save_comparison_complex():
             manager_comparison_id=comparison.id
         ).scalar() or 0
         
-        print(f"🏢 DEBUG save-complex: max_order={max_order}")
+        logger.debug("🏢 save-complex: max_order=%s", max_order)
         
         # Create new comparison complex
         comparison_complex = ComparisonComplex(
@@ -22672,17 +21325,17 @@ def manager_save_comparison_complex():
             order_index=max_order + 1
         )
         
-        print(f"🏢 DEBUG save-complex: Created object with complex_id={comparison_complex.complex_id}")
+        logger.debug("🏢 save-complex: Created object with complex_id=%s", comparison_complex.complex_id)
         
         db.session.add(comparison_complex)
         db.session.commit()
         
-        print(f"✅ DEBUG save-complex: Successfully saved complex {complex_id} to database")
+        logger.debug("✅ save-complex: Successfully saved complex %s to database", complex_id)
         
         return jsonify({'success': True, 'message': 'Complex added to comparison'})
         
     except Exception as e:
-        print(f"❌ DEBUG save-complex: Exception {str(e)}")
+        logger.warning(f"❌ save-complex: Exception {str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
 
@@ -22773,7 +21426,7 @@ def manager_clear_comparison():
         
         manager_id = session.get('manager_id')
         
-        print(f"🗑️ DEBUG clear: Starting clear for manager_id={manager_id}")
+        logger.debug("🗑️ clear: Starting clear for manager_id=%s", manager_id)
         
         # Find active comparison
         comparison = ManagerComparison.query.filter_by(
@@ -22782,29 +21435,29 @@ def manager_clear_comparison():
         ).first()
         
         if comparison:
-            print(f"🗑️ DEBUG clear: Found comparison_id={comparison.id}")
+            logger.debug("🗑️ clear: Found comparison_id=%s", comparison.id)
             
             # Count items before deletion
             properties_count = ComparisonProperty.query.filter_by(manager_comparison_id=comparison.id).count()
             complexes_count = ComparisonComplex.query.filter_by(manager_comparison_id=comparison.id).count()
             
-            print(f"🗑️ DEBUG clear: Found {properties_count} properties, {complexes_count} complexes to delete")
+            logger.debug("🗑️ clear: Found %s properties, %s complexes to delete", properties_count, complexes_count)
             
             # Remove all properties and complexes
             ComparisonProperty.query.filter_by(manager_comparison_id=comparison.id).delete()
             ComparisonComplex.query.filter_by(manager_comparison_id=comparison.id).delete()
             db.session.commit()
             
-            print(f"✅ DEBUG clear: Successfully cleared comparison")
+            logger.debug("✅ clear: Successfully cleared comparison")
         else:
-            print(f"ℹ️ DEBUG clear: No active comparison found for manager {manager_id}")
+            logger.debug("ℹ️ clear: No active comparison found for manager %s", manager_id)
         
         return jsonify({'success': True, 'message': 'Comparison cleared'})
         
     except Exception as e:
-        print(f"❌ DEBUG clear: Exception {str(e)}")
+        logger.warning(f"❌ clear: Exception {str(e)}")
         import traceback
-        print(f"❌ DEBUG clear: Traceback {traceback.format_exc()}")
+        logger.warning(f"❌ clear: Traceback {traceback.format_exc()}")
         return jsonify({'success': False, 'error': str(e)})
 
 
@@ -22870,6 +21523,7 @@ def admin_assign_client():
             client.assigned_manager_id = None
             client.client_status = 'Не назначен'
             db.session.commit()
+            invalidate_principal('user', client.id)
             logging.info(f"Admin removed manager assignment from client {client_id}")
             return jsonify({
                 'success': True, 
@@ -22887,6 +21541,7 @@ def admin_assign_client():
         client.assigned_manager_id = manager_id
         client.client_status = 'Назначен'
         db.session.commit()
+        invalidate_principal('user', client.id)
         
         logging.info(f"Admin assigned client {client_id} to manager {manager_id}")
         
@@ -22985,6 +21640,19 @@ def load_comparison():
             user_comparison_id=user_comparison.id
         ).order_by(ComparisonProperty.order_index).all()
         
+        # ✅ Все объекты сравнения загружаются из excel_properties одним запросом
+        excel_rows = {}
+        try:
+            excel_rows = fetch_excel_properties_by_ids(
+                [cp.property_id for cp in comparison_properties if cp.property_id],
+                ['complex_name', 'developer_name', 'renovation_display_name',
+                 'complex_building_end_build_year', 'complex_building_end_build_quarter',
+                 'object_min_floor', 'object_max_floor', 'object_area', 'object_rooms',
+                 'price', 'address_display_name', 'photos']
+            )
+        except Exception as e:
+            print(f"❌ Error loading comparison properties: {str(e)}")
+        
         for cp in comparison_properties:
             # ✅ ИСПРАВЛЕНИЕ: Обогащаем property данные из excel_properties для нормализованных полей
             property_completion_date = 'Не указано'
@@ -22993,26 +21661,9 @@ def load_comparison():
             property_developer_name = cp.complex_name or 'Не указано'
             property_finishing = 'Не указано'
             
-            print(f"DEBUG: User comparison searching for property with cp.property_id: {cp.property_id}")
-            
             if cp.property_id:
                 try:
-                    # ✅ НОВОЕ: Ищем в excel_properties для property данных
-                    excel_property_query = db.session.execute(text("""
-                        SELECT 
-                            ep.complex_name,
-                            ep.developer_name,
-                            ep.renovation_display_name,
-                            ep.complex_building_end_build_year,
-                            ep.complex_building_end_build_quarter,
-                            ep.object_min_floor,
-                            ep.object_max_floor
-                        FROM excel_properties ep
-                        WHERE ep.inner_id = :property_id
-                        LIMIT 1
-                    """), {"property_id": str(cp.property_id)})
-                    
-                    property_result = excel_property_query.fetchone()
+                    property_result = excel_rows.get(str(cp.property_id))
                     if property_result:
                         # ✅ Формируем completion_date из года и квартала
                         if property_result.complex_building_end_build_year:
@@ -23033,12 +21684,12 @@ def load_comparison():
                         if property_result.renovation_display_name:
                             property_finishing = property_result.renovation_display_name
                         
-                        print(f"DEBUG: ✅ Found user property in excel_properties: {property_result.complex_name}, completion_date={property_completion_date}, floors={property_object_min_floor}-{property_object_max_floor}")
+                        logger.debug("✅ Found user property in excel_properties: %s, completion_date=%s, floors=%s-%s", property_result.complex_name, property_completion_date, property_object_min_floor, property_object_max_floor)
                     else:
-                        print(f"DEBUG: ❌ User property not found in excel_properties for property_id: {cp.property_id}")
+                        logger.warning(f"❌ User property not found in excel_properties for property_id: {cp.property_id}")
                         
                 except Exception as e:
-                    print(f"❌ DEBUG property lookup: Exception {str(e)}")
+                    logger.warning(f"❌ property lookup: Exception {str(e)}")
                     
             # ✅ ИСПРАВЛЕНО: Обогащаем данные из excel_properties если таблица comparison_properties пустая
             enriched_property_name = cp.property_name
@@ -23051,22 +21702,8 @@ def load_comparison():
             
             if cp.property_id and (not enriched_property_name or enriched_property_price == 0):
                 try:
-                    # Получаем полные данные из excel_properties
-                    property_query = db.session.execute(text("""
-                        SELECT 
-                            ep.complex_name,
-                            ep.object_area,
-                            ep.object_rooms,
-                            ep.price,
-                            ep.developer_name,
-                            ep.address_display_name,
-                            ep.photos
-                        FROM excel_properties ep
-                        WHERE ep.inner_id = :property_id
-                        LIMIT 1
-                    """), {"property_id": str(cp.property_id)})
-                    
-                    prop_data = property_query.fetchone()
+                    # Полные данные уже загружены батчем выше
+                    prop_data = excel_rows.get(str(cp.property_id))
                     if prop_data:
                         enriched_rooms = prop_data.object_rooms if prop_data.object_rooms is not None else 0
                         enriched_area = prop_data.object_area if prop_data.object_area else 0
@@ -23086,7 +21723,7 @@ def load_comparison():
                         area_text = f", {enriched_area} м²" if enriched_area else ""
                         enriched_property_name = f"{rooms_text}{area_text}"
                         
-                        print(f"DEBUG: ✅ Enriched property data: {enriched_property_name}, price={enriched_property_price}, area={enriched_area}, address={enriched_address}, photos={enriched_photos}")
+                        logger.debug("✅ Enriched property data: %s, price=%s, area=%s, address=%s, photos=%s", enriched_property_name, enriched_property_price, enriched_area, enriched_address, enriched_photos)
                     
                 except Exception as e:
                     print(f"❌ Error enriching property data: {str(e)}")
@@ -23117,6 +21754,7 @@ def load_comparison():
             user_comparison_id=user_comparison.id
         ).order_by(ComparisonComplex.order_index).all()
         
+        excel_complexes = None
         for cc in comparison_complexes:
             # ✅ ИСПРАВЛЕНИЕ: Ищем реальные данные в excel_properties для системы сравнения пользователей
             real_complex_name = cc.complex_name or 'ЖК'
@@ -23133,81 +21771,36 @@ def load_comparison():
             real_floors_min = 0  # ✅ Инициализация этажности
             real_floors_max = 0
             
-            print(f"DEBUG: User comparison searching for complex with cc.complex_id: {cc.complex_id}")
-            
             if cc.complex_id:
                 try:
-                    # ✅ НОВОЕ: Ищем в excel_properties используя тот же SQL что и для избранного
-                    excel_complex_query = db.session.execute(text("""
-                        SELECT 
-                            ep.complex_name,
-                            COUNT(*) as apartments_count,
-                            MIN(ep.price) as price_from,
-                            MAX(ep.price) as price_to,
-                            MAX(ep.developer_name) as developer_name,
-                            MAX(ep.address_display_name) as address_display_name,
-                            MAX(ep.complex_object_class_display_name) as complex_class,
-                            MAX(ep.renovation_display_name) as renovation_display_name,
-                            MAX(ep.complex_building_end_build_year) as end_build_year,
-                            MAX(ep.complex_building_end_build_quarter) as end_build_quarter,
-                            MIN(ep.object_min_floor) as floors_min,
-                            MAX(ep.object_max_floor) as floors_max,
-                            COALESCE(rc.id, ROW_NUMBER() OVER (ORDER BY ep.complex_name) + 1000) as real_id,
-                            CASE 
-                                WHEN COUNT(DISTINCT ep.complex_building_id) > 0 
-                                THEN COUNT(DISTINCT ep.complex_building_id)
-                                WHEN COUNT(DISTINCT NULLIF(ep.complex_building_name, '')) > 0 
-                                THEN COUNT(DISTINCT NULLIF(ep.complex_building_name, ''))
-                                ELSE GREATEST(1, CEIL(COUNT(*) / 3.0))
-                            END as buildings_count,
-                            (SELECT photos FROM excel_properties p2 
-                             WHERE p2.complex_name = ep.complex_name 
-                             AND p2.photos IS NOT NULL 
-                             ORDER BY p2.price DESC LIMIT 1) as photos
-                        FROM excel_properties ep
-                        LEFT JOIN residential_complexes rc ON rc.name = ep.complex_name
-                        GROUP BY ep.complex_name, rc.id
-                        ORDER BY ep.complex_name
-                    """))
+                    # ✅ Комплексы из excel_properties агрегируются один раз на запрос
+                    if excel_complexes is None:
+                        excel_complexes = load_excel_complexes_by_real_id()
                     
-                    # Находим комплекс с нужным ID
-                    target_id = int(cc.complex_id)
-                    for row in excel_complex_query:
-                        if int(row.real_id) == target_id:
-                            real_complex_name = row.complex_name
-                            real_developer_name = row.developer_name or real_developer_name
-                            real_min_price = int(row.price_from) if row.price_from else 0
-                            real_max_price = int(row.price_to) if row.price_to else 0
-                            real_apartments_count = int(row.apartments_count) if row.apartments_count else 0
-                            real_buildings_count = int(row.buildings_count) if row.buildings_count else 0
-                            real_complex_class = row.complex_class or real_complex_class
-                            real_renovation = row.renovation_display_name or 'Не указано'  # ✅ Добавили отделку
-                            real_floors_min = int(row.floors_min) if row.floors_min else 0  # ✅ Этажность мин
-                            real_floors_max = int(row.floors_max) if row.floors_max else 0  # ✅ Этажность макс
-                            
-                            # Формируем дату сдачи
-                            if row.end_build_year and row.end_build_quarter:
-                                quarters = {1: 'I кв.', 2: 'II кв.', 3: 'III кв.', 4: 'IV кв.'}
-                                quarter_name = quarters.get(row.end_build_quarter, f'{row.end_build_quarter} кв.')
-                                real_completion_date = f"{quarter_name} {row.end_build_year} г."
-                            
-                            # Парсим фото
-                            if row.photos:
-                                try:
-                                    import json
-                                    photos = json.loads(row.photos) if isinstance(row.photos, str) else row.photos
-                                    if photos and isinstance(photos, list) and len(photos) > 0:
-                                        real_photo = photos[0]  # Берем первое фото
-                                except:
-                                    pass
-                            
-                            print(f"DEBUG: ✅ Found user comparison complex in excel_properties: {real_complex_name}")
-                            break
-                    else:
-                        print(f"DEBUG: ❌ User comparison complex with ID {cc.complex_id} not found in excel_properties")
+                    row = excel_complexes.get(int(cc.complex_id))
+                    if row is not None:
+                        real_complex_name = row.complex_name
+                        real_developer_name = row.developer_name or real_developer_name
+                        real_min_price = int(row.price_from) if row.price_from else 0
+                        real_max_price = int(row.price_to) if row.price_to else 0
+                        real_apartments_count = int(row.apartments_count) if row.apartments_count else 0
+                        real_buildings_count = int(row.buildings_count) if row.buildings_count else 0
+                        real_complex_class = row.complex_class or real_complex_class
+                        real_renovation = row.renovation_display_name or 'Не указано'  # ✅ Добавили отделку
+                        real_floors_min = int(row.floors_min) if row.floors_min else 0  # ✅ Этажность мин
+                        real_floors_max = int(row.floors_max) if row.floors_max else 0  # ✅ Этажность макс
+                        
+                        # Формируем дату сдачи
+                        if row.end_build_year and row.end_build_quarter:
+                            quarters = {1: 'I кв.', 2: 'II кв.', 3: 'III кв.', 4: 'IV кв.'}
+                            quarter_name = quarters.get(row.end_build_quarter, f'{row.end_build_quarter} кв.')
+                            real_completion_date = f"{quarter_name} {row.end_build_year} г."
+                        
+                        # Парсим фото
+                        real_photo = normalize_photos(row.photos)['main_image'] or real_photo  # Берем первое фото
                 
                 except Exception as e:
-                    print(f"DEBUG: Error searching user comparison excel_properties: {e}")
+                    logger.warning(f"Error searching user comparison excel_properties: {e}")
             
             complexes.append({
                 'complex_id': cc.complex_id,
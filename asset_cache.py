@@ -0,0 +1,171 @@
+"""
+Дисковый кэш готовых ассетов (QR коды, отрисованные карточки объектов, PDF)
+
+QR код детерминирован для URL, а карточка объекта для печати/PDF полностью
+определяется данными объекта и версией шаблона. Поэтому готовый результат
+хранится на диске под ключом sha256(данные + версия шаблона) и переиспользуется
+при повторной печати той же квартиры для другого клиента — без генерации QR
+и без повторной верстки WeasyPrint.
+
+Каталог общий для всех воркеров gunicorn. Время последнего доступа хранится
+в mtime файла; при превышении лимита размера удаляются давно не использованные
+записи (LRU).
+"""
+import hashlib
+import json
+import os
+import threading
+
+
+class AssetCache:
+    """Дисковый LRU кэш бинарных ассетов с ключами по хэшу содержимого"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, low_watermark=0.9):
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+
+        self.app = None
+        self.storage_dir = None
+        self._size = 0
+        self._lock = threading.Lock()
+        self._template_versions = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.storage_dir = app.config.get('ASSET_CACHE_DIR') or os.path.join(app.instance_path, 'asset_cache')
+        self.max_bytes = app.config.get('ASSET_CACHE_MAX_BYTES', self.max_bytes)
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self._size = sum(size for _, _, size in self._scan())
+        app.extensions['asset_cache'] = self
+
+    # --- Ключи -------------------------------------------------------------
+
+    @staticmethod
+    def make_key(*parts):
+        """Хэш содержимого: части сериализуются в канонический JSON"""
+        payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def template_version(self, template_name):
+        """Версия шаблона — хэш его исходника (меняется при деплое новой верстки)"""
+        version = self._template_versions.get(template_name)
+        if version is None:
+            try:
+                source, _, _ = self.app.jinja_env.loader.get_source(self.app.jinja_env, template_name)
+                version = hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+            except Exception as e:
+                print(f"Error computing template version for {template_name}: {e}")
+                version = 'unknown'
+            # В debug режиме шаблоны правятся на лету — версию не запоминаем
+            if not self.app.debug:
+                self._template_versions[template_name] = version
+        return version
+
+    def _path(self, namespace, key):
+        return os.path.join(self.storage_dir, namespace, key[:2], f"{key}.bin")
+
+    # --- Чтение/запись -----------------------------------------------------
+
+    def get(self, namespace, key):
+        if not self.storage_dir:
+            return None
+        path = self._path(namespace, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path, None)  # отметка последнего доступа для LRU
+        except OSError:
+            pass
+        return data
+
+    def set(self, namespace, key, data):
+        if not self.storage_dir or data is None:
+            return
+        path = self._path(namespace, key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing asset cache entry {namespace}/{key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._size += len(data)
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def get_or_create(self, namespace, key, factory):
+        """Вернуть ассет из кэша или создать через factory() и сохранить"""
+        data = self.get(namespace, key)
+        if data is None:
+            data = factory()
+            if data is not None:
+                self.set(namespace, key, data)
+        return data
+
+    # --- Вытеснение --------------------------------------------------------
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.storage_dir):
+            for name in files:
+                if not name.endswith('.bin'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def evict(self):
+        """Удалить давно не использованные записи, пока размер не станет ниже порога"""
+        with self._lock:
+            # Пересчитываем по диску: записи могли добавить другие воркеры
+            entries = self._scan()
+            total = sum(size for _, _, size in entries)
+            target = int(self.max_bytes * self.low_watermark)
+            removed = 0
+            for _, path, size in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._size = total
+        return removed
+
+    def clear(self, namespace=None):
+        """Очистить кэш целиком или одно пространство имен"""
+        if not self.storage_dir:
+            return 0
+        removed = 0
+        for _, path, _ in self._scan():
+            if namespace and os.path.relpath(path, self.storage_dir).split(os.sep)[0] != namespace:
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+        with self._lock:
+            self._size = sum(size for _, _, size in self._scan())
+        return removed
+
+
+asset_cache = AssetCache()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark: request throughput with DEBUG tracing off / on / sampled
+
+Каждый запрос повторяет вызовы из app.py: строка manager_required с
+данными запроса и сессии, затем цикл по 20 объектам, как в обогащении
+избранного и презентаций: "Property %s not found in main data" с id и
+запись с dict объекта. Для сравнения — те же вызовы со старыми f-строками
+(строка собирается даже при INFO) и print(). Вывод логов уходит в
+/dev/null, чтобы измерять стоимость самого логирования, а не скорость
+терминала.
+
+    python benchmark_logging.py [requests]
+"""
+import logging
+import os
+import sys
+import time
+
+from flask import request, session
+
+from app import app, logger
+from logging_config import configure_logging
+
+ITEMS_PER_REQUEST = 20
+ITEMS = [{'id': n, 'complex_name': f'ЖК {n}', 'price': 5000000 + n, 'area': 40.5, 'photos': ['a.jpg', 'b.jpg']}
+         for n in range(ITEMS_PER_REQUEST)]
+
+
+@app.route('/__benchmark/logging')
+def benchmark_logging_view():
+    logger.debug("manager_required: %s %s manager_id=%s is_manager=%s",
+                 request.method, request.path, session.get('manager_id'), session.get('is_manager'))
+    for item in ITEMS:
+        logger.debug("Property %s not found in main data", item['id'])
+        logger.debug("✅ Enriched property data: %s", item)
+    return 'ok'
+
+
+@app.route('/__benchmark/fstring')
+def benchmark_fstring_view():
+    logger.debug(f"manager_required: {request.method} {request.path} manager_id={session.get('manager_id')} "
+                 f"is_manager={session.get('is_manager')}")
+    for item in ITEMS:
+        logger.debug(f"Property {item['id']} not found in main data")
+        logger.debug(f"✅ Enriched property data: {item}")
+    return 'ok'
+
+
+@app.route('/__benchmark/print')
+def benchmark_print_view():
+    print(f"DEBUG: manager_required: {request.method} {request.path} manager_id={session.get('manager_id')} "
+          f"is_manager={session.get('is_manager')}", flush=True)
+    for item in ITEMS:
+        print(f"DEBUG: Property {item['id']} not found in main data", flush=True)
+        print(f"DEBUG: ✅ Enriched property data: {item}", flush=True)
+    return 'ok'
+
+
+def legacy_print_run(client, requests_count, devnull):
+    """Старое поведение: синхронный print на каждую запись"""
+    stdout = sys.stdout
+    sys.stdout = devnull
+    try:
+        return run(client, '/__benchmark/print', requests_count)
+    finally:
+        sys.stdout = stdout
+
+
+def run(client, path, requests_count):
+    client.get(path)  # прогрев
+    started = time.perf_counter()
+    for _ in range(requests_count):
+        client.get(path)
+    return requests_count / (time.perf_counter() - started)
+
+
+def benchmark(requests_count=2000):
+    devnull = open(os.devnull, 'w')
+    modes = [
+        ('tracing off (INFO)', {'LOG_LEVEL': 'INFO'}),
+        ('tracing on (DEBUG)', {'LOG_LEVEL': 'DEBUG'}),
+        ('tracing on, sampled 1%', {'LOG_LEVEL': 'DEBUG', 'LOG_DEBUG_SAMPLE': '0.01'}),
+        ('tracing on, 5/s per call site', {'LOG_LEVEL': 'DEBUG', 'LOG_DEBUG_RATE': '5'}),
+    ]
+
+    results = []
+    with app.test_client() as client:
+        for title, env in modes:
+            for key in ('LOG_LEVEL', 'LOG_DEBUG_SAMPLE', 'LOG_DEBUG_RATE'):
+                os.environ.pop(key, None)
+            os.environ.update(env)
+            configure_logging(stream=devnull)
+            results.append((title, run(client, '/__benchmark/logging', requests_count)))
+
+        configure_logging(level='INFO', stream=devnull)
+        results.append(('f-string debug, tracing off', run(client, '/__benchmark/fstring', requests_count)))
+        results.append(('legacy print() (stdout)', legacy_print_run(client, requests_count, devnull)))
+
+    baseline = results[0][1]
+    print(f"{'mode':<32} {'req/s':>10} {'vs off':>8}")
+    for title, rps in results:
+        print(f"{title:<32} {rps:>10.0f} {rps / baseline:>7.0%}")
+
+
+if __name__ == '__main__':
+    logging.getLogger('app').setLevel(logging.NOTSET)
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
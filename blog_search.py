@@ -0,0 +1,561 @@
+"""
+Полнотекстовый поиск по блогу
+
+/api/blog/search на каждое нажатие клавиши в blog-search.js выполнял три
+ilike('%q%') по title/content/excerpt всех статей и еще один запрос для
+подсказок — время росло с длиной статей, а "ипотеки" не находило "ипотека".
+Теперь поиск идет по инвертированному индексу:
+
+- blog_search_documents — опубликованные BlogPost и BlogArticle: поля для
+  выдачи; blog_search_fragments — их текст без разметки кусками по
+  FRAGMENT_LENGTH символов (источник сниппетов);
+- blog_search_terms — основа слова (русский стеммер Snowball) -> документ:
+  вес (заголовок x3, анонс и теги x2, текст x1, затем 1 + log), позиция
+  первого вхождения в тексте, признак слова из заголовка;
+- индекс ведется из событий сессии SQLAlchemy: при flush новой/измененной/
+  удаленной статьи ее строки пересобираются в той же транзакции, черновики
+  и архив в индекс не попадают. Изменения в обход ORM и первичное
+  заполнение — rebuild_blog_search_index.py;
+- запрос: каждое слово — выборка строк индекса по первичному ключу,
+  последнее слово — по префиксу (поиск по мере набора), документ должен
+  содержать все слова; ранжирование — сумма вес x idf;
+- сниппет собирается из одного-двух кусков текста вокруг первого
+  вхождения, поэтому время ответа не зависит от длины статей.
+
+Таблицы обычные (без tsvector/GIN), поэтому индекс одинаково работает на
+PostgreSQL и на SQLite в разработке.
+"""
+import math
+import re
+from functools import lru_cache
+from html import escape, unescape
+
+from sqlalchemy import bindparam, event, inspect, text
+
+SOURCES = {'post': 'blog_posts', 'article': 'blog_articles'}
+INDEXED_FIELDS = ('title', 'slug', 'content', 'excerpt', 'status', 'category', 'category_id',
+                  'featured_image', 'tags', 'published_at', 'reading_time')
+FIELD_WEIGHTS = {'title': 3, 'excerpt': 2, 'tags': 2, 'body': 1}
+MAX_TERM_LENGTH = 64
+MIN_PREFIX_LENGTH = 2
+SNIPPET_CONTEXT = 80
+SNIPPET_LENGTH = 240
+FRAGMENT_LENGTH = 1000  # >= SNIPPET_LENGTH: окно сниппета лежит не больше чем в двух кусках
+
+TOKEN_RE = re.compile(r'[0-9a-zа-яё]+', re.IGNORECASE)
+STOP_WORDS = {
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так',
+    'его', 'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было',
+    'вот', 'от', 'меня', 'еще', 'нет', 'о', 'из', 'ему', 'ли', 'если', 'или', 'ни', 'быть', 'был',
+    'до', 'вас', 'для', 'мы', 'их', 'чем', 'была', 'без', 'это', 'при', 'об', 'под', 'над',
+}
+
+# --- Русский стеммер (Snowball, https://snowballstem.org/algorithms/russian/stemmer.html) ---
+
+VOWELS = set('аеиоуыэюя')
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'),
+                     ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+                  'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'),
+              ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть',
+         'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+         'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой',
+             'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь',
+             'ию', 'ью', 'ю', 'ия', 'ья', 'я'))
+SUPERLATIVE = ((), ('ейш', 'ейше'))
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _endings(group):
+    """[(длина, {окончание: только после а/я})] от длинных к коротким"""
+    after_a, plain = group
+    by_length = {}
+    for ending in after_a + plain:
+        by_length.setdefault(len(ending), {})[ending] = ending in after_a
+    return sorted(by_length.items(), reverse=True)
+
+
+_PERFECTIVE_GERUND = _endings(PERFECTIVE_GERUND)
+_ADJECTIVE = _endings(ADJECTIVE)
+_PARTICIPLE = _endings(PARTICIPLE)
+_REFLEXIVE = _endings(REFLEXIVE)
+_VERB = _endings(VERB)
+_NOUN = _endings(NOUN)
+_SUPERLATIVE = _endings(SUPERLATIVE)
+
+
+def _remove_ending(rv, endings):
+    """rv без самого длинного подходящего окончания или None.
+
+    Окончания первой группы отрезаются, только если перед ними а/я (сама буква остается).
+    """
+    for length, group in endings:
+        after_a = group.get(rv[-length:]) if len(rv) >= length else None
+        if after_a is None:
+            continue
+        stem = rv[:-length]
+        if after_a and stem[-1:] not in ('а', 'я'):
+            return None
+        return stem
+    return None
+
+
+def _region(word, start):
+    """Начало области после первой согласной, следующей за гласной (R1/R2)"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem(word):
+    """Основа русского слова; латиница и числа возвращаются как есть"""
+    return _stem(word.lower().replace('ё', 'е'))
+
+
+@lru_cache(maxsize=50000)
+def _stem(word):
+    rv_start = next((i + 1 for i, char in enumerate(word) if char in VOWELS), len(word))
+    r2 = _region(word, _region(word, 0))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе возвратная частица + прилагательное/глагол/существительное
+    result = _remove_ending(rv, _PERFECTIVE_GERUND)
+    if result is None:
+        reflexive = _remove_ending(rv, _REFLEXIVE)
+        rv = rv if reflexive is None else reflexive
+        result = _remove_ending(rv, _ADJECTIVE)
+        if result is not None:
+            participle = _remove_ending(result, _PARTICIPLE)
+            result = result if participle is None else participle
+        else:
+            result = _remove_ending(rv, _VERB)
+            if result is None:
+                result = _remove_ending(rv, _NOUN)
+    rv = rv if result is None else result
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательный суффикс в R2
+    for suffix in DERIVATIONAL:
+        if rv.endswith(suffix) and rv_start + len(rv) - len(suffix) >= r2:
+            rv = rv[:-len(suffix)]
+            break
+
+    # Шаг 4: нн -> н, превосходная степень, мягкий знак
+    superlative = _remove_ending(rv, _SUPERLATIVE)
+    if superlative is not None:
+        rv = superlative
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif superlative is None and rv.endswith('ь'):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def plain_text(html):
+    """Текст статьи без HTML-разметки"""
+    if not html:
+        return ''
+    content = re.sub(r'(?is)<(script|style)\b.*?</\1>', ' ', html)
+    content = re.sub(r'<[^>]+>', ' ', content)
+    return re.sub(r'\s+', ' ', unescape(content)).strip()
+
+
+def _is_indexable(word, term):
+    return word.lower() not in STOP_WORDS and (len(term) > 1 or term.isdigit())
+
+
+def document_terms(title, excerpt='', body='', tags=()):
+    """{основа: (вес, позиция в body или None, есть в заголовке)}"""
+    terms = {}
+    fields = (('title', title), ('excerpt', excerpt), ('tags', ' '.join(tags)), ('body', body))
+    for field, content in fields:
+        for match in TOKEN_RE.finditer(content or ''):
+            term = stem(match.group())[:MAX_TERM_LENGTH]
+            if not _is_indexable(match.group(), term):
+                continue
+            entry = terms.setdefault(term, [0, None, False])
+            entry[0] += FIELD_WEIGHTS[field]
+            if field == 'body' and entry[1] is None:
+                entry[1] = match.start()
+            if field == 'title':
+                entry[2] = True
+    return {term: (1 + math.log(weight), position, in_title)
+            for term, (weight, position, in_title) in terms.items()}
+
+
+def query_terms(query):
+    """[(основа, по префиксу)] — последнее слово ищется по префиксу, пока его набирают"""
+    matches = list(TOKEN_RE.finditer(query or ''))
+    terms = []
+    for i, match in enumerate(matches):
+        term = stem(match.group())[:MAX_TERM_LENGTH]
+        is_last = i == len(matches) - 1
+        prefix = is_last and match.end() == len(query) and len(term) >= MIN_PREFIX_LENGTH
+        if prefix or _is_indexable(match.group(), term):
+            terms.append((term, prefix))
+    return list(dict.fromkeys(terms))
+
+
+def _tags(raw):
+    """Теги BlogPost хранятся JSON-массивом или строкой через запятую"""
+    import json
+    if not raw:
+        return []
+    try:
+        tags = json.loads(raw)
+    except (TypeError, ValueError):
+        tags = raw.split(',')
+    return [str(tag) for tag in tags] if isinstance(tags, list) else [str(tags)]
+
+
+def post_document(post):
+    return {
+        'source': 'post',
+        'source_id': post.id,
+        'title': post.title,
+        'slug': post.slug,
+        'excerpt': post.excerpt,
+        'category': post.category,
+        'featured_image': post.featured_image,
+        'reading_time': None,
+        'published_at': post.published_at or post.created_at,
+        'body': plain_text(post.content),
+        'tags': _tags(post.tags),
+    }
+
+
+def article_document(article, category_name):
+    return {
+        'source': 'article',
+        'source_id': article.id,
+        'title': article.title,
+        'slug': article.slug,
+        'excerpt': article.excerpt,
+        'category': category_name,
+        'featured_image': article.featured_image,
+        'reading_time': article.reading_time,
+        'published_at': article.published_at or article.created_at,
+        'body': plain_text(article.content),
+        'tags': [],
+    }
+
+
+INDEX_TABLES = ('blog_search_terms', 'blog_search_fragments', 'blog_search_documents')
+
+_INSERT_DOCUMENT = text("""
+    INSERT INTO blog_search_documents
+        (source, source_id, title, slug, excerpt, category, featured_image, reading_time, published_at)
+    VALUES
+        (:source, :source_id, :title, :slug, :excerpt, :category, :featured_image, :reading_time, :published_at)
+""")
+
+_INSERT_FRAGMENT = text("""
+    INSERT INTO blog_search_fragments (source, source_id, number, content)
+    VALUES (:source, :source_id, :number, :content)
+""")
+
+_INSERT_TERM = text("""
+    INSERT INTO blog_search_terms (term, source, source_id, weight, position, in_title)
+    VALUES (:term, :source, :source_id, :weight, :position, :in_title)
+""")
+
+# Поля выдачи; просмотры читаются из исходной таблицы — в индексе они бы устаревали
+_RESULT_COLUMNS = """
+    source, source_id, title, slug, excerpt, category, featured_image, reading_time, published_at,
+    CASE source
+        WHEN 'post' THEN (SELECT views_count FROM blog_posts WHERE blog_posts.id = source_id)
+        ELSE (SELECT views_count FROM blog_articles WHERE blog_articles.id = source_id)
+    END AS views_count
+"""
+
+
+def remove_document(connection, source, source_id):
+    for table in INDEX_TABLES:
+        connection.execute(text(f"DELETE FROM {table} WHERE source = :source AND source_id = :source_id"),
+                           {'source': source, 'source_id': source_id})
+
+
+def index_document(connection, document):
+    """Заменить строки индекса статьи"""
+    remove_document(connection, document['source'], document['source_id'])
+    terms = document_terms(document['title'], document['excerpt'], document['body'], document['tags'])
+    connection.execute(_INSERT_DOCUMENT, {key: value for key, value in document.items()
+                                          if key not in ('body', 'tags')})
+    body = document['body']
+    if body:
+        connection.execute(_INSERT_FRAGMENT, [
+            {'source': document['source'], 'source_id': document['source_id'],
+             'number': start // FRAGMENT_LENGTH, 'content': body[start:start + FRAGMENT_LENGTH]}
+            for start in range(0, len(body), FRAGMENT_LENGTH)
+        ])
+    if terms:
+        connection.execute(_INSERT_TERM, [
+            {'term': term, 'source': document['source'], 'source_id': document['source_id'],
+             'weight': weight, 'position': position, 'in_title': in_title}
+            for term, (weight, position, in_title) in terms.items()
+        ])
+    return len(terms)
+
+
+def _category_name(connection, category_id):
+    if category_id is None:
+        return None
+    return connection.execute(text("SELECT name FROM blog_categories WHERE id = :id"),
+                              {'id': category_id}).scalar()
+
+
+def _indexed_fields_changed(obj):
+    attrs = inspect(obj).attrs
+    return any(name in attrs.keys() and attrs[name].history.has_changes() for name in INDEXED_FIELDS)
+
+
+class BlogSearchIndex:
+    def __init__(self):
+        self.enabled = True
+        self.db = None
+
+    def init_app(self, app, db):
+        self.db = db
+        self.enabled = app.config.get('BLOG_SEARCH_INDEX_ENABLED', True)
+        event.listen(db.session, 'after_flush', self._after_flush)
+        app.extensions['blog_search'] = self
+
+    # new/dirty/deleted в after_flush еще в состоянии до flush, id новых статей уже присвоены
+    def _after_flush(self, session, flush_context):
+        if not self.enabled:
+            return
+        from models import BlogPost, BlogArticle
+
+        changes = []
+        for obj in session.deleted:
+            if isinstance(obj, (BlogPost, BlogArticle)):
+                changes.append((obj, True))
+        for obj in session.new:
+            if isinstance(obj, (BlogPost, BlogArticle)):
+                changes.append((obj, False))
+        for obj in session.dirty:
+            if isinstance(obj, (BlogPost, BlogArticle)) and _indexed_fields_changed(obj):
+                changes.append((obj, False))
+        if not changes:
+            return
+
+        connection = session.connection()
+        for obj, deleted in changes:
+            source = 'post' if isinstance(obj, BlogPost) else 'article'
+            if deleted or obj.status != 'published':
+                identity = inspect(obj).identity  # у новых объектов ключ появится после flush
+                remove_document(connection, source, identity[0] if identity else obj.id)
+            elif source == 'post':
+                index_document(connection, post_document(obj))
+            else:
+                index_document(connection, article_document(obj, _category_name(connection, obj.category_id)))
+
+    def _session(self):
+        return self.db.session
+
+    def _postings(self, term, prefix, title_only=False):
+        """{(source, source_id): (вес, позиция)}; при поиске по префиксу — лучшее из слов документа"""
+        condition = "term LIKE :term" if prefix else "term = :term"
+        if title_only:
+            condition += " AND in_title = :in_title"
+        rows = self._session().execute(
+            text(f"SELECT source, source_id, weight, position FROM blog_search_terms WHERE {condition}"),
+            {'term': term + '%' if prefix else term, 'in_title': True}
+        ).fetchall()
+        postings = {}
+        for source, source_id, weight, position in rows:
+            key = (source, source_id)
+            if key in postings:
+                best_weight, best_position = postings[key]
+                weight = max(weight, best_weight)
+                if best_position is not None and (position is None or best_position < position):
+                    position = best_position
+            postings[key] = (weight, position)
+        return postings
+
+    def _rank(self, terms, category=None, title_only=False):
+        """[((source, source_id), score, позиция первого совпадения)] по убыванию score"""
+        session = self._session()
+        total = session.execute(text("SELECT COUNT(*) FROM blog_search_documents")).scalar() or 0
+        scores = None
+        for term, prefix in terms:
+            postings = self._postings(term, prefix, title_only)
+            if not postings:
+                return []
+            idf = math.log(1 + total / len(postings))
+            if scores is None:
+                scores = {key: (weight * idf, position) for key, (weight, position) in postings.items()}
+                continue
+            merged = {}
+            for key in scores.keys() & postings.keys():
+                score, position = scores[key]
+                weight, other = postings[key]
+                positions = [value for value in (position, other) if value is not None]
+                merged[key] = (score + weight * idf, min(positions) if positions else None)
+            scores = merged
+            if not scores:
+                return []
+
+        if scores and category:
+            in_category = {tuple(row) for row in session.execute(
+                text("SELECT source, source_id FROM blog_search_documents WHERE category = :category"),
+                {'category': category}
+            ).fetchall()}
+            scores = {key: value for key, value in scores.items() if key in in_category}
+
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1][0], item[0][1]))
+        return [(key, score, position) for key, (score, position) in ranked]
+
+    def search(self, query, category=None, limit=20):
+        """Статьи по запросу: словари с полями выдачи, score и snippet (HTML с <mark>)"""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        ranked = self._rank(terms, category)[:limit]
+        if not ranked:
+            return []
+
+        # Одна выборка на все результаты: каждая ветка UNION ALL — строка по первичному ключу
+        # и два куска текста, в которых лежит окно сниппета вокруг первого совпадения
+        fragment = ("(SELECT content FROM blog_search_fragments f WHERE f.source = d.source "
+                    "AND f.source_id = d.source_id AND f.number = :number{i} + {offset})")
+        branches, params, starts = [], {}, []
+        for i, ((source, source_id), score, position) in enumerate(ranked):
+            start = max((position or 0) - SNIPPET_CONTEXT, 0)
+            starts.append(start)
+            branches.append(
+                f"SELECT {_RESULT_COLUMNS}, {fragment.format(i=i, offset=0)} AS fragment, "
+                f"{fragment.format(i=i, offset=1)} AS next_fragment, {i} AS result_order "
+                f"FROM blog_search_documents d WHERE d.source = :source{i} AND d.source_id = :id{i}"
+            )
+            params.update({f'number{i}': start // FRAGMENT_LENGTH, f'source{i}': source, f'id{i}': source_id})
+        rows = self._session().execute(text(' UNION ALL '.join(branches)), params).mappings().all()
+
+        results = []
+        for row in sorted(rows, key=lambda row: row['result_order']):
+            _, score, position = ranked[row['result_order']]
+            start = starts[row['result_order']]
+            window = (row['fragment'] or '') + (row['next_fragment'] or '')
+            offset = start % FRAGMENT_LENGTH
+            window = window[offset:offset + SNIPPET_LENGTH]
+            result = self._result(row)
+            result['score'] = round(score, 4)
+            result['snippet'] = snippet(window or result['excerpt'], terms, cut_start=start > 0)
+            results.append(result)
+        return results
+
+    def suggest(self, query, category=None, limit=5):
+        """Подсказки по словам заголовков (последнее слово — по префиксу)"""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        ranked = self._rank(terms, category, title_only=True)[:limit]
+        if not ranked:
+            return []
+        rows = self._documents([key for key, _, _ in ranked])
+        return [rows[key] for key, _, _ in ranked if key in rows]
+
+    def latest(self, category=None, limit=20):
+        """Последние опубликованные статьи (пустой запрос)"""
+        condition = "WHERE category = :category" if category else ""
+        rows = self._session().execute(text(
+            f"SELECT {_RESULT_COLUMNS} FROM blog_search_documents {condition} "
+            f"ORDER BY published_at DESC LIMIT :limit"
+        ), {'category': category, 'limit': limit}).mappings().all()
+        return [self._result(row) for row in rows]
+
+    def matching_keys(self, query, limit=None):
+        """[(source, source_id)] найденных статей по убыванию релевантности"""
+        terms = query_terms(query)
+        ranked = self._rank(terms) if terms else []
+        return [key for key, _, _ in ranked[:limit]]
+
+    def _documents(self, keys):
+        rows = {}
+        for source in SOURCES:
+            ids = [source_id for key_source, source_id in keys if key_source == source]
+            if not ids:
+                continue
+            for row in self._session().execute(
+                text(f"SELECT {_RESULT_COLUMNS} FROM blog_search_documents "
+                     f"WHERE source = :source AND source_id IN :ids")
+                .bindparams(bindparam('ids', expanding=True)),
+                {'source': source, 'ids': ids}
+            ).mappings():
+                rows[(row['source'], row['source_id'])] = self._result(row)
+        return rows
+
+    @staticmethod
+    def _result(row):
+        from view_counters import view_counters
+        published_at = row['published_at']
+        if isinstance(published_at, str):  # SQLite в raw SQL отдает даты строкой
+            from datetime import datetime
+            published_at = datetime.fromisoformat(published_at)
+        return {
+            'source': row['source'],
+            'id': row['source_id'],
+            'title': row['title'],
+            'slug': row['slug'],
+            'excerpt': row['excerpt'] or '',
+            'featured_image': row['featured_image'] or '',
+            'category': row['category'] or 'Общее',
+            'date': published_at.strftime('%d.%m.%Y') if published_at else '',
+            'reading_time': row['reading_time'] or 5,
+            'views': view_counters.value(SOURCES[row['source']], row['source_id'], row['views_count']),
+        }
+
+
+def snippet(fragment, terms, cut_start=False):
+    """Экранированный фрагмент с <mark> вокруг слов запроса"""
+    if cut_start and ' ' in fragment:
+        fragment = '…' + fragment.split(' ', 1)[1]
+    if len(fragment) >= SNIPPET_LENGTH and ' ' in fragment:
+        fragment = fragment.rsplit(' ', 1)[0] + '…'
+
+    def matches(word):
+        term = stem(word)
+        return any(term.startswith(query) if prefix else term == query for query, prefix in terms)
+
+    parts, last = [], 0
+    for match in TOKEN_RE.finditer(fragment):
+        if matches(match.group()):
+            parts.append(escape(fragment[last:match.start()]))
+            parts.append(f'<mark>{escape(match.group())}</mark>')
+            last = match.end()
+    parts.append(escape(fragment[last:]))
+    return ''.join(parts)
+
+
+def rebuild_blog_search_index(session):
+    """Пересобрать индекс из опубликованных статей (первичное заполнение/сверка)"""
+    from models import BlogPost, BlogArticle, BlogCategory
+
+    connection = session.connection()
+    for table in INDEX_TABLES:
+        connection.execute(text(f"DELETE FROM {table}"))
+
+    counts = {'post': 0, 'article': 0, 'terms': 0}
+    for post in BlogPost.query.filter_by(status='published').yield_per(200):
+        counts['terms'] += index_document(connection, post_document(post))
+        counts['post'] += 1
+
+    categories = dict(session.query(BlogCategory.id, BlogCategory.name).all())
+    for article in BlogArticle.query.filter_by(status='published').yield_per(200):
+        counts['terms'] += index_document(connection, article_document(article, categories.get(article.category_id)))
+        counts['article'] += 1
+
+    session.commit()
+    return counts
+
+
+blog_search = BlogSearchIndex()
@@ -0,0 +1,197 @@
+"""
+Аналитика заявок на кешбек по месяцам и статусам
+
+admin_dashboard и /admin/analytics/cashback считали count/sum по всем
+CashbackApplication на каждый просмотр. Теперь агрегаты лежат в таблице
+cashback_stats (месяц created_at x статус -> количество и сумма) и
+обновляются в той же транзакции при flush новых, измененных (статус или
+сумма) и удаленных заявок — так же, как счетчики в manager_rollups.py.
+Выборка "последние 12 месяцев по статусам" читает не больше 12 x N строк.
+
+Заявки, записанные в обход ORM (raw SQL, восстановление из бэкапа), не
+учитываются — после них и для первичного заполнения запускается
+rebuild_cashback_stats.py.
+"""
+from collections import Counter, namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import event, func, inspect, text
+
+MonthStat = namedtuple('MonthStat', ['month', 'count', 'total_amount'])
+StatusStat = namedtuple('StatusStat', ['status', 'count', 'total_amount'])
+
+_UPSERT_BUCKET = text("""
+    INSERT INTO cashback_stats (month, status, applications_count, cashback_total)
+    VALUES (:month, :status, :count, :amount)
+    ON CONFLICT (month, status) DO UPDATE SET
+    applications_count = cashback_stats.applications_count + excluded.applications_count,
+    cashback_total = cashback_stats.cashback_total + excluded.cashback_total
+""")
+
+
+def month_bucket(value):
+    if value is None:
+        value = datetime.utcnow()
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return date(value.year, value.month, 1)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def _history_value(state, attr, current):
+    """Значение атрибута до изменения (если он менялся в этом flush)"""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return current
+
+
+class CashbackBuckets:
+    """Изменения бакетов (month, status) -> [count, amount] за один flush"""
+
+    def __init__(self):
+        self.count = Counter()
+        self.amount = Counter()
+
+    def add(self, created_at, status, amount, sign=1):
+        key = (month_bucket(created_at), status or '')
+        self.count[key] += sign
+        self.amount[key] += sign * int(amount or 0)
+
+    def apply(self, connection):
+        rows = [{'month': month, 'status': status,
+                 'count': self.count[(month, status)], 'amount': self.amount[(month, status)]}
+                for month, status in set(self.count) | set(self.amount)
+                if self.count[(month, status)] or self.amount[(month, status)]]
+        if rows:
+            connection.execute(_UPSERT_BUCKET, rows)
+        return len(rows)
+
+
+class CashbackAnalytics:
+    def __init__(self):
+        self.enabled = True
+
+    def init_app(self, app, db):
+        from models import CashbackApplication
+
+        self.enabled = app.config.get('CASHBACK_ANALYTICS_ENABLED', True)
+        # Старое значение нужно даже у истекших после commit объектов, иначе
+        # история изменения пуста и заявка не "уходит" из прежнего бакета
+        for attr in (CashbackApplication.status, CashbackApplication.cashback_amount,
+                     CashbackApplication.created_at):
+            event.listen(attr, 'set', _keep_old_value, active_history=True)
+        event.listen(db.session, 'before_flush', self._before_flush)
+        event.listen(db.session, 'after_flush', self._after_flush)
+        app.extensions['cashback_analytics'] = self
+
+    def _before_flush(self, session, flush_context, instances):
+        if not self.enabled or not session.deleted:
+            return
+        from models import CashbackApplication
+
+        buckets = session.info.setdefault('cashback_stats_deleted', CashbackBuckets())
+        for obj in session.deleted:
+            if isinstance(obj, CashbackApplication):
+                state = inspect(obj)
+                buckets.add(obj.created_at,
+                            _history_value(state, 'status', obj.status),
+                            _history_value(state, 'cashback_amount', obj.cashback_amount), -1)
+
+    def _after_flush(self, session, flush_context):
+        buckets = session.info.pop('cashback_stats_deleted', None)
+        if not self.enabled:
+            return
+        from models import CashbackApplication
+
+        buckets = buckets or CashbackBuckets()
+        for obj in session.new:
+            if isinstance(obj, CashbackApplication):
+                buckets.add(obj.created_at, obj.status, obj.cashback_amount)
+
+        for obj in session.dirty:
+            if not isinstance(obj, CashbackApplication):
+                continue
+            state = inspect(obj)
+            if not any(state.attrs[attr].history.has_changes()
+                       for attr in ('status', 'cashback_amount', 'created_at')):
+                continue
+            buckets.add(_history_value(state, 'created_at', obj.created_at),
+                        _history_value(state, 'status', obj.status),
+                        _history_value(state, 'cashback_amount', obj.cashback_amount), -1)
+            buckets.add(obj.created_at, obj.status, obj.cashback_amount)
+
+        if buckets.count or buckets.amount:
+            buckets.apply(session.connection())
+
+
+cashback_analytics = CashbackAnalytics()
+
+
+def _bucket_query(months=None, statuses=None):
+    from models import CashbackStats
+    query = CashbackStats.query
+    if months:
+        today = datetime.utcnow()
+        year, month = today.year, today.month - (months - 1)
+        while month <= 0:
+            year, month = year - 1, month + 12
+        query = query.filter(CashbackStats.month >= date(year, month, 1))
+    if statuses:
+        query = query.filter(CashbackStats.status.in_(statuses))
+    return query
+
+
+def get_monthly_stats(months=None, statuses=None):
+    """[MonthStat(month, count, total_amount)] по возрастанию месяца"""
+    count, amount = Counter(), Counter()
+    for bucket in _bucket_query(months, statuses).all():
+        count[bucket.month] += bucket.applications_count
+        amount[bucket.month] += bucket.cashback_total
+    return [MonthStat(datetime(month.year, month.month, 1), count[month], amount[month])
+            for month in sorted(count) if count[month]]
+
+
+def get_status_stats(months=None):
+    """[StatusStat(status, count, total_amount)] за все время или последние months месяцев"""
+    count, amount = Counter(), Counter()
+    for bucket in _bucket_query(months).all():
+        count[bucket.status] += bucket.applications_count
+        amount[bucket.status] += bucket.cashback_total
+    return [StatusStat(status or None, count[status], amount[status])
+            for status in sorted(count) if count[status]]
+
+
+def get_status_totals():
+    """{status: (count, total_amount)} для карточек дашборда"""
+    return {stat.status: (stat.count, stat.total_amount) for stat in get_status_stats()}
+
+
+def rebuild_cashback_stats(session):
+    """Пересчитать cashback_stats из cashback_applications (первичное заполнение/сверка)"""
+    from models import CashbackApplication, CashbackStats
+
+    # Индекс для ленты "крупные кешбеки" (ORDER BY created_at DESC LIMIT 10)
+    session.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_cashback_applications_created "
+        "ON cashback_applications (created_at)"
+    ))
+
+    buckets = CashbackBuckets()
+    day_column = func.date(CashbackApplication.created_at)
+    rows = session.query(
+        day_column, CashbackApplication.status,
+        func.count(CashbackApplication.id), func.sum(CashbackApplication.cashback_amount)
+    ).group_by(day_column, CashbackApplication.status).all()
+    for day, status, count, amount in rows:
+        key = (month_bucket(day), status or '')
+        buckets.count[key] += count
+        buckets.amount[key] += int(amount or 0)
+
+    session.query(CashbackStats).delete(synchronize_session=False)
+    written = buckets.apply(session.connection())
+    session.commit()
+    return written
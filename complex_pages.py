@@ -0,0 +1,483 @@
+"""
+Предрасчитанные страницы ЖК
+
+residential_complex_detail на каждый просмотр искал ЖК перебором (для
+/zk/<slug> create_slug считался по каждой строке residential_complexes,
+затем по каждому DISTINCT complex_name из excel_properties), делал пять
+запросов по квартирам ЖК (агрегаты с bool_or, который есть только в
+PostgreSQL, застройщик, координаты, фото, все колонки всех квартир), запрос
+по корпусам, GROUP BY по всем ЖК для похожих и раскладывал квартиры по
+комнатам и корпусам в Python. Здесь:
+
+- refresh_complex_pages() после импорта одним проходом по excel_properties
+  собирает модель страницы каждого ЖК и пишет ее в complex_pages (JSON):
+  сводку цен, площадей и этажей, корпуса со сроками, этажностью и числом
+  квартир, диапазоны цен по типам квартир, галерею ЖК, список квартир по
+  цене с разбиением по комнатам и по корпусам и похожие ЖК;
+- id страниц не меняются при пересборке: строки обновляются по complex_name,
+  удаляются только страницы исчезнувших ЖК; refresh_complex_pages(names=...)
+  пересобирает отдельные ЖК (правка в админке) по их квартирам;
+- complex_page_index() — индекс slug/id/название -> страница, приложение
+  держит его в кэше вместе с complex_pages_version(); resolve_complex_page()
+  находит страницу без запросов, а если страница не нашлась и версия в базе
+  другая (пересборка в другом процессе), индекс перечитывается;
+- load_complex_page() — один запрос: страница и актуальная строка
+  residential_complexes (кэшбек и описание правятся в админке без импорта);
+  статус корпусов считается от текущей даты на отрисовке.
+
+После изменения residential_complexes в обход админки и для первичного
+заполнения запускается rebuild_complex_pages.py.
+"""
+import re
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import JSON, bindparam, text
+
+from property_photos import PHOTO_COLUMNS_SQL, photo_set
+
+YIELD_PER = 2000
+CHUNK_SIZE = 500
+SIMILAR_COMPLEXES = 3
+DEFAULT_COORDINATES = [45.0355, 38.9753]  # Краснодар
+PLACEHOLDER_IMAGE = 'https://via.placeholder.com/400x300/0088CC/FFFFFF?text=Квартира'
+# Временная привязка застройщиков для ссылки со страницы ЖК без developer_id
+DEVELOPER_IDS = {
+    'ГК «Инвестстройкуб»': 1,
+    'ЖК Девелопмент': 2,
+    'Краснодар Строй': 3,
+    'Южный Дом': 4,
+    'Кубань Девелопмент': 5,
+}
+
+
+def _plain(value):
+    """Значение строки БД -> JSON"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _building_order(name):
+    """Корпуса по первому числу в названии, без номера — в конце"""
+    match = re.search(r'([0-9]+)', str(name)) if name else None
+    return int(match.group(1)) if match else 999
+
+
+def _gallery_images(gallery):
+    """Фото ЖК из галереи квартиры: первые фото — планировки и интерьеры"""
+    if not gallery:
+        return []
+    start = min(len(gallery) // 4, 5) if len(gallery) > 8 else 1
+    return gallery[start:] if len(gallery) > start else gallery
+
+
+class _ComplexTotals:
+    def __init__(self, name):
+        self.name = name
+        self.rows = []
+        self.gallery_row = None  # самая дорогая квартира с фото — ее галерея идет в слайдер ЖК
+
+    def add(self, row):
+        row = dict(row._mapping)
+        self.rows.append(row)
+        if row['photos'] is not None:
+            key = (row['price'] or 0, row['object_area'] or 0)
+            if self.gallery_row is None or key > self.gallery_row[0]:
+                self.gallery_row = (key, row)
+
+    def page(self):
+        rows = sorted(self.rows, key=lambda row: (row['price'] is None, row['price'] or 0))
+        summary = self._summary(rows)
+        total_floors = summary.get('total_floors_in_complex', 25)
+
+        properties = []
+        by_rooms = {}
+        by_building = {}
+        for index, row in enumerate(rows):
+            rooms = row['object_rooms']
+            floor = row['object_min_floor']
+            room_type = 'Студия' if rooms == 0 else f'{rooms}-комнатная квартира'
+            photos = photo_set(row)['gallery']
+            properties.append({
+                'id': row['inner_id'],
+                'inner_id': row['inner_id'],
+                'price': row['price'],
+                'object_area': row['object_area'],
+                'object_rooms': rooms,
+                'object_min_floor': floor,
+                'object_max_floor': row['object_max_floor'],
+                'complex_building_name': row['complex_building_name'],
+                'developer_name': row['developer_name'],
+                'cashback_amount': int(row['price'] * 0.035) if row['price'] else 0,
+                'type': f'{rooms}-комн',
+                'title': f"{room_type}, {row['object_area'] or 0} м², {floor}/{total_floors} эт.",
+                'apartment_floor': floor,
+                'total_floors_in_complex': total_floors,
+                'image': photos[0] if photos else PLACEHOLDER_IMAGE,
+                'property_type': 'Квартира',
+                'residential_complex': self.name,
+            })
+            by_rooms.setdefault('Студия' if rooms == 0 else f'{rooms}-комн', []).append(index)
+            by_building.setdefault(row['complex_building_name'], []).append(index)
+
+        return {
+            'summary': summary,
+            'properties': properties,
+            'by_rooms': list(by_rooms.items()),
+            'by_building': sorted(by_building.items(), key=lambda item: _building_order(item[0])),
+            'room_stats': self._room_stats(properties, by_rooms),
+            'buildings': self._buildings(rows),
+        }
+
+    def _summary(self, rows):
+        if not rows:
+            return {}
+        prices = [row['price'] for row in rows if row['price'] is not None]
+        areas = [row['object_area'] for row in rows if row['object_area'] is not None]
+        min_floors = [row['object_min_floor'] for row in rows if row['object_min_floor'] is not None]
+        max_floors = [row['object_max_floor'] for row in rows if row['object_max_floor'] is not None]
+
+        def largest(column):
+            values = [row[column] for row in rows if row[column] is not None]
+            return max(values) if values else None
+
+        price_from = int(min(prices)) if prices else 3000000
+        price_to = int(max(prices)) if prices else 15000000
+        max_floor = max(max_floors) if max_floors else 25
+        buildings = {row['complex_building_name'] for row in rows if row['complex_building_name']}
+        coordinates = next(([row['address_position_lat'], row['address_position_lon']] for row in rows
+                            if row['address_position_lat'] is not None and row['address_position_lon'] is not None),
+                           DEFAULT_COORDINATES)
+        images = _gallery_images(photo_set(self.gallery_row[1])['gallery']) if self.gallery_row else []
+        summary = {
+            'apartments_count': len(rows),
+            'price_from': price_from,
+            'price_to': price_to,
+            'real_price_from': price_from,
+            'real_price_to': price_to,
+            'real_area_from': min(areas) if areas else 35,
+            'real_area_to': max(areas) if areas else 135,
+            'real_floors_min': min(min_floors) if min_floors else 1,
+            'real_floors_max': max_floor,
+            'total_floors_in_complex': max_floor,
+            'full_address': largest('address_short_display_name'),
+            'sales_address': largest('complex_sales_address'),
+            'buildings_count': len(buildings) or 1,
+            'complex_start_year': largest('complex_start_build_year') or 2020,
+            'complex_start_quarter': largest('complex_start_build_quarter') or 1,
+            'object_class_display_name': largest('complex_object_class_display_name') or 'Комфорт',
+            'with_renovation': any(row['complex_with_renovation'] for row in rows),
+            'coordinates': [float(value) for value in coordinates],
+            'images': images[:10],
+            'image': images[0] if images else None,
+        }
+        developer = next((row['developer_name'] for row in rows if row['developer_name']), None)
+        if developer:
+            summary['developer_name'] = developer
+        # Без адресов в квартирах остаются значения из residential_complexes
+        return {key: value for key, value in summary.items()
+                if value is not None or key not in ('full_address', 'sales_address')}
+
+    @staticmethod
+    def _room_stats(properties, by_rooms):
+        stats = {}
+        for room_key, indexes in by_rooms.items():
+            prices = [properties[index]['price'] for index in indexes if properties[index]['price']]
+            areas = [properties[index]['object_area'] for index in indexes if properties[index]['object_area']]
+            stats[room_key] = {
+                'name': room_key,
+                'count': len(indexes),
+                'price_from': min(prices) if prices else 0,
+                'price_to': max(prices) if prices else 0,
+                'area_from': min(areas) if areas else 0,
+                'area_to': max(areas) if areas else 0,
+            }
+        return stats
+
+    @staticmethod
+    def _buildings(rows):
+        buildings = {}
+        for row in rows:
+            name = row['complex_building_name']
+            if not name:
+                continue
+            building = buildings.setdefault(name, {
+                'building_name': name, 'total_apartments': 0, 'total_floors': None,
+                'max_end_build_year': None, 'max_end_build_quarter': None,
+                'start_build_year': None, 'start_build_quarter': None, 'object_class': None,
+            })
+            building['total_apartments'] += 1
+            for key, column in (('total_floors', 'object_max_floor'),
+                                ('max_end_build_year', 'complex_building_end_build_year'),
+                                ('max_end_build_quarter', 'complex_building_end_build_quarter'),
+                                ('start_build_year', 'complex_start_build_year'),
+                                ('start_build_quarter', 'complex_start_build_quarter'),
+                                ('object_class', 'complex_object_class_display_name')):
+                if row[column] is not None and (building[key] is None or row[column] > building[key]):
+                    building[key] = row[column]
+        for building in buildings.values():
+            building['sort_order'] = _building_order(building['building_name'])
+        return sorted(buildings.values(), key=lambda item: (item['sort_order'], item['building_name']))
+
+
+def _similar_candidates(totals, residential_ids):
+    """Самые дешевые ЖК (на один больше, чтобы исключить текущий)"""
+    candidates = []
+    for name, complex_totals in totals.items():
+        prices = [row['price'] for row in complex_totals.rows if row['price'] is not None]
+        if not prices:
+            continue
+        summary_images = (_gallery_images(photo_set(complex_totals.gallery_row[1])['gallery'])
+                          if complex_totals.gallery_row else [])
+        rc_id = residential_ids.get(name)
+        candidates.append({
+            'id': rc_id or 999,
+            'name': name,
+            'price_from': int(min(prices)),
+            'price_to': int(max(prices)),
+            'apartments_count': len(complex_totals.rows),
+            'developer': next((row['developer_name'] for row in complex_totals.rows if row['developer_name']),
+                              None) or 'Не указан',
+            'location': max((row['address_short_display_name'] for row in complex_totals.rows
+                             if row['address_short_display_name']), default=None) or 'Адрес не указан',
+            'image': summary_images[0] if summary_images else 'https://via.placeholder.com/300x200',
+            'completion_date': '2025 г.',
+            'cashback_percent': 5.0,
+            'url': f'/residential-complex/{rc_id}' if rc_id else '#',
+        })
+    candidates.sort(key=lambda item: item['price_from'])
+    return candidates[:SIMILAR_COMPLEXES + 1]
+
+
+def _scoped(sql, column, names):
+    """Запрос по всем ЖК или только по названиям names (подстановка {scope})"""
+    if names is None:
+        return text(sql.format(scope=''))
+    return text(sql.format(scope=f'AND {column} IN :names')).bindparams(bindparam('names', expanding=True))
+
+
+def _stored_similar(session, names):
+    """Кандидаты в похожие ЖК из уже собранных страниц (без пересобираемых ЖК).
+
+    Похожие — самые дешевые ЖК вообще, у страниц они отличаются только
+    исключением самого ЖК, поэтому хватает двух страниц.
+    """
+    rows = session.execute(text("SELECT page FROM complex_pages ORDER BY id LIMIT 2").columns(page=JSON))
+    candidates = {}
+    for (page,) in rows:
+        for item in page.get('similar', []):
+            if item['name'] not in names:
+                candidates.setdefault(item['name'], item)
+    return sorted(candidates.values(), key=lambda item: item['price_from'])[:SIMILAR_COMPLEXES + 1]
+
+
+def refresh_complex_pages(session, slugify, names=None):
+    """Пересобрать complex_pages. slugify — create_slug из app.py.
+
+    names — пересобрать только эти ЖК: читаются только их квартиры, похожие
+    ЖК берутся из уже собранных страниц. Возвращает количество страниц.
+    """
+    if names is not None:
+        names = [name for name in dict.fromkeys(names) if name]
+        if not names:
+            return 0
+    params = {'names': names} if names is not None else {}
+    residential = session.execute(_scoped(
+        "SELECT id, name, complex_id FROM residential_complexes WHERE name IS NOT NULL {scope} ORDER BY id",
+        'name', names), params).fetchall()
+    residential_ids = {}
+    for rc_id, name, _ in residential:
+        residential_ids.setdefault(name, rc_id)
+
+    totals = {}
+    rows = session.execute(_scoped(f"""
+        SELECT ep.inner_id, ep.complex_name, ep.developer_name, ep.price, ep.object_area, ep.object_rooms,
+               ep.object_min_floor, ep.object_max_floor, ep.address_short_display_name, ep.complex_sales_address,
+               ep.complex_building_name, ep.complex_building_end_build_year, ep.complex_building_end_build_quarter,
+               ep.complex_start_build_year, ep.complex_start_build_quarter, ep.complex_object_class_display_name,
+               ep.complex_with_renovation, ep.address_position_lat, ep.address_position_lon, ep.photos,
+               {PHOTO_COLUMNS_SQL}
+        FROM excel_properties ep
+        LEFT JOIN property_photos pp ON pp.inner_id = ep.inner_id
+        WHERE ep.complex_name IS NOT NULL {{scope}}
+    """, 'ep.complex_name', names).execution_options(yield_per=YIELD_PER), params)
+    for row in rows:
+        totals.setdefault(row.complex_name, _ComplexTotals(row.complex_name)).add(row)
+
+    if names is None:
+        similar = _similar_candidates(totals, residential_ids)
+    else:
+        similar = _stored_similar(session, names)
+    page_names = list(dict.fromkeys([name for _, name, _ in residential] + list(totals)))
+    complex_keys = {name: key for _, name, key in reversed(residential)}
+    now = datetime.utcnow()
+    mappings = []
+    for name in page_names:
+        page = (totals.get(name) or _ComplexTotals(name)).page()
+        page['similar'] = [item for item in similar if item['name'] != name][:SIMILAR_COMPLEXES]
+        mappings.append({
+            'complex_name': name,
+            'slug': slugify(name),
+            'residential_complex_id': residential_ids.get(name),
+            'complex_key': complex_keys.get(name),
+            'apartments_count': len(page['properties']),
+            'page': page,
+            'refreshed_at': now,
+        })
+
+    _save_pages(session, mappings, names)
+    return len(mappings)
+
+
+def _save_pages(session, mappings, names):
+    """Обновить страницы по complex_name, добавить новые, удалить исчезнувшие ЖК.
+
+    id страниц сохраняются: индекс, закэшированный другим процессом, не
+    начинает указывать на чужой ЖК.
+    """
+    existing = dict(session.execute(_scoped(
+        "SELECT complex_name, id FROM complex_pages WHERE complex_name IS NOT NULL {scope}",
+        'complex_name', names), {'names': names} if names is not None else {}).fetchall())
+    update = text("""
+        UPDATE complex_pages
+        SET slug = :slug, residential_complex_id = :residential_complex_id, complex_key = :complex_key,
+            apartments_count = :apartments_count, page = :page, refreshed_at = :refreshed_at
+        WHERE complex_name = :complex_name
+    """).bindparams(bindparam('page', type_=JSON))
+    insert = text("""
+        INSERT INTO complex_pages (complex_name, slug, residential_complex_id, complex_key, apartments_count,
+                                   page, refreshed_at)
+        VALUES (:complex_name, :slug, :residential_complex_id, :complex_key, :apartments_count, :page, :refreshed_at)
+    """).bindparams(bindparam('page', type_=JSON))
+    for start in range(0, len(mappings), CHUNK_SIZE):
+        chunk = [{**mapping, 'page': _json_safe(mapping['page'])} for mapping in mappings[start:start + CHUNK_SIZE]]
+        updates = [mapping for mapping in chunk if mapping['complex_name'] in existing]
+        inserts = [mapping for mapping in chunk if mapping['complex_name'] not in existing]
+        if updates:
+            session.execute(update, updates)
+        if inserts:
+            session.execute(insert, inserts)
+
+    built = {mapping['complex_name'] for mapping in mappings}
+    gone = [page_id for name, page_id in existing.items() if name not in built]
+    delete = text("DELETE FROM complex_pages WHERE id IN :ids").bindparams(bindparam('ids', expanding=True))
+    for start in range(0, len(gone), CHUNK_SIZE):
+        session.execute(delete, {'ids': gone[start:start + CHUNK_SIZE]})
+
+
+def _json_safe(value):
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return _plain(value)
+
+
+def complex_pages_version(session):
+    """Отметка последней пересборки: меняется при любом обновлении или удалении страниц"""
+    count, refreshed_at = session.execute(text("SELECT COUNT(*), MAX(refreshed_at) FROM complex_pages")).one()
+    return count, str(refreshed_at)
+
+
+def complex_page_index(session):
+    """{('slug'|'name'|'id', значение): id страницы}.
+
+    Порядок как у прежнего поиска: по slug сначала ЖК из residential_complexes,
+    затем названия из excel_properties; по id — id и внешний complex_id.
+    """
+    index = {}
+    rows = session.execute(text("""
+        SELECT id, complex_name, slug, residential_complex_id, complex_key
+        FROM complex_pages
+        ORDER BY CASE WHEN residential_complex_id IS NULL THEN 1 ELSE 0 END, residential_complex_id, id
+    """)).fetchall()
+    for page_id, name, slug, rc_id, complex_key in rows:
+        index.setdefault(('slug', slug), page_id)
+        index.setdefault(('name', name), page_id)
+        if complex_key:
+            index.setdefault(('id', str(complex_key)), page_id)
+    for page_id, _, _, rc_id, _ in rows:
+        if rc_id is not None:
+            index.setdefault(('id', str(rc_id)), page_id)
+    return index
+
+
+def resolve_complex_page(index, complex_id=None, complex_name=None, slug=None):
+    """id страницы ЖК по параметрам маршрута или None"""
+    if slug:
+        return index.get(('slug', slug))
+    if complex_name:
+        return index.get(('name', complex_name))
+    if complex_id:
+        return index.get(('id', str(complex_id)))
+    return None
+
+
+def _building_status(building, current_year, current_quarter):
+    building = dict(building)
+    end_year, end_quarter = building['max_end_build_year'], building['max_end_build_quarter']
+    if end_year and end_quarter:
+        done = end_year < current_year or (end_year == current_year and end_quarter <= current_quarter)
+        building['building_status'] = 'Сдан' if done else 'Строится'
+        building['end_build_year'] = end_year
+        building['end_build_quarter'] = end_quarter
+    else:
+        building['building_status'] = 'Не указан'
+    return building
+
+
+def load_complex_page(session, page_id, complex_id=None, now=None):
+    """Контекст шаблона residential_complex_detail.html одним запросом или None"""
+    row = session.execute(text("""
+        SELECT cp.page AS complex_page, cp.complex_name AS complex_page_name,
+               cp.apartments_count AS complex_page_apartments, cp.residential_complex_id AS complex_page_rc, rc.*
+        FROM complex_pages cp
+        LEFT JOIN residential_complexes rc ON rc.id = cp.residential_complex_id
+        WHERE cp.id = :page_id
+    """).columns(complex_page=JSON), {'page_id': page_id}).fetchone()
+    if row is None:
+        return None
+
+    data = dict(row._mapping)
+    page = data.pop('complex_page')
+    name = data.pop('complex_page_name')
+    apartments = data.pop('complex_page_apartments')
+    if data.pop('complex_page_rc') is not None:
+        complex_data = data
+    else:
+        complex_data = {'id': 1, 'name': name, 'apartments_count': apartments,
+                        'description': f'ЖК {name} с {apartments} квартирами'}
+    complex_data.update(page['summary'])
+    if page['summary'] and 'full_address' not in page['summary']:
+        complex_data['full_address'] = complex_data.get('sales_address', '')
+
+    complex_data.setdefault('price_from', 3000000)
+    complex_data.setdefault('real_price_from', complex_data['price_from'])
+    complex_data.setdefault('cashback_percent', 3.5)
+    if 'developer_id' not in complex_data:
+        complex_data['developer_id'] = DEVELOPER_IDS.get(complex_data.get('developer', ''), 1)
+    complex_data['room_stats'] = page['room_stats']
+
+    now = now or datetime.now()
+    current_year, current_quarter = now.year, (now.month - 1) // 3 + 1
+    complex_data['buildings'] = {
+        building['building_name']: _building_status(building, current_year, current_quarter)
+        for building in page['buildings']
+    }
+    complex_data['current_year'] = current_year
+    complex_data['current_quarter'] = current_quarter
+
+    properties = page['properties']
+    for prop in properties:
+        prop['residential_complex_id'] = complex_id
+    return {
+        'complex': complex_data,
+        'properties': properties,
+        'properties_by_rooms': {key: [properties[index] for index in indexes] for key, indexes in page['by_rooms']},
+        'properties_by_building': {name: [properties[index] for index in indexes]
+                                   for name, indexes in page['by_building']},
+        'similar_complexes': page['similar'],
+    }
@@ -0,0 +1,287 @@
+"""
+Состояние парсеров в базе вместо JSON-дампов scraped_developers_*.json
+
+Каждый прогон парсеров заново качал всех застройщиков и ЖК и сохранял
+результат в файл с меткой времени, а админка перечитывала эти файлы.
+Теперь:
+
+- crawl_pages — очередь URL: когда загружен, ETag/Last-Modified, хэш
+  содержимого и next_fetch_at. Парсер загружает только "устаревшие"
+  страницы (новые или старше CRAWL_RECRAWL_HOURS, по умолчанию 24 часа),
+  для остальных берет сущности, разобранные в прошлый раз;
+- crawl_entities — разобранные сущности (застройщик, проект, квартира) с
+  хэшем данных. Если данные изменились, imported_at сбрасывается, и
+  импорт забирает только изменения (pending_changes / mark_imported);
+- админка (/admin/scraper/datasets) читает наборы из базы.
+
+Хранилище используется, когда парсер запущен в контексте приложения
+(for_source); без него парсеры работают как раньше — качают все.
+"""
+import hashlib
+import json
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import func
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECRAWL_HOURS = 24
+# После ошибки загрузки страница повторяется раньше обычного интервала
+ERROR_RETRY = timedelta(hours=1)
+# Поля, которые меняются на каждом прогоне и не означают изменения данных
+VOLATILE_FIELDS = ('inner_id', 'scraped_at', 'found_at', 'parsed_at')
+
+EntityDiff = namedtuple('EntityDiff', ['created', 'updated', 'unchanged'])
+
+
+def content_hash(content):
+    if content is None:
+        return None
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def entity_hash(data):
+    stable = {key: value for key, value in data.items() if key not in VOLATILE_FIELDS}
+    return content_hash(json.dumps(stable, sort_keys=True, ensure_ascii=False, default=str))
+
+
+class CrawlStore:
+    """Очередь URL и разобранные сущности одного парсера (source)"""
+
+    def __init__(self, session, source, recrawl_after=None):
+        self.session = session
+        self.source = source
+        self.recrawl_after = recrawl_after or timedelta(hours=DEFAULT_RECRAWL_HOURS)
+        self._pages = {}
+
+    def _load_pages(self, urls):
+        from models import CrawlPage
+        missing = [url for url in urls if url not in self._pages]
+        if missing:
+            rows = self.session.query(CrawlPage).filter(
+                CrawlPage.source == self.source, CrawlPage.url.in_(missing)
+            ).all()
+            for page in rows:
+                self._pages[page.url] = page
+        return {url: self._pages.get(url) for url in urls}
+
+    def stale(self, urls):
+        """URL, которые нужно загрузить: новые и с наступившим next_fetch_at"""
+        urls = list(dict.fromkeys(url for url in urls if url))
+        now = datetime.utcnow()
+        pages = self._load_pages(urls)
+        return [url for url in urls
+                if pages[url] is None or pages[url].next_fetch_at is None or pages[url].next_fetch_at <= now]
+
+    def plan(self, urls):
+        """(URL для загрузки, {URL: сущности прошлого разбора}) для списка страниц.
+
+        Свежая страница без сохраненных сущностей тоже загружается.
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        to_fetch = set(self.stale(urls))
+        reused = {}
+        for url in urls:
+            if url in to_fetch:
+                continue
+            entities = self.entities(group_key=url)
+            if entities:
+                reused[url] = entities
+            else:
+                to_fetch.add(url)
+        return [url for url in urls if url in to_fetch], reused
+
+    def record_page(self, url, content=None, status_code=200, etag=None, last_modified=None,
+                    kind=None, error=None):
+        """Запомнить загрузку страницы -> True, если содержимое изменилось (или страница новая)"""
+        from models import CrawlPage
+
+        now = datetime.utcnow()
+        page = self._load_pages([url])[url]
+        if page is None:
+            page = CrawlPage(source=self.source, url=url, first_seen_at=now, fetch_count=0)
+            self.session.add(page)
+            self._pages[url] = page
+
+        page.kind = kind or page.kind
+        page.status_code = status_code
+        page.last_fetched_at = now
+        page.fetch_count = (page.fetch_count or 0) + 1
+
+        if error or content is None:
+            page.error = error or f'HTTP {status_code}'
+            page.next_fetch_at = now + min(self.recrawl_after, ERROR_RETRY)
+            return False
+
+        page.error = None
+        page.etag = etag or page.etag
+        page.last_modified = last_modified or page.last_modified
+        page.next_fetch_at = now + self.recrawl_after
+        digest = content_hash(content)
+        changed = digest != page.content_hash
+        if changed:
+            page.content_hash = digest
+            page.last_changed_at = now
+        return changed
+
+    def record_fetch(self, url, result, kind=None):
+        """record_page для FetchResult из crawler.py (None — страница не получена)"""
+        if result is None:
+            return self.record_page(url, kind=kind, status_code=None, error='Нет ответа')
+        if not result.ok:
+            return self.record_page(url, kind=kind, status_code=result.status_code)
+        return self.record_page(url, result.content, status_code=result.status_code,
+                                etag=result.headers.get('ETag'),
+                                last_modified=result.headers.get('Last-Modified'), kind=kind)
+
+    def record_entities(self, entity_type, items, key, group_key=None):
+        """Сохранить разобранные сущности -> EntityDiff(created, updated, unchanged).
+
+        key — функция data -> уникальный ключ сущности в пределах source/entity_type.
+        Новые и изменившиеся сущности становятся ожидающими импорта.
+        """
+        from models import CrawlEntity
+
+        now = datetime.utcnow()
+        keyed = {}
+        for data in items:
+            entity_key = key(data)
+            if entity_key:
+                keyed[str(entity_key)[:500]] = data
+
+        existing = {}
+        if keyed:
+            existing = {entity.entity_key: entity for entity in self.session.query(CrawlEntity).filter(
+                CrawlEntity.source == self.source,
+                CrawlEntity.entity_type == entity_type,
+                CrawlEntity.entity_key.in_(list(keyed)),
+            ).all()}
+
+        diff = EntityDiff([], [], [])
+        for entity_key, data in keyed.items():
+            digest = entity_hash(data)
+            entity = existing.get(entity_key)
+            if entity is None:
+                self.session.add(CrawlEntity(
+                    source=self.source, entity_type=entity_type, entity_key=entity_key,
+                    group_key=group_key, data=data, data_hash=digest,
+                    first_seen_at=now, last_seen_at=now, changed_at=now,
+                ))
+                diff.created.append(data)
+                continue
+
+            entity.last_seen_at = now
+            entity.group_key = group_key or entity.group_key
+            if entity.data_hash == digest:
+                diff.unchanged.append(data)
+                continue
+            entity.data = data
+            entity.data_hash = digest
+            entity.changed_at = now
+            entity.imported_at = None
+            diff.updated.append(data)
+        return diff
+
+    def entities(self, entity_type=None, group_key=None):
+        """Данные сохраненных сущностей (для страниц, которые не перезагружались)"""
+        from models import CrawlEntity
+        query = self.session.query(CrawlEntity).filter(CrawlEntity.source == self.source)
+        if entity_type:
+            query = query.filter(CrawlEntity.entity_type == entity_type)
+        if group_key:
+            query = query.filter(CrawlEntity.group_key == group_key)
+        return [entity.data for entity in query.order_by(CrawlEntity.id).all()]
+
+    def commit(self):
+        try:
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Ошибка сохранения состояния парсера {self.source}: {e}")
+
+
+def for_source(source):
+    """CrawlStore для парсера, если он запущен в контексте приложения, иначе None"""
+    if not has_app_context():
+        return None
+    from models import db
+    hours = current_app.config.get('CRAWL_RECRAWL_HOURS', DEFAULT_RECRAWL_HOURS)
+    return CrawlStore(db.session, source, timedelta(hours=hours))
+
+
+def pending_changes(session, source=None, entity_type=None):
+    """Новые и изменившиеся сущности, которые еще не забрал импорт"""
+    from models import CrawlEntity
+    query = session.query(CrawlEntity).filter(CrawlEntity.imported_at.is_(None))
+    if source:
+        query = query.filter(CrawlEntity.source == source)
+    if entity_type:
+        query = query.filter(CrawlEntity.entity_type == entity_type)
+    return query.order_by(CrawlEntity.id).all()
+
+
+def mark_imported(session, entities):
+    """Отметить сущности (объекты или id) импортированными"""
+    from models import CrawlEntity
+    ids = [getattr(entity, 'id', entity) for entity in entities]
+    if ids:
+        session.query(CrawlEntity).filter(CrawlEntity.id.in_(ids)).update(
+            {CrawlEntity.imported_at: datetime.utcnow()}, synchronize_session=False)
+
+
+def dataset_summary(session):
+    """Наборы (source, entity_type) для админки: количество, ожидают импорта, последнее обновление"""
+    from models import CrawlEntity, CrawlPage
+
+    rows = session.query(
+        CrawlEntity.source, CrawlEntity.entity_type,
+        func.count(CrawlEntity.id),
+        func.count(CrawlEntity.id).filter(CrawlEntity.imported_at.is_(None)),
+        func.max(CrawlEntity.last_seen_at),
+        func.max(CrawlEntity.changed_at),
+    ).group_by(CrawlEntity.source, CrawlEntity.entity_type).all()
+
+    pages = {source: (total, errors, last_fetched) for source, total, errors, last_fetched in session.query(
+        CrawlPage.source,
+        func.count(CrawlPage.id),
+        func.count(CrawlPage.id).filter(CrawlPage.error.isnot(None)),
+        func.max(CrawlPage.last_fetched_at),
+    ).group_by(CrawlPage.source).all()}
+
+    datasets = []
+    for source, entity_type, total, pending, last_seen, last_changed in rows:
+        page_total, page_errors, last_fetched = pages.get(source, (0, 0, None))
+        datasets.append({
+            'source': source,
+            'entity_type': entity_type,
+            'entities': total,
+            'pending': pending,
+            'pages': page_total,
+            'page_errors': page_errors,
+            'last_seen': last_seen,
+            'last_changed': last_changed,
+            'last_fetched': last_fetched,
+        })
+    datasets.sort(key=lambda item: item['last_seen'] or datetime.min, reverse=True)
+    return datasets
+
+
+def dataset_entities(session, source, entity_type, limit=1000):
+    """Сущности набора для просмотра в админке"""
+    from models import CrawlEntity
+    rows = session.query(CrawlEntity).filter(
+        CrawlEntity.source == source, CrawlEntity.entity_type == entity_type
+    ).order_by(CrawlEntity.id).limit(limit).all()
+    return [{
+        'key': entity.entity_key,
+        'group': entity.group_key,
+        'first_seen': entity.first_seen_at.isoformat() if entity.first_seen_at else None,
+        'changed': entity.changed_at.isoformat() if entity.changed_at else None,
+        'imported': entity.imported_at.isoformat() if entity.imported_at else None,
+        'data': entity.data,
+    } for entity in rows]
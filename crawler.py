@@ -0,0 +1,320 @@
+"""
+Общий HTTP-движок для парсеров (Domclick, сайты застройщиков, ИИ-парсер)
+
+Раньше каждый парсер качал страницы по одной через requests с
+time.sleep(1 + attempt * 0.5) перед каждым запросом, а часть парсеров
+поднимала Selenium даже для статических страниц. Здесь:
+
+- пул соединений httpx.AsyncClient (keep-alive, HTTP/1.1) на весь прогон;
+- ограничение параллельности на хост (per_host) и "вежливая" пауза между
+  запусками запросов к одному хосту (delay) — разные хосты качаются параллельно;
+- условный GET: ETag/Last-Modified запоминаются в ValidatorCache, при 304
+  тело берется из кэша;
+- повторы при сетевых ошибках, 429 и 5xx с экспоненциальной паузой и
+  джиттером (Retry-After учитывается);
+- offline=True — ответы только из кэша, без сети (воспроизведение прогона).
+
+Парсеры синхронные, поэтому для них есть Crawler — обертка со своим event
+loop: fetch(url) и fetch_all(urls) используют один и тот же пул соединений.
+Selenium остается только там, где страница без JS пустая (needs_js_rendering).
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchResult:
+    """Ответ сервера (или кэша при 304) с интерфейсом, похожим на requests.Response"""
+
+    def __init__(self, url, status_code, content, headers=None, from_cache=False, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache
+        self.encoding = encoding or 'utf-8'
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+    def __repr__(self):
+        source = 'cache' if self.from_cache else 'network'
+        return f'<FetchResult {self.status_code} {self.url} ({source})>'
+
+
+class ValidatorCache:
+    """ETag/Last-Modified и тело последнего ответа 200 по URL.
+
+    По умолчанию хранится в памяти; с path — в JSON файле, чтобы повторный
+    запуск парсера получал 304 на неизменившихся страницах. store_all —
+    хранить тело и без валидаторов (для offline-воспроизведения).
+    """
+
+    def __init__(self, path=None, store_all=False):
+        self.path = path
+        self.store_all = store_all
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Кэш валидаторов {path} не прочитан: {e}")
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def conditional_headers(self, url):
+        entry = self.get(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified and not self.store_all:
+            return
+        with self._lock:
+            self.entries[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'encoding': response.encoding,
+                'body': response.content.decode('latin-1'),
+            }
+
+    def cached_result(self, url):
+        entry = self.get(url)
+        if not entry:
+            return None
+        return FetchResult(url, 200, entry['body'].encode('latin-1'),
+                           from_cache=True, encoding=entry.get('encoding'))
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class _HostSlot:
+    """Семафор и время следующего разрешенного запроса для одного хоста"""
+
+    def __init__(self, per_host):
+        self.semaphore = asyncio.Semaphore(per_host)
+        self.lock = asyncio.Lock()
+        self.next_start = 0.0
+
+
+class AsyncCrawler:
+    def __init__(self, headers=None, per_host=2, delay=1.0, retries=3, backoff=0.5,
+                 timeout=30, max_connections=20, cache=None, follow_redirects=True, offline=False):
+        self.headers = dict(DEFAULT_HEADERS)
+        self.headers.update(headers or {})
+        self.per_host = per_host
+        self.delay = delay
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.follow_redirects = follow_redirects
+        self.offline = offline
+        self.cache = cache if cache is not None else ValidatorCache()
+        self.stats = {'requests': 0, 'not_modified': 0, 'retries': 0, 'errors': 0}
+        self._client = None
+        self._hosts = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                follow_redirects=self.follow_redirects,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        # Семафоры привязаны к event loop, в котором использовались
+        self._hosts = {}
+        self.cache.save()
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        slot = self._hosts.get(host)
+        if slot is None:
+            slot = self._hosts[host] = _HostSlot(self.per_host)
+        return slot
+
+    async def _wait_turn(self, slot):
+        """Пауза delay между запусками запросов к одному хосту"""
+        async with slot.lock:
+            now = time.monotonic()
+            wait = slot.next_start - now
+            slot.next_start = max(now, slot.next_start) + self.delay
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _retry_delay(self, attempt, response=None):
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    async def fetch(self, url, headers=None, retries=None):
+        """FetchResult или None, если страницу так и не удалось получить"""
+        if self.offline:
+            return self.cache.cached_result(url)
+        retries = retries or self.retries
+        slot = self._host_slot(url)
+        for attempt in range(retries):
+            response = None
+            try:
+                async with slot.semaphore:
+                    await self._wait_turn(slot)
+                    request_headers = self.cache.conditional_headers(url)
+                    request_headers.update(headers or {})
+                    self.stats['requests'] += 1
+                    response = await self.client.get(url, headers=request_headers)
+
+                if response.status_code == 304:
+                    cached = self.cache.cached_result(url)
+                    if cached is not None:
+                        self.stats['not_modified'] += 1
+                        logger.debug(f"304 Not Modified: {url}")
+                        return cached
+
+                if response.status_code not in RETRY_STATUSES:
+                    result = FetchResult(str(response.url), response.status_code, response.content,
+                                         response.headers, encoding=response.encoding)
+                    if response.status_code == 200:
+                        self.cache.store(url, result)
+                    return result
+
+                logger.warning(f"HTTP {response.status_code} для {url} (попытка {attempt + 1})")
+            except httpx.HTTPError as e:
+                logger.warning(f"Ошибка получения {url} (попытка {attempt + 1}): {e}")
+
+            if attempt < retries - 1:
+                self.stats['retries'] += 1
+                await asyncio.sleep(self._retry_delay(attempt, response))
+
+        self.stats['errors'] += 1
+        return None
+
+    async def fetch_all(self, urls, headers=None):
+        """{url: FetchResult|None} — хосты параллельно, внутри хоста по per_host/delay"""
+        urls = list(dict.fromkeys(url for url in urls if url))
+        results = await asyncio.gather(*(self.fetch(url, headers) for url in urls))
+        return dict(zip(urls, results))
+
+
+class Crawler:
+    """Синхронная обертка над AsyncCrawler для существующих парсеров.
+
+    Держит собственный event loop, поэтому пул соединений и кэш валидаторов
+    живут между вызовами fetch()/fetch_all(); после close() следующий вызов
+    откроет новый пул. Не использовать из кода, который уже выполняется
+    внутри event loop — там нужен AsyncCrawler.
+    """
+
+    def __init__(self, **options):
+        self._loop = None
+        self.engine = AsyncCrawler(**options)
+
+    @property
+    def stats(self):
+        return self.engine.stats
+
+    def _run(self, coroutine):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coroutine)
+
+    def fetch(self, url, headers=None, retries=None):
+        return self._run(self.engine.fetch(url, headers, retries))
+
+    def fetch_all(self, urls, headers=None):
+        return self._run(self.engine.fetch_all(urls, headers))
+
+    def close(self):
+        if self._loop is None:
+            return
+        self._loop.run_until_complete(self.engine.close())
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def needs_js_rendering(html, min_text_length=500):
+    """Страница без JS пустая (SPA-заглушка) — нужен браузер (Selenium)"""
+    if not html:
+        return True
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(['script', 'style', 'noscript']):
+        tag.decompose()
+    return len(soup.get_text(separator=' ', strip=True)) < min_text_length
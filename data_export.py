@@ -0,0 +1,340 @@
+"""
+Потоковая выгрузка объектов, клиентов и сделок в CSV/XLSX
+
+Строки читаются серверным курсором (yield_per) и сразу пишутся в ответ:
+CSV отдается частями по мере чтения, XLSX собирается openpyxl в режиме
+write_only (строки уходят во временный файл, а не в память) и затем
+отдается файлом по кускам. Память воркера не зависит от размера выгрузки,
+поэтому 50 тыс. объектов не загружаются целиком, как при постраничном JSON.
+
+Фильтры объектов — тот же словарь, что строит /properties
+(property_filters_from_args), но условия применяются в SQL, а не в цикле.
+"""
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response, stream_with_context
+from sqlalchemy import text
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+YIELD_PER = 1000
+CSV_FLUSH_ROWS = 500
+FILE_CHUNK_SIZE = 64 * 1024
+
+PROPERTY_COLUMNS = [
+    ('inner_id', 'ID'),
+    ('complex_name', 'ЖК'),
+    ('developer_name', 'Застройщик'),
+    ('address_display_name', 'Адрес'),
+    ('address_locality_name', 'Район'),
+    ('complex_building_name', 'Корпус'),
+    ('object_rooms', 'Комнат'),
+    ('object_area', 'Площадь, м²'),
+    ('object_min_floor', 'Этаж'),
+    ('object_max_floor', 'Этажность'),
+    ('price', 'Цена, ₽'),
+    ('square_price', 'Цена за м², ₽'),
+    ('complex_object_class_display_name', 'Класс'),
+    ('renovation_display_name', 'Отделка'),
+    ('complex_end_build_year', 'Год сдачи'),
+    ('complex_end_build_quarter', 'Квартал сдачи'),
+]
+
+CLIENT_COLUMNS = [
+    ('id', 'ID'),
+    ('user_id', 'Номер клиента'),
+    ('full_name', 'ФИО'),
+    ('email', 'Email'),
+    ('phone', 'Телефон'),
+    ('client_status', 'Статус'),
+    ('manager_name', 'Менеджер'),
+    ('is_active', 'Активен'),
+    ('created_at', 'Дата регистрации'),
+]
+
+DEAL_COLUMNS = [
+    ('deal_number', 'Номер сделки'),
+    ('status', 'Статус'),
+    ('client_name', 'Клиент'),
+    ('manager_name', 'Менеджер'),
+    ('complex_name', 'ЖК'),
+    ('property_rooms', 'Комнат'),
+    ('property_area', 'Площадь, м²'),
+    ('property_floor', 'Этаж'),
+    ('property_price', 'Стоимость, ₽'),
+    ('cashback_amount', 'Кешбек, ₽'),
+    ('contract_date', 'Дата договора'),
+    ('completion_date', 'Дата завершения'),
+    ('created_at', 'Создана'),
+]
+
+
+def property_filters_from_args(args):
+    """Словарь фильтров объектов из query string (формат страницы /properties)"""
+    filters = {}
+    filters['price_min'] = args.get('price_min', args.get('priceFrom', args.get('price_from', '')))
+    filters['price_max'] = args.get('price_max', args.get('priceTo', args.get('price_to', '')))
+    # Обработка комнат (может прийти как "1,2,3" или как список)
+    rooms_param = args.get('rooms', '')
+    if rooms_param:
+        filters['rooms'] = rooms_param.split(',') if ',' in rooms_param else [rooms_param]
+    else:
+        filters['rooms'] = args.getlist('rooms') or []
+    filters['districts'] = args.getlist('districts') or []
+    filters['developers'] = args.getlist('developers') or []
+    filters['completion'] = args.getlist('completion') or []
+    filters['developer'] = args.get('developer', '')
+    filters['district'] = args.get('district', '')
+    filters['residential_complex'] = args.get('residential_complex', '')
+    filters['building'] = args.get('building', '')
+
+    # Расширенные фильтры из секции "Еще"
+    filters['area_min'] = args.get('area_from', args.get('areaFrom', ''))
+    filters['area_max'] = args.get('area_to', args.get('areaTo', ''))
+    filters['floor_min'] = args.get('floor_from', args.get('floorFrom', ''))
+    filters['floor_max'] = args.get('floor_to', args.get('floorTo', ''))
+    filters['building_types'] = args.getlist('building_types') or []
+    filters['delivery_years'] = args.getlist('delivery_years') or []
+    filters['features'] = args.getlist('features') or []
+    filters['object_classes'] = args.getlist('object_classes') or []
+
+    # Региональные фильтры
+    filters['regions'] = args.getlist('regions') or []
+    filters['cities'] = args.getlist('cities') or []
+    filters['region'] = args.get('region', '')
+    filters['city'] = args.get('city', '')
+
+    # Поисковый запрос
+    filters['search'] = args.get('search', '')
+    return filters
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _room_values(room_filters):
+    """Значения комнат из '1', '2-комн', 'студия', '4+' -> (точные значения, есть ли 4+)"""
+    exact, four_plus = set(), False
+    for room_filter in room_filters:
+        normalized = str(room_filter).lower().strip()
+        if normalized in ('студия', 'studio', '0'):
+            exact.add(0)
+        elif normalized.startswith('4+') or normalized in ('4', '4-комн', '4-комнатная'):
+            four_plus = True
+        else:
+            number = _number(normalized.split('-')[0], int)
+            if number is not None:
+                if number >= 4:
+                    four_plus = True
+                else:
+                    exact.add(number)
+    return exact, four_plus
+
+
+def property_filter_sql(filters):
+    """WHERE для excel_properties ep по словарю фильтров /properties -> (sql, params)"""
+    conditions, params = [], {}
+
+    def like_any(column, values, name, allow_null=False):
+        values = [value for value in values if value]
+        if not values:
+            return
+        parts = []
+        for index, value in enumerate(values):
+            params[f'{name}_{index}'] = f'%{value.lower()}%'
+            parts.append(f"LOWER({column}) LIKE :{name}_{index}")
+        if allow_null:
+            parts.append(f"{column} IS NULL")
+        conditions.append('(' + ' OR '.join(parts) + ')')
+
+    # Цена вводится в миллионах
+    for key, operator in (('price_min', '>='), ('price_max', '<=')):
+        value = _number(filters.get(key))
+        if value is not None:
+            params[key] = value * 1000000
+            conditions.append(f"COALESCE(ep.price, 0) {operator} :{key}")
+    for key, column, operator, cast in (
+        ('area_min', 'ep.object_area', '>=', float),
+        ('area_max', 'ep.object_area', '<=', float),
+        ('floor_min', 'ep.object_min_floor', '>=', int),
+        ('floor_max', 'ep.object_min_floor', '<=', int),
+    ):
+        value = _number(filters.get(key), cast)
+        if value is not None:
+            params[key] = value
+            conditions.append(f"COALESCE({column}, 0) {operator} :{key}")
+
+    building_types = {
+        'малоэтажный': 'ep.object_max_floor <= 5',
+        'среднеэтажный': 'ep.object_max_floor BETWEEN 6 AND 12',
+        'многоэтажный': 'ep.object_max_floor >= 13',
+    }
+    selected = [building_types[value] for value in filters.get('building_types') or [] if value in building_types]
+    if selected:
+        conditions.append('(' + ' OR '.join(selected) + ')')
+
+    like_any('ep.address_locality_name', filters.get('districts') or [], 'district_any')
+    like_any('ep.developer_name', filters.get('developers') or [], 'developer_any')
+    like_any('ep.developer_name', [filters.get('developer')], 'developer', allow_null=True)
+    like_any('ep.address_locality_name', [filters.get('district')], 'district')
+    like_any('ep.complex_name', [filters.get('residential_complex')], 'complex', allow_null=True)
+    like_any('ep.complex_building_name', [filters.get('building')], 'building', allow_null=True)
+    like_any('ep.complex_object_class_display_name', filters.get('object_classes') or [],
+             'object_class', allow_null=True)
+    for key in ('regions', 'cities'):
+        like_any('ep.address_display_name', filters.get(key) or [], key)
+    for key in ('region', 'city'):
+        like_any('ep.address_display_name', [filters.get(key)], key)
+
+    exact, four_plus = _room_values(filters.get('rooms') or [])
+    if exact or four_plus:
+        parts = []
+        if exact:
+            parts.append("COALESCE(ep.object_rooms, 0) IN ({})".format(', '.join(str(value) for value in sorted(exact))))
+        if four_plus:
+            parts.append("ep.object_rooms >= 4")
+        conditions.append('(' + ' OR '.join(parts) + ')')
+
+    # Год сдачи; "Сдан" снимает фильтр, как на странице объектов
+    years = [value for value in (filters.get('completion') or []) + (filters.get('delivery_years') or [])]
+    if years and 'Сдан' not in years:
+        year_numbers = [number for number in (_number(value, int) for value in years) if number is not None]
+        if year_numbers:
+            year_list = ', '.join(str(year) for year in year_numbers)
+            conditions.append(f"(ep.complex_end_build_year IN ({year_list}) "
+                              f"OR ep.complex_building_end_build_year IN ({year_list}))")
+
+    search = (filters.get('search') or '').strip().lower()
+    if search:
+        params['search'] = f'%{search}%'
+        conditions.append("(" + " OR ".join(
+            f"LOWER({column}) LIKE :search" for column in (
+                'ep.address_display_name', 'ep.developer_name', 'ep.complex_name',
+                'ep.address_locality_name', 'ep.complex_building_name')
+        ) + ")")
+
+    return (' AND '.join(conditions) or '1=1'), params
+
+
+def property_export_rows(session, filters):
+    where, params = property_filter_sql(filters)
+    columns = ', '.join(f'ep.{column}' for column, _ in PROPERTY_COLUMNS)
+    statement = text(f"SELECT {columns} FROM excel_properties ep WHERE {where} ORDER BY ep.inner_id")
+    return session.execute(statement.execution_options(yield_per=YIELD_PER), params)
+
+
+def client_export_rows(session, manager_id=None):
+    """Клиенты менеджера (или все покупатели для администратора)"""
+    where = "u.assigned_manager_id = :manager_id" if manager_id else "u.role = 'buyer'"
+    statement = text(f"""
+        SELECT u.id, u.user_id, u.full_name, u.email, u.phone, u.client_status,
+               m.first_name || ' ' || m.last_name AS manager_name, u.is_active, u.created_at
+        FROM users u
+        LEFT JOIN managers m ON m.id = u.assigned_manager_id
+        WHERE {where}
+        ORDER BY u.id
+    """)
+    return session.execute(statement.execution_options(yield_per=YIELD_PER), {'manager_id': manager_id})
+
+
+def deal_export_rows(session, manager_id=None, statuses=None):
+    """Сделки менеджера (или все для администратора), статусы как в /api/deals"""
+    conditions, params = [], {}
+    if manager_id:
+        conditions.append("d.manager_id = :manager_id")
+        params['manager_id'] = manager_id
+    for index, status in enumerate(statuses or []):
+        params[f'status_{index}'] = status
+    if statuses:
+        conditions.append("d.status IN ({})".format(', '.join(f':status_{index}' for index in range(len(statuses)))))
+    statement = text(f"""
+        SELECT d.deal_number, d.status, u.full_name AS client_name,
+               m.first_name || ' ' || m.last_name AS manager_name, rc.name AS complex_name,
+               d.property_rooms, d.property_area, d.property_floor, d.property_price,
+               d.cashback_amount, d.contract_date, d.completion_date, d.created_at
+        FROM deals d
+        LEFT JOIN users u ON u.id = d.client_id
+        LEFT JOIN managers m ON m.id = d.manager_id
+        LEFT JOIN residential_complexes rc ON rc.id = d.residential_complex_id
+        WHERE {' AND '.join(conditions) or '1=1'}
+        ORDER BY d.created_at DESC, d.id DESC
+    """)
+    return session.execute(statement.execution_options(yield_per=YIELD_PER), params)
+
+
+def _cell(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bool):
+        return 'да' if value else 'нет'
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(rows, columns):
+    """CSV (UTF-8 с BOM для Excel, разделитель ';') порциями по CSV_FLUSH_ROWS строк"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow([title for _, title in columns])
+    pending = 0
+    for row in rows:
+        writer.writerow([_cell(value) for value in row])
+        pending += 1
+        if pending >= CSV_FLUSH_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_xlsx(rows, columns, sheet_title='Export'):
+    """XLSX через write-only книгу во временном файле, отдается кусками"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title[:31])
+    sheet.append([title for _, title in columns])
+    for row in rows:
+        sheet.append([_cell(value) for value in row])
+
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def export_response(rows, columns, fmt, filename, sheet_title='Export'):
+    """Потоковый ответ с выгрузкой; rows — итератор строк (курсор с yield_per)"""
+    if fmt == 'xlsx':
+        body = iter_xlsx(rows, columns, sheet_title)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = iter_csv(rows, columns)
+        mimetype = 'text/csv; charset=utf-8'
+    stamp = datetime.now().strftime('%Y%m%d_%H%M')
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}_{stamp}.{fmt}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Параллельный бэкап и восстановление базы InBack по таблицам
+
+restore_backup.py / restore_backup_improved.py читали Excel-выгрузки в pandas
+и на каждую строку делали SELECT + INSERT/UPDATE, database_restore.py прогонял
+весь SQL-дамп через psql одним потоком — полное восстановление шло часами.
+Здесь:
+
+- dump: каждая таблица выгружается своим потоком (до --jobs одновременно)
+  в CSV-куски по CHUNK_ROWS строк, разбитые по первичному ключу и сжатые
+  gzip; на PostgreSQL все потоки читают один снимок (pg_export_snapshot),
+  поэтому бэкап согласован между таблицами. В manifest.json для каждого
+  куска записываются число строк и sha256;
+- restore: сначала проверяются контрольные суммы всех кусков, затем таблицы
+  загружаются через COPY FROM STDIN уровнями по внешним ключам (родительские
+  раньше дочерних), до --jobs таблиц одновременно. Каждый кусок — своя
+  транзакция, загруженные куски отмечаются в restore_progress.json, поэтому
+  прерванное восстановление продолжается с места остановки (--resume);
+- после загрузки выставляются последовательности id и число строк каждой
+  таблицы сверяется с манифестом.
+
+На PostgreSQL данные идут через COPY (psycopg2 copy_expert), на других базах
+(SQLite в разработке) — тот же формат кусков через INSERT пачками.
+Схема не выгружается: таблицы создает приложение (db.create_all()).
+
+    python db_backup.py dump [--dir backups/20250101_120000] [--jobs 8]
+    python db_backup.py verify backups/20250101_120000
+    python db_backup.py restore backups/20250101_120000 [--jobs 8] [--resume]
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import Integer, create_engine, inspect, text
+
+FORMAT_VERSION = 1
+CHUNK_ROWS = 50000
+GZIP_LEVEL = 3  # Сжатие не должно быть узким местом по сравнению с COPY
+DEFAULT_JOBS = min(8, os.cpu_count() or 4)
+MANIFEST = 'manifest.json'
+PROGRESS = 'restore_progress.json'
+NULL = '\\N'
+CSV_OPTIONS = f"FORMAT csv, NULL '{NULL}'"
+INSERT_BATCH = 5000
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(directory):
+    with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемый формат бэкапа: {manifest.get('format')}")
+    return manifest
+
+
+class DatabaseBackup:
+    """Выгрузка и загрузка таблиц кусками, параллельно по таблицам"""
+
+    def __init__(self, database_url=None, jobs=DEFAULT_JOBS, chunk_rows=CHUNK_ROWS):
+        database_url = database_url or os.environ.get('DATABASE_URL')
+        if not database_url:
+            raise ValueError("DATABASE_URL не найден в переменных окружения")
+        self.engine = create_engine(database_url, pool_size=jobs + 1, max_overflow=2)
+        self.is_postgres = self.engine.dialect.name == 'postgresql'
+        self.jobs = max(1, jobs)
+        self.chunk_rows = chunk_rows
+        self.quote = self.engine.dialect.identifier_preparer.quote
+        self._lock = threading.Lock()
+
+    # --- Схема ---
+
+    def table_info(self, tables=None):
+        """{таблица: {'columns': [...], 'primary_key': столбец или None, 'depends_on': [...]}}"""
+        inspector = inspect(self.engine)
+        names = tables or inspector.get_table_names()
+        info = {}
+        for table in names:
+            columns = inspector.get_columns(table)
+            pk = inspector.get_pk_constraint(table).get('constrained_columns') or []
+            pk_column = next((column for column in columns if column['name'] == pk[0]), None) if len(pk) == 1 else None
+            info[table] = {
+                'columns': [column['name'] for column in columns],
+                # Куски по диапазонам ключа — только для целочисленного первичного ключа
+                'primary_key': pk[0] if pk_column is not None and isinstance(pk_column['type'], Integer) else None,
+                'depends_on': sorted({fk['referred_table'] for fk in inspector.get_foreign_keys(table)
+                                      if fk['referred_table'] != table}),
+            }
+        return info
+
+    @staticmethod
+    def load_order(tables):
+        """Уровни загрузки: таблица идет после таблиц, на которые ссылается.
+
+        Таблицы одного уровня друг от друга не зависят и грузятся параллельно.
+        Циклические ссылки попадают в последний уровень.
+        """
+        pending = {name: set(info['depends_on']) & set(tables) for name, info in tables.items()}
+        levels = []
+        while pending:
+            ready = sorted(name for name, deps in pending.items() if not deps)
+            if not ready:
+                levels.append(sorted(pending))
+                break
+            levels.append(ready)
+            for name in ready:
+                del pending[name]
+            for deps in pending.values():
+                deps.difference_update(ready)
+        return levels
+
+    # --- Выгрузка ---
+
+    def dump(self, directory, tables=None):
+        os.makedirs(directory, exist_ok=True)
+        info = self.table_info(tables)
+        manifest = {
+            'format': FORMAT_VERSION,
+            'created_at': datetime.now().isoformat(),
+            'dialect': self.engine.dialect.name,
+            'chunk_rows': self.chunk_rows,
+            'tables': {},
+        }
+        started = time.monotonic()
+        snapshot_connection, snapshot = self._export_snapshot()
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = {table: executor.submit(self._dump_table, directory, table, info[table], snapshot)
+                           for table in sorted(info, key=lambda name: -self._estimated_rows(name))}
+                for table, future in futures.items():
+                    manifest['tables'][table] = future.result()
+        finally:
+            if snapshot_connection is not None:
+                snapshot_connection.rollback()
+                snapshot_connection.close()
+
+        _write_json(os.path.join(directory, MANIFEST), manifest)
+        total = sum(table['rows'] for table in manifest['tables'].values())
+        print(f"✅ Бэкап {directory}: {len(manifest['tables'])} таблиц, {total} строк "
+              f"за {time.monotonic() - started:.1f} c")
+        return manifest
+
+    def _estimated_rows(self, table):
+        """Оценка размера таблицы, чтобы крупные начинали выгружаться первыми"""
+        if not self.is_postgres:
+            return 0
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"),
+                                {'table': self.quote(table)}).scalar() or 0
+
+    def _export_snapshot(self):
+        """Общий снимок данных для всех потоков выгрузки (держится открытым до конца)"""
+        if not self.is_postgres:
+            return None, None
+        connection = self.engine.raw_connection()
+        cursor = connection.cursor()
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cursor.execute("SELECT pg_export_snapshot()")
+        return connection, cursor.fetchone()[0]
+
+    def _chunk_bounds(self, cursor, table, pk):
+        """Первые значения ключа каждого куска (одно чтение индекса первичного ключа)"""
+        if not pk:
+            return [None]
+        cursor.execute(
+            f"SELECT {self.quote(pk)} FROM (SELECT {self.quote(pk)}, "
+            f"ROW_NUMBER() OVER (ORDER BY {self.quote(pk)}) AS rn FROM {self.quote(table)}) AS numbered "
+            f"WHERE rn % {int(self.chunk_rows)} = 1 ORDER BY {self.quote(pk)}"
+        )
+        return [row[0] for row in cursor.fetchall()] or [None]
+
+    def _chunk_query(self, table, columns, pk, bounds, index):
+        select = f"SELECT {', '.join(self.quote(column) for column in columns)} FROM {self.quote(table)}"
+        if pk is None or bounds[index] is None:
+            return select
+        condition = f"{self.quote(pk)} >= {int(bounds[index])}"
+        if index + 1 < len(bounds):
+            condition += f" AND {self.quote(pk)} < {int(bounds[index + 1])}"
+        return f"{select} WHERE {condition} ORDER BY {self.quote(pk)}"
+
+    def _dump_table(self, directory, table, info, snapshot):
+        started = time.monotonic()
+        os.makedirs(os.path.join(directory, table), exist_ok=True)
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            if snapshot:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                cursor.execute(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+            bounds = self._chunk_bounds(cursor, table, info['primary_key'])
+            chunks = []
+            for index in range(len(bounds)):
+                filename = f'{table}/{index:05d}.csv.gz'
+                path = os.path.join(directory, filename)
+                query = self._chunk_query(table, info['columns'], info['primary_key'], bounds, index)
+                with gzip.open(path, 'wb', compresslevel=GZIP_LEVEL) as f:
+                    rows = self._copy_out(cursor, query, f)
+                chunks.append({'file': filename, 'rows': rows, 'bytes': os.path.getsize(path),
+                               'sha256': _sha256(path)})
+        finally:
+            connection.rollback()
+            connection.close()
+
+        rows = sum(chunk['rows'] for chunk in chunks)
+        with self._lock:
+            print(f"   📦 {table}: {rows} строк, {len(chunks)} кусков за {time.monotonic() - started:.1f} c")
+        return {'columns': info['columns'], 'primary_key': info['primary_key'],
+                'depends_on': info['depends_on'], 'rows': rows, 'chunks': chunks}
+
+    def _copy_out(self, cursor, query, f):
+        if self.is_postgres:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH ({CSV_OPTIONS})", f)
+            return cursor.rowcount
+        stream = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        writer = csv.writer(stream, lineterminator='\n')
+        cursor.execute(query)
+        rows = 0
+        while True:
+            batch = cursor.fetchmany(INSERT_BATCH)
+            if not batch:
+                break
+            writer.writerows([NULL if value is None else value for value in row] for row in batch)
+            rows += len(batch)
+        stream.detach()
+        return rows
+
+    # --- Проверка ---
+
+    def verify(self, directory, manifest=None):
+        """Список поврежденных или отсутствующих кусков (пустой — бэкап цел)"""
+        manifest = manifest or load_manifest(directory)
+        chunks = [chunk for table in manifest['tables'].values() for chunk in table['chunks']]
+
+        def check(chunk):
+            path = os.path.join(directory, chunk['file'])
+            if not os.path.exists(path):
+                return f"{chunk['file']}: файл отсутствует"
+            if _sha256(path) != chunk['sha256']:
+                return f"{chunk['file']}: контрольная сумма не совпадает"
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return [error for error in executor.map(check, chunks) if error]
+
+    # --- Восстановление ---
+
+    def restore(self, directory, resume=False):
+        manifest = load_manifest(directory)
+        if manifest['dialect'] != self.engine.dialect.name:
+            print(f"⚠️  Бэкап снят с {manifest['dialect']}, восстанавливаем в {self.engine.dialect.name}")
+
+        errors = self.verify(directory, manifest)
+        if errors:
+            for error in errors:
+                print(f"❌ {error}")
+            raise ValueError(f"Бэкап поврежден: {len(errors)} кусков")
+
+        progress_path = os.path.join(directory, PROGRESS)
+        progress = {'backup': manifest['created_at'], 'done': {}}
+        if resume and os.path.exists(progress_path):
+            with open(progress_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('backup') == manifest['created_at']:
+                progress = saved
+        resumed = bool(progress['done'])
+
+        tables = manifest['tables']
+        existing = set(inspect(self.engine).get_table_names())
+        missing = sorted(set(tables) - existing)
+        if missing:
+            raise ValueError(f"В базе нет таблиц {', '.join(missing)} — сначала создайте схему (db.create_all())")
+
+        levels = self.load_order(tables)
+        started = time.monotonic()
+        if not resumed:
+            self._clear_tables(levels)
+            _write_json(progress_path, progress)
+
+        # SQLite допускает одного писателя: параллельная загрузка только ждала бы блокировку
+        workers = self.jobs if self.is_postgres else 1
+        for level in levels:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._restore_table, directory, table, tables[table],
+                                           progress, progress_path) for table in level]
+                for future in futures:
+                    future.result()
+
+        self._reset_sequences(tables)
+        mismatches = self.verify_counts(tables)
+        elapsed = time.monotonic() - started
+        if mismatches:
+            for table, expected, actual in mismatches:
+                print(f"❌ {table}: ожидалось {expected} строк, в базе {actual}")
+            raise ValueError(f"Число строк не совпадает в {len(mismatches)} таблицах")
+
+        os.remove(progress_path)
+        total = sum(table['rows'] for table in tables.values())
+        print(f"✅ Восстановлено {len(tables)} таблиц, {total} строк за {elapsed:.1f} c")
+        return total
+
+    def _clear_tables(self, levels):
+        tables = [table for level in levels for table in level]
+        with self.engine.begin() as conn:
+            if self.is_postgres:
+                # Одним TRUNCATE: ссылки между очищаемыми таблицами не мешают
+                conn.execute(text(f"TRUNCATE {', '.join(self.quote(table) for table in tables)}"))
+            else:
+                for table in reversed(tables):
+                    conn.execute(text(f"DELETE FROM {self.quote(table)}"))
+
+    def _restore_table(self, directory, table, info, progress, progress_path):
+        with self._lock:
+            done = set(progress['done'].get(table, []))
+        chunks = [chunk for chunk in info['chunks'] if chunk['file'] not in done]
+        if not chunks:
+            return
+        started = time.monotonic()
+        columns = ', '.join(self.quote(column) for column in info['columns'])
+
+        connection = self.engine.raw_connection() if self.is_postgres else None
+        try:
+            for chunk in chunks:
+                path = os.path.join(directory, chunk['file'])
+                with gzip.open(path, 'rb') as f:
+                    if connection is not None:
+                        cursor = connection.cursor()
+                        cursor.copy_expert(f"COPY {self.quote(table)} ({columns}) FROM STDIN WITH ({CSV_OPTIONS})", f)
+                        connection.commit()
+                    else:
+                        self._insert_chunk(table, info['columns'], f)
+                with self._lock:
+                    progress['done'].setdefault(table, []).append(chunk['file'])
+                    _write_json(progress_path, progress)
+        except Exception:
+            if connection is not None:
+                connection.rollback()
+            raise
+        finally:
+            if connection is not None:
+                connection.close()
+
+        with self._lock:
+            print(f"   📥 {table}: {sum(chunk['rows'] for chunk in chunks)} строк, "
+                  f"{len(chunks)} кусков за {time.monotonic() - started:.1f} c")
+
+    def _insert_chunk(self, table, columns, f):
+        statement = text(
+            f"INSERT INTO {self.quote(table)} ({', '.join(self.quote(column) for column in columns)}) "
+            f"VALUES ({', '.join(f':c{i}' for i in range(len(columns)))})"
+        )
+        reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+        with self.engine.begin() as conn:
+            batch = []
+            for row in reader:
+                batch.append({f'c{i}': None if value == NULL else value for i, value in enumerate(row)})
+                if len(batch) >= INSERT_BATCH:
+                    conn.execute(statement, batch)
+                    batch = []
+            if batch:
+                conn.execute(statement, batch)
+
+    def _reset_sequences(self, tables):
+        """Следующий id после загруженных строк (SERIAL/IDENTITY на PostgreSQL)"""
+        if not self.is_postgres:
+            return
+        with self.engine.begin() as conn:
+            for table, info in tables.items():
+                pk = info['primary_key']
+                if not pk:
+                    continue
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence(:table, :column), "
+                    f"COALESCE(MAX({self.quote(pk)}), 1), MAX({self.quote(pk)}) IS NOT NULL) "
+                    f"FROM {self.quote(table)}"
+                ), {'table': self.quote(table), 'column': pk})
+
+    def verify_counts(self, tables):
+        """[(таблица, строк в манифесте, строк в базе)] для несовпадающих таблиц"""
+        mismatches = []
+        with self.engine.connect() as conn:
+            for table, info in tables.items():
+                actual = conn.execute(text(f"SELECT COUNT(*) FROM {self.quote(table)}")).scalar()
+                if actual != info['rows']:
+                    mismatches.append((table, info['rows'], actual))
+        return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Параллельный бэкап и восстановление базы InBack')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    dump_parser = subparsers.add_parser('dump', help='Выгрузить таблицы в сжатые куски')
+    dump_parser.add_argument('--dir', default=os.path.join('backups', datetime.now().strftime('%Y%m%d_%H%M%S')))
+    dump_parser.add_argument('--tables', help='Только эти таблицы, через запятую')
+
+    verify_parser = subparsers.add_parser('verify', help='Проверить контрольные суммы кусков')
+    verify_parser.add_argument('dir')
+
+    restore_parser = subparsers.add_parser('restore', help='Загрузить бэкап через COPY')
+    restore_parser.add_argument('dir')
+    restore_parser.add_argument('--resume', action='store_true', help='Продолжить прерванное восстановление')
+
+    for subparser in (dump_parser, verify_parser, restore_parser):
+        subparser.add_argument('--jobs', type=int, default=DEFAULT_JOBS, help='Параллельных таблиц')
+    args = parser.parse_args(argv)
+
+    try:
+        backup = DatabaseBackup(jobs=args.jobs)
+        if args.command == 'dump':
+            backup.dump(args.dir, args.tables.split(',') if args.tables else None)
+        elif args.command == 'verify':
+            errors = backup.verify(args.dir)
+            for error in errors:
+                print(f"❌ {error}")
+            if errors:
+                return 1
+            print(f"✅ Бэкап {args.dir} цел")
+        else:
+            backup.restore(args.dir, resume=args.resume)
+        return 0
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
+        if args.command == 'restore':
+            print("💡 После исправления причины запустите restore с --resume")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
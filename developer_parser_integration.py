@@ -14,7 +14,8 @@ except ImportError:
     DeveloperInfo = None
 
 from models import Developer, db
-from app import app
+from app import app, developer_slug
+from developer_profiles import refresh_developer_profiles
 
 logger = logging.getLogger(__name__)
 
@@ -191,6 +192,9 @@ class DeveloperParserService:
             
             db.session.flush()  # Получаем ID без коммита
             
+            # Профиль страницы застройщика пересобирается вместе с данными парсера
+            refresh_developer_profiles(db.session, developer_slug, [developer.id])
+            
             return {
                 'developer': developer,
                 'created': created
@@ -0,0 +1,370 @@
+"""
+Профили застройщиков для /developers и /developer/<slug>
+
+Страница застройщика искала его по slug через TRANSLATE/LIKE по названию
+(TRANSLATE есть только в PostgreSQL), затем по developer_name в
+excel_properties собирала ЖК (фото через json_array_elements_text — тоже
+только PostgreSQL), отдельным запросом на каждый ЖК — распределение по
+комнатам, выбирала все колонки всех квартир застройщика и еще раз считала
+общую статистику. /developers делал запрос к excel_properties на каждого
+застройщика и кэшировался на час в каждом воркере. Здесь:
+
+- refresh_developer_profiles() после импорта одним проходом по
+  excel_properties собирает профиль каждого застройщика из developers:
+  slug для ссылок (фильтр developer_slug), список ЖК с распределением по
+  комнатам, статистику квартир и цен, самые доступные квартиры и счетчики
+  ЖК/объектов из residential_complexes и properties; результат пишется в
+  developer_profiles;
+- developer_listing() и developer_profile() читают профиль вместе с
+  актуальной строкой developers (рейтинг, контакты, проверки) одним
+  запросом;
+- парсер застройщиков (DeveloperParserService.save_developer_to_db)
+  пересобирает профиль сохраненного застройщика, профиль застройщика,
+  добавленного в обход импорта и парсера, строится при первом открытии
+  страницы (find_unprofiled_developer).
+
+Для первичного заполнения запускается rebuild_developer_profiles.py.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import JSON, bindparam, text
+
+from property_photos import normalize_photos
+
+YIELD_PER = 2000
+SAMPLE_APARTMENTS = 12
+DEFAULT_COMPLEX_IMAGE = 'https://images.unsplash.com/photo-1545324418-cc1a3fa10c00?w=800'
+PROFILE_JSON_COLUMNS = ('complexes', 'apartments')
+DEFAULT_ADVANTAGES = [
+    'Собственное строительство без субподряда',
+    'Сдача объектов точно в срок',
+    'Качественные материалы и технологии',
+    'Полный пакет документов и сервисов',
+]
+
+
+def developer_key(name):
+    """Сопоставление developer_name с developers.name: как UPPER(TRIM(...))"""
+    return str(name or '').strip().upper()
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _room_type(rooms):
+    return 'Студия' if rooms == 0 else f'{rooms}-комн.'
+
+
+class _ComplexTotals:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.prices = []
+        self.buildings = set()
+        self.locations = []
+        self.sales_addresses = []
+        self.lat = None
+        self.lng = None
+        self.photos = None  # как MAX(photos): наибольшая строка
+        self.end_year = None
+        self.end_quarter = None
+        self.rooms = {}
+
+    def add(self, row):
+        self.count += 1
+        if row.price is not None:
+            self.prices.append(row.price)
+        if row.complex_building_id is not None:
+            self.buildings.add(row.complex_building_id)
+        if row.address_short_display_name:
+            self.locations.append(row.address_short_display_name)
+        if row.complex_sales_address:
+            self.sales_addresses.append(row.complex_sales_address)
+        if row.address_position_lat is not None and (self.lat is None or row.address_position_lat > self.lat):
+            self.lat = row.address_position_lat
+        if row.address_position_lon is not None and (self.lng is None or row.address_position_lon > self.lng):
+            self.lng = row.address_position_lon
+        if row.photos and (self.photos is None or row.photos > self.photos):
+            self.photos = row.photos
+        if row.complex_end_build_year is not None and (self.end_year is None or row.complex_end_build_year > self.end_year):
+            self.end_year = row.complex_end_build_year
+        if row.complex_end_build_quarter is not None and \
+                (self.end_quarter is None or row.complex_end_build_quarter > self.end_quarter):
+            self.end_quarter = row.complex_end_build_quarter
+        if row.object_rooms is not None:
+            room = self.rooms.setdefault(row.object_rooms, {'count': 0, 'prices': [], 'areas': []})
+            room['count'] += 1
+            if row.price is not None:
+                room['prices'].append(row.price)
+            if row.object_area is not None:
+                room['areas'].append(row.object_area)
+
+    def mapping(self):
+        images = normalize_photos(self.photos)['gallery'] or [DEFAULT_COMPLEX_IMAGE]
+        min_price = min(self.prices) if self.prices else None
+        return {
+            'name': self.name,
+            'id': self.name,
+            'location': max(self.locations) if self.locations else 'Адрес не указан',
+            'apartments_count': self.count,
+            'buildings_count': len(self.buildings),
+            'min_price': min_price,
+            'max_price': max(self.prices) if self.prices else None,
+            'avg_price': sum(self.prices) / len(self.prices) if self.prices else None,
+            'lat': self.lat,
+            'lng': self.lng,
+            'sales_address': max(self.sales_addresses) if self.sales_addresses else None,
+            'images': images,
+            'image': images[0],
+            'completion_date': (f'{self.end_quarter} кв. {self.end_year}'
+                                if self.end_year is not None and self.end_quarter is not None else 'Сдан'),
+            'real_price_from': min_price,
+            'room_types_count': len(self.rooms),
+            'real_room_distribution': {_room_type(rooms): self.rooms[rooms]['count'] for rooms in sorted(self.rooms)},
+            'room_details': {
+                _room_type(rooms): {
+                    'price_from': min(room['prices']) if room['prices'] else None,
+                    'price_to': max(room['prices']) if room['prices'] else None,
+                    'area_from': min(room['areas']) if room['areas'] else None,
+                    'area_to': max(room['areas']) if room['areas'] else None,
+                }
+                for rooms, room in sorted(self.rooms.items())
+            },
+        }
+
+
+class _DeveloperTotals:
+    def __init__(self):
+        self.prices = []
+        self.complexes = {}
+        self.cheapest = []
+
+    def add(self, row):
+        if row.price is not None:
+            self.prices.append(row.price)
+        self.complexes.setdefault(row.complex_name, _ComplexTotals(row.complex_name)).add(row)
+        self.cheapest.append(row)
+
+    def mapping(self):
+        complexes = sorted((totals.mapping() for totals in self.complexes.values()),
+                           key=lambda item: -item['apartments_count'])
+        cheapest = sorted(self.cheapest, key=lambda row: (row.price is None, row.price or 0))[:SAMPLE_APARTMENTS]
+        return {
+            'properties_count': len(self.cheapest),
+            'complexes_count': len(self.complexes),
+            'price_min': min(self.prices) if self.prices else None,
+            'price_max': max(self.prices) if self.prices else None,
+            'price_avg': sum(self.prices) / len(self.prices) if self.prices else None,
+            'complexes': [{key: _plain(value) for key, value in item.items()} for item in complexes],
+            'apartments': [{
+                'inner_id': row.inner_id,
+                'complex_name': row.complex_name,
+                'object_rooms': row.object_rooms,
+                'object_area': _plain(row.object_area),
+                'price': _plain(row.price),
+                'object_min_floor': row.object_min_floor,
+                'object_max_floor': row.object_max_floor,
+                'object_completion_year': row.object_completion_year,
+                'object_completion_quarter': row.object_completion_quarter,
+            } for row in cheapest],
+        }
+
+
+def refresh_developer_profiles(session, slugify, developer_ids=None):
+    """Пересобрать developer_profiles для всех застройщиков или только developer_ids.
+
+    slugify — developer_slug из app.py. Возвращает количество профилей.
+    """
+    developers = session.execute(text("SELECT id, name FROM developers")).fetchall()
+    if developer_ids is not None:
+        wanted = {int(developer_id) for developer_id in developer_ids}
+        developers = [developer for developer in developers if developer.id in wanted]
+    if not developers:
+        return 0
+    keys = {developer_key(developer.name) for developer in developers}
+
+    totals = {}
+    rows = session.execute(text("""
+        SELECT inner_id, developer_name, complex_name, price, object_area, object_rooms, object_min_floor,
+               object_max_floor, complex_building_end_build_year AS object_completion_year,
+               complex_building_end_build_quarter AS object_completion_quarter, complex_building_id,
+               address_short_display_name, complex_sales_address, address_position_lat, address_position_lon,
+               photos, complex_end_build_year, complex_end_build_quarter
+        FROM excel_properties
+        WHERE developer_name IS NOT NULL
+    """).execution_options(yield_per=YIELD_PER))
+    for row in rows:
+        key = developer_key(row.developer_name)
+        if key in keys:
+            totals.setdefault(key, _DeveloperTotals()).add(row)
+
+    complexes_counts = dict(session.execute(text("""
+        SELECT developer_id, COUNT(*) FROM residential_complexes WHERE developer_id IS NOT NULL GROUP BY developer_id
+    """)).fetchall())
+    properties_counts = dict(session.execute(text("""
+        SELECT developer_id, COUNT(*) FROM properties WHERE developer_id IS NOT NULL GROUP BY developer_id
+    """)).fetchall())
+
+    now = datetime.utcnow()
+    mappings = []
+    for developer in developers:
+        mapping = totals.get(developer_key(developer.name), _DeveloperTotals()).mapping()
+        mapping.update({
+            'developer_id': developer.id,
+            'slug': slugify(developer.name),
+            'db_complexes_count': complexes_counts.get(developer.id, 0),
+            'db_properties_count': properties_counts.get(developer.id, 0),
+            'refreshed_at': now,
+        })
+        mappings.append(mapping)
+
+    if developer_ids is None:
+        session.execute(text("DELETE FROM developer_profiles"))
+    else:
+        session.execute(text("DELETE FROM developer_profiles WHERE developer_id IN :ids")
+                        .bindparams(bindparam('ids', expanding=True)),
+                        {'ids': [mapping['developer_id'] for mapping in mappings]})
+    columns = list(mappings[0])
+    session.execute(text(f"""
+        INSERT INTO developer_profiles ({', '.join(columns)})
+        VALUES ({', '.join(':' + column for column in columns)})
+    """).bindparams(*(bindparam(column, type_=JSON) for column in PROFILE_JSON_COLUMNS)), mappings)
+    return len(mappings)
+
+
+_PROFILE_SELECT = """
+    SELECT d.*, p.slug AS profile_slug, p.properties_count AS profile_properties_count,
+           p.complexes_count AS profile_complexes_count, p.price_min AS profile_price_min,
+           p.price_max AS profile_price_max, p.price_avg AS profile_price_avg,
+           p.db_complexes_count AS profile_db_complexes_count, p.db_properties_count AS profile_db_properties_count,
+           p.complexes AS profile_complexes, p.apartments AS profile_apartments
+    FROM developers d
+    {join} developer_profiles p ON p.developer_id = d.id
+"""
+
+
+def find_unprofiled_developer(session, slug, slugify):
+    """Застройщик без профиля (добавлен после пересборки) по slug ссылки, developers.slug или названию -> (id, name)"""
+    name_pattern = slug.replace('-', ' ').lower()
+    rows = session.execute(text("""
+        SELECT d.id, d.name, d.slug FROM developers d
+        LEFT JOIN developer_profiles p ON p.developer_id = d.id
+        WHERE p.developer_id IS NULL
+    """)).fetchall()
+    for matches in (lambda row: row.slug == slug or slugify(row.name) == slug,
+                    lambda row: row.name.replace(' ', '-').lower() == slug.lower(),
+                    lambda row: name_pattern in row.name.lower()):
+        row = next((row for row in rows if matches(row)), None)
+        if row is not None:
+            return row.id, row.name
+    return None
+
+
+def _split(row):
+    """Строка запроса -> (developer dict, профиль dict)"""
+    developer = dict(row._mapping)
+    profile = {key[len('profile_'):]: developer.pop(key) for key in list(developer) if key.startswith('profile_')}
+    profile['complexes'] = profile['complexes'] or []
+    profile['apartments'] = profile['apartments'] or []
+    return developer, profile
+
+
+def _json_list(raw):
+    try:
+        value = json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        return []
+    return value if isinstance(value, list) else []
+
+
+def developer_listing(session):
+    """Застройщики со статистикой для /developers — один запрос"""
+    # LEFT JOIN: застройщик, добавленный после последней пересборки, показывается без статистики
+    rows = session.execute(text(_PROFILE_SELECT.format(join='LEFT JOIN')
+                                + " ORDER BY COALESCE(p.db_properties_count, 0) DESC, d.id")
+                           .columns(profile_complexes=JSON, profile_apartments=JSON))
+    developers = []
+    for row in rows:
+        developer, profile = _split(row)
+        complexes_count = profile['db_complexes_count'] or 0
+        properties_count = profile['db_properties_count'] or 0
+        stats = {'total_projects': complexes_count, 'total_apartments': properties_count, 'avg_price': None}
+        if profile['properties_count']:
+            complexes_count = profile['complexes_count'] or complexes_count
+            properties_count = profile['properties_count']
+            stats = {
+                'total_projects': complexes_count,
+                'total_apartments': properties_count,
+                'avg_price': int(profile['price_avg']) if profile['price_avg'] else None,
+                'min_price': int(profile['price_min']) if profile['price_min'] else None,
+                'max_price': int(profile['price_max']) if profile['price_max'] else None,
+            }
+        name = developer['name']
+        developers.append({
+            'id': developer['id'],
+            'name': name,
+            'slug': developer['slug'],
+            'description': developer['description'] or f"Застройщик {name}",
+            'logo_url': developer['logo_url'] or
+                        f"https://via.placeholder.com/200x100/3B82F6/FFFFFF?text={name.replace(' ', '+')}",
+            'website': developer['website'],
+            'phone': developer['phone'],
+            'email': developer['email'],
+            'address': developer['address'],
+            'complexes_count': complexes_count,
+            'properties_count': properties_count,
+            'established_year': developer['established_year'],
+            'max_cashback': 10,
+            'max_cashback_percent': 10,
+            'stats': stats,
+        })
+    return developers
+
+
+def developer_profile(session, slug=None, name=None):
+    """Контекст страницы застройщика по slug ссылки, developers.slug или названию; None — нет профиля"""
+    if slug is not None:
+        row = session.execute(text(_PROFILE_SELECT.format(join='JOIN') + """
+            WHERE p.slug = :slug OR d.slug = :slug
+            ORDER BY CASE WHEN p.slug = :slug THEN 0 ELSE 1 END
+            LIMIT 1
+        """).columns(profile_complexes=JSON, profile_apartments=JSON), {'slug': slug}).fetchone()
+    else:
+        row = session.execute(text(_PROFILE_SELECT.format(join='JOIN') + " WHERE d.name = :name")
+                              .columns(profile_complexes=JSON, profile_apartments=JSON), {'name': name}).fetchone()
+    if row is None:
+        return None
+
+    developer, profile = _split(row)
+    if profile['properties_count']:
+        developer['properties_count'] = profile['properties_count']
+        developer['complexes_count'] = profile['complexes_count']
+        developer['min_price'] = int(profile['price_min']) if profile['price_min'] else 12000000
+        developer['max_price'] = int(profile['price_max']) if profile['price_max'] else 0
+        developer['avg_price'] = int(profile['price_avg']) if profile['price_avg'] else 0
+    developer['total_projects'] = developer.get('completed_projects') or developer.get('complexes_count') or 0
+    developer['rating'] = developer.get('rating') or 4.2
+    developer['founded_year'] = developer.get('founded_year') or 2015
+    developer['detailed_description'] = developer.get('description') or \
+        'Надёжный застройщик с многолетним опытом строительства качественного жилья в регионе.'
+    developer['description'] = developer.get('description') or developer['detailed_description']
+    developer['advantages'] = developer.get('advantages') or DEFAULT_ADVANTAGES
+
+    apartments = profile['apartments']
+    return {
+        'developer': developer,
+        'developer_name': developer['name'],
+        'complexes': profile['complexes'],
+        'apartments': apartments,
+        'total_properties': profile['properties_count'],
+        'min_price': apartments[0]['price'] if apartments else 0,
+        'features': _json_list(developer.get('features')),
+        'infrastructure': _json_list(developer.get('infrastructure')),
+    }
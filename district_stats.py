@@ -0,0 +1,316 @@
+"""
+Районы объектов и предрасчитанная сводка по районам
+
+Страница /district/<slug> загружала весь снимок объектов и все ЖК, выбирала
+объекты района подстрокой (slug района в адресе), считала статистику в Python
+и на каждый запрос разбирала JSON districts.infrastructure_data; /districts
+тоже декодировал JSON каждого района. Здесь:
+
+- район объекта определяется при импорте только для новых и переехавших
+  объектов и хранится в property_districts вместе с ближайшей улицей:
+  точкой в полигоне границ (static/data/districts/<slug>.json, векторно —
+  см. spatial_assign.py), затем по parsed_district, затем по району
+  ближайшей улицы, затем по названию района в адресе (без частей
+  "край"/"область", чтобы "Краснодарский край" не давал район
+  "Краснодарский");
+- refresh_district_stats() после импорта пересчитывает district_stats:
+  количество объектов, ЖК и застройщиков, цены, распределение цены за м²
+  (мин/p25/медиана/p75/макс), список ЖК, застройщиков, самые доступные
+  объекты и уже разобранную инфраструктуру;
+- district_listing() и district_page() читают готовые строки: одна строка
+  на район, один запрос на страницу.
+
+Сводка считается в Python одним проходом по объектам, распределенным по
+районам, — перцентили одинаково работают в PostgreSQL и SQLite. После
+изменения районов, их границ или инфраструктуры и для первичного заполнения
+запускается rebuild_district_stats.py.
+"""
+import heapq
+import json
+import re
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import JSON, bindparam, text
+
+from spatial_assign import SpatialAssigner
+
+SAMPLE_PROPERTIES = 8
+TOP_COMPLEXES = 12
+CHUNK_SIZE = 1000
+YIELD_PER = 2000
+
+_MARKERS = re.compile(r'(?<!\w)(мкрн|мкр|микрорайон|м-н|р-н|район|округ|пос|поселок|жк)(?!\w)\.?')
+_REGION_WORDS = ('край', 'область', 'республика', 'россия')
+STATS_JSON_COLUMNS = ('complexes', 'developers', 'sample_property_ids', 'infrastructure')
+
+
+def normalize_name(value):
+    """'Кудепста м-н', 'мкр. Гидростроителей' -> 'кудепста', 'гидростроителей'"""
+    value = str(value or '').lower().replace('ё', 'е')
+    value = _MARKERS.sub(' ', value)
+    value = re.sub(r'[^\w\s]', ' ', value.replace('-', ' '))
+    return ' '.join(value.split())
+
+
+class DistrictResolver:
+    """Район объекта по parsed_district или по названию района в адресе"""
+
+    def __init__(self, districts):
+        self.by_name = {}
+        for district in districts:
+            for name in (district.name, district.slug):
+                key = normalize_name(name)
+                if key:
+                    self.by_name.setdefault(key, district.id)
+        # Длинные названия раньше: "Славянский 2" не должен стать "Славянский"
+        self.names = sorted((name for name in self.by_name if len(name) >= 4), key=len, reverse=True)
+
+    def by_parsed(self, parsed_district):
+        return self.by_name.get(normalize_name(parsed_district)) if parsed_district else None
+
+    def by_address(self, address):
+        parts = [part for part in str(address or '').split(',')
+                 if not any(word in part.lower() for word in _REGION_WORDS)]
+        haystack = f" {normalize_name(' '.join(parts))} "
+        for name in self.names:
+            if f' {name} ' in haystack:
+                return self.by_name[name]
+        return None
+
+
+_SELECT_PROPERTIES = """
+    SELECT ep.inner_id, ep.parsed_district, ep.address_display_name,
+           ep.address_position_lat, ep.address_position_lon
+    FROM excel_properties ep
+"""
+# Новые объекты и объекты, чьи координаты изменились с прошлого определения
+_CHANGED_PROPERTIES = _SELECT_PROPERTIES + """
+    LEFT JOIN property_districts pd ON pd.inner_id = ep.inner_id
+    WHERE pd.inner_id IS NULL
+       OR COALESCE(pd.latitude, 1000) <> COALESCE(ep.address_position_lat, 1000)
+       OR COALESCE(pd.longitude, 1000) <> COALESCE(ep.address_position_lon, 1000)
+"""
+
+
+def _changed_rows(session, inner_ids, full):
+    if full:
+        return session.execute(text(_SELECT_PROPERTIES)).fetchall()
+    if inner_ids is None:
+        # Объекты, удаленные из excel_properties, уходят из property_districts
+        session.execute(text("""
+            DELETE FROM property_districts
+            WHERE NOT EXISTS (SELECT 1 FROM excel_properties ep WHERE ep.inner_id = property_districts.inner_id)
+        """))
+        return session.execute(text(_CHANGED_PROPERTIES)).fetchall()
+    ids = sorted({int(inner_id) for inner_id in inner_ids if inner_id is not None})
+    rows = []
+    for start in range(0, len(ids), CHUNK_SIZE):
+        rows.extend(session.execute(text(_SELECT_PROPERTIES + " WHERE ep.inner_id IN :ids")
+                                    .bindparams(bindparam('ids', expanding=True)),
+                                    {'ids': ids[start:start + CHUNK_SIZE]}).fetchall())
+    return rows
+
+
+def assign_districts(session, inner_ids=None, boundaries=None, full=False):
+    """Определить район и ближайшую улицу объектов и записать в property_districts.
+
+    По умолчанию обрабатываются только новые и переехавшие объекты, inner_ids —
+    только перечисленные, full=True — все. Возвращает количество обработанных
+    объектов, для которых район найден.
+    """
+    rows = _changed_rows(session, inner_ids, full)
+    if full:
+        session.execute(text("DELETE FROM property_districts"))
+    if not rows:
+        return 0
+
+    districts = session.execute(text("SELECT id, name, slug FROM districts")).fetchall()
+    streets = session.execute(text("""
+        SELECT id, district_id, latitude, longitude FROM streets
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """)).fetchall()
+    resolver = DistrictResolver(districts)
+    assigner = SpatialAssigner(districts, streets, boundaries)
+    polygon_ids, street_ids, street_districts, distances = assigner.assign(
+        [row.address_position_lat for row in rows], [row.address_position_lon for row in rows])
+
+    now = datetime.utcnow()
+    resolved = 0
+    mappings = []
+    for index, (inner_id, parsed_district, address, lat, lon) in enumerate(rows):
+        district_id, method = int(polygon_ids[index]), 'polygon'
+        if district_id < 0:
+            district_id, method = resolver.by_parsed(parsed_district), 'parsed'
+        if not district_id and street_districts[index] >= 0:
+            district_id, method = int(street_districts[index]), 'street'
+        if not district_id:
+            district_id, method = resolver.by_address(address), 'address'
+        if not district_id:
+            district_id, method = None, None
+        resolved += district_id is not None
+        street_id = int(street_ids[index]) if street_ids[index] >= 0 else None
+        mappings.append({'inner_id': inner_id, 'district_id': district_id, 'method': method,
+                         'street_id': street_id,
+                         'street_distance_m': round(float(distances[index]), 1) if street_id else None,
+                         'latitude': lat, 'longitude': lon, 'assigned_at': now})
+
+    insert = text("""
+        INSERT INTO property_districts (inner_id, district_id, method, street_id, street_distance_m,
+                                        latitude, longitude, assigned_at)
+        VALUES (:inner_id, :district_id, :method, :street_id, :street_distance_m,
+                :latitude, :longitude, :assigned_at)
+    """)
+    for start in range(0, len(mappings), CHUNK_SIZE):
+        chunk = mappings[start:start + CHUNK_SIZE]
+        if not full:
+            session.execute(text("DELETE FROM property_districts WHERE inner_id IN :ids")
+                            .bindparams(bindparam('ids', expanding=True)),
+                            {'ids': [mapping['inner_id'] for mapping in chunk]})
+        session.execute(insert, chunk)
+    return resolved
+
+
+def _percentile(values, fraction):
+    """Перцентиль по отсортированному списку с линейной интерполяцией"""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _decode_infrastructure(raw):
+    if isinstance(raw, dict):
+        return raw
+    try:
+        decoded = json.loads(raw) if raw else None
+    except (TypeError, ValueError):
+        return None
+    return decoded if isinstance(decoded, dict) else None
+
+
+class _DistrictTotals:
+    def __init__(self):
+        self.prices = []
+        self.sqm_prices = []
+        self.complexes = {}
+        self.developers = Counter()
+        self.sample = []  # max-куча (-цена, inner_id) самых дешевых объектов с координатами
+
+    def add(self, row):
+        price = float(row.price)
+        self.prices.append(price)
+        if row.object_area and row.object_area > 0:
+            self.sqm_prices.append(price / float(row.object_area))
+        if row.developer_name:
+            self.developers[row.developer_name] += 1
+        if row.complex_name:
+            complex_totals = self.complexes.setdefault(row.complex_name, {
+                'name': row.complex_name, 'developer': row.developer_name, 'apartments_count': 0,
+                'buildings': set(), 'floors': 0, 'price_from': price,
+            })
+            complex_totals['apartments_count'] += 1
+            complex_totals['price_from'] = min(complex_totals['price_from'], price)
+            complex_totals['floors'] = max(complex_totals['floors'], row.object_max_floor or 0)
+            if row.complex_building_name:
+                complex_totals['buildings'].add(row.complex_building_name)
+        if row.address_position_lat is not None:
+            item = (-price, row.inner_id)
+            if len(self.sample) < SAMPLE_PROPERTIES:
+                heapq.heappush(self.sample, item)
+            elif item > self.sample[0]:
+                heapq.heapreplace(self.sample, item)
+
+    def mapping(self, district_id, infrastructure, now):
+        sqm = sorted(self.sqm_prices)
+        complexes = sorted(self.complexes.values(), key=lambda item: (-item['apartments_count'], item['name']))
+        return {
+            'district_id': district_id,
+            'properties_count': len(self.prices),
+            'complexes_count': len(self.complexes),
+            'developers_count': len(self.developers),
+            'price_min': min(self.prices) if self.prices else None,
+            'price_max': max(self.prices) if self.prices else None,
+            'price_per_sqm_min': sqm[0] if sqm else None,
+            'price_per_sqm_p25': _percentile(sqm, 0.25),
+            'price_per_sqm_median': _percentile(sqm, 0.5),
+            'price_per_sqm_p75': _percentile(sqm, 0.75),
+            'price_per_sqm_max': sqm[-1] if sqm else None,
+            'complexes': [
+                {**{key: value for key, value in item.items() if key != 'buildings'},
+                 'buildings_count': len(item['buildings']) or 1}
+                for item in complexes[:TOP_COMPLEXES]
+            ],
+            'developers': [{'name': name, 'properties_count': count}
+                           for name, count in sorted(self.developers.items(), key=lambda item: (-item[1], item[0]))],
+            'sample_property_ids': [inner_id for _, inner_id in sorted(self.sample, reverse=True)],
+            'infrastructure': infrastructure,
+            'refreshed_at': now,
+        }
+
+
+def refresh_district_stats(session):
+    """Пересчитать district_stats для всех районов. Возвращает количество районов."""
+    totals = {}
+    rows = session.execute(text("""
+        SELECT pd.district_id, ep.inner_id, ep.price, ep.object_area, ep.complex_name, ep.developer_name,
+               ep.complex_building_name, ep.object_max_floor, ep.address_position_lat
+        FROM property_districts pd
+        JOIN excel_properties ep ON ep.inner_id = pd.inner_id
+        WHERE pd.district_id IS NOT NULL AND ep.price > 0
+    """).execution_options(yield_per=YIELD_PER))
+    for row in rows:
+        totals.setdefault(row.district_id, _DistrictTotals()).add(row)
+
+    now = datetime.utcnow()
+    mappings = [
+        totals.get(district_id, _DistrictTotals()).mapping(district_id, _decode_infrastructure(raw), now)
+        for district_id, raw in session.execute(text("SELECT id, infrastructure_data FROM districts")).fetchall()
+    ]
+    session.execute(text("DELETE FROM district_stats"))
+    if mappings:
+        columns = list(mappings[0])
+        insert = text(f"""
+            INSERT INTO district_stats ({', '.join(columns)})
+            VALUES ({', '.join(':' + column for column in columns)})
+        """).bindparams(*(bindparam(column, type_=JSON) for column in STATS_JSON_COLUMNS))
+        session.execute(insert, mappings)
+    return len(mappings)
+
+
+def _district_rows(session, where='', params=None):
+    statement = text(f"""
+        SELECT d.id, d.name, d.slug, d.description, d.latitude, d.longitude, d.zoom_level,
+               d.distance_to_center, s.properties_count, s.complexes_count, s.developers_count,
+               s.price_min, s.price_max, s.price_per_sqm_min, s.price_per_sqm_p25,
+               s.price_per_sqm_median, s.price_per_sqm_p75, s.price_per_sqm_max,
+               s.complexes, s.developers, s.sample_property_ids, s.infrastructure, s.refreshed_at
+        FROM districts d
+        LEFT JOIN district_stats s ON s.district_id = d.id
+        {where}
+        ORDER BY d.name
+    """).columns(**{column: JSON for column in STATS_JSON_COLUMNS})
+    districts = []
+    for row in session.execute(statement, params or {}):
+        district = dict(row._mapping)
+        district['properties_count'] = district['properties_count'] or 0
+        district['complexes_count'] = district['complexes_count'] or 0
+        district['developers_count'] = district['developers_count'] or 0
+        for column in ('complexes', 'developers', 'sample_property_ids'):
+            district[column] = district[column] or []
+        district['infrastructure_data'] = district.pop('infrastructure') or {}
+        districts.append(district)
+    return districts
+
+
+def district_listing(session):
+    """Все районы со сводкой для /districts — один запрос"""
+    return _district_rows(session)
+
+
+def district_page(session, slug):
+    """Район со сводкой для /district/<slug> или None"""
+    rows = _district_rows(session, 'WHERE d.slug = :slug', {'slug': slug})
+    return rows[0] if rows else None
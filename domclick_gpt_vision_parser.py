@@ -15,6 +15,9 @@ from datetime import datetime
 from playwright.sync_api import sync_playwright
 import requests
 from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_extraction_cache import ExtractionCache, max_concurrency, schema_version, strip_boilerplate
 
 # Проверяем наличие OpenAI
 try:
@@ -24,6 +27,40 @@ except ImportError:
     OPENAI_AVAILABLE = False
     print("⚠️ OpenAI не установлен. Установите: pip install openai")
 
+VISION_MODEL = "gpt-4o"  # GPT-4 Vision
+VISION_PROMPT = """
+Проанализируй скриншот сайта Domclick с объявлениями о недвижимости в Краснодаре.
+
+Извлеки ВСЕ видимые объекты недвижимости в формате JSON массива:
+
+[
+    {
+        "name": "название ЖК или адрес объекта",
+        "price": "цена в рублях (только число)",
+        "rooms": "количество комнат (0 для студии)",
+        "area": "площадь в м² (только число)",
+        "floor": "этаж",
+        "floors_total": "всего этажей в доме",
+        "developer": "застройщик или агентство",
+        "district": "район Краснодара",
+        "address": "полный адрес",
+        "property_type": "квартира/дом/коммерческая",
+        "status": "новостройка/вторичка",
+        "year": "год постройки",
+        "description": "краткое описание объекта"
+    }
+]
+
+ВАЖНО:
+- Извлекай ТОЛЬКО реальные данные с изображения
+- Если данные неясны, пиши null
+- Числовые поля должны содержать только цифры
+- Ищи карточки объектов, списки, таблицы недвижимости
+- Фокусируйся на новостройках для Краснодара
+"""
+# Версия схемы для кэша извлечения: меняется вместе с текстом промпта
+VISION_SCHEMA_VERSION = schema_version(VISION_PROMPT)
+
 class DomclickGPTVisionParser:
     def __init__(self):
         self.openai_api_key = os.environ.get("OPENAI_API_KEY")
@@ -34,6 +71,10 @@ class DomclickGPTVisionParser:
             self.client = None
             print("⚠️ OpenAI API ключ не найден")
         
+        # Результаты GPT Vision по тексту страницы: неизменившиеся страницы не
+        # отправляются повторно; AI_EXTRACTION_MODE=replay — только кэш, без API
+        self.extraction_cache = ExtractionCache('instance/extraction_cache/domclick_gpt_vision.json')
+        
         self.scraped_data = []
         self.base_urls = [
             "https://domclick.ru/krasnodar/search/living/newbuilding",
@@ -186,44 +227,13 @@ class DomclickGPTVisionParser:
             return []
         
         try:
-            prompt = """
-Проанализируй скриншот сайта Domclick с объявлениями о недвижимости в Краснодаре.
-
-Извлеки ВСЕ видимые объекты недвижимости в формате JSON массива:
-
-[
-    {
-        "name": "название ЖК или адрес объекта",
-        "price": "цена в рублях (только число)",
-        "rooms": "количество комнат (0 для студии)",
-        "area": "площадь в м² (только число)",
-        "floor": "этаж",
-        "floors_total": "всего этажей в доме",
-        "developer": "застройщик или агентство",
-        "district": "район Краснодара",
-        "address": "полный адрес",
-        "property_type": "квартира/дом/коммерческая",
-        "status": "новостройка/вторичка",
-        "year": "год постройки",
-        "description": "краткое описание объекта"
-    }
-]
-
-ВАЖНО:
-- Извлекай ТОЛЬКО реальные данные с изображения
-- Если данные неясны, пиши null
-- Числовые поля должны содержать только цифры
-- Ищи карточки объектов, списки, таблицы недвижимости
-- Фокусируйся на новостройках для Краснодара
-"""
-
             response = self.client.chat.completions.create(
-                model="gpt-4o",  # GPT-4 Vision
+                model=VISION_MODEL,
                 messages=[
                     {
                         "role": "user",
                         "content": [
-                            {"type": "text", "text": prompt},
+                            {"type": "text", "text": VISION_PROMPT},
                             {
                                 "type": "image_url",
                                 "image_url": {
@@ -339,6 +349,10 @@ class DomclickGPTVisionParser:
         if not browser:
             return {'success': False, 'error': 'Не удалось запустить браузер'}
         
+        # Запросы к GPT идут в фоне, пока браузер открывает следующую страницу
+        executor = ThreadPoolExecutor(max_workers=max_concurrency())
+        pending = []
+        
         try:
             for url in self.base_urls:
                 print(f"\n🔍 Парсинг: {url}")
@@ -349,6 +363,21 @@ class DomclickGPTVisionParser:
                 # Ждем загрузки контента
                 time.sleep(random.uniform(3, 7))
                 
+                # Ключ кэша — видимый текст страницы: пиксели скриншота одной и той же
+                # выдачи отличаются (баннеры, анимация), текст — нет
+                page_text = strip_boilerplate(page.content())
+                cached = self.extraction_cache.cached(page_text, VISION_SCHEMA_VERSION, VISION_MODEL)
+                if cached is not None:
+                    print("♻️ Страница не изменилась - данные из кэша извлечения")
+                    processed = self.process_extracted_data(cached)
+                    all_properties.extend(processed)
+                    print(f"✅ Добавлено объектов: {len(processed)}")
+                    continue
+                
+                if self.extraction_cache.offline:
+                    print("⚠️ Нет в кэше извлечения (replay) - страница пропущена")
+                    continue
+                
                 # Делаем скриншот
                 screenshot = self.take_smart_screenshot(page)
                 if not screenshot:
@@ -356,17 +385,22 @@ class DomclickGPTVisionParser:
                 
                 # Извлекаем данные с помощью GPT-4 Vision
                 if self.client:
-                    properties = self.extract_property_data_with_gpt(screenshot)
-                    if properties:
-                        processed = self.process_extracted_data(properties)
-                        all_properties.extend(processed)
-                        print(f"✅ Добавлено объектов: {len(processed)}")
+                    pending.append(executor.submit(
+                        self.extraction_cache.call, page_text, VISION_SCHEMA_VERSION, VISION_MODEL,
+                        lambda screenshot=screenshot: self.extract_property_data_with_gpt(screenshot)))
                 else:
                     print("⚠️ OpenAI API недоступен - скриншот сохранен для будущего анализа")
                 
                 # Пауза между URL
                 time.sleep(random.uniform(5, 10))
             
+            for future in pending:
+                properties = future.result()
+                if properties:
+                    processed = self.process_extracted_data(properties)
+                    all_properties.extend(processed)
+                    print(f"✅ Добавлено объектов: {len(processed)}")
+            
             self.scraped_data = all_properties
             
             return {
@@ -380,6 +414,8 @@ class DomclickGPTVisionParser:
             return {'success': False, 'error': str(e)}
             
         finally:
+            executor.shutdown(wait=True)
+            self.extraction_cache.save()
             browser.close()
             print("🔒 Браузер закрыт")
 
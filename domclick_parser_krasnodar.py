@@ -5,7 +5,6 @@
 Собирает застройщиков → ЖК → корпуса/литеры → квартиры
 """
 
-import requests
 import time
 import json
 import pandas as pd
@@ -16,19 +15,21 @@ import re
 from datetime import datetime
 import os
 
+import crawl_store
+from crawler import Crawler, ValidatorCache
+
 class DomclickParser:
     def __init__(self, city="krasnodar"):
         self.city = city
         self.base_url = "https://domclick.ru"
-        self.session = requests.Session()
         self.ua = UserAgent()
         
-        # Настройка сессии с продвинутыми заголовками
-        self.session.headers.update({
+        # Продвинутые заголовки для всех запросов
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
             'Accept-Language': 'ru,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Ch-Ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
@@ -39,7 +40,18 @@ class DomclickParser:
             'Sec-Fetch-Site': 'none',
             'Referer': 'https://www.google.com/',
             'DNT': '1'
-        })
+        }
+        
+        # Общий пул соединений: не больше 2 запросов к хосту, старт не чаще раза в секунду;
+        # ETag/Last-Modified сохраняются между запусками для условных GET
+        self.crawler = Crawler(
+            headers=self.headers,
+            per_host=2,
+            delay=1.0,
+            retries=3,
+            cache=ValidatorCache('instance/crawler_cache/domclick.json'),
+        )
+        self._prefetched = {}
         
         self.developers_data = []
         self.complexes_data = []
@@ -49,24 +61,28 @@ class DomclickParser:
         print(f"🚀 Инициализирован парсер Domclick для города: {city}")
 
     def get_page(self, url, retries=3):
-        """Получить страницу с повторными попытками"""
-        for attempt in range(retries):
-            try:
-                # Случайная задержка между запросами
-                time.sleep(1 + attempt * 0.5)
-                
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                
-                print(f"✅ Получена страница: {url}")
-                return response
-                
-            except Exception as e:
-                print(f"❌ Ошибка получения страницы (попытка {attempt + 1}): {e}")
-                if attempt == retries - 1:
-                    return None
-                    
-        return None
+        """Получить страницу (паузы и повторы с джиттером — в crawler.py)"""
+        if url in self._prefetched:
+            response = self._prefetched.pop(url)
+        else:
+            response = self.crawler.fetch(url, retries=retries)
+        
+        if response is None or not response.ok:
+            status = response.status_code if response is not None else 'нет ответа'
+            print(f"❌ Ошибка получения страницы {url}: {status}")
+            return None
+        
+        source = " (не изменилась)" if response.from_cache else ""
+        print(f"✅ Получена страница: {url}{source}")
+        return response
+
+    def prefetch_pages(self, urls):
+        """Загрузить страницы параллельно (с ограничением на хост) для последующих get_page"""
+        self._prefetched.update(self.crawler.fetch_all(urls))
+
+    def close(self):
+        """Закрыть пул соединений и сохранить кэш ETag/Last-Modified"""
+        self.crawler.close()
 
     def parse_developers_list(self):
         """Парсит список застройщиков для Краснодара"""
@@ -509,14 +525,50 @@ class DomclickParser:
         # 1. Парсим список ЖК и застройщиков
         complexes = self.parse_developers_list()
         
-        # 2. Парсим детали каждого ЖК
+        # 2. Парсим детали каждого ЖК (страницы загружаются заранее, параллельно).
+        # С хранилищем состояния загружаются только устаревшие страницы ЖК,
+        # для остальных берутся квартиры прошлого разбора
+        complexes = complexes[:10]  # Ограничиваем для тестирования
+        store = crawl_store.for_source('domclick')
+        urls = [complex_data.get('complex_url') for complex_data in complexes]
+        to_fetch, reused = store.plan(urls) if store else (urls, {})
+        try:
+            self.prefetch_pages(to_fetch)
+        finally:
+            self.crawler.close()
+        
+        changes = {'created': 0, 'updated': 0, 'unchanged': 0}
         all_apartments = []
-        for complex_data in complexes[:10]:  # Ограничиваем для тестирования
+        for complex_data in complexes:
+            url = complex_data.get('complex_url')
+            stored = reused.get(url)
+            response = self._prefetched.get(url)
+            if store and url and stored is None:
+                changed = store.record_fetch(url, response, kind='complex')
+                if not changed or response is None or not response.ok:
+                    stored = store.entities('apartment', group_key=url) or None
+            
+            if stored:
+                print(f"♻️ ЖК {complex_data['complex_name']} не изменился: {len(stored)} квартир из прошлого разбора")
+                self._prefetched.pop(url, None)
+                changes['unchanged'] += len(stored)
+                all_apartments.extend(stored)
+                continue
+            
             apartments = self.parse_complex_details(complex_data)
             all_apartments.extend(apartments)
             
-            # Пауза между запросами
-            time.sleep(2)
+            # Тестовые квартиры (страница не получена) в хранилище не попадают
+            if store and url and response is not None and response.ok:
+                diff = store.record_entities(
+                    'apartment', apartments, group_key=url,
+                    key=lambda apartment: f"{apartment['complex_name']}|{apartment['building_name']}|{apartment['apartment_number']}",
+                )
+                for field in changes:
+                    changes[field] += len(getattr(diff, field))
+        
+        if store:
+            store.commit()
             
         self.apartments_data.extend(all_apartments)
         
@@ -526,12 +578,16 @@ class DomclickParser:
         print(f"   • ЖК: {len(self.complexes_data)}")
         print(f"   • Корпусов: {len(self.buildings_data)}")
         print(f"   • Квартир: {len(self.apartments_data)}")
+        if store:
+            print(f"   • Изменения: новых {changes['created']}, изменилось {changes['updated']}, "
+                  f"без изменений {changes['unchanged']}")
         
         return {
             'developers': self.developers_data,
             'complexes': self.complexes_data, 
             'buildings': self.buildings_data,
-            'apartments': self.apartments_data
+            'apartments': self.apartments_data,
+            'changes': changes
         }
 
     def save_to_excel(self, filename=None):
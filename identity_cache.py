@@ -0,0 +1,181 @@
+"""
+Кэш идентификации пользователей и менеджеров
+
+load_user выполняется на каждом авторизованном запросе, manager_required
+повторно проверяет менеджера, а обработчики часто загружают его еще раз.
+Чтобы частые AJAX-запросы кабинета не стоили 2-3 запроса по первичному ключу:
+
+- в общем кэше (flask_caching, TTL IDENTITY_CACHE_TTL, по умолчанию 60 сек)
+  хранится облегченная запись principal: id, роль, активность, закрепленный менеджер;
+- в пределах запроса principal и загруженные ORM объекты запоминаются на
+  объекте запроса;
+- load_user возвращает CachedIdentity: id/роль/активность отдаются из кэша,
+  полный объект User/Manager загружается только при обращении к другим полям.
+
+Админские маршруты редактирования, смены статуса и удаления вызывают
+invalidate_principal, чтобы изменения вступали в силу сразу, а не через TTL.
+"""
+from flask import has_request_context, request
+
+DEFAULT_TTL = 60
+
+# Поля principal, которые есть в модели (отдаются без загрузки объекта)
+SLIM_FIELDS = {
+    'user': ('id', 'role', 'is_active', 'assigned_manager_id'),
+    'manager': ('id', 'is_active'),
+}
+
+
+def _model(kind):
+    from models import User, Manager
+    return Manager if kind == 'manager' else User
+
+
+def _cache_key(kind, principal_id):
+    return f'principal:{kind}:{principal_id}'
+
+
+def _request_store(name):
+    # На объекте запроса, а не в g: g живет в контексте приложения, который
+    # бывает общим для нескольких запросов (тест-клиент внутри app_context)
+    if not has_request_context():
+        return None
+    store = getattr(request, name, None)
+    if store is None:
+        store = {}
+        setattr(request, name, store)
+    return store
+
+
+class IdentityCache:
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.cache = None
+
+    def init_app(self, app, cache):
+        self.ttl = int(app.config.get('IDENTITY_CACHE_TTL', self.ttl))
+        self.cache = cache
+        app.extensions['identity_cache'] = self
+
+    def _query_principal(self, kind, principal_id):
+        model = _model(kind)
+        columns = [getattr(model, field) for field in SLIM_FIELDS[kind]]
+        row = model.query.with_entities(*columns).filter(model.id == principal_id).first()
+        if row is None:
+            return None
+        principal = dict(zip(SLIM_FIELDS[kind], row))
+        principal['kind'] = kind
+        principal.setdefault('role', 'manager' if kind == 'manager' else None)
+        principal.setdefault('assigned_manager_id', None)
+        return principal
+
+    def get_principal(self, kind, principal_id):
+        """Облегченная запись пользователя/менеджера или None, если его нет"""
+        try:
+            principal_id = int(principal_id)
+        except (TypeError, ValueError):
+            return None
+
+        key = _cache_key(kind, principal_id)
+        local = _request_store('_identity_principals')
+        if local is not None and key in local:
+            return local[key]
+
+        principal = self.cache.get(key) if self.cache is not None else None
+        if principal is None:
+            principal = self._query_principal(kind, principal_id)
+            # Отсутствующих не кэшируем: удаление и так сбрасывает запись
+            if principal is not None and self.cache is not None:
+                self.cache.set(key, principal, timeout=self.ttl)
+
+        if local is not None:
+            local[key] = principal
+        return principal
+
+    def load(self, kind, principal_id):
+        """Полный ORM объект, не чаще одного запроса к БД на HTTP-запрос"""
+        key = _cache_key(kind, principal_id)
+        local = _request_store('_identity_objects')
+        if local is not None and key in local:
+            return local[key]
+        obj = _model(kind).query.get(int(principal_id))
+        if local is not None:
+            local[key] = obj
+        return obj
+
+    def invalidate(self, kind, *principal_ids):
+        for principal_id in principal_ids:
+            key = _cache_key(kind, principal_id)
+            if self.cache is not None:
+                self.cache.delete(key)
+            for name in ('_identity_principals', '_identity_objects'):
+                local = _request_store(name)
+                if local is not None:
+                    local.pop(key, None)
+
+
+identity_cache = IdentityCache()
+
+
+def get_principal(kind, principal_id):
+    return identity_cache.get_principal(kind, principal_id)
+
+
+def invalidate_principal(kind, *principal_ids):
+    """Сбросить кэш после изменения/удаления пользователя ('user') или менеджера ('manager')"""
+    identity_cache.invalidate(kind, *principal_ids)
+
+
+class CachedIdentity:
+    """current_user для Flask-Login поверх principal.
+
+    Поля из SLIM_FIELDS читаются из кэша; остальные атрибуты, методы и
+    присваивания прозрачно переходят к ORM объекту, который загружается
+    при первом таком обращении.
+    """
+
+    is_anonymous = False
+
+    @property
+    def is_authenticated(self):
+        # Как UserMixin: деактивированный пользователь/менеджер не авторизован
+        return bool(self._principal['is_active'])
+
+    def __init__(self, principal):
+        object.__setattr__(self, '_principal', principal)
+        object.__setattr__(self, '_object', None)
+
+    def _get_object(self):
+        obj = object.__getattribute__(self, '_object')
+        if obj is None:
+            principal = object.__getattribute__(self, '_principal')
+            obj = identity_cache.load(principal['kind'], principal['id'])
+            object.__setattr__(self, '_object', obj)
+        return obj
+
+    def __getattr__(self, name):
+        principal = object.__getattribute__(self, '_principal')
+        if name in SLIM_FIELDS[principal['kind']]:
+            return principal[name]
+        return getattr(self._get_object(), name)
+
+    def __setattr__(self, name, value):
+        principal = object.__getattribute__(self, '_principal')
+        setattr(self._get_object(), name, value)
+        if name in SLIM_FIELDS[principal['kind']]:
+            principal[name] = value
+            invalidate_principal(principal['kind'], principal['id'])
+
+    def get_id(self):
+        return str(self._principal['id'])
+
+    def __eq__(self, other):
+        if isinstance(other, CachedIdentity):
+            other = other._get_object()
+        return self._get_object() == other
+
+    def __hash__(self):
+        return hash((self._principal['kind'], self._principal['id']))
+
+    def __repr__(self):
+        return f"<CachedIdentity {self._principal['kind']}:{self._principal['id']}>"
@@ -0,0 +1,197 @@
+"""
+Прокси и миниатюры внешних фотографий объектов
+
+Фото объектов приходят внешними ссылками на полноразмерные изображения.
+Вместо хотлинка шаблоны выдают адрес /img/<hash>/<size>: исходник скачивается
+один раз через пул соединений, из него строятся варианты фиксированного размера
+(WebP для браузеров, которые его принимают, иначе JPEG) и складываются в общий
+дисковый LRU кэш (asset_cache). WeasyPrint читает фото из того же кэша через
+url_fetcher, поэтому PDF не скачивает каждое фото заново.
+
+Скачиваются только адреса, зарегистрированные сервером при отрисовке страниц:
+соответствие hash → URL хранится отдельно от кэша и не вытесняется.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Размеры вариантов: вписываем изображение в рамку, пропорции сохраняем
+IMAGE_SIZES = {
+    'thumb': (400, 300),
+    'card': (800, 600),
+    'large': (1600, 1200),
+    'pdf': (1200, 900),
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+PROXY_PATH_RE = re.compile(r'^/img/([0-9a-f]{32})/([a-z]+)$')
+
+
+class ImageProxy:
+    """Скачивание, ресайз и кэширование внешних фотографий"""
+
+    def __init__(self, max_source_bytes=20 * 1024 * 1024, timeout=10, lock_stripes=64):
+        self.max_source_bytes = max_source_bytes
+        self.timeout = timeout
+
+        self.app = None
+        self.cache = None
+        self.sources_dir = None
+        self._sources = {}  # hash -> URL (уже записанные соответствия)
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._http = None
+
+    def init_app(self, app, cache):
+        self.app = app
+        self.cache = cache
+        self.sources_dir = app.config.get('IMAGE_PROXY_SOURCES_DIR') or os.path.join(app.instance_path, 'image_sources')
+        os.makedirs(self.sources_dir, exist_ok=True)
+
+        session = requests.Session()
+        retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = 'InBack image proxy'
+        self._http = session
+
+        app.extensions['image_proxy'] = self
+
+    # --- Адреса ------------------------------------------------------------
+
+    @staticmethod
+    def hash_for(src):
+        return hashlib.sha256(src.encode('utf-8')).hexdigest()[:32]
+
+    def _source_path(self, image_hash):
+        return os.path.join(self.sources_dir, image_hash[:2], f"{image_hash}.url")
+
+    def register(self, src):
+        """Запомнить соответствие hash → URL и вернуть hash"""
+        image_hash = self.hash_for(src)
+        if image_hash in self._sources or not self.sources_dir:
+            return image_hash
+
+        path = self._source_path(image_hash)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(src)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error registering image source {src}: {e}")
+                return image_hash
+        self._sources[image_hash] = src
+        return image_hash
+
+    def source_url(self, image_hash):
+        src = self._sources.get(image_hash)
+        if src is None:
+            try:
+                with open(self._source_path(image_hash), 'r', encoding='utf-8') as f:
+                    src = f.read().strip()
+            except OSError:
+                return None
+            self._sources[image_hash] = src
+        return src
+
+    def url(self, src, size='card'):
+        """Адрес уменьшенной копии внешнего фото; локальные и data: адреса не трогаем"""
+        if not src or not isinstance(src, str) or size not in IMAGE_SIZES:
+            return src
+        src = src.strip()
+        if not src.startswith(('http://', 'https://')) or self.app is None:
+            return src
+        return f"/img/{self.register(src)}/{size}"
+
+    # --- Варианты ----------------------------------------------------------
+
+    def _fetch_source(self, image_hash, src):
+        def download():
+            response = self._http.get(src, timeout=self.timeout, stream=True)
+            response.raise_for_status()
+            chunks = []
+            received = 0
+            for chunk in response.iter_content(64 * 1024):
+                received += len(chunk)
+                if received > self.max_source_bytes:
+                    raise ValueError(f"Image too large: {src}")
+                chunks.append(chunk)
+            return b''.join(chunks)
+
+        return self.cache.get_or_create('img-src', image_hash, download)
+
+    def _resize(self, data, size, fmt):
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail(IMAGE_SIZES[size], Image.LANCZOS)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        if fmt == 'jpeg' and image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            image = background
+
+        buffer = io.BytesIO()
+        if fmt == 'webp':
+            image.save(buffer, format='WEBP', quality=80, method=4)
+        else:
+            image.save(buffer, format='JPEG', quality=82, optimize=True, progressive=True)
+        return buffer.getvalue()
+
+    def get_variant(self, image_hash, size, fmt='jpeg'):
+        """Байты варианта изображения или None, если hash неизвестен"""
+        if size not in IMAGE_SIZES or self.cache is None:
+            return None
+        src = self.source_url(image_hash)
+        if src is None:
+            return None
+
+        key = f"{image_hash}-{size}-{fmt}"
+        data = self.cache.get('img', key)
+        if data is not None:
+            return data
+
+        # Один поток на исходник: параллельные запросы ждут готовый результат
+        with self._locks[int(image_hash[:4], 16) % len(self._locks)]:
+            data = self.cache.get('img', key)
+            if data is None:
+                data = self._resize(self._fetch_source(image_hash, src), size, fmt)
+                self.cache.set('img', key, data)
+        return data
+
+    # --- WeasyPrint --------------------------------------------------------
+
+    def weasyprint_url_fetcher(self, url, *args, **kwargs):
+        """url_fetcher для WeasyPrint: фото берутся из локального кэша"""
+        from weasyprint import default_url_fetcher
+
+        parsed = urlparse(url)
+        match = PROXY_PATH_RE.match(parsed.path)
+        try:
+            if match:
+                data = self.get_variant(match.group(1), 'pdf', 'jpeg')
+            elif parsed.scheme in ('http', 'https') and parsed.path.lower().endswith(IMAGE_EXTENSIONS):
+                data = self.get_variant(self.register(url), 'pdf', 'jpeg')
+            else:
+                data = None
+        except Exception as e:
+            print(f"Error loading image {url} from cache: {e}")
+            data = None
+
+        if data is None:
+            return default_url_fetcher(url, *args, **kwargs)
+        return {'string': data, 'mime_type': 'image/jpeg', 'redirected_url': url}
+
+
+image_proxy = ImageProxy()
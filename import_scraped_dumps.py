@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Load legacy scraped_developers_*.json dumps into crawl_entities
+
+Парсер сайтов застройщиков больше не пишет JSON-дампы: состояние хранится в
+crawl_pages/crawl_entities. Скрипт переносит старые дампы (от старых к новым),
+чтобы следующий прогон сравнивал проекты с последними известными данными.
+Перенесенные проекты отмечаются импортированными — они уже были в базе.
+"""
+
+import glob
+import json
+
+from app import app, db
+import crawl_store
+
+
+def import_scraped_dumps(pattern='scraped_developers_*.json'):
+    """Перенести JSON-дампы парсера застройщиков в хранилище парсеров"""
+
+    with app.app_context():
+        try:
+            store = crawl_store.CrawlStore(db.session, 'developer_sites')
+            total = 0
+            for filename in sorted(glob.glob(pattern)):
+                with open(filename, 'r', encoding='utf-8') as f:
+                    dump = json.load(f)
+
+                for developer_code, projects in dump.items():
+                    for project in projects:
+                        project['developer_code'] = developer_code
+                        store.record_entities('project', [project],
+                                              key=lambda data: data.get('url'),
+                                              group_key=project.get('url'))
+                    total += len(projects)
+                print(f"   {filename}: {sum(len(projects) for projects in dump.values())} проектов")
+
+            crawl_store.mark_imported(db.session, crawl_store.pending_changes(db.session, 'developer_sites', 'project'))
+            db.session.commit()
+            print(f"✅ Dumps imported: {total} projects")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error importing dumps: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    import_scraped_dumps()
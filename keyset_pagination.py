@@ -0,0 +1,142 @@
+"""
+Keyset-пагинация и массовые действия над пользователями
+
+paginate() строит страницу через OFFSET: на 100 тыс. пользователей дальние
+страницы читают и отбрасывают все предыдущие строки. Здесь страница
+выбирается по ключу сортировки (id, по убыванию — новые сверху):
+WHERE id < :after ORDER BY id DESC LIMIT n+1, что всегда идет по первичному
+ключу. Ссылки "Назад/Далее" передают ?before=/?after= вместо номера страницы.
+
+Массовые действия админки выполняются одним UPDATE/DELETE на весь набор
+вместо загрузки и изменения пользователей по одному.
+"""
+from sqlalchemy import case, inspect
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 500
+
+
+class KeysetPage:
+    """Страница результатов: items, has_prev/has_next и курсоры соседних страниц"""
+
+    def __init__(self, items, key, per_page, has_prev, has_next, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.total = total
+        self.prev_cursor = getattr(items[0], key) if items and has_prev else None
+        self.next_cursor = getattr(items[-1], key) if items and has_next else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _cursor(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def page_size(value, default=DEFAULT_PER_PAGE):
+    size = _cursor(value) or default
+    return max(1, min(size, MAX_PER_PAGE))
+
+
+def keyset_paginate(query, key_column, per_page=DEFAULT_PER_PAGE, after=None, before=None, with_total=False):
+    """Страница query по убыванию key_column (уникальный, индексированный столбец).
+
+    after — курсор "Далее" (ключ последней строки предыдущей страницы),
+    before — курсор "Назад" (ключ первой строки следующей страницы).
+    """
+    after, before = _cursor(after), _cursor(before)
+    total = query.order_by(None).count() if with_total else None
+
+    if before is not None:
+        rows = query.filter(key_column > before).order_by(key_column.asc()).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, key_column.key, per_page, has_prev=has_prev, has_next=True, total=total)
+
+    if after is not None:
+        query = query.filter(key_column < after)
+    rows = query.order_by(key_column.desc()).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], key_column.key, per_page,
+                      has_prev=after is not None, has_next=len(rows) > per_page, total=total)
+
+
+def search_filter(columns, search):
+    """OR по ILIKE '%search%' (в PostgreSQL использует trigram индексы из add_search_indexes.py)"""
+    pattern = f'%{search.strip()}%'
+    condition = None
+    for column in columns:
+        clause = column.ilike(pattern)
+        condition = clause if condition is None else condition | clause
+    return condition
+
+
+def _ids(values):
+    ids = []
+    for value in values or []:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def bulk_set_role(session, user_ids, role):
+    """UPDATE users SET role = :role WHERE id IN (...) -> (количество, id)"""
+    from models import User
+    ids = _ids(user_ids)
+    if not ids:
+        return 0, []
+    updated = session.query(User).filter(User.id.in_(ids)).update(
+        {User.role: role}, synchronize_session=False)
+    return updated, ids
+
+
+def bulk_toggle_active(session, user_ids):
+    """Инвертировать is_active одним UPDATE -> (активировано, деактивировано, id)"""
+    from models import User
+    ids = _ids(user_ids)
+    if not ids:
+        return 0, 0, []
+    selected = session.query(User).filter(User.id.in_(ids))
+    deactivated = selected.filter(User.is_active == True).count()
+    existing = selected.count()
+    selected.update(
+        {User.is_active: case((User.is_active == True, False), else_=True)},
+        synchronize_session=False)
+    return existing - deactivated, deactivated, ids
+
+
+def bulk_delete_users(session, user_ids):
+    """Удалить пользователей одним DELETE.
+
+    Как и при session.delete(user), ссылки на пользователя в связанных таблицах
+    обнуляются (у связей User нет каскадного удаления) — но одним UPDATE на
+    таблицу, а не загрузкой связей каждого пользователя.
+    """
+    from models import User
+    ids = _ids(user_ids)
+    if not ids:
+        return 0, []
+    ids = [row[0] for row in session.query(User.id).filter(User.id.in_(ids)).all()]
+    if not ids:
+        return 0, []
+
+    for relationship in inspect(User).relationships:
+        if (relationship.direction.name != 'ONETOMANY' or relationship.viewonly
+                or relationship.secondary is not None):
+            continue
+        child = relationship.mapper.class_
+        for column in relationship.remote_side:
+            session.query(child).filter(column.in_(ids)).update({column: None}, synchronize_session=False)
+
+    deleted = session.query(User).filter(User.id.in_(ids)).delete(synchronize_session=False)
+    return deleted, ids
@@ -0,0 +1,219 @@
+"""
+Настройка логирования приложения
+
+- Уровни по модулям: LOG_LEVEL (общий, по умолчанию INFO) и
+  LOG_LEVELS="app=DEBUG,sqlalchemy.engine=WARNING".
+- Неблокирующая запись: логгеры кладут записи в очередь (QueueHandler),
+  в stdout пишет отдельный поток (QueueListener), поэтому запрос не ждет
+  вывода и строки разных потоков не перемешиваются.
+- Корреляция: каждому запросу присваивается request_id (берется из заголовка
+  X-Request-ID или генерируется), он попадает в каждую строку лога и в ответ.
+- DEBUG сэмплируется: LOG_DEBUG_SAMPLE=0.1 пропускает ~10% записей,
+  LOG_DEBUG_RATE=20 — не более 20 записей в секунду с одной строки кода.
+  Логгеры, созданные после configure_logging (SampledLogger), отбрасывают
+  запись до ее создания.
+- LOG_FORMAT=json включает вывод в JSON (по строке на запись).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+
+_listener = None
+_sampler = None
+
+
+def current_request_id():
+    try:
+        from flask import g, has_request_context
+        if has_request_context():
+            return getattr(g, 'request_id', '-')
+    except Exception:
+        pass
+    return '-'
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет request_id текущего запроса в запись"""
+
+    def filter(self, record):
+        record.request_id = current_request_id()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Сэмплирование и ограничение частоты DEBUG записей (INFO и выше проходят всегда)"""
+
+    def __init__(self, sample_rate=1.0, per_site_limit=0, window=1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.per_site_limit = per_site_limit
+        self.window = window
+        self._sites = {}  # (pathname, lineno) -> [начало окна, количество]
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.sample_rate < 1.0 or bool(self.per_site_limit)
+
+    def admit(self, pathname, lineno):
+        """Пропустить ли DEBUG запись с этой строки кода"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.per_site_limit:
+            key = (pathname, lineno)
+            now = time.monotonic()
+            with self._lock:
+                site = self._sites.get(key)
+                if site is None or now - site[0] >= self.window:
+                    site = self._sites[key] = [now, 0]
+                if site[1] >= self.per_site_limit:
+                    return False
+                site[1] += 1
+        return True
+
+    def filter(self, record):
+        # Записи SampledLogger уже прошли admit() до создания
+        if record.levelno > logging.DEBUG or getattr(record, 'debug_sampled', False):
+            return True
+        return self.admit(record.pathname, record.lineno)
+
+
+class SampledLogger(logging.Logger):
+    """Logger, который решает о сэмплировании DEBUG до создания записи.
+
+    Фильтр обработчика срабатывает уже после findCaller и LogRecord: при
+    сэмплировании 1% отброшенные записи стоили почти столько же, сколько
+    записанные. Здесь строка вызова берется из кадра, и отброшенная запись
+    не создается. Логгеры сторонних библиотек, созданные до
+    configure_logging, сэмплируются фильтром, как раньше.
+    """
+
+    def debug(self, msg, *args, **kwargs):
+        if not self.isEnabledFor(logging.DEBUG):
+            return
+        if _sampler is not None and _sampler.active:
+            frame = sys._getframe(1)
+            if not _sampler.admit(frame.f_code.co_filename, frame.f_lineno):
+                return
+            kwargs['extra'] = {**(kwargs.get('extra') or {}), 'debug_sampled': True}
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self._log(logging.DEBUG, msg, args, **kwargs)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+def parse_levels(spec):
+    """'app=DEBUG,sqlalchemy.engine=WARNING' -> {'app': 10, 'sqlalchemy.engine': 30}"""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        name, level = name.strip(), level.strip().upper()
+        if name and isinstance(logging.getLevelName(level), int):
+            levels[name] = logging.getLevelName(level)
+    return levels
+
+
+def configure_logging(app=None, level=None, levels=None, stream=None):
+    """Настроить корневой логгер: очередь + фоновый писатель + фильтры"""
+    global _listener, _sampler
+
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    levels = parse_levels(os.environ.get('LOG_LEVELS')) if levels is None else levels
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if os.environ.get('LOG_FORMAT', '').lower() == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Фильтры выполняются в вызывающем потоке: отброшенные записи не попадают в очередь
+    _sampler = DebugSampler(
+        sample_rate=float(os.environ.get('LOG_DEBUG_SAMPLE', '1.0')),
+        per_site_limit=int(os.environ.get('LOG_DEBUG_RATE', '0')),
+    )
+    queue_handler.addFilter(_sampler)
+    queue_handler.addFilter(RequestIdFilter())
+    # Логгеры, созданные дальше (в т.ч. logger app.py и app.logger), сэмплируют DEBUG до создания записи
+    logging.setLoggerClass(SampledLogger)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    if _listener is None:
+        atexit.register(stop_logging)
+    else:
+        stop_logging()
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    if app is not None:
+        init_request_logging(app)
+    return root
+
+
+def stop_logging():
+    """Дописать оставшиеся в очереди записи и остановить фоновый поток"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def init_request_logging(app):
+    """request_id для каждого запроса и заголовок X-Request-ID в ответе"""
+    from flask import g, request
+
+    if app.extensions.get('request_logging'):
+        return
+    app.extensions['request_logging'] = True
+    # Логгер Flask пишет через корневой обработчик (без собственного stderr handler)
+    app.logger.handlers.clear()
+    app.logger.propagate = True
+    access_log = logging.getLogger('app.access')
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = incoming[:64] if incoming else uuid.uuid4().hex[:16]
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        request_id = getattr(g, 'request_id', None)
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        if access_log.isEnabledFor(logging.DEBUG):
+            started_at = getattr(g, 'request_started_at', None)
+            duration_ms = (time.perf_counter() - started_at) * 1000 if started_at else 0
+            access_log.debug('%s %s -> %s (%.1f ms)', request.method, request.path,
+                             response.status_code, duration_ms)
+        return response
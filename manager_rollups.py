@@ -0,0 +1,354 @@
+"""
+Предрасчитанная статистика и лента активности менеджера
+
+Дашборд менеджера (/api/manager/dashboard-stats, activity-feed, top-clients,
+/manager/analytics) раньше на каждое обновление считал COUNT/GROUP BY по
+recommendations, manager_notifications и collections, а ленту склеивал
+и сортировал в Python. Теперь он читает несколько строк:
+
+- manager_stats — накопительные счетчики менеджера;
+- manager_daily_stats — те же счетчики по дням (месячная статистика, графики);
+- manager_client_stats — число рекомендаций клиенту (топ клиентов);
+- manager_activity — готовая лента (уведомления и рекомендации).
+
+Таблицы ведутся инкрементально из событий сессии SQLAlchemy: при flush
+новых/измененных/удаленных Recommendation, ManagerNotification, Collection
+и Deal счетчики обновляются в той же транзакции (откат транзакции откатывает
+и счетчики). Массовые вставки в обход ORM (raw SQL, bulk_insert_mappings)
+не отслеживаются — после них и для первичного заполнения запускается
+rebuild_manager_rollups.py.
+"""
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import bindparam, event, func, inspect, text
+
+from models import ROLLUP_COUNTERS
+
+SENT_COLLECTION_STATUS = 'Отправлена'
+
+MonthCount = namedtuple('MonthCount', ['month', 'count'])
+
+_UPSERT_DAILY = text(f"""
+    INSERT INTO manager_daily_stats (manager_id, day, {', '.join(ROLLUP_COUNTERS)})
+    VALUES (:manager_id, :day, {', '.join(':' + name for name in ROLLUP_COUNTERS)})
+    ON CONFLICT (manager_id, day) DO UPDATE SET
+    {', '.join(f'{name} = manager_daily_stats.{name} + excluded.{name}' for name in ROLLUP_COUNTERS)}
+""")
+
+_UPSERT_TOTALS = text(f"""
+    INSERT INTO manager_stats (manager_id, {', '.join(ROLLUP_COUNTERS)})
+    VALUES (:manager_id, {', '.join(':' + name for name in ROLLUP_COUNTERS)})
+    ON CONFLICT (manager_id) DO UPDATE SET
+    {', '.join(f'{name} = manager_stats.{name} + excluded.{name}' for name in ROLLUP_COUNTERS)}
+""")
+
+_UPSERT_CLIENT = text("""
+    INSERT INTO manager_client_stats (manager_id, client_id, interactions_count)
+    VALUES (:manager_id, :client_id, :delta)
+    ON CONFLICT (manager_id, client_id) DO UPDATE SET
+    interactions_count = manager_client_stats.interactions_count + excluded.interactions_count
+""")
+
+_INSERT_ACTIVITY = text("""
+    INSERT INTO manager_activity
+        (manager_id, source_type, source_id, title, description, icon, color, is_read, occurred_at)
+    VALUES
+        (:manager_id, :source_type, :source_id, :title, :description, :icon, :color, :is_read, :occurred_at)
+""")
+
+
+def _day(value):
+    if value is None:
+        return datetime.utcnow().date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime) else value
+
+
+def notification_activity(notification):
+    is_view = notification.notification_type == 'presentation_view'
+    return {
+        'manager_id': notification.manager_id,
+        'source_type': 'notification',
+        'source_id': notification.id,
+        'title': notification.title,
+        'description': notification.message,
+        'icon': 'eye' if is_view else 'bell',
+        'color': 'purple' if is_view else 'gray',
+        'is_read': bool(notification.is_read),
+        'occurred_at': notification.created_at or datetime.utcnow(),
+    }
+
+
+def recommendation_activity(recommendation, client_name):
+    return {
+        'manager_id': recommendation.manager_id,
+        'source_type': 'recommendation',
+        'source_id': recommendation.id,
+        'title': 'Отправлена рекомендация',
+        'description': f'{recommendation.title} для {client_name}',
+        'icon': 'paper-plane',
+        'color': 'blue',
+        'is_read': None,
+        'occurred_at': recommendation.sent_at or datetime.utcnow(),
+    }
+
+
+class RollupDelta:
+    """Изменения счетчиков, накопленные за один flush"""
+
+    def __init__(self):
+        self.daily = defaultdict(Counter)    # (manager_id, day) -> Counter
+        self.totals = defaultdict(Counter)   # manager_id -> Counter
+        self.clients = Counter()             # (manager_id, client_id) -> delta
+        self.activity_new = []               # (row, client_id для рекомендаций)
+        self.activity_deleted = []           # (source_type, source_id)
+        self.activity_read = []              # (source_id, is_read)
+
+    def count(self, manager_id, counter, when, delta=1):
+        if manager_id is None:
+            return
+        self.daily[(manager_id, _day(when))][counter] += delta
+        self.totals[manager_id][counter] += delta
+
+    def __bool__(self):
+        return bool(self.daily or self.clients or self.activity_new
+                    or self.activity_deleted or self.activity_read)
+
+    def apply(self, connection):
+        def counters(counter):
+            return {name: counter.get(name, 0) for name in ROLLUP_COUNTERS}
+
+        daily = [{'manager_id': manager_id, 'day': day, **counters(counter)}
+                 for (manager_id, day), counter in self.daily.items() if any(counter.values())]
+        if daily:
+            connection.execute(_UPSERT_DAILY, daily)
+        totals = [{'manager_id': manager_id, **counters(counter)}
+                  for manager_id, counter in self.totals.items() if any(counter.values())]
+        if totals:
+            connection.execute(_UPSERT_TOTALS, totals)
+
+        clients = [{'manager_id': manager_id, 'client_id': client_id, 'delta': delta}
+                   for (manager_id, client_id), delta in self.clients.items() if delta and client_id]
+        if clients:
+            connection.execute(_UPSERT_CLIENT, clients)
+
+        if self.activity_new:
+            client_ids = {client_id for _, client_id in self.activity_new if client_id}
+            names = {}
+            if client_ids:
+                names = dict(connection.execute(
+                    text("SELECT id, full_name FROM users WHERE id IN :ids")
+                    .bindparams(bindparam('ids', expanding=True)),
+                    {'ids': list(client_ids)}
+                ).fetchall())
+            rows = []
+            for row, client_id in self.activity_new:
+                if callable(row):
+                    row = row(names.get(client_id, 'клиента'))
+                rows.append(row)
+            connection.execute(_INSERT_ACTIVITY, rows)
+
+        for source_type, source_id in self.activity_deleted:
+            connection.execute(
+                text("DELETE FROM manager_activity WHERE source_type = :source_type AND source_id = :source_id"),
+                {'source_type': source_type, 'source_id': source_id}
+            )
+        for source_id, is_read in self.activity_read:
+            connection.execute(
+                text("UPDATE manager_activity SET is_read = :is_read "
+                     "WHERE source_type = 'notification' AND source_id = :source_id"),
+                {'source_id': source_id, 'is_read': bool(is_read)}
+            )
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def _status_change(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    if not history.has_changes():
+        return None
+    old = history.deleted[0] if history.deleted else None
+    new = history.added[0] if history.added else None
+    return old, new
+
+
+class ManagerRollups:
+    def __init__(self):
+        self.enabled = True
+
+    def init_app(self, app, db):
+        from models import Collection, ManagerNotification
+
+        self.enabled = app.config.get('MANAGER_ROLLUPS_ENABLED', True)
+        # Загружать прежнее значение статуса и у истекших после commit объектов
+        for attr in (Collection.status, ManagerNotification.is_read):
+            event.listen(attr, 'set', _keep_old_value, active_history=True)
+        event.listen(db.session, 'before_flush', self._before_flush)
+        event.listen(db.session, 'after_flush', self._after_flush)
+        app.extensions['manager_rollups'] = self
+
+    # Удаленные объекты разбираем до flush: после DELETE их атрибуты уже не загрузить
+    def _before_flush(self, session, flush_context, instances):
+        if not self.enabled or not session.deleted:
+            return
+        from models import Recommendation, ManagerNotification, Collection, Deal
+
+        delta = session.info.setdefault('manager_rollups_deleted', RollupDelta())
+        for obj in session.deleted:
+            if isinstance(obj, Recommendation):
+                delta.count(obj.manager_id, 'recommendations_sent', obj.sent_at, -1)
+                delta.clients[(obj.manager_id, obj.client_id)] -= 1
+                delta.activity_deleted.append(('recommendation', obj.id))
+            elif isinstance(obj, ManagerNotification):
+                delta.count(obj.manager_id, 'notifications', obj.created_at, -1)
+                delta.activity_deleted.append(('notification', obj.id))
+            elif isinstance(obj, Collection):
+                delta.count(obj.created_by_manager_id, 'collections_created', obj.created_at, -1)
+                if obj.status == SENT_COLLECTION_STATUS:
+                    delta.count(obj.created_by_manager_id, 'collections_sent',
+                                obj.sent_at or obj.created_at, -1)
+            elif isinstance(obj, Deal):
+                delta.count(obj.manager_id, 'deals_created', obj.created_at, -1)
+
+    def _after_flush(self, session, flush_context):
+        deleted = session.info.pop('manager_rollups_deleted', None)
+        if not self.enabled:
+            return
+        from models import Recommendation, ManagerNotification, Collection, Deal
+
+        delta = deleted or RollupDelta()
+        for obj in session.new:
+            if isinstance(obj, Recommendation):
+                delta.count(obj.manager_id, 'recommendations_sent', obj.sent_at)
+                delta.clients[(obj.manager_id, obj.client_id)] += 1
+                delta.activity_new.append(
+                    (lambda name, rec=obj: recommendation_activity(rec, name), obj.client_id))
+            elif isinstance(obj, ManagerNotification):
+                delta.count(obj.manager_id, 'notifications', obj.created_at)
+                delta.activity_new.append((notification_activity(obj), None))
+            elif isinstance(obj, Collection):
+                delta.count(obj.created_by_manager_id, 'collections_created', obj.created_at)
+                if obj.status == SENT_COLLECTION_STATUS:
+                    delta.count(obj.created_by_manager_id, 'collections_sent', obj.sent_at or obj.created_at)
+            elif isinstance(obj, Deal):
+                delta.count(obj.manager_id, 'deals_created', obj.created_at)
+
+        for obj in session.dirty:
+            if isinstance(obj, ManagerNotification):
+                change = _status_change(obj, 'is_read')
+                if change:
+                    delta.activity_read.append((obj.id, change[1]))
+            elif isinstance(obj, Collection):
+                change = _status_change(obj, 'status')
+                if change:
+                    old, new = change
+                    when = obj.sent_at or obj.created_at
+                    if old == SENT_COLLECTION_STATUS and new != SENT_COLLECTION_STATUS:
+                        delta.count(obj.created_by_manager_id, 'collections_sent', when, -1)
+                    elif new == SENT_COLLECTION_STATUS and old != SENT_COLLECTION_STATUS:
+                        delta.count(obj.created_by_manager_id, 'collections_sent', when)
+
+        if delta:
+            delta.apply(session.connection())
+
+
+manager_rollups = ManagerRollups()
+
+
+def get_manager_totals(manager_id):
+    """Накопительные счетчики менеджера (нули, если событий еще не было)"""
+    from models import ManagerStats
+    row = ManagerStats.query.get(manager_id)
+    return {name: (getattr(row, name) or 0) if row else 0 for name in ROLLUP_COUNTERS}
+
+
+def get_manager_period_totals(manager_id, since):
+    """Сумма дневных счетчиков начиная с даты since (не больше 31 строки за месяц)"""
+    from models import ManagerDailyStats
+    rows = ManagerDailyStats.query.filter(
+        ManagerDailyStats.manager_id == manager_id,
+        ManagerDailyStats.day >= _day(since)
+    ).all()
+    return {name: sum(getattr(row, name) or 0 for row in rows) for name in ROLLUP_COUNTERS}
+
+
+def get_monthly_counts(manager_id, counter):
+    """[(datetime первого дня месяца, count)] по дневным счетчикам"""
+    from models import ManagerDailyStats
+    column = getattr(ManagerDailyStats, counter)
+    rows = ManagerDailyStats.query.with_entities(ManagerDailyStats.day, column).filter(
+        ManagerDailyStats.manager_id == manager_id,
+        column != 0
+    ).all()
+    months = Counter()
+    for day, count in rows:
+        months[datetime(day.year, day.month, 1)] += count
+    return [MonthCount(month, count) for month, count in sorted(months.items()) if count > 0]
+
+
+def get_activity_feed(manager_id, limit=10):
+    from models import ManagerActivity
+    return ManagerActivity.query.filter_by(manager_id=manager_id).order_by(
+        ManagerActivity.occurred_at.desc(), ManagerActivity.id.desc()
+    ).limit(limit).all()
+
+
+def get_top_clients(manager_id, limit=5):
+    """[(User, interactions_count)] по manager_client_stats"""
+    from models import ManagerClientStats, User
+    return ManagerClientStats.query.join(
+        User, User.id == ManagerClientStats.client_id
+    ).with_entities(User, ManagerClientStats.interactions_count).filter(
+        ManagerClientStats.manager_id == manager_id,
+        ManagerClientStats.interactions_count > 0
+    ).order_by(ManagerClientStats.interactions_count.desc()).limit(limit).all()
+
+
+def rebuild_manager_rollups(session):
+    """Пересчитать все таблицы статистики из исходных данных (первичное заполнение/сверка)"""
+    from models import (Recommendation, ManagerNotification, Collection, Deal, User,
+                        ManagerStats, ManagerDailyStats, ManagerClientStats, ManagerActivity)
+
+    delta = RollupDelta()
+    sources = [
+        (Recommendation.manager_id, Recommendation.sent_at, 'recommendations_sent', None),
+        (ManagerNotification.manager_id, ManagerNotification.created_at, 'notifications', None),
+        (Collection.created_by_manager_id, Collection.created_at, 'collections_created', None),
+        # sent_at может быть пустым у старых подборок — как в инкрементальном учете
+        (Collection.created_by_manager_id, func.coalesce(Collection.sent_at, Collection.created_at),
+         'collections_sent', Collection.status == SENT_COLLECTION_STATUS),
+        (Deal.manager_id, Deal.created_at, 'deals_created', None),
+    ]
+    for manager_column, time_column, counter, condition in sources:
+        day_column = func.date(time_column)
+        query = session.query(manager_column, day_column, func.count()).group_by(manager_column, day_column)
+        if condition is not None:
+            query = query.filter(condition)
+        for manager_id, day, count in query.all():
+            delta.count(manager_id, counter, day, count)
+
+    for manager_id, client_id, count in session.query(
+        Recommendation.manager_id, Recommendation.client_id, func.count()
+    ).group_by(Recommendation.manager_id, Recommendation.client_id).all():
+        delta.clients[(manager_id, client_id)] += count
+
+    for model in (ManagerStats, ManagerDailyStats, ManagerClientStats, ManagerActivity):
+        session.query(model).delete(synchronize_session=False)
+
+    # Лента: уведомления и рекомендации с именем клиента
+    activity = [(notification_activity(notification), None)
+                for notification in ManagerNotification.query.yield_per(1000)]
+    names = dict(session.query(User.id, User.full_name).join(
+        Recommendation, Recommendation.client_id == User.id).distinct().all())
+    activity += [(recommendation_activity(rec, names.get(rec.client_id, 'клиента')), None)
+                 for rec in Recommendation.query.yield_per(1000)]
+    delta.activity_new = activity
+
+    delta.apply(session.connection())
+    session.commit()
+    return {name: sum(counter.get(name, 0) for counter in delta.totals.values())
+            for name in ROLLUP_COUNTERS}
@@ -209,6 +209,54 @@ class Developer(db.Model):
         return f'<Developer {self.name}>'
 
 
+class CrawlPage(db.Model):
+    """Состояние URL в очереди парсеров: когда загружен, хэш содержимого, когда перезагружать"""
+    __tablename__ = 'crawl_pages'
+    __table_args__ = (
+        db.UniqueConstraint('source', 'url', name='uq_crawl_pages_source_url'),
+        db.Index('idx_crawl_pages_due', 'source', 'next_fetch_at'),
+        {"extend_existing": True}
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(50), nullable=False)  # domclick, developer_sites, ai_developer_parser, multi_source
+    url = db.Column(db.String(1000), nullable=False)
+    kind = db.Column(db.String(50))  # listing, complex, developer, project
+    status_code = db.Column(db.Integer)
+    etag = db.Column(db.String(255))
+    last_modified = db.Column(db.String(100))
+    content_hash = db.Column(db.String(64))
+    fetch_count = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    first_seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_fetched_at = db.Column(db.DateTime)
+    last_changed_at = db.Column(db.DateTime)
+    next_fetch_at = db.Column(db.DateTime)
+
+
+class CrawlEntity(db.Model):
+    """Сущность, разобранная парсером (застройщик, ЖК, проект, квартира); imported_at IS NULL — изменение еще не импортировано"""
+    __tablename__ = 'crawl_entities'
+    __table_args__ = (
+        db.UniqueConstraint('source', 'entity_type', 'entity_key', name='uq_crawl_entities_key'),
+        db.Index('idx_crawl_entities_group', 'source', 'entity_type', 'group_key'),
+        db.Index('idx_crawl_entities_pending', 'source', 'imported_at'),
+        {"extend_existing": True}
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(50), nullable=False)
+    entity_type = db.Column(db.String(50), nullable=False)
+    entity_key = db.Column(db.String(500), nullable=False)
+    group_key = db.Column(db.String(1000))  # URL страницы-источника или код застройщика
+    data = db.Column(db.JSON, nullable=False, default=dict)
+    data_hash = db.Column(db.String(64), nullable=False)
+    first_seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    imported_at = db.Column(db.DateTime)
+
+
 class DeveloperAppointment(db.Model):
     """Developer appointment model"""
     __tablename__ = 'developer_appointments'
@@ -268,7 +316,10 @@ class CallbackRequest(db.Model):
 class User(UserMixin, db.Model):
     """User model for authentication"""
     __tablename__ = 'users'
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        db.Index('idx_users_assigned_manager', 'assigned_manager_id'),
+        {"extend_existing": True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
@@ -735,6 +786,71 @@ class ManagerNotification(db.Model):
         return f'<ManagerNotification {self.notification_type} for Manager {self.manager_id}>'
 
 
+ROLLUP_COUNTERS = ('recommendations_sent', 'notifications', 'collections_created',
+                   'collections_sent', 'deals_created')
+
+
+class ManagerStats(db.Model):
+    """Накопительные счетчики менеджера (ведутся инкрементально, см. manager_rollups.py)"""
+    __tablename__ = 'manager_stats'
+    __table_args__ = {"extend_existing": True}
+
+    manager_id = db.Column(db.Integer, db.ForeignKey('managers.id', ondelete='CASCADE'), primary_key=True)
+    recommendations_sent = db.Column(db.Integer, nullable=False, default=0)
+    notifications = db.Column(db.Integer, nullable=False, default=0)
+    collections_created = db.Column(db.Integer, nullable=False, default=0)
+    collections_sent = db.Column(db.Integer, nullable=False, default=0)
+    deals_created = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ManagerDailyStats(db.Model):
+    """Счетчики менеджера по дням (UTC) для месячной статистики и графиков"""
+    __tablename__ = 'manager_daily_stats'
+    __table_args__ = {"extend_existing": True}
+
+    manager_id = db.Column(db.Integer, db.ForeignKey('managers.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    recommendations_sent = db.Column(db.Integer, nullable=False, default=0)
+    notifications = db.Column(db.Integer, nullable=False, default=0)
+    collections_created = db.Column(db.Integer, nullable=False, default=0)
+    collections_sent = db.Column(db.Integer, nullable=False, default=0)
+    deals_created = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ManagerClientStats(db.Model):
+    """Количество взаимодействий (рекомендаций) менеджера с клиентом"""
+    __tablename__ = 'manager_client_stats'
+    __table_args__ = (
+        db.Index('idx_manager_client_stats_top', 'manager_id', 'interactions_count'),
+        {"extend_existing": True}
+    )
+
+    manager_id = db.Column(db.Integer, db.ForeignKey('managers.id', ondelete='CASCADE'), primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    interactions_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ManagerActivity(db.Model):
+    """Лента активности менеджера: готовые к выводу строки уведомлений и рекомендаций"""
+    __tablename__ = 'manager_activity'
+    __table_args__ = (
+        db.Index('idx_manager_activity_feed', 'manager_id', 'occurred_at'),
+        db.Index('idx_manager_activity_source', 'source_type', 'source_id'),
+        {"extend_existing": True}
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    manager_id = db.Column(db.Integer, db.ForeignKey('managers.id', ondelete='CASCADE'), nullable=False)
+    source_type = db.Column(db.String(20), nullable=False)  # notification, recommendation
+    source_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(255), nullable=False)
+    description = db.Column(db.Text)
+    icon = db.Column(db.String(30))
+    color = db.Column(db.String(20))
+    is_read = db.Column(db.Boolean, nullable=True)  # Только для уведомлений
+    occurred_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
 class Admin(db.Model):
     """Administrator model with full system access"""
     __tablename__ = 'admins'
@@ -974,16 +1090,19 @@ class BlogPost(db.Model):
         db.session.commit()
     
     def increment_views(self):
-        """Increment view count"""
-        self.views_count += 1
-        db.session.commit()
+        """Increment view count (buffered, see view_counters.py)"""
+        from view_counters import view_counters
+        view_counters.increment('blog_posts', self.id)
     
     def __repr__(self):
         return f'<BlogPost {self.title}>'
 
 class CashbackApplication(db.Model):
     __tablename__ = 'cashback_applications'
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        db.Index('idx_cashback_applications_created', 'created_at'),
+        {"extend_existing": True}
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -1012,6 +1131,17 @@ class CashbackApplication(db.Model):
     user = db.relationship('User', backref='cashback_applications')
     approved_by_manager = db.relationship('Manager', foreign_keys=[approved_by_manager_id])
 
+
+class CashbackStats(db.Model):
+    """Заявки на кешбек по месяцам (created_at) и статусам, см. cashback_analytics.py"""
+    __tablename__ = 'cashback_stats'
+    __table_args__ = {"extend_existing": True}
+
+    month = db.Column(db.Date, primary_key=True)  # Первое число месяца
+    status = db.Column(db.String(50), primary_key=True)
+    applications_count = db.Column(db.Integer, nullable=False, default=0)
+    cashback_total = db.Column(db.BigInteger, nullable=False, default=0)
+
 class FavoriteProperty(db.Model):
     __tablename__ = 'favorite_properties'
     __table_args__ = {"extend_existing": True}
@@ -1969,6 +2099,54 @@ class BlogArticle(db.Model):
         }
 
 
+class BlogSearchDocument(db.Model):
+    """Опубликованная статья блога в поисковом индексе (ведется из событий сессии, см. blog_search.py)"""
+    __tablename__ = 'blog_search_documents'
+    __table_args__ = (
+        db.Index('idx_blog_search_documents_latest', 'category', 'published_at'),
+        {"extend_existing": True}
+    )
+
+    source = db.Column(db.String(20), primary_key=True)  # post (blog_posts), article (blog_articles)
+    source_id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(255), nullable=False)
+    slug = db.Column(db.String(255), nullable=False)
+    excerpt = db.Column(db.Text)
+    category = db.Column(db.String(100))
+    featured_image = db.Column(db.String(500))
+    reading_time = db.Column(db.Integer)
+    published_at = db.Column(db.DateTime)
+
+
+class BlogSearchFragment(db.Model):
+    """Текст статьи без разметки кусками фиксированной длины — источник сниппетов"""
+    __tablename__ = 'blog_search_fragments'
+    __table_args__ = {"extend_existing": True}
+
+    source = db.Column(db.String(20), primary_key=True)
+    source_id = db.Column(db.Integer, primary_key=True)
+    number = db.Column(db.Integer, primary_key=True)  # Кусок number начинается с символа number * FRAGMENT_LENGTH
+    content = db.Column(db.Text, nullable=False)
+
+
+class BlogSearchTerm(db.Model):
+    """Инвертированный индекс блога: основа слова -> документ"""
+    __tablename__ = 'blog_search_terms'
+    __table_args__ = (
+        db.Index('idx_blog_search_terms_document', 'source', 'source_id'),
+        # LIKE 'основа%' для подсказок при любой collation базы
+        db.Index('idx_blog_search_terms_prefix', 'term', postgresql_ops={'term': 'text_pattern_ops'}),
+        {"extend_existing": True}
+    )
+
+    term = db.Column(db.String(64), primary_key=True)
+    source = db.Column(db.String(20), primary_key=True)
+    source_id = db.Column(db.Integer, primary_key=True)
+    weight = db.Column(db.Float, nullable=False)
+    position = db.Column(db.Integer)  # Первое вхождение в текст (символ), NULL — только в заголовке/анонсе
+    in_title = db.Column(db.Boolean, nullable=False, default=False)
+
+
 class BlogTag(db.Model):
     """Tags for blog articles"""
     __tablename__ = 'blog_tags'
@@ -2281,6 +2459,98 @@ class ExcelProperty(db.Model):
         return "Тип не указан"
 
 
+class PropertyPhotos(db.Model):
+    """Разобранные при импорте фотографии объекта (из excel_properties.photos)"""
+    __tablename__ = 'property_photos'
+    __table_args__ = {'extend_existing': True}
+
+    inner_id = db.Column(db.BigInteger, primary_key=True)  # excel_properties.inner_id
+    main_image = db.Column(db.Text, nullable=True)
+    gallery = db.Column(db.JSON, nullable=False, default=list)  # Фото квартиры
+    floor_plans = db.Column(db.JSON, nullable=False, default=list)  # Планировки
+    complex_gallery = db.Column(db.JSON, nullable=False, default=list)  # Фото ЖК
+    source_hash = db.Column(db.String(32), nullable=True)  # md5 исходного photos
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PropertyPhotos {self.inner_id}: {len(self.gallery or [])} photos>'
+
+
+class PropertyDistrict(db.Model):
+    """Район и ближайшая улица объекта, определенные при импорте (см. district_stats.py)"""
+    __tablename__ = 'property_districts'
+    __table_args__ = {'extend_existing': True}
+
+    inner_id = db.Column(db.BigInteger, primary_key=True)  # excel_properties.inner_id
+    district_id = db.Column(db.Integer, db.ForeignKey('districts.id', ondelete='SET NULL'), nullable=True, index=True)
+    method = db.Column(db.String(20), nullable=True)  # polygon, parsed, street, address
+    street_id = db.Column(db.Integer, db.ForeignKey('streets.id', ondelete='SET NULL'), nullable=True, index=True)
+    street_distance_m = db.Column(db.Float, nullable=True)  # Расстояние до ближайшей улицы
+    latitude = db.Column(db.Float, nullable=True)  # Координаты, по которым определен район
+    longitude = db.Column(db.Float, nullable=True)
+    assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ComplexPage(db.Model):
+    """Предрасчитанная страница ЖК для /zk/<slug> и /residential-complex/..., пересчитывается после импорта"""
+    __tablename__ = 'complex_pages'
+    __table_args__ = {'extend_existing': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    complex_name = db.Column(db.String(255), nullable=False, unique=True)
+    slug = db.Column(db.String(255), nullable=True, index=True)  # create_slug(complex_name)
+    residential_complex_id = db.Column(db.Integer, nullable=True, index=True)  # residential_complexes.id
+    complex_key = db.Column(db.String(50), nullable=True)  # residential_complexes.complex_id
+    apartments_count = db.Column(db.Integer, default=0)
+    page = db.Column(db.JSON, nullable=False)  # Сводка, корпуса, типы квартир, галерея, квартиры, похожие ЖК
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DeveloperProfile(db.Model):
+    """Профиль застройщика для /developers и /developer/<slug>, пересчитывается после импорта и парсинга"""
+    __tablename__ = 'developer_profiles'
+    __table_args__ = {'extend_existing': True}
+
+    developer_id = db.Column(db.Integer, db.ForeignKey('developers.id', ondelete='CASCADE'), primary_key=True)
+    slug = db.Column(db.String(255), nullable=True, index=True)  # developer_slug(name)
+    # Статистика по excel_properties (developer_name)
+    properties_count = db.Column(db.Integer, nullable=False, default=0)
+    complexes_count = db.Column(db.Integer, nullable=False, default=0)
+    price_min = db.Column(db.Float, nullable=True)
+    price_max = db.Column(db.Float, nullable=True)
+    price_avg = db.Column(db.Float, nullable=True)
+    # Счетчики по residential_complexes и properties (developer_id)
+    db_complexes_count = db.Column(db.Integer, nullable=False, default=0)
+    db_properties_count = db.Column(db.Integer, nullable=False, default=0)
+    complexes = db.Column(db.JSON, nullable=True)  # ЖК с распределением по комнатам и ценами по типам
+    apartments = db.Column(db.JSON, nullable=True)  # Самые доступные квартиры для страницы
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DistrictStats(db.Model):
+    """Сводка района для /districts и /district/<slug>, пересчитывается после импорта"""
+    __tablename__ = 'district_stats'
+    __table_args__ = {'extend_existing': True}
+
+    district_id = db.Column(db.Integer, db.ForeignKey('districts.id', ondelete='CASCADE'), primary_key=True)
+    properties_count = db.Column(db.Integer, nullable=False, default=0)
+    complexes_count = db.Column(db.Integer, nullable=False, default=0)
+    developers_count = db.Column(db.Integer, nullable=False, default=0)
+    price_min = db.Column(db.Float, nullable=True)
+    price_max = db.Column(db.Float, nullable=True)
+    # Распределение цены за м²
+    price_per_sqm_min = db.Column(db.Float, nullable=True)
+    price_per_sqm_p25 = db.Column(db.Float, nullable=True)
+    price_per_sqm_median = db.Column(db.Float, nullable=True)
+    price_per_sqm_p75 = db.Column(db.Float, nullable=True)
+    price_per_sqm_max = db.Column(db.Float, nullable=True)
+    complexes = db.Column(db.JSON, nullable=False, default=list)  # [{name, developer, apartments_count, ...}]
+    developers = db.Column(db.JSON, nullable=False, default=list)  # [{name, properties_count}]
+    sample_property_ids = db.Column(db.JSON, nullable=False, default=list)  # Самые доступные объекты
+    infrastructure = db.Column(db.JSON, nullable=True)  # Разобранный districts.infrastructure_data
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class BookingRequest(db.Model):
     """Booking requests for properties from presentations"""
     __tablename__ = 'booking_requests'
@@ -2577,8 +2847,8 @@ class UserActivity(db.Model):
     
     @staticmethod
     def log_activity(user_id, activity_type, description, **kwargs):
-        """Helper method to log user activity"""
-        activity = UserActivity(
+        """Helper method to log user activity (batched by view_counters when it is running)"""
+        fields = dict(
             user_id=user_id,
             activity_type=activity_type,
             description=description,
@@ -2587,9 +2857,15 @@ class UserActivity(db.Model):
             search_query=kwargs.get('search_query'),
             extra_data=json.dumps(kwargs.get('extra_data', {})) if kwargs.get('extra_data') else None,
             ip_address=kwargs.get('ip_address'),
-            user_agent=kwargs.get('user_agent')
+            user_agent=kwargs.get('user_agent'),
+            created_at=datetime.utcnow()
         )
-        db.session.add(activity)
+        from view_counters import view_counters
+        if view_counters.app is not None:
+            view_counters.log_activity(**fields)
+            return
+        
+        db.session.add(UserActivity(**fields))
         try:
             db.session.commit()
         except Exception as e:
@@ -2843,7 +3119,10 @@ class JobApplication(db.Model):
 class Deal(db.Model):
     """Deal model for transactions between managers and clients"""
     __tablename__ = 'deals'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('idx_deals_manager_id', 'manager_id', 'id'),
+        {'extend_existing': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     deal_number = db.Column(db.String(20), unique=True, nullable=False)  # Номер сделки (DL12345678)
@@ -14,6 +14,8 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
 
+import crawl_store
+
 logger = logging.getLogger(__name__)
 
 def create_stealth_driver():
@@ -42,6 +44,11 @@ def create_stealth_driver():
         logger.error(f"Ошибка создания драйвера: {e}")
         return None
 
+def _developer_key(developer: Dict) -> str:
+    """Ключ застройщика в crawl_entities: источник + нормализованное название"""
+    name_clean = re.sub(r'\s+', ' ', developer['name'].strip().lower())
+    return f"{developer.get('url', '')}|{name_clean}"
+
 def scrape_multiple_sources() -> Dict:
     """Парсинг застройщиков с нескольких источников"""
     
@@ -55,12 +62,20 @@ def scrape_multiple_sources() -> Dict:
     all_developers = []
     driver = None
     
+    # Источники, загруженные недавно, берем из crawl_entities без браузера
+    store = crawl_store.for_source('multi_source')
+    to_fetch, reused = store.plan(sources) if store else (sources, {})
+    for url, developers in reused.items():
+        logger.info(f"♻️ {url}: {len(developers)} застройщиков из прошлого прогона")
+        all_developers.extend(developers)
+    
     try:
-        driver = create_stealth_driver()
-        if not driver:
-            raise Exception("Не удалось создать браузер")
+        if to_fetch:
+            driver = create_stealth_driver()
+            if not driver:
+                raise Exception("Не удалось создать браузер")
         
-        for url in sources:
+        for url in to_fetch:
             try:
                 logger.info(f"🌐 Пробуем источник: {url}")
                 
@@ -111,11 +126,20 @@ def scrape_multiple_sources() -> Dict:
                     all_developers.extend(developers)
                 else:
                     logger.warning(f"❌ Не найдено застройщиков на {url}")
+                
+                if store:
+                    store.record_page(url, html, kind='listing')
+                    store.record_entities('developer', developers, key=_developer_key, group_key=url)
                     
             except Exception as e:
                 logger.error(f"Ошибка при парсинге {url}: {e}")
+                if store:
+                    store.record_page(url, kind='listing', status_code=None, error=str(e))
                 continue
         
+        if store:
+            store.commit()
+        
         # Убираем дубликаты по названию
         unique_developers = []
         seen_names = set()
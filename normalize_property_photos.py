@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Backfill property_photos from excel_properties.photos
+
+Запускать после импорта скриптами вне админки или восстановления базы из бэкапа:
+объекты с неизменившимся photos пропускаются, удаленные объекты чистятся.
+"""
+
+from app import app, db
+from property_photos import backfill_property_photos
+
+
+def normalize_property_photos():
+    """Разобрать фото всех объектов в таблицу property_photos"""
+
+    with app.app_context():
+        try:
+            print("Normalizing property photos...")
+            updated = backfill_property_photos(db.session)
+            print(f"✅ Property photos normalized: {updated} rows updated")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error normalizing photos: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    normalize_property_photos()
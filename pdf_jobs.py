@@ -0,0 +1,189 @@
+"""
+Фоновая генерация PDF/ZIP файлов
+
+Тяжелая генерация (WeasyPrint, ZIP архивы презентаций, PDF сравнений) выполняется
+в пуле потоков, а не в запросе пользователя. Состояние задачи хранится в JSON файле
+рядом с результатом в общем каталоге (instance/pdf_jobs), поэтому прогресс виден
+любому воркеру gunicorn, а не только тому, который принял запрос на скачивание.
+
+Внутри процесса обновления прогресса будят ожидающие SSE потоки через Condition;
+задачи, выполняемые другим воркером, подхватываются по изменению файла состояния.
+Готовые файлы хранятся ttl секунд и отдаются через send_file с поддержкой Range.
+"""
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE_STAGES = ('queued', 'processing', 'completing')
+
+
+class PdfJobService:
+    """Сервис фоновых задач генерации документов с персистентным прогрессом"""
+
+    def __init__(self, max_workers=2, ttl=3600, stale_after=600):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.stale_after = stale_after
+
+        self.app = None
+        self.storage_dir = None
+        self._executor = None
+        self._cond = threading.Condition()
+        self._submit_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.storage_dir = app.config.get('PDF_JOBS_DIR') or os.path.join(app.instance_path, 'pdf_jobs')
+        self.ttl = app.config.get('PDF_JOBS_TTL', self.ttl)
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pdf-job')
+        app.extensions['pdf_jobs'] = self
+
+    # --- Хранилище ---------------------------------------------------------
+
+    def job_id_for(self, kind, key):
+        """Детерминированный, но неугадываемый id задачи для (тип, версия данных)"""
+        secret = (self.app.secret_key or 'inback') if self.app else 'inback'
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        digest = hmac.new(secret, f"{kind}:{key}".encode('utf-8'), hashlib.sha256).hexdigest()
+        return f"{kind}-{digest[:32]}"
+
+    def _status_path(self, job_id):
+        return os.path.join(self.storage_dir, f"{job_id}.json")
+
+    def artefact_path(self, job_id):
+        return os.path.join(self.storage_dir, f"{job_id}.bin")
+
+    def get_status(self, job_id):
+        try:
+            with open(self._status_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def update(self, job_id, **fields):
+        """Атомарно обновить состояние задачи и разбудить ожидающих"""
+        status = self.get_status(job_id) or {'job_id': job_id}
+        status.update(fields)
+        status['updated_at'] = time.time()
+
+        tmp_path = f"{self._status_path(job_id)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f, ensure_ascii=False)
+        os.replace(tmp_path, self._status_path(job_id))
+
+        with self._cond:
+            self._cond.notify_all()
+        return status
+
+    def _is_reusable(self, status):
+        if not status:
+            return False
+        age = time.time() - status.get('updated_at', 0)
+        if status.get('stage') == 'complete':
+            return age < self.ttl and os.path.exists(self.artefact_path(status['job_id']))
+        if status.get('stage') in ACTIVE_STAGES:
+            return age < self.stale_after
+        return False
+
+    def cleanup_expired(self):
+        """Удалить результаты и состояния задач старше ttl"""
+        if not self.storage_dir:
+            return 0
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.storage_dir):
+            path = os.path.join(self.storage_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    # --- Выполнение --------------------------------------------------------
+
+    def submit(self, kind, key, func, filename, mimetype, base_url=None, total=None):
+        """Поставить задачу в очередь или вернуть id уже выполняющейся/готовой задачи.
+
+        func(output_path, progress) должна записать результат в output_path;
+        progress(**fields) обновляет видимое клиенту состояние.
+        """
+        job_id = self.job_id_for(kind, key)
+        with self._submit_lock:
+            if self._is_reusable(self.get_status(job_id)):
+                return job_id
+
+            self.cleanup_expired()
+            self.update(job_id, kind=kind, stage='queued', progress=0, current=0, total=total,
+                        message='Задача поставлена в очередь...', filename=filename,
+                        mimetype=mimetype, error=None)
+            self._executor.submit(self._run, job_id, func, filename, base_url)
+        return job_id
+
+    def _run(self, job_id, func, filename, base_url):
+        output_path = self.artefact_path(job_id)
+        tmp_path = f"{output_path}.tmp"
+
+        def progress(**fields):
+            fields.setdefault('stage', 'processing')
+            self.update(job_id, **fields)
+
+        try:
+            with self.app.app_context(), self.app.test_request_context(base_url=base_url or 'http://localhost/'):
+                progress(message='Начинаю создание файлов...')
+                func(tmp_path, progress)
+            os.replace(tmp_path, output_path)
+            self.update(job_id, stage='complete', progress=100, message='Готово! Скачивание началось.')
+        except Exception as e:
+            print(f"Error in background job {job_id}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            self.update(job_id, stage='error', progress=0, error=str(e),
+                        message=f'Ошибка при создании файла: {str(e)}')
+
+    def wait(self, job_id, timeout=300):
+        """Дождаться завершения задачи; возвращает последнее состояние"""
+        status = None
+        for status in self.iter_events(job_id, timeout=timeout):
+            pass
+        return status
+
+    def iter_events(self, job_id, timeout=300, poll_interval=1.0):
+        """Генератор состояний задачи: отдает состояние при каждом изменении до завершения.
+
+        Обновления из этого процесса приходят мгновенно через Condition, обновления
+        из других воркеров — по изменению файла состояния (не реже poll_interval).
+        """
+        deadline = time.monotonic() + timeout
+        last_seen = None
+        while True:
+            status = self.get_status(job_id)
+            if status is None:
+                yield {'job_id': job_id, 'stage': 'error', 'progress': 0, 'message': 'Задача не найдена'}
+                return
+
+            if status.get('updated_at') != last_seen:
+                last_seen = status.get('updated_at')
+                yield status
+            if status.get('stage') not in ACTIVE_STAGES:
+                return
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield {**status, 'stage': 'error', 'message': 'Превышено время ожидания'}
+                return
+
+            with self._cond:
+                self._cond.wait(min(poll_interval, remaining))
+
+
+pdf_job_service = PdfJobService()
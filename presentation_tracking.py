@@ -0,0 +1,197 @@
+"""
+Буферизованный учет просмотров презентаций
+
+Просмотр публичной презентации больше не пишет в базу в рамках запроса клиента:
+событие кладется в очередь, фоновый поток раз в несколько секунд сбрасывает
+накопленные просмотры одной транзакцией (пакетная вставка presentation_views +
+один UPDATE счетчика на презентацию), после чего отправляет уведомления менеджерам.
+Повторные открытия той же ссылки с того же IP/браузера в окне дедупликации
+не учитываются.
+Если запись не удалась, просмотры возвращаются в буфер до следующего сброса;
+событие, которое не записалось max_attempts раз подряд, отбрасывается.
+"""
+import atexit
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class PresentationViewTracker:
+    """Асинхронный писатель просмотров презентаций с дедупликацией"""
+
+    def __init__(self, flush_interval=3.0, dedup_window=1800, max_batch=500, max_dedup_keys=50000,
+                 max_attempts=5):
+        self.flush_interval = flush_interval
+        self.dedup_window = dedup_window
+        self.max_batch = max_batch
+        self.max_dedup_keys = max_dedup_keys
+        self.max_attempts = max_attempts
+
+        self.app = None
+        self.db = None
+        self._queue = queue.Queue()
+        self._retry = []  # события из неудавшегося сброса, пишутся первыми
+        self._recent = OrderedDict()  # (collection_id, ip, user_agent) -> monotonic time
+        self._recent_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self._stop = threading.Event()
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.extensions['presentation_view_tracker'] = self
+        atexit.register(self.shutdown)
+
+    def _is_duplicate(self, key):
+        now = time.monotonic()
+        with self._recent_lock:
+            seen_at = self._recent.get(key)
+            if seen_at is not None and now - seen_at < self.dedup_window:
+                return True
+            self._recent[key] = now
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.max_dedup_keys:
+                self._recent.popitem(last=False)
+        return False
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='presentation-view-writer', daemon=True)
+        self._worker.start()
+
+    def track(self, collection_id, view_ip=None, user_agent=None, referer=None, url_root=None, notifier=None):
+        """Поставить просмотр в очередь. Возвращает False, если просмотр отброшен как повторный.
+
+        notifier(presentation, view, url_root) вызывается после записи просмотра в базу.
+        """
+        if self._is_duplicate((collection_id, view_ip, user_agent)):
+            return False
+
+        self._queue.put({
+            'collection_id': collection_id,
+            'view_ip': view_ip,
+            'user_agent': user_agent,
+            'referer': (referer or '')[:500] or None,
+            'viewed_at': datetime.utcnow(),
+            'url_root': url_root,
+            'notifier': notifier,
+            'attempts': 0,
+        })
+        self._ensure_worker()
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing presentation views: {e}")
+
+    def _drain(self):
+        # Вызывается под _flush_lock, как и _restore
+        events, self._retry = self._retry[:self.max_batch], self._retry[self.max_batch:]
+        while len(events) < self.max_batch:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _restore(self, events):
+        kept = []
+        for event in events:
+            event['attempts'] += 1
+            if event['attempts'] < self.max_attempts:
+                kept.append(event)
+        self._retry = kept + self._retry
+        return len(events) - len(kept)
+
+    def flush(self):
+        """Записать все накопленные просмотры. Возвращает количество записанных событий."""
+        if self.app is None:
+            return 0
+
+        written = 0
+        with self._flush_lock:
+            while True:
+                events = self._drain()
+                if not events:
+                    break
+                with self.app.app_context():
+                    batch_written = self._write_batch(events)
+                if not batch_written:
+                    # База недоступна: повторим на следующем сбросе
+                    break
+                written += batch_written
+        return written
+
+    def _write_batch(self, events):
+        from models import Collection, PresentationView
+
+        session = self.db.session
+        try:
+            views = []
+            per_collection = {}
+            for event in events:
+                view = PresentationView(
+                    collection_id=event['collection_id'],
+                    view_ip=event['view_ip'],
+                    user_agent=event['user_agent'],
+                    referer=event['referer'],
+                    viewed_at=event['viewed_at'],
+                )
+                views.append((view, event))
+                stats = per_collection.setdefault(event['collection_id'], [0, event['viewed_at']])
+                stats[0] += 1
+                stats[1] = max(stats[1], event['viewed_at'])
+            session.add_all([view for view, _ in views])
+
+            # Один UPDATE на презентацию; updated_at не трогаем, чтобы не сбрасывать кэш отрисовки
+            for collection_id, (count, last_viewed_at) in per_collection.items():
+                session.execute(
+                    self.db.update(Collection)
+                    .where(Collection.id == collection_id)
+                    .values(
+                        view_count=self.db.func.coalesce(Collection.view_count, 0) + count,
+                        last_viewed_at=last_viewed_at,
+                        updated_at=Collection.updated_at,
+                    )
+                )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            dropped = self._restore(events)
+            print(f"Error recording presentation views: {e} ({dropped} views dropped)")
+            return 0
+
+        presentations = {
+            collection.id: collection
+            for collection in Collection.query.filter(Collection.id.in_(list(per_collection))).all()
+        }
+        for view, event in views:
+            notifier = event['notifier']
+            presentation = presentations.get(view.collection_id)
+            if notifier is None or presentation is None:
+                continue
+            try:
+                notifier(presentation, view, event['url_root'])
+            except Exception as e:
+                session.rollback()
+                print(f"Error sending view notification: {e}")
+
+        return len(views)
+
+    def shutdown(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing presentation views on shutdown: {e}")
+
+
+presentation_view_tracker = PresentationViewTracker()
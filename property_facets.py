@@ -0,0 +1,261 @@
+"""
+Счетчики фасетов для фильтров страницы /properties
+
+Для выпадающих списков фильтров страница делала Developer.query.all() и запрос
+ЖК с подзапросом фото на каждый ЖК (LIMIT 11), а счетчики "(216)" рядом с
+вариантами были вписаны в шаблон руками и давно не совпадали с базой. Живые
+счетчики через GROUP BY потребовали бы отдельный запрос на каждый фасет при
+каждом изменении фильтра. Здесь:
+
+- FacetIndex строится один раз над снимком load_properties(): объект в
+  позиции i снимка — бит i; для каждого значения фасета хранится битовая
+  маска (int) объектов с этим значением;
+- диапазоны цены, площади и этажа — отсортированные массивы значений, маска
+  диапазона собирается по срезу bisect;
+- counts(filters) считает фасеты "дизъюнктивно": счетчики фасета учитывают
+  выбор во всех остальных фасетах, но не в нем самом, поэтому рядом с уже
+  отмеченным вариантом видно, сколько добавят соседние; подсчет — AND масок
+  и int.bit_count(), без обращений к базе;
+- значения фильтров сопоставляются как на странице объектов: застройщик,
+  район, класс и отделка — по вхождению подстроки, комнаты — через
+  _room_values выгрузки, "Сдан" снимает фильтр по году сдачи.
+
+Индекс неизменяемый; app.get_facet_index() пересобирает его, когда
+load_properties() возвращает новый снимок.
+"""
+from bisect import bisect_left, bisect_right
+
+from data_export import _number, _room_values
+
+ROOM_LABELS = {
+    'студия': 'Студия',
+    '1-комн': '1-комнатная',
+    '2-комн': '2-комнатная',
+    '3-комн': '3-комнатная',
+    '4+-комн': '4+ комнат',
+}
+BUILDING_TYPE_LABELS = {
+    'малоэтажный': 'Малоэтажный (до 5 эт.)',
+    'среднеэтажный': 'Среднеэтажный (6-12 эт.)',
+    'многоэтажный': 'Многоэтажный (от 13 эт.)',
+}
+FEATURE_LABELS = {
+    'accreditation': 'Аккредитация',
+    'green_mortgage': 'Зеленая ипотека',
+    'government_program': 'Господдержка',
+    'trade_in': 'Trade-in',
+}
+
+# Фасеты, значения которых выбираются по вхождению подстроки (как на /properties)
+SUBSTRING_FACETS = {'developer', 'district', 'object_class', 'renovation'}
+# Фасет -> ключи словаря фильтров property_filters_from_args
+FILTER_KEYS = {
+    'rooms': ('rooms',),
+    'developer': ('developers', 'developer'),
+    'district': ('districts', 'district'),
+    'completion': ('completion', 'delivery_years'),
+    'building_type': ('building_types',),
+    'object_class': ('object_classes',),
+    'renovation': ('renovation',),
+    'features': ('features',),
+}
+# Диапазон -> (поле снимка, ключ "от", ключ "до", множитель ввода)
+RANGES = {
+    'price': ('price', 'price_min', 'price_max', 1000000),
+    'area': ('area', 'area_min', 'area_max', 1),
+    'floor': ('floor', 'floor_min', 'floor_max', 1),
+}
+# Текстовые фильтры без фасета: ключ -> поля снимка
+TEXT_FILTERS = {
+    'search': ('address', 'developer', 'residential_complex', 'district', 'building_name'),
+    'residential_complex': ('residential_complex',),
+    'building': ('building_name',),
+    'regions': ('address',),
+    'cities': ('address',),
+    'region': ('address',),
+    'city': ('address',),
+}
+
+
+def rooms_value(prop):
+    rooms = int(prop.get('rooms') or 0)
+    if rooms == 0:
+        return 'студия'
+    return '4+-комн' if rooms >= 4 else f'{rooms}-комн'
+
+
+def building_type_value(prop):
+    floors = int(prop.get('total_floors') or 0)
+    if floors <= 5:
+        return 'малоэтажный'
+    return 'среднеэтажный' if floors <= 12 else 'многоэтажный'
+
+
+def facet_values(prop):
+    """{фасет: [значения]} одного объекта снимка; год сдачи и особенности многозначны"""
+    years = {str(year) for year in (prop.get('completion_year'), prop.get('complex_completion_year')) if year}
+    features = [name for name, field in (
+        ('accreditation', 'accreditation'),
+        ('green_mortgage', 'green_mortgage_available'),
+        ('government_program', 'government_program'),
+        ('trade_in', 'trade_in_available'),
+    ) if prop.get(field)]
+    return {
+        'rooms': [rooms_value(prop)],
+        'developer': [prop.get('developer')],
+        'district': [prop.get('district')],
+        'completion': sorted(years),
+        'building_type': [building_type_value(prop)],
+        'object_class': [prop.get('complex_class')],
+        'renovation': [prop.get('finishing')],
+        'features': features,
+    }
+
+
+def _bitset(positions):
+    # Через bytearray: сдвиги большого int на каждую позицию квадратичны
+    positions = list(positions)
+    if not positions:
+        return 0
+    bits = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class FacetIndex:
+    """Битовые маски значений фасетов над неизменяемым снимком объектов"""
+
+    def __init__(self, properties):
+        self.source = properties
+        self.all = (1 << len(properties)) - 1
+
+        positions = {facet: {} for facet in FILTER_KEYS}
+        for position, prop in enumerate(properties):
+            for facet, values in facet_values(prop).items():
+                for value in values:
+                    if value not in (None, ''):
+                        positions[facet].setdefault(str(value), []).append(position)
+        self.bitsets = {
+            facet: {value: _bitset(items) for value, items in values.items()}
+            for facet, values in positions.items()
+        }
+        # Порядок вариантов не зависит от выбора, чтобы список не прыгал
+        self.order = {facet: self._option_order(facet, values) for facet, values in positions.items()}
+
+        self.ranges = {}
+        for name, (field, _, _, _) in RANGES.items():
+            pairs = sorted((float(prop.get(field) or 0), position) for position, prop in enumerate(properties))
+            self.ranges[name] = ([value for value, _ in pairs], [position for _, position in pairs])
+
+    @staticmethod
+    def _option_order(facet, values):
+        if facet == 'rooms':
+            return [value for value in ROOM_LABELS if value in values]
+        if facet == 'building_type':
+            return [value for value in BUILDING_TYPE_LABELS if value in values]
+        if facet == 'features':
+            return [value for value in FEATURE_LABELS if value in values]
+        if facet == 'completion':
+            return sorted(values)
+        return sorted(values, key=lambda value: (-len(values[value]), value))
+
+    def value_mask(self, facet, selected):
+        """Объекты, подходящие хотя бы под одно выбранное значение фасета (None — фасет не выбран)"""
+        selected = [str(value).strip() for value in selected if value not in (None, '')]
+        if not selected:
+            return None
+        bitsets = self.bitsets[facet]
+        if facet == 'rooms':
+            exact, four_plus = _room_values(selected)
+            keys = [rooms_value({'rooms': rooms}) for rooms in exact] + (['4+-комн'] if four_plus else [])
+        elif facet == 'completion':
+            if 'Сдан' in selected:
+                return None
+            keys = [str(year) for year in (_number(value, int) for value in selected) if year is not None]
+        elif facet in SUBSTRING_FACETS:
+            needles = [value.lower() for value in selected]
+            keys = [key for key in bitsets if any(needle in key.lower() for needle in needles)]
+        else:
+            keys = selected
+        mask = 0
+        for key in keys:
+            mask |= bitsets.get(key, 0)
+        return mask
+
+    def range_mask(self, name, low, high):
+        values, positions = self.ranges[name]
+        start = bisect_left(values, low) if low is not None else 0
+        end = bisect_right(values, high) if high is not None else len(values)
+        if end <= start:
+            return 0
+        # Широкий диапазон дешевле собрать как дополнение
+        if end - start > len(values) // 2:
+            return self.all & ~(_bitset(positions[:start]) | _bitset(positions[end:]))
+        return _bitset(positions[start:end])
+
+    def text_mask(self, fields, needles):
+        needles = [needle.lower().strip() for needle in needles if needle and needle.strip()]
+        if not needles:
+            return None
+        positions = []
+        for position, prop in enumerate(self.source):
+            haystack = '\n'.join(str(prop.get(field) or '') for field in fields).lower()
+            if all(needle in haystack for needle in needles):
+                positions.append(position)
+        return _bitset(positions)
+
+    def base_mask(self, filters):
+        """Фильтры, для которых фасетов нет: диапазоны и текстовые условия"""
+        mask = self.all
+        for name, (_, low_key, high_key, scale) in RANGES.items():
+            low, high = _number(filters.get(low_key)), _number(filters.get(high_key))
+            if low is not None or high is not None:
+                mask &= self.range_mask(name, low * scale if low is not None else None,
+                                        high * scale if high is not None else None)
+        for key, fields in TEXT_FILTERS.items():
+            value = filters.get(key)
+            if isinstance(value, list):
+                # Несколько регионов/городов — любой из них
+                masks = [self.text_mask(fields, [item]) for item in value if item]
+                if masks:
+                    combined = 0
+                    for item_mask in masks:
+                        combined |= item_mask
+                    mask &= combined
+            else:
+                item_mask = self.text_mask(fields, [value])
+                if item_mask is not None:
+                    mask &= item_mask
+        return mask
+
+    def counts(self, filters):
+        """{total, facets: {фасет: [{value, label, count}]}} для текущего выбора фильтров"""
+        base = self.base_mask(filters)
+        selections = {}
+        for facet, keys in FILTER_KEYS.items():
+            selected = []
+            for key in keys:
+                value = filters.get(key)
+                selected.extend(value if isinstance(value, list) else [value])
+            mask = self.value_mask(facet, selected)
+            if mask is not None:
+                selections[facet] = mask
+
+        total = base
+        for mask in selections.values():
+            total &= mask
+
+        facets = {}
+        for facet, bitsets in self.bitsets.items():
+            others = base
+            for other, mask in selections.items():
+                if other != facet:
+                    others &= mask
+            labels = {'rooms': ROOM_LABELS, 'building_type': BUILDING_TYPE_LABELS,
+                      'features': FEATURE_LABELS}.get(facet, {})
+            facets[facet] = [
+                {'value': value, 'label': labels.get(value, value), 'count': (bitsets[value] & others).bit_count()}
+                for value in self.order[facet]
+            ]
+        return {'total': total.bit_count(), 'facets': facets}
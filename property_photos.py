@@ -0,0 +1,182 @@
+"""
+Нормализованные фотографии объектов
+
+Колонка excel_properties.photos исторически хранится в трех форматах:
+JSON массив ссылок, JSON объект {apartment_gallery, floor_plans, complex_gallery}
+и литерал массива PostgreSQL {url1,url2}. Формат определяется и разбирается
+один раз при импорте, результат кладется в таблицу property_photos
+(главное фото, галерея, планировки, фото ЖК). Списки и карточки читают
+готовые массивы через LEFT JOIN и не декодируют JSON в каждом запросе.
+"""
+import hashlib
+import json
+
+from sqlalchemy import bindparam, text
+
+# Колонки для SELECT ... LEFT JOIN property_photos pp ON pp.inner_id = <alias>.inner_id
+PHOTO_COLUMNS_SQL = (
+    "pp.main_image AS photo_main_image, pp.gallery AS photo_gallery, "
+    "pp.floor_plans AS photo_floor_plans, pp.complex_gallery AS photo_complex_gallery"
+)
+
+FLOOR_PLAN_KEYWORDS = ('plan', 'layout', 'scheme', 'планировка')
+
+
+def _clean_urls(values):
+    urls = []
+    seen = set()
+    for value in values or []:
+        if not isinstance(value, str):
+            continue
+        url = value.strip().strip('"').strip()
+        if url and url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def _decode(raw):
+    """Привести значение photos к list/dict независимо от формата хранения"""
+    if raw is None or isinstance(raw, (list, dict)):
+        return raw
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8', 'ignore')
+    raw = str(raw).strip()
+    if not raw:
+        return None
+
+    if raw[0] in '[{':
+        try:
+            return json.loads(raw)
+        except ValueError:
+            pass
+        # PostgreSQL array literal: {url1,url2} или {"url1","url2"}
+        if raw.startswith('{') and raw.endswith('}'):
+            return raw[1:-1].split(',')
+        return None
+    if raw.startswith(('http://', 'https://')) and ',http' in raw:
+        return raw.split(',')  # Ссылки через запятую
+    if raw.startswith(('http://', 'https://', '/')):
+        return [raw]  # Одиночная ссылка
+    return None
+
+
+def normalize_photos(raw):
+    """Разобрать photos в структуру {main_image, gallery, floor_plans, complex_gallery}"""
+    data = _decode(raw)
+
+    if isinstance(data, dict):
+        gallery = _clean_urls(data.get('apartment_gallery') or data.get('photos') or [])
+        floor_plans = _clean_urls(data.get('floor_plans') or [])
+        complex_gallery = _clean_urls(data.get('complex_gallery') or [])
+    else:
+        gallery = _clean_urls(data if isinstance(data, list) else [])
+        floor_plans = [url for url in gallery if any(keyword in url.lower() for keyword in FLOOR_PLAN_KEYWORDS)]
+        complex_gallery = []
+
+    main_image = (gallery or complex_gallery or floor_plans or [None])[0]
+    return {
+        'main_image': main_image,
+        'gallery': gallery,
+        'floor_plans': floor_plans,
+        'complex_gallery': complex_gallery,
+    }
+
+
+def _json_list(value):
+    """JSON колонка: в PostgreSQL драйвер отдает list, в SQLite — строку"""
+    if isinstance(value, list):
+        return value
+    if not value:
+        return []
+    try:
+        decoded = json.loads(value)
+    except (TypeError, ValueError):
+        return []
+    return decoded if isinstance(decoded, list) else []
+
+
+def photo_set(row, raw_key='photos'):
+    """Фото объекта из строки запроса.
+
+    Если запрос выбрал PHOTO_COLUMNS_SQL и объект уже нормализован — берем готовые
+    массивы, иначе (объект еще не прошел импорт/бэкфилл) разбираем сырое photos.
+    """
+    if row.get('photo_gallery') is not None:
+        return {
+            'main_image': row.get('photo_main_image'),
+            'gallery': _json_list(row.get('photo_gallery')),
+            'floor_plans': _json_list(row.get('photo_floor_plans')),
+            'complex_gallery': _json_list(row.get('photo_complex_gallery')),
+        }
+    return normalize_photos(row.get(raw_key))
+
+
+def photos_hash(raw):
+    return hashlib.md5(('' if raw is None else str(raw)).encode('utf-8')).hexdigest()
+
+
+def sync_property_photos(session, rows, chunk_size=1000):
+    """Записать нормализованные фото для пар (inner_id, photos).
+
+    Объекты с неизменившимся photos (по md5 исходной строки) пропускаются.
+    Возвращает количество вставленных/обновленных записей.
+    """
+    from models import PropertyPhotos
+
+    rows = [(int(inner_id), raw) for inner_id, raw in rows if inner_id is not None]
+    changed = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        existing = dict(session.execute(
+            text("SELECT inner_id, source_hash FROM property_photos WHERE inner_id IN :ids")
+            .bindparams(bindparam('ids', expanding=True)),
+            {'ids': [inner_id for inner_id, _ in chunk]}
+        ).fetchall())
+
+        inserts, updates = [], []
+        for inner_id, raw in chunk:
+            source_hash = photos_hash(raw)
+            if existing.get(inner_id) == source_hash:
+                continue
+            mapping = {'inner_id': inner_id, 'source_hash': source_hash, **normalize_photos(raw)}
+            (updates if inner_id in existing else inserts).append(mapping)
+
+        if inserts:
+            session.bulk_insert_mappings(PropertyPhotos, inserts)
+        if updates:
+            session.bulk_update_mappings(PropertyPhotos, updates)
+        changed += len(inserts) + len(updates)
+    return changed
+
+
+def backfill_property_photos(session, batch_size=2000):
+    """Нормализовать фото всех объектов excel_properties (после импорта/восстановления)"""
+    total = 0
+    last_id = None
+    while True:
+        params = {'limit': batch_size}
+        where = ''
+        if last_id is not None:
+            where = 'WHERE inner_id > :last_id'
+            params['last_id'] = last_id
+        batch = session.execute(text(f"""
+            SELECT inner_id, photos FROM excel_properties
+            {where}
+            ORDER BY inner_id
+            LIMIT :limit
+        """), params).fetchall()
+        if not batch:
+            break
+
+        total += sync_property_photos(session, [(row[0], row[1]) for row in batch])
+        session.commit()
+        last_id = batch[-1][0]
+
+    # Удаляем фото объектов, которых больше нет в excel_properties
+    session.execute(text("""
+        DELETE FROM property_photos
+        WHERE NOT EXISTS (SELECT 1 FROM excel_properties ep WHERE ep.inner_id = property_photos.inner_id)
+    """))
+    session.commit()
+    return total
@@ -9,6 +9,7 @@ import os
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from web_scraper import KrasnodarDeveloperScraper
+import crawl_store
 
 # Database integration
 try:
@@ -359,17 +360,33 @@ class Property(db.Model):
         print("🚀 Запуск полного цикла парсинга и интеграции")
         print("="*60)
         
-        # Этап 1: Парсинг
+        # Этап 1: Парсинг (состояние страниц и проектов сохраняется в crawl_pages/crawl_entities)
         print("📡 Этап 1: Парсинг сайтов застройщиков...")
-        scraped_data = self.scraper.scrape_all_developers()
-        
-        # Этап 2: Сохранение в JSON (резервная копия)
-        print("\n💾 Этап 2: Сохранение резервной копии...")
-        json_file = self.scraper.save_to_json(scraped_data)
+        pending_ids = []
+        if app:
+            with app.app_context():
+                scraped_data = self.scraper.scrape_all_developers()
+                
+                # Этап 2: Изменения с прошлого импорта — новые и изменившиеся проекты
+                print("\n🔍 Этап 2: Отбор изменений...")
+                pending = crawl_store.pending_changes(db.session, 'developer_sites', 'project')
+                changes = {}
+                for entity in pending:
+                    changes.setdefault(entity.data.get('developer_code'), []).append(entity.data)
+                pending_ids = [entity.id for entity in pending]
+                print(f"Проектов к импорту: {len(pending_ids)}")
+        else:
+            scraped_data = self.scraper.scrape_all_developers()
+            changes = scraped_data
         
         # Этап 3: Интеграция с базой данных
         print("\n🔗 Этап 3: Интеграция с базой данных...")
-        integration_stats = self.integrate_scraped_data(scraped_data)
+        integration_stats = self.integrate_scraped_data(changes)
+        
+        if pending_ids:
+            with app.app_context():
+                crawl_store.mark_imported(db.session, pending_ids)
+                db.session.commit()
         
         # Итоговая статистика
         print("\n" + "="*60)
@@ -380,13 +397,10 @@ class Property(db.Model):
         print(f"✅ Квартир добавлено: {integration_stats['apartments_created']}")
         print(f"❌ Ошибок: {integration_stats['errors']}")
         
-        if json_file:
-            print(f"💾 Резервная копия: {json_file}")
-        
         result = {
             'scraped_data': scraped_data,
             'integration_stats': integration_stats,
-            'json_backup': json_file,
+            'imported_changes': {dev_code: len(projects) for dev_code, projects in changes.items()},
             'timestamp': datetime.now().isoformat()
         }
         
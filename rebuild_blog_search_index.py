@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Rebuild blog full-text search index (blog_search_documents, blog_search_terms)
+from published BlogPost and BlogArticle
+
+Запускать один раз после деплоя, а также после массового импорта или
+правки статей в обход ORM.
+"""
+
+from app import app, db
+from blog_search import rebuild_blog_search_index
+
+
+def rebuild_index():
+    """Пересобрать поисковый индекс блога"""
+
+    with app.app_context():
+        try:
+            print("Rebuilding blog search index...")
+            counts = rebuild_blog_search_index(db.session)
+            print(f"  blog_posts: {counts['post']}")
+            print(f"  blog_articles: {counts['article']}")
+            print(f"  terms: {counts['terms']}")
+            print("✅ Blog search index rebuilt")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error rebuilding blog search index: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    rebuild_index()
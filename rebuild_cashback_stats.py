@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Rebuild cashback_stats (cashback applications by month and status)
+
+Запускать один раз после деплоя и после восстановления базы из бэкапа
+или других записей в cashback_applications в обход ORM.
+"""
+
+from app import app, db
+from cashback_analytics import rebuild_cashback_stats
+
+
+def rebuild_stats():
+    """Пересчитать агрегаты кешбека для админки"""
+
+    with app.app_context():
+        try:
+            print("Rebuilding cashback stats...")
+            buckets = rebuild_cashback_stats(db.session)
+            print(f"✅ Cashback stats rebuilt: {buckets} month/status buckets")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error rebuilding cashback stats: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    rebuild_stats()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Rebuild complex_pages from excel_properties and residential_complexes
+
+Запускать один раз после деплоя, а также после изменения residential_complexes
+или загрузки объектов в обход импорта и админки.
+"""
+
+from app import app, db, refresh_complex_page_cache
+
+
+def rebuild_complex_pages():
+    """Заново собрать страницы всех ЖК и сбросить индекс"""
+
+    with app.app_context():
+        try:
+            print("Building complex pages...")
+            pages = refresh_complex_page_cache()
+            print(f"  complex pages: {pages}")
+            print("✅ Complex pages rebuilt")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error rebuilding complex pages: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    rebuild_complex_pages()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Rebuild developer_profiles from developers, excel_properties and residential_complexes
+
+Запускать один раз после деплоя, а также после загрузки объектов или
+застройщиков в обход импорта и парсера.
+"""
+
+from app import app, db, developer_slug
+from developer_profiles import refresh_developer_profiles
+
+
+def rebuild_developer_profiles():
+    """Заново собрать профили всех застройщиков"""
+
+    with app.app_context():
+        try:
+            print("Building developer profiles...")
+            profiles = refresh_developer_profiles(db.session, developer_slug)
+            db.session.commit()
+            print(f"  developer profiles: {profiles}")
+            print("✅ Developer profiles rebuilt")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error rebuilding developer profiles: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    rebuild_developer_profiles()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Rebuild property_districts and district_stats from excel_properties and districts
+
+Запускать один раз после деплоя, а также после изменения районов, их границ
+(static/data/districts) или инфраструктуры и после загрузки объектов в обход
+импорта.
+"""
+
+from app import app, db
+from district_stats import assign_districts, refresh_district_stats
+
+
+def rebuild_district_stats():
+    """Заново определить районы всех объектов и пересчитать сводку районов"""
+
+    with app.app_context():
+        try:
+            print("Assigning districts to properties...")
+            resolved = assign_districts(db.session, full=True)
+            print(f"  properties with district: {resolved}")
+            districts = refresh_district_stats(db.session)
+            db.session.commit()
+            print(f"  districts refreshed: {districts}")
+            print("✅ District stats rebuilt")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error rebuilding district stats: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    rebuild_district_stats()
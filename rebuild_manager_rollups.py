@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Rebuild manager dashboard rollups (manager_stats, manager_daily_stats,
+manager_client_stats, manager_activity) from source tables
+
+Запускать один раз после деплоя, а также после массового импорта/удаления
+рекомендаций, уведомлений, подборок или сделок в обход ORM.
+"""
+
+from app import app, db
+from manager_rollups import rebuild_manager_rollups
+
+
+def rebuild_rollups():
+    """Пересчитать статистику и ленту активности всех менеджеров"""
+
+    with app.app_context():
+        try:
+            print("Rebuilding manager rollups...")
+            totals = rebuild_manager_rollups(db.session)
+            for name, value in totals.items():
+                print(f"  {name}: {value}")
+            print("✅ Manager rollups rebuilt")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error rebuilding manager rollups: {e}")
+            import traceback
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    rebuild_rollups()
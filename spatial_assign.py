@@ -0,0 +1,237 @@
+"""
+Пространственная привязка объектов к районам и улицам
+
+Район объекта определялся строками: parse_address_components резал
+address_display_name, fix_district_data.py и mass_districts_update.py
+правили районы задним числом, а get_district_boundaries_osm скачивал
+полигоны по одному. Здесь один векторный проход по координатам объектов:
+
+- полигоны районов (static/data/districts/<slug>.json) загружаются один раз
+  и кладутся в упакованное R-дерево (STRtree, Sort-Tile-Recursive) по
+  ограничивающим прямоугольникам;
+- точки объектов группируются по клеткам сетки TILE_DEGREES; для клетки
+  дерево отдает полигоны, пересекающие ее, и точка-в-полигоне считается
+  numpy сразу для всех точек клетки (лучевой алгоритм, цикл по ребрам,
+  вектор по точкам); меньшие полигоны проверяются первыми, чтобы микрорайон
+  внутри округа побеждал округ;
+- ближайшая улица (streets с координатами) — argmin расстояний по пачкам
+  точек в локальной равнопромежуточной проекции, не дальше
+  STREET_MAX_DISTANCE_M.
+
+Shapely не используется — зависимостью проекта является только numpy.
+"""
+import glob
+import json
+import math
+import os
+
+import numpy as np
+
+BOUNDARIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'data', 'districts')
+NODE_CAPACITY = 8
+TILE_DEGREES = 0.02
+STREET_MAX_DISTANCE_M = 400
+# Ограничение на размер матрицы расстояний точки x улицы в одной пачке
+DISTANCE_MATRIX_CELLS = 2000000
+EARTH_RADIUS_M = 6371000.0
+
+
+def load_boundaries(directory=BOUNDARIES_DIR):
+    """{slug: [(bbox, exterior, holes)]} из GeoJSON Feature/Polygon/MultiPolygon"""
+    boundaries = {}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        geometry = data.get('geometry', data) if isinstance(data, dict) else {}
+        if geometry.get('type') == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            continue
+        slug = os.path.splitext(os.path.basename(path))[0]
+        boundaries[slug] = []
+        for rings in polygons:
+            exterior = [(float(lon), float(lat)) for lon, lat, *_ in rings[0]]
+            holes = [[(float(lon), float(lat)) for lon, lat, *_ in ring] for ring in rings[1:]]
+            lons = [lon for lon, _ in exterior]
+            lats = [lat for _, lat in exterior]
+            boundaries[slug].append(((min(lons), min(lats), max(lons), max(lats)), exterior, holes))
+    return boundaries
+
+
+def _union(boxes):
+    boxes = list(boxes)
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class STRtree:
+    """Упакованное R-дерево над прямоугольниками (min_x, min_y, max_x, max_y)"""
+
+    def __init__(self, items):
+        # Узел: (bbox, дочерние узлы или None, значение листа)
+        level = [(bbox, None, value) for bbox, value in items]
+        while len(level) > 1:
+            level = [(_union(node[0] for node in group), group, None) for group in self._pack(level)]
+        self.root = level[0] if level else None
+
+    @staticmethod
+    def _pack(nodes):
+        """Sort-Tile-Recursive: вертикальные полосы по x, внутри — группы по y"""
+        leaves = math.ceil(len(nodes) / NODE_CAPACITY)
+        per_slice = math.ceil(math.sqrt(leaves)) * NODE_CAPACITY
+        nodes = sorted(nodes, key=lambda node: node[0][0] + node[0][2])
+        groups = []
+        for start in range(0, len(nodes), per_slice):
+            column = sorted(nodes[start:start + per_slice], key=lambda node: node[0][1] + node[0][3])
+            groups.extend(column[index:index + NODE_CAPACITY] for index in range(0, len(column), NODE_CAPACITY))
+        return groups
+
+    def query(self, bbox):
+        """Значения, чьи прямоугольники пересекают bbox"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_bbox, children, value = stack.pop()
+            if not _intersects(node_bbox, bbox):
+                continue
+            if children is None:
+                found.append(value)
+            else:
+                stack.extend(children)
+        return found
+
+
+def points_in_ring(lons, lats, ring):
+    """Маска точек внутри кольца: четность пересечений луча вправо, вектор по точкам"""
+    inside = np.zeros(len(lons), dtype=bool)
+    xj, yj = ring[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for xi, yi in ring:
+            crosses = (yi > lats) != (yj > lats)
+            x_at = (xj - xi) * (lats - yi) / (yj - yi) + xi
+            inside ^= crosses & (lons < x_at)
+            xj, yj = xi, yi
+    return inside
+
+
+class _Polygon:
+    def __init__(self, district_id, bbox, exterior, holes):
+        self.district_id = district_id
+        self.bbox = bbox
+        self.exterior = exterior
+        self.holes = holes
+        self.area = abs(sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(exterior, exterior[1:] + exterior[:1]))) / 2
+
+    def contains(self, lons, lats):
+        mask = points_in_ring(lons, lats, self.exterior)
+        for hole in self.holes:
+            if mask.any():
+                mask &= ~points_in_ring(lons, lats, hole)
+        return mask
+
+
+class DistrictPolygons:
+    """Полигоны районов в STRtree; districts() — id района для массива точек"""
+
+    def __init__(self, boundaries, district_ids_by_slug):
+        polygons = [
+            _Polygon(district_ids_by_slug[slug], bbox, exterior, holes)
+            for slug, items in boundaries.items() if slug in district_ids_by_slug
+            for bbox, exterior, holes in items
+        ]
+        self.tree = STRtree([(polygon.bbox, polygon) for polygon in polygons])
+
+    def districts(self, lats, lons):
+        """-> массив id районов (-1 — точка вне полигонов или без координат)"""
+        result = np.full(len(lats), -1, dtype=np.int64)
+        valid = np.nonzero(~(np.isnan(lats) | np.isnan(lons)))[0]
+        if not len(valid) or self.tree.root is None:
+            return result
+
+        tiles = np.stack([np.floor(lons[valid] / TILE_DEGREES), np.floor(lats[valid] / TILE_DEGREES)], axis=1)
+        keys, inverse, counts = np.unique(tiles, axis=0, return_inverse=True, return_counts=True)
+        order = valid[np.argsort(inverse.ravel(), kind='stable')]
+        start = 0
+        for (tile_x, tile_y), count in zip(keys, counts):
+            points = order[start:start + count]
+            start += count
+            bbox = (tile_x * TILE_DEGREES, tile_y * TILE_DEGREES,
+                    (tile_x + 1) * TILE_DEGREES, (tile_y + 1) * TILE_DEGREES)
+            for polygon in sorted(self.tree.query(bbox), key=lambda item: item.area):
+                points = points[result[points] == -1]
+                if not len(points):
+                    break
+                inside = polygon.contains(lons[points], lats[points])
+                result[points[inside]] = polygon.district_id
+        return result
+
+
+class StreetIndex:
+    """Ближайшая улица по координатам"""
+
+    def __init__(self, streets):
+        streets = [street for street in streets if street.latitude is not None and street.longitude is not None]
+        self.ids = np.array([street.id for street in streets], dtype=np.int64)
+        self.district_ids = np.array([street.district_id or -1 for street in streets], dtype=np.int64)
+        lats = np.array([street.latitude for street in streets], dtype=float)
+        lons = np.array([street.longitude for street in streets], dtype=float)
+        self.cos_lat = math.cos(math.radians(float(lats.mean()))) if len(lats) else 1.0
+        self.x, self.y = self._project(lats, lons)
+
+    def _project(self, lats, lons):
+        scale = math.pi / 180 * EARTH_RADIUS_M
+        return lons * scale * self.cos_lat, lats * scale
+
+    def nearest(self, lats, lons, max_distance=STREET_MAX_DISTANCE_M):
+        """-> (индексы улиц в self.ids или -1, расстояния в метрах)"""
+        count = len(lats)
+        indexes = np.full(count, -1, dtype=np.int64)
+        distances = np.full(count, np.nan)
+        valid = np.nonzero(~(np.isnan(lats) | np.isnan(lons)))[0]
+        if not len(valid) or not len(self.ids):
+            return indexes, distances
+
+        x, y = self._project(lats[valid], lons[valid])
+        chunk = max(1, DISTANCE_MATRIX_CELLS // len(self.ids))
+        for start in range(0, len(valid), chunk):
+            dx = x[start:start + chunk, None] - self.x[None, :]
+            dy = y[start:start + chunk, None] - self.y[None, :]
+            squared = dx * dx + dy * dy
+            best = squared.argmin(axis=1)
+            best_distance = np.sqrt(squared[np.arange(len(best)), best])
+            points = valid[start:start + chunk]
+            close = best_distance <= max_distance
+            indexes[points[close]] = best[close]
+            distances[points[close]] = best_distance[close]
+        return indexes, distances
+
+
+class SpatialAssigner:
+    """Район (по полигону) и ближайшая улица для массива объектов за один проход"""
+
+    def __init__(self, districts, streets, boundaries=None):
+        slugs = {district.slug: district.id for district in districts}
+        self.polygons = DistrictPolygons(load_boundaries() if boundaries is None else boundaries, slugs)
+        self.streets = StreetIndex(streets)
+
+    def assign(self, lats, lons):
+        """-> (id района по полигону, id улицы, id района улицы, расстояние до улицы) — массивы, -1/NaN — нет"""
+        lats = np.asarray([np.nan if value is None else float(value) for value in lats], dtype=float)
+        lons = np.asarray([np.nan if value is None else float(value) for value in lons], dtype=float)
+        district_ids = self.polygons.districts(lats, lons)
+        indexes, distances = self.streets.nearest(lats, lons)
+        found = indexes >= 0
+        street_ids = np.full(len(lats), -1, dtype=np.int64)
+        street_districts = np.full(len(lats), -1, dtype=np.int64)
+        street_ids[found] = self.streets.ids[indexes[found]]
+        street_districts[found] = self.streets.district_ids[indexes[found]]
+        return district_ids, street_ids, street_districts, distances
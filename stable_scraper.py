@@ -10,8 +10,15 @@ import time
 from typing import List, Dict
 from botasaurus import *
 
+import crawl_store
+
 logger = logging.getLogger(__name__)
 
+def _developer_key(developer: Dict) -> str:
+    """Ключ застройщика в crawl_entities: источник + нормализованное название"""
+    name_clean = re.sub(r'\s+', ' ', developer['name'].strip().lower())
+    return f"{developer.get('url', '')}|{name_clean}"
+
 @browser(
     headless=True,
     block_images=True,
@@ -31,7 +38,14 @@ def scrape_developers_multiple_sources(driver, data):
     
     all_developers = []
     
-    for url in sources:
+    # Источники, загруженные недавно, берем из crawl_entities без браузера
+    store = crawl_store.for_source('stable_scraper')
+    to_fetch, reused = store.plan(sources) if store else (sources, {})
+    for url, developers in reused.items():
+        logger.info(f"♻️ {url}: {len(developers)} застройщиков из прошлого прогона")
+        all_developers.extend(developers)
+    
+    for url in to_fetch:
         try:
             logger.info(f"🌐 Пробуем источник: {url}")
             
@@ -81,11 +95,20 @@ def scrape_developers_multiple_sources(driver, data):
                 all_developers.extend(developers)
             else:
                 logger.warning(f"❌ Не найдено застройщиков на {url}")
+            
+            if store:
+                store.record_page(url, html, kind='listing')
+                store.record_entities('developer', developers, key=_developer_key, group_key=url)
                 
         except Exception as e:
             logger.error(f"Ошибка при парсинге {url}: {e}")
+            if store:
+                store.record_page(url, kind='listing', status_code=None, error=str(e))
             continue
     
+    if store:
+        store.commit()
+    
     # Убираем дубликаты по названию
     unique_developers = []
     seen_names = set()
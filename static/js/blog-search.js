@@ -307,8 +307,8 @@
                         </a>
                     </h3>
                     
-                    ${article.excerpt ? `
-                        <p class="text-gray-600 text-sm mb-4 line-clamp-3">${article.excerpt}</p>
+                    ${article.snippet || article.excerpt ? `
+                        <p class="text-gray-600 text-sm mb-4 line-clamp-3">${article.snippet || article.excerpt}</p>
                     ` : ''}
                     
                     <div class="flex items-center justify-between text-sm text-gray-500">
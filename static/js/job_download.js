@@ -0,0 +1,67 @@
+// Скачивание файлов, которые собирает фоновая задача (PDF/ZIP презентаций).
+// Запрос с Accept: application/json получает 202 с адресами задачи: ждем
+// завершения по SSE и скачиваем готовый файл. Уже готовый файл приходит сразу.
+
+function waitForJob(eventsUrl, onProgress) {
+    return new Promise((resolve, reject) => {
+        const eventSource = new EventSource(eventsUrl);
+        eventSource.onmessage = function(event) {
+            const data = JSON.parse(event.data);
+            if (onProgress) {
+                onProgress(data);
+            }
+            if (data.stage === 'complete') {
+                eventSource.close();
+                resolve(data);
+            } else if (data.stage === 'error' || data.error) {
+                eventSource.close();
+                reject(new Error(data.error || data.message || 'Ошибка при создании файла'));
+            }
+        };
+        eventSource.onerror = function() {
+            eventSource.close();
+            reject(new Error('Соединение с сервером потеряно'));
+        };
+    });
+}
+
+function triggerDownload(url, filename) {
+    const link = document.createElement('a');
+    link.href = url;
+    if (filename) {
+        link.download = filename;
+    }
+    link.style.display = 'none';
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+}
+
+async function downloadJobFile(url, filename, onProgress) {
+    const response = await fetch(url, {
+        headers: {'Accept': 'application/json', 'X-Requested-With': 'XMLHttpRequest'},
+        credentials: 'same-origin'
+    });
+
+    if (response.status === 202) {
+        const job = await response.json();
+        const result = await waitForJob(job.events_url, onProgress);
+        triggerDownload(result.download_url || job.download_url, filename);
+        return;
+    }
+
+    const contentType = response.headers.get('content-type') || '';
+    if (!response.ok || contentType.includes('application/json')) {
+        let message = `Ошибка ${response.status}`;
+        try {
+            const data = await response.json();
+            message = data.error || message;
+        } catch (e) {}
+        throw new Error(message);
+    }
+
+    // Файл уже был готов и пришел в ответе
+    const blobUrl = URL.createObjectURL(await response.blob());
+    triggerDownload(blobUrl, filename);
+    setTimeout(() => URL.revokeObjectURL(blobUrl), 60000);
+}
@@ -1046,6 +1046,26 @@ function handleSendClientForm() {
     generateComparisonPDF(pdfData);
 }
 
+function waitForPdfJob(eventsUrl) {
+    return new Promise((resolve, reject) => {
+        const eventSource = new EventSource(eventsUrl);
+        eventSource.onmessage = function(event) {
+            const data = JSON.parse(event.data);
+            if (data.stage === 'complete') {
+                eventSource.close();
+                resolve(data);
+            } else if (data.stage === 'error' || data.error) {
+                eventSource.close();
+                reject(new Error(data.error || data.message || 'PDF generation failed'));
+            }
+        };
+        eventSource.onerror = function() {
+            eventSource.close();
+            reject(new Error('Connection to server lost'));
+        };
+    });
+}
+
 async function generateComparisonPDF(pdfData) {
     try {
         console.log('📤 Sending PDF generation request to backend...');
@@ -1054,13 +1074,27 @@ async function generateComparisonPDF(pdfData) {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
-                'Accept': 'text/html, application/pdf'
+                'Accept': 'application/json'
             },
             credentials: 'same-origin',
             body: JSON.stringify(pdfData)
         });
         
-        if (response.ok) {
+        if (response.status === 202) {
+            // PDF is generated by a background job: follow its progress, then download the file
+            const job = await response.json();
+            await waitForPdfJob(job.events_url);
+            
+            const link = document.createElement('a');
+            link.href = job.download_url;
+            document.body.appendChild(link);
+            link.click();
+            document.body.removeChild(link);
+            
+            closeSendClientModal();
+            console.log('✅ PDF generated and downloaded successfully');
+            alert('PDF uspeshno sozdan i skachan!');
+        } else if (response.ok) {
             // Handle HTML/PDF response (new HTML approach)
             const contentType = response.headers.get('content-type') || '';
             if (contentType.includes('text/html')) {
@@ -0,0 +1,141 @@
+/**
+ * Property Filter Facet Counts
+ * Live "(124)" counters next to /properties filter options from /api/properties/facets
+ */
+
+(function() {
+    'use strict';
+
+    // data-filter-type -> параметр запроса (как у property_filters_from_args)
+    const FACET_PARAMS = {
+        rooms: 'rooms',
+        developer: 'developers',
+        district: 'districts',
+        completion: 'completion',
+        building_type: 'building_types',
+        object_class: 'object_classes',
+        renovation: 'renovation',
+        features: 'features'
+    };
+    const RANGE_INPUTS = {
+        priceFrom: 'price_min',
+        priceTo: 'price_max',
+        areaFrom: 'area_min',
+        areaTo: 'area_max',
+        floorFrom: 'floor_min',
+        floorTo: 'floor_max'
+    };
+    // Фасеты, где вариант совпадает со значениями по подстроке (как фильтр на сервере)
+    const SUBSTRING_FACETS = ['developer', 'district', 'object_class', 'renovation'];
+
+    let refreshTimeout;
+    let controller;
+
+    function facetQuery() {
+        // Поиск, ЖК и регион берем из адреса страницы, фасеты и диапазоны — из формы
+        const params = new URLSearchParams(window.location.search);
+        Object.values(FACET_PARAMS).concat(Object.values(RANGE_INPUTS), ['rooms', 'price_from', 'price_to',
+            'area_from', 'area_to', 'floor_from', 'floor_to', 'page', 'sort']).forEach(name => params.delete(name));
+
+        document.querySelectorAll('input[data-filter-type]:checked').forEach(input => {
+            const param = FACET_PARAMS[input.dataset.filterType];
+            if (param && !params.getAll(param).includes(input.value)) {
+                params.append(param, input.value);
+            }
+        });
+        Object.entries(RANGE_INPUTS).forEach(([id, param]) => {
+            const input = document.getElementById(id);
+            if (input && input.value.trim()) {
+                params.set(param, input.value.trim());
+            }
+        });
+        return params.toString();
+    }
+
+    function optionCount(options, facet, value) {
+        const needle = value.toLowerCase();
+        const matches = SUBSTRING_FACETS.includes(facet)
+            ? options.filter(option => option.value.toLowerCase().includes(needle))
+            : options.filter(option => option.value === value);
+        if (!matches.length) {
+            return null;
+        }
+        return matches.reduce((sum, option) => sum + option.count, 0);
+    }
+
+    function renderFacets(data) {
+        if (!data || !data.facets) {
+            return;
+        }
+        document.querySelectorAll('input[data-filter-type]').forEach(input => {
+            const facet = input.dataset.filterType;
+            const options = data.facets[facet];
+            const label = input.closest('label');
+            if (!options || !label) {
+                return;
+            }
+            const count = optionCount(options, facet, input.value);
+            let badge = label.querySelector('.facet-count');
+            if (count === null) {
+                // Значения нет в снимке (например, "Сдан") — счетчик не показываем
+                if (badge) badge.remove();
+                return;
+            }
+            if (!badge) {
+                badge = document.createElement('span');
+                badge.className = 'facet-count ml-1 text-xs text-gray-400';
+                label.appendChild(badge);
+            }
+            badge.textContent = `(${count})`;
+            label.classList.toggle('opacity-50', count === 0 && !input.checked);
+        });
+    }
+
+    function loadFacets() {
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        fetch('/api/properties/facets?' + facetQuery(), { signal: controller.signal })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    renderFacets(data);
+                }
+            })
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.error('Facet counts error:', error);
+                }
+            });
+    }
+
+    function refreshPropertyFacets() {
+        clearTimeout(refreshTimeout);
+        refreshTimeout = setTimeout(loadFacets, 150);
+    }
+
+    document.addEventListener('change', function(event) {
+        const target = event.target;
+        if (target.matches('input[data-filter-type]') || RANGE_INPUTS[target.id]) {
+            refreshPropertyFacets();
+        }
+    });
+
+    document.addEventListener('DOMContentLoaded', function() {
+        // Первые счетчики пришли со страницей — запрос не нужен
+        renderFacets(window.initialPropertyFacets);
+
+        // Снятие фильтра крестиком меняет чекбоксы без события change
+        const displayActiveFilters = window.displayActiveFilters;
+        if (typeof displayActiveFilters === 'function') {
+            window.displayActiveFilters = function() {
+                const result = displayActiveFilters.apply(this, arguments);
+                refreshPropertyFacets();
+                return result;
+            };
+        }
+    });
+
+    window.refreshPropertyFacets = refreshPropertyFacets;
+})();
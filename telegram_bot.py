@@ -5,8 +5,12 @@ Telegram Bot для интеграции с InBack
 
 import os
 import asyncio
+import gc
 import logging
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 # Try importing telegram modules with error handling
 try:
@@ -28,6 +32,12 @@ from models import User
 # Конфигурация
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')  # URL для webhook
+# Сколько обновлений обрабатывается одновременно и сколько потоков ходят в БД
+TELEGRAM_CONCURRENT_UPDATES = int(os.environ.get('TELEGRAM_CONCURRENT_UPDATES', 64))
+TELEGRAM_DB_WORKERS = int(os.environ.get('TELEGRAM_DB_WORKERS', 8))
+
+NOT_LINKED_MESSAGE = ("❌ Аккаунт не привязан.\n\n"
+                      "Используйте /link для привязки аккаунта.")
 
 # Логирование
 logging.basicConfig(
@@ -82,8 +92,63 @@ def send_recommendation_notification(user_telegram_id, recommendation_data):
     
     return send_telegram_message(user_telegram_id, message)
 
+# Синхронные запросы SQLAlchemy выполняются в ограниченном пуле потоков, а не в
+# event loop: медленная команда одного чата не задерживает ответы остальным
+_db_executor = None
+
+def _warm_up_db_worker(barrier):
+    # Барьер держит задачу, пока не стартуют все потоки — каждая попадает в свой поток
+    barrier.wait()
+    with app.app_context():
+        try:
+            # Первый запрос настраивает мапперы и компилирует SQL — пусть это будет до приема обновлений
+            User.query.filter_by(telegram_id='').first()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Прогрев потока БД не удался: {e}")
+
+def _get_db_executor():
+    """Пул потоков БД; при создании все потоки запускаются и прогреваются.
+
+    ThreadPoolExecutor создает потоки лениво в submit(), а Thread.start()
+    ждет, пока новый поток запустится. Новые потоки сразу занимают GIL
+    холодным app context и первым запросом. Если пул создается из event loop,
+    первые команды задерживают его на ~20 мс на каждый поток. Поэтому пул
+    создается заранее, в InBackBot().
+
+    Там же, один раз, долгоживущие объекты приложения (модули, мапперы, кэши)
+    переводятся в постоянное поколение GC. Иначе полная сборка на всплеске
+    обновлений обходит их все (~100 мс) прямо в event loop.
+    """
+    global _db_executor
+    if _db_executor is None:
+        executor = ThreadPoolExecutor(max_workers=TELEGRAM_DB_WORKERS, thread_name_prefix='telegram-db')
+        barrier = threading.Barrier(TELEGRAM_DB_WORKERS)
+        for future in [executor.submit(_warm_up_db_worker, barrier) for _ in range(TELEGRAM_DB_WORKERS)]:
+            future.result()
+        gc.freeze()
+        _db_executor = executor
+    return _db_executor
+
+def _call_in_app_context(func, *args):
+    # Свой app context на вызов: сессия SQLAlchemy закрывается вместе с ним
+    with app.app_context():
+        try:
+            return func(*args)
+        except Exception:
+            db.session.rollback()
+            raise
+
+async def run_db(func, *args):
+    """Выполнить func(*args) в пуле потоков БД внутри app context"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_db_executor(), partial(_call_in_app_context, func, *args))
+
 class InBackBot:
     def __init__(self):
+        # Пул БД запускается до event loop, а не при первой команде
+        _get_db_executor()
+        
         if not TELEGRAM_BOT_TOKEN:
             logger.error("TELEGRAM_BOT_TOKEN не установлен")
             return
@@ -92,7 +157,9 @@ class InBackBot:
             logger.error("Telegram library not available")
             return
         
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        # Обновления разных чатов обрабатываются параллельно (по умолчанию — строго по одному)
+        self.application = (Application.builder().token(TELEGRAM_BOT_TOKEN)
+                            .concurrent_updates(TELEGRAM_CONCURRENT_UPDATES).build())
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -193,31 +260,27 @@ class InBackBot:
             )
             return
         
-        with app.app_context():
-            # Ищем пользователя по email
-            user = User.query.filter_by(email=email).first()
-            
-            if not user:
-                await update.message.reply_text(
-                    f"❌ Аккаунт с email {email} не найден.\n\n"
-                    "Зарегистрируйтесь на сайте InBack.ru и повторите попытку."
-                )
-                return
-            
-            # Проверяем, не привязан ли уже другой Telegram
-            if user.telegram_id and user.telegram_id != str(chat_id):
-                await update.message.reply_text(
-                    "❌ Этот аккаунт уже привязан к другому Telegram.\n\n"
-                    "Для смены привязки обратитесь в поддержку."
-                )
-                return
-            
-            # Привязываем аккаунт
-            user.telegram_id = str(chat_id)
-            user.telegram_notifications = True
-            db.session.commit()
-            
-            success_message = f"""
+        await self.reply(update, await run_db(self._link_account, chat_id, email))
+    
+    def _link_account(self, chat_id, email):
+        # Ищем пользователя по email
+        user = User.query.filter_by(email=email).first()
+        
+        if not user:
+            return (f"❌ Аккаунт с email {email} не найден.\n\n"
+                    "Зарегистрируйтесь на сайте InBack.ru и повторите попытку.")
+        
+        # Проверяем, не привязан ли уже другой Telegram
+        if user.telegram_id and user.telegram_id != str(chat_id):
+            return ("❌ Этот аккаунт уже привязан к другому Telegram.\n\n"
+                    "Для смены привязки обратитесь в поддержку.")
+        
+        # Привязываем аккаунт
+        user.telegram_id = str(chat_id)
+        user.telegram_notifications = True
+        db.session.commit()
+        
+        success_message = f"""
 ✅ <b>Аккаунт успешно привязан!</b>
 
 👤 <b>Профиль:</b> {user.full_name}
@@ -228,47 +291,37 @@ class InBackBot:
 
 Управляйте настройками: /notifications
             """
-            
-            await update.message.reply_text(success_message, parse_mode='HTML')
+        return success_message, 'HTML'
     
     async def unlink_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /unlink для отвязки аккаунта"""
-        chat_id = update.effective_chat.id
+        await self.reply(update, await run_db(self._unlink_account, update.effective_chat.id))
+    
+    def _unlink_account(self, chat_id):
+        user = User.query.filter_by(telegram_id=str(chat_id)).first()
         
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=str(chat_id)).first()
-            
-            if not user:
-                await update.message.reply_text(
-                    "❌ Аккаунт не привязан к этому Telegram.\n\n"
-                    "Используйте /link для привязки аккаунта."
-                )
-                return
-            
-            user.telegram_id = None
-            user.telegram_notifications = False
-            db.session.commit()
-            
-            await update.message.reply_text(
-                "✅ Аккаунт успешно отвязан от Telegram.\n\n"
-                "Уведомления больше не будут приходить в этот чат."
-            )
+        if not user:
+            return ("❌ Аккаунт не привязан к этому Telegram.\n\n"
+                    "Используйте /link для привязки аккаунта.")
+        
+        user.telegram_id = None
+        user.telegram_notifications = False
+        db.session.commit()
+        
+        return ("✅ Аккаунт успешно отвязан от Telegram.\n\n"
+                "Уведомления больше не будут приходить в этот чат.")
     
     async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /profile"""
-        chat_id = update.effective_chat.id
+        await self.reply(update, await run_db(self._profile_message, update.effective_chat.id))
+    
+    def _profile_message(self, chat_id):
+        user = User.query.filter_by(telegram_id=str(chat_id)).first()
         
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=str(chat_id)).first()
-            
-            if not user:
-                await update.message.reply_text(
-                    "❌ Аккаунт не привязан.\n\n"
-                    "Используйте /link для привязки аккаунта."
-                )
-                return
-            
-            profile_message = f"""
+        if not user:
+            return NOT_LINKED_MESSAGE
+        
+        profile_message = f"""
 👤 <b>Ваш профиль InBack</b>
 
 <b>Имя:</b> {user.full_name}
@@ -285,81 +338,64 @@ class InBackBot:
 
 <a href="https://inback.ru/dashboard">Перейти в личный кабинет</a>
             """
-            
-            await update.message.reply_text(profile_message, parse_mode='HTML')
+        return profile_message, 'HTML'
     
     async def favorites_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /favorites"""
-        chat_id = update.effective_chat.id
+        await self.reply(update, await run_db(self._favorites_message, update.effective_chat.id))
+    
+    def _favorites_message(self, chat_id):
+        user = User.query.filter_by(telegram_id=str(chat_id)).first()
         
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=str(chat_id)).first()
-            
-            if not user:
-                await update.message.reply_text(
-                    "❌ Аккаунт не привязан.\n\n"
-                    "Используйте /link для привязки аккаунта."
-                )
-                return
-            
-            if not user.favorites:
-                await update.message.reply_text(
-                    "📭 У вас пока нет избранных объектов.\n\n"
-                    "Добавляйте понравившиеся квартиры в избранное на сайте InBack.ru"
-                )
-                return
-            
-            favorites_message = f"❤️ <b>Ваши избранные объекты ({len(user.favorites)}):</b>\n\n"
-            
-            # Загружаем данные об объектах
-            from app import load_properties
-            properties = load_properties()
-            
-            for i, favorite in enumerate(user.favorites[:5], 1):  # Показываем первые 5
-                # Находим объект по ID
-                property_data = next((p for p in properties if p['id'] == favorite.property_id), None)
-                if property_data:
-                    price = f"{property_data.get('price', 0):,}".replace(',', ' ')
-                    favorites_message += f"{i}. <b>{property_data.get('title', 'Объект')}</b>\n"
-                    favorites_message += f"   💰 {price} ₽\n"
-                    favorites_message += f"   📍 {property_data.get('location', 'Краснодар')}\n\n"
-            
-            if len(user.favorites) > 5:
-                favorites_message += f"... и еще {len(user.favorites) - 5} объектов\n\n"
-            
-            favorites_message += "<a href='https://inback.ru/favorites'>Посмотреть все избранные</a>"
-            
-            await update.message.reply_text(favorites_message, parse_mode='HTML')
+        if not user:
+            return NOT_LINKED_MESSAGE
+        
+        if not user.favorites:
+            return ("📭 У вас пока нет избранных объектов.\n\n"
+                    "Добавляйте понравившиеся квартиры в избранное на сайте InBack.ru")
+        
+        favorites_message = f"❤️ <b>Ваши избранные объекты ({len(user.favorites)}):</b>\n\n"
+        
+        # Объекты по id через индекс над кэшем load_properties() вместо перебора списка
+        from app import get_properties_by_ids
+        shown = user.favorites[:5]  # Показываем первые 5
+        properties = get_properties_by_ids([favorite.property_id for favorite in shown])
+        
+        for i, property_data in enumerate(properties, 1):
+            if property_data:
+                price = f"{property_data.get('price', 0):,}".replace(',', ' ')
+                favorites_message += f"{i}. <b>{property_data.get('title', 'Объект')}</b>\n"
+                favorites_message += f"   💰 {price} ₽\n"
+                favorites_message += f"   📍 {property_data.get('location', 'Краснодар')}\n\n"
+        
+        if len(user.favorites) > 5:
+            favorites_message += f"... и еще {len(user.favorites) - 5} объектов\n\n"
+        
+        favorites_message += "<a href='https://inback.ru/favorites'>Посмотреть все избранные</a>"
+        return favorites_message, 'HTML'
     
     async def notifications_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /notifications"""
-        chat_id = update.effective_chat.id
+        action = context.args[0].lower() if context.args else None
+        await self.reply(update, await run_db(self._notifications_message, update.effective_chat.id, action))
+    
+    def _notifications_message(self, chat_id, action):
+        user = User.query.filter_by(telegram_id=str(chat_id)).first()
         
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=str(chat_id)).first()
-            
-            if not user:
-                await update.message.reply_text(
-                    "❌ Аккаунт не привязан.\n\n"
-                    "Используйте /link для привязки аккаунта."
-                )
-                return
-            
-            if context.args:
-                action = context.args[0].lower()
-                if action == 'on':
-                    user.telegram_notifications = True
-                    db.session.commit()
-                    await update.message.reply_text("✅ Уведомления включены!")
-                    return
-                elif action == 'off':
-                    user.telegram_notifications = False
-                    db.session.commit()
-                    await update.message.reply_text("❌ Уведомления выключены.")
-                    return
-            
-            status = "включены" if user.telegram_notifications else "выключены"
-            message = f"""
+        if not user:
+            return NOT_LINKED_MESSAGE
+        
+        if action == 'on':
+            user.telegram_notifications = True
+            db.session.commit()
+            return "✅ Уведомления включены!"
+        elif action == 'off':
+            user.telegram_notifications = False
+            db.session.commit()
+            return "❌ Уведомления выключены."
+        
+        status = "включены" if user.telegram_notifications else "выключены"
+        message = f"""
 🔔 <b>Настройки уведомлений</b>
 
 <b>Статус:</b> {status}
@@ -374,8 +410,12 @@ class InBackBot:
 • 📅 Назначенных встречах
 • ✅ Обновлениях заявок
             """
-            
-            await update.message.reply_text(message, parse_mode='HTML')
+        return message, 'HTML'
+    
+    async def reply(self, update: Update, reply):
+        """Ответить текстом или парой (текст, parse_mode) из обработчика run_db"""
+        text, parse_mode = reply if isinstance(reply, tuple) else (reply, None)
+        await update.message.reply_text(text, parse_mode=parse_mode)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка текстовых сообщений"""
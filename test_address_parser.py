@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование разбора адресов пачкой (address_parser.py): компоненты адреса,
+мемоизация, создание регионов и городов пачкой и массовое обновление
+excel_properties по уникальным адресам
+"""
+
+from sqlalchemy import text
+
+from address_parser import _parse, parse_address_components, parse_addresses
+from app import app, db, update_parsed_addresses, update_properties_with_regions
+
+ID_BASE = 986000
+REGION = 'Тестовая область'
+ADDRESSES = {
+    'sochi': 'Россия, Краснодарский край, Сочи, Кудепста м-н, Искры, 88 лит7',
+    'krasnodar': 'Россия, Краснодарский край, Краснодар, Прикубанский, улица Ленина, 5',
+    'test': f'Россия, {REGION}, Тестоград, ул. Полевая, 3',
+}
+
+
+def cleanup():
+    db.session.execute(text("DELETE FROM excel_properties WHERE inner_id >= :base AND inner_id < :top"),
+                       {'base': ID_BASE, 'top': ID_BASE + 1000})
+    db.session.execute(text("DELETE FROM cities WHERE region_id IN (SELECT id FROM regions WHERE name = :name)"),
+                       {'name': REGION})
+    db.session.execute(text("DELETE FROM regions WHERE name = :name"), {'name': REGION})
+    db.session.commit()
+
+
+def test_address_parser():
+    """Тестируем разбор адресов"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем разбор адресов...")
+    check("Полный адрес с микрорайоном", parse_address_components(ADDRESSES['sochi']) == {
+        'country': 'Россия', 'region': 'Краснодарский край', 'city': 'Сочи', 'district': 'Кудепста м-н',
+        'street': 'Искры', 'house_number': '88 лит7'})
+    parts = parse_address_components(ADDRESSES['krasnodar'])
+    check("Район без суффикса после города",
+          (parts['city'], parts['district'], parts['street']) == ('Краснодар', 'Прикубанский', 'улица Ленина'))
+    parts = parse_address_components('Россия, Краснодарский край, Краснодар 6, Краснодар, ул. Мира, 12')
+    check("Псевдо-город 'Краснодар 6' пропускается", parts['city'] == 'Краснодар' and parts['district'] is None)
+    check("Пустой адрес", parse_address_components(None) == dict.fromkeys(
+        ('country', 'region', 'city', 'district', 'street', 'house_number')))
+
+    _parse.cache_clear()
+    parsed = parse_addresses([ADDRESSES['sochi']] * 300 + [ADDRESSES['krasnodar']] * 200 + [None, ''])
+    info = _parse.cache_info()
+    check("Уникальные адреса разбираются один раз", len(parsed) == 2 and info.misses == 2)
+    parse_address_components(ADDRESSES['sochi'])
+    check("Повторный разбор берется из кэша", _parse.cache_info().hits == info.hits + 1)
+
+    with app.app_context():
+        cleanup()
+        try:
+            for offset, key in enumerate(['sochi'] * 3 + ['krasnodar'] * 2 + ['test'] * 2):
+                db.session.execute(text("""
+                    INSERT INTO excel_properties (inner_id, address_display_name, parsed_street, region_id)
+                    VALUES (:id, :address, 'старая', NULL)
+                """), {'id': ID_BASE + offset, 'address': ADDRESSES[key]})
+            db.session.commit()
+
+            update_parsed_addresses()
+            rows = db.session.execute(text("""
+                SELECT parsed_country, parsed_city, parsed_district, parsed_street, parsed_house_number
+                FROM excel_properties WHERE inner_id >= :base AND inner_id < :top ORDER BY inner_id
+            """), {'base': ID_BASE, 'top': ID_BASE + 1000}).fetchall()
+            check("Все поля parsed_* записаны по уникальным адресам",
+                  [tuple(row) for row in rows[:3]] == [('Россия', 'Сочи', 'Кудепста м-н', 'Искры', '88 лит7')] * 3
+                  and rows[5][1] == 'Тестоград' and rows[5][3] == 'ул. Полевая')
+
+            update_properties_with_regions()
+            update_properties_with_regions()
+            regions = db.session.execute(text("SELECT id FROM regions WHERE name = :name"), {'name': REGION}).fetchall()
+            cities = db.session.execute(text("SELECT id, region_id FROM cities WHERE name = 'Тестоград'")).fetchall()
+            check("Регион и город созданы один раз", len(regions) == 1 and len(cities) == 1
+                  and cities[0][1] == regions[0][0])
+            linked = db.session.execute(text("""
+                SELECT region_id, city_id FROM excel_properties WHERE inner_id IN (:a, :b)
+            """), {'a': ID_BASE + 5, 'b': ID_BASE + 6}).fetchall()
+            check("Объекты привязаны к региону и городу",
+                  [tuple(row) for row in linked] == [(regions[0][0], cities[0][0])] * 2)
+        finally:
+            cleanup()
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки разбора адресов пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_address_parser()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование кэша GPT-извлечения (ai_extraction_cache.py) без сети и OpenAI:
+попадания по содержимому, инвалидация схемой/моделью, режим replay,
+ограничение параллельности и повторный прогон parse_all_developers
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from ai_extraction_cache import ExtractionCache, run_limited, schema_version, strip_boilerplate
+
+PAGE = """
+<html><head><script>var t = {ts};</script><style>.a {{}}</style></head>
+<body><nav>Меню</nav><h1>ССК</h1><p>Телефон +7 (861) 000-00-00</p>
+<!-- render {ts} --></body></html>
+"""
+
+
+class DeveloperPageHandler(BaseHTTPRequestHandler):
+    """Страница застройщика /dev/<n> со служебной разметкой, меняющейся на каждый запрос"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        name = f"Застройщик {self.path.rsplit('/', 1)[-1]}"
+        body = PAGE.format(ts=time.time()).replace('ССК', name).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeCompletions:
+    """Заглушка chat.completions: считает запросы и одновременные вызовы"""
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        text = kwargs['messages'][-1]['content']
+        content = json.dumps({'name': 'ССК', 'phone': '+7 (861) 000-00-00', 'length': len(text)})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_ai_extraction_cache():
+    """Тестируем кэш извлечения"""
+    failures = 0
+    calls = []
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        failures += 0 if condition else 1
+
+    def request():
+        calls.append(1)
+        return {'name': 'ССК'}
+
+    print("🧪 Тестируем кэш GPT-извлечения...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cache.json')
+        first, second = strip_boilerplate(PAGE.format(ts=1)), strip_boilerplate(PAGE.format(ts=2))
+        check("Скрипты, меню и комментарии не влияют на текст", first == second and 'Меню' not in first)
+
+        version = schema_version({'name': 'string'})
+        cache = ExtractionCache(path, mode='online')
+        cache.extract(first, version, 'gpt-4o', request)
+        result = cache.extract(second, version, 'gpt-4o', request)
+        check("Повтор по неизменившемуся тексту — из кэша", result == {'name': 'ССК'} and len(calls) == 1)
+
+        cache.extract(first, schema_version({'name': 'string', 'phone': 'string'}), 'gpt-4o', request)
+        cache.extract(first, version, 'gpt-4o-mini', request)
+        check("Другая схема или модель — новый запрос", len(calls) == 3)
+
+        check("Пустой ответ не кэшируется",
+              cache.extract('пусто', version, 'gpt-4o', dict) == {} and
+              cache.cached('пусто', version, 'gpt-4o') is None)
+        cache.save()
+
+        replay = ExtractionCache(path, mode='replay')
+        check("Replay: результат из файла без запросов",
+              replay.extract(first, version, 'gpt-4o', request) == {'name': 'ССК'} and len(calls) == 3)
+        check("Replay: промах без запроса", replay.extract('новая страница', version, 'gpt-4o', request) is None
+              and len(calls) == 3)
+
+        refresh = ExtractionCache(path, mode='refresh')
+        refresh.extract(first, version, 'gpt-4o', request)
+        check("Refresh: запрос даже при наличии в кэше", len(calls) == 4)
+
+        active = {'now': 0, 'max': 0}
+        lock = threading.Lock()
+
+        def slow(item):
+            with lock:
+                active['now'] += 1
+                active['max'] = max(active['max'], active['now'])
+            time.sleep(0.05)
+            with lock:
+                active['now'] -= 1
+            return item * 2
+
+        results = run_limited(slow, range(8), limit=3)
+        check(f"run_limited: порядок сохранен, одновременно не больше 3 (было {active['max']})",
+              results == [item * 2 for item in range(8)] and active['max'] <= 3)
+
+        if not _check_parse_all_developers_replay(tmp, check):
+            failures += 1
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки кэша извлечения пройдены")
+    return failures == 0
+
+
+def _check_parse_all_developers_replay(tmp, check):
+    """Повторный прогон parse_all_developers: первый — с локального сервера,
+    второй в режиме replay — сервер остановлен, OpenAI недоступен"""
+    from ai_developer_parser import DeveloperScraper
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DeveloperPageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    os.environ.pop('OPENAI_API_KEY', None)
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        developers = [{'name': f'Застройщик {i}', 'url': f'{base_url}/dev/{i}'} for i in range(6)]
+
+        parser = DeveloperScraper()
+        parser.get_developers_list = lambda: developers
+        parser.scraper.crawler.engine.delay = 0
+        completions = FakeCompletions(delay=0.05)
+        parser.scraper.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        first = parser.parse_all_developers(limit=6)
+        parser.close()
+        check(f"Первый прогон: {completions.calls} запросов, одновременно {completions.max_active}",
+              len(first) == 6 and completions.calls == 6 and 1 < completions.max_active <= 4)
+
+        server.shutdown()
+        os.environ['AI_EXTRACTION_MODE'] = 'replay'
+        parser = DeveloperScraper()
+        parser.get_developers_list = lambda: developers
+        parser.scraper.openai_client = None
+        started = time.monotonic()
+        second = parser.parse_all_developers(limit=6)
+        elapsed = time.monotonic() - started
+        stats = parser.scraper.extraction_cache.stats
+        parser.close()
+        check(f"Replay без сети и API: {stats['hits']} попаданий за {elapsed:.2f} c",
+              [dev.name for dev in second] == [dev.name for dev in first]
+              and stats['hits'] == 6 and stats['calls'] == 0)
+        return True
+    except Exception as e:
+        print(f"❌ Ошибка прогона parse_all_developers: {e}")
+        return False
+    finally:
+        server.shutdown()
+        os.environ.pop('AI_EXTRACTION_MODE', None)
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    test_ai_extraction_cache()
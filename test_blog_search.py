@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование поискового индекса блога (blog_search.py): стемминг, ведение
+индекса при публикации/правке/удалении, ранжирование, сниппеты, подсказки
+и время ответа на длинных статьях
+"""
+
+import time
+
+from app import app, db
+from blog_search import blog_search, stem
+from models import Admin, BlogPost
+
+FILLER = 'Рынок жилья Краснодара продолжает развиваться, спрос остается стабильным. ' * 3000
+SLUG_PREFIX = 'test-blog-search-'
+
+
+def create_posts(author_id):
+    posts = [
+        BlogPost(title='Семейная ипотека в 2025 году', slug=f'{SLUG_PREFIX}family',
+                 excerpt='Условия льготной программы', category='Ипотека',
+                 content=f'<p>{FILLER}</p><p>Банки снизили ставки по семейной ипотеке.</p>',
+                 status='published', author_id=author_id),
+        BlogPost(title='Как выбрать новостройку', slug=f'{SLUG_PREFIX}newbuild',
+                 excerpt='Проверяем застройщика', category='Покупка',
+                 content=f'<p>Ипотека тоже упоминается.</p><script>var x = "ипотека";</script><p>{FILLER}</p>',
+                 status='published', author_id=author_id),
+        BlogPost(title='Черновик про ипотеку', slug=f'{SLUG_PREFIX}draft',
+                 content='Ипотека', status='draft', author_id=author_id),
+    ]
+    posts += [BlogPost(title=f'Обзор района {n}', slug=f'{SLUG_PREFIX}district-{n}', category='Районы',
+                       content=f'<p>{FILLER}</p>', status='published', author_id=author_id)
+              for n in range(30)]
+    db.session.add_all(posts)
+    db.session.commit()
+    return posts
+
+
+def cleanup():
+    for post in BlogPost.query.filter(BlogPost.slug.like(f'{SLUG_PREFIX}%')).all():
+        db.session.delete(post)
+    Admin.query.filter_by(email='blog-search-test@example.test').delete()
+    db.session.commit()
+
+
+def test_blog_search():
+    """Тестируем поиск по блогу"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем поисковый индекс блога...")
+    check("Стемминг: ипотеки/ипотекой/ипотека", stem('ипотеки') == stem('ипотекой') == stem('ипотека'))
+    check("Стемминг: квартиры/квартирами", stem('квартиры') == stem('квартирами') == 'квартир')
+
+    with app.app_context():
+        cleanup()
+        admin = Admin(email='blog-search-test@example.test', full_name='Blog Search Test', admin_id='BLOGSEARCHTEST')
+        admin.set_password('test')
+        db.session.add(admin)
+        db.session.commit()
+        try:
+            posts = create_posts(admin.id)
+            family, newbuild, draft = posts[:3]
+
+            results = blog_search.search('ипотеки')
+            slugs = [result['slug'] for result in results]
+            check("Найдено по другой форме слова, заголовок выше текста",
+                  slugs[:2] == [family.slug, newbuild.slug])
+            check("Черновик не индексируется", draft.slug not in slugs)
+            check("Сниппет вокруг совпадения с подсветкой",
+                  '<mark>ипотеке</mark>' in results[0]['snippet'] and len(results[0]['snippet']) < 400)
+            check("Текст из <script> не индексируется",
+                  not blog_search.search('var'))
+
+            check("Все слова запроса обязательны",
+                  [r['slug'] for r in blog_search.search('семейная ипотека')] == [family.slug])
+            check("Последнее слово — по префиксу",
+                  [r['slug'] for r in blog_search.search('новостр')] == [newbuild.slug])
+            check("Фильтр по категории",
+                  [r['slug'] for r in blog_search.search('ипотека', category='Покупка')] == [newbuild.slug])
+            check("Подсказки только по заголовкам",
+                  [s['slug'] for s in blog_search.suggest('ипот')] == [family.slug])
+
+            family.title = 'Льготные кредиты для семей'
+            db.session.commit()
+            check("Правка заголовка переиндексирует статью",
+                  [s['slug'] for s in blog_search.suggest('льготн')] == [family.slug]
+                  and not blog_search.suggest('ипот'))
+
+            draft.status = 'published'
+            db.session.commit()
+            check("Публикация добавляет статью в индекс", draft.slug in
+                  [r['slug'] for r in blog_search.search('ипотека')])
+
+            newbuild.status = 'archived'
+            db.session.delete(draft)
+            db.session.commit()
+            slugs = [r['slug'] for r in blog_search.search('ипотека')]
+            check("Снятие с публикации и удаление убирают из индекса",
+                  newbuild.slug not in slugs and draft.slug not in slugs)
+
+            queries = ['ипотека', 'рынок жилья', 'краснодар', 'обзор района', 'спрос стаб', 'семейн']
+            timings = []
+            with app.test_request_context():
+                for _ in range(5):
+                    for query in queries:
+                        started = time.perf_counter()
+                        blog_search.search(query)
+                        blog_search.suggest(query)
+                        timings.append(time.perf_counter() - started)
+            timings.sort()
+            median = timings[len(timings) // 2] * 1000
+            check(f"Поиск + подсказки по {len(posts)} статьям ~{len(FILLER) // 1000} тыс. символов: "
+                  f"медиана {median:.1f} мс", median < 10)
+        finally:
+            cleanup()
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки поиска по блогу пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_blog_search()
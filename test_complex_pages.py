@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование предрасчитанных страниц ЖК (complex_pages.py): сводка, корпуса,
+типы квартир, галерея, поиск по slug/id/названию, один запрос на страницу
+и отрисовка маршрутов
+"""
+
+import json
+
+from sqlalchemy import event, text
+
+from app import app, create_slug, db, get_complex_page_index, refresh_complex_page_cache
+from complex_pages import load_complex_page, refresh_complex_pages, resolve_complex_page
+
+ID_BASE = 985000
+RC_NAME = 'ЖК Тестовый Квартал'
+EXCEL_NAME = 'ЖК Только Эксель'
+NEW_NAME = 'ЖК Новый Из Импорта'
+RENAMED = 'ЖК Тестовый Квартал 2'
+
+
+def add_property(offset, complex_name, price, area, rooms, building, floor=3, photos=None, end_year=2020):
+    db.session.execute(text("""
+        INSERT INTO excel_properties (inner_id, complex_name, developer_name, object_rooms, object_area, price,
+                                      object_min_floor, object_max_floor, complex_building_name,
+                                      complex_building_end_build_year, complex_building_end_build_quarter,
+                                      address_short_display_name, address_position_lat, address_position_lon, photos)
+        VALUES (:id, :complex, 'СЗ Тест', :rooms, :area, :price, :floor, 16, :building, :end_year, 2,
+                'ул. Тестовая, 1', 45.05, 38.95, :photos)
+    """), {'id': ID_BASE + offset, 'complex': complex_name, 'rooms': rooms, 'area': area, 'price': price,
+           'floor': floor, 'building': building, 'end_year': end_year, 'photos': photos})
+
+
+def cleanup():
+    db.session.execute(text("DELETE FROM excel_properties WHERE inner_id >= :base AND inner_id < :top"),
+                       {'base': ID_BASE, 'top': ID_BASE + 1000})
+    db.session.execute(text("DELETE FROM residential_complexes WHERE name IN (:name, :renamed)"),
+                       {'name': RC_NAME, 'renamed': RENAMED})
+    db.session.commit()
+
+
+def test_complex_pages():
+    """Тестируем страницы ЖК"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем страницы ЖК...")
+    with app.app_context():
+        cleanup()
+        try:
+            db.session.execute(text("""
+                INSERT INTO residential_complexes (name, slug, cashback_rate, complex_id, sales_address, is_active)
+                VALUES (:name, 'test-kvartal', 5.0, 'ext-985', 'Офис продаж', TRUE)
+            """), {'name': RC_NAME})
+            rc_id = db.session.execute(text("SELECT id FROM residential_complexes WHERE name = :name"),
+                                       {'name': RC_NAME}).scalar()
+            gallery = json.dumps([f'https://img/{n}.jpg' for n in range(4)])
+            add_property(0, RC_NAME, 9000000, 80, 3, 'Литер 10', photos=gallery, end_year=2099)
+            add_property(1, RC_NAME, 4000000, 30, 0, 'Литер 2')
+            add_property(2, RC_NAME, 5000000, 40, 1, 'Литер 2', floor=7)
+            add_property(3, RC_NAME, 6000000, 45, 1, 'Литер 10', end_year=2099)
+            add_property(4, EXCEL_NAME, 1000, 20, 0, None)
+            db.session.commit()
+
+            pages = refresh_complex_page_cache()
+            check("Страницы собраны для ЖК из обеих таблиц", pages >= 2)
+
+            _, index = get_complex_page_index()
+            by_slug = resolve_complex_page(index, slug=create_slug(RC_NAME))
+            check("Поиск по slug, названию, id и внешнему complex_id",
+                  by_slug is not None
+                  and resolve_complex_page(index, complex_name=RC_NAME) == by_slug
+                  and resolve_complex_page(index, complex_id=rc_id) == by_slug
+                  and resolve_complex_page(index, complex_id='ext-985') == by_slug)
+            check("Неизвестный slug", resolve_complex_page(index, slug='net-takogo-zhk') is None)
+
+            statements = []
+
+            def count(*args):
+                statements.append(args[2])
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                page = load_complex_page(db.session, by_slug, complex_id=rc_id)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            check(f"Страница — один запрос ({len(statements)})", len(statements) == 1)
+
+            complex_data = page['complex']
+            check("Сводка и данные residential_complexes",
+                  complex_data['apartments_count'] == 4 and complex_data['price_from'] == 4000000
+                  and complex_data['price_to'] == 9000000 and complex_data['buildings_count'] == 2
+                  and complex_data['cashback_rate'] == 5.0 and complex_data['full_address'] == 'ул. Тестовая, 1')
+            check("Галерея ЖК из самой дорогой квартиры", complex_data['images'] == [f'https://img/{n}.jpg'
+                                                                                      for n in range(1, 4)])
+            check("Квартиры по цене", [prop['price'] for prop in page['properties']]
+                  == [4000000, 5000000, 6000000, 9000000])
+            check("Корпуса по номеру: Литер 2, затем Литер 10",
+                  list(page['properties_by_building']) == ['Литер 2', 'Литер 10']
+                  and [prop['id'] for prop in page['properties_by_building']['Литер 10']] == [ID_BASE + 3, ID_BASE])
+            buildings = complex_data['buildings']
+            check("Статус корпусов от текущей даты",
+                  buildings['Литер 2']['building_status'] == 'Сдан'
+                  and buildings['Литер 10']['building_status'] == 'Строится'
+                  and buildings['Литер 10']['total_apartments'] == 2)
+            check("Цены по типам квартир", complex_data['room_stats']['1-комн']['price_from'] == 5000000
+                  and complex_data['room_stats']['1-комн']['count'] == 2
+                  and list(page['properties_by_rooms']) == ['Студия', '1-комн', '3-комн'])
+            check("Похожие ЖК без текущего",
+                  all(item['name'] != RC_NAME for item in page['similar_complexes'])
+                  and page['similar_complexes'][0]['name'] == EXCEL_NAME)
+
+            db.session.execute(text("UPDATE residential_complexes SET cashback_rate = 7.5 WHERE id = :id"), {'id': rc_id})
+            db.session.commit()
+            check("Правка ЖК видна без пересборки", load_complex_page(db.session, by_slug)['complex']['cashback_rate'] == 7.5)
+
+            client = app.test_client()
+            response = client.get(f'/zk/{create_slug(RC_NAME)}')
+            check(f"Страница /zk/<slug> ({response.status_code})",
+                  response.status_code == 200 and RC_NAME in response.get_data(as_text=True))
+            response = client.get(f'/residential-complex/{EXCEL_NAME}')
+            check(f"ЖК только из excel_properties ({response.status_code})",
+                  response.status_code == 200 and EXCEL_NAME in response.get_data(as_text=True))
+            response = client.get('/zk/net-takogo-zhk')
+            check("Неизвестный ЖК -> /properties", response.status_code == 302)
+
+            # Пересборка в другом процессе: индекс этого процесса в кэше не сброшен
+            excel_page = resolve_complex_page(index, complex_name=EXCEL_NAME)
+            add_property(5, NEW_NAME, 2000000, 25, 0, None)
+            db.session.commit()
+            refresh_complex_pages(db.session, create_slug)
+            db.session.commit()
+            response = client.get(f'/residential-complex/{NEW_NAME}')
+            check(f"Устаревший индекс перечитывается ({response.status_code})",
+                  response.status_code == 200 and NEW_NAME in response.get_data(as_text=True))
+            _, fresh_index = get_complex_page_index()
+            check("id страниц не меняются при пересборке",
+                  resolve_complex_page(fresh_index, slug=create_slug(RC_NAME)) == by_slug
+                  and resolve_complex_page(fresh_index, complex_name=EXCEL_NAME) == excel_page)
+
+            # Переименование в админке: пересобираются только старое и новое название
+            db.session.execute(text("UPDATE residential_complexes SET name = :name WHERE id = :id"),
+                               {'name': RENAMED, 'id': rc_id})
+            db.session.commit()
+            refresh_complex_page_cache(names=[RC_NAME, RENAMED])
+            _, index = get_complex_page_index()
+            renamed_page = load_complex_page(db.session, resolve_complex_page(index, complex_name=RENAMED))
+            old_page = load_complex_page(db.session, resolve_complex_page(index, complex_name=RC_NAME))
+            check("Частичная пересборка: новое название со ссылкой на ЖК, старое — по квартирам",
+                  renamed_page is not None and renamed_page['complex']['cashback_rate'] == 7.5
+                  and old_page is not None and old_page['complex']['apartments_count'] == 4
+                  and resolve_complex_page(index, complex_id=rc_id) == resolve_complex_page(index, complex_name=RENAMED)
+                  and resolve_complex_page(index, complex_name=EXCEL_NAME) == excel_page
+                  and renamed_page['similar_complexes'][0]['name'] == EXCEL_NAME)
+        finally:
+            cleanup()
+            refresh_complex_page_cache()
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки страниц ЖК пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_complex_pages()
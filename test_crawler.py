@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование движка загрузки страниц (crawler.py) на локальном HTTP-сервере:
+условный GET (ETag/304), повторы при 503, ограничение параллельности на хост
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crawler import Crawler
+
+PAGE = 'ЖК Тестовый — квартиры от 3,5 млн ₽'.encode('utf-8')
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    hits = {}
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.hits[self.path] = cls.hits.get(self.path, 0) + 1
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            if self.path == '/etag':
+                if self.headers.get('If-None-Match') == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self._send(200, PAGE, {'ETag': '"v1"'})
+            elif self.path == '/flaky':
+                # Первые два запроса — 503, потом 200
+                if cls.hits[self.path] <= 2:
+                    self._send(503, b'busy')
+                else:
+                    self._send(200, PAGE)
+            elif self.path.startswith('/slow/'):
+                time.sleep(0.2)
+                self._send(200, PAGE)
+            else:
+                self._send(404, b'not found')
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_crawler():
+    """Тестируем crawler на локальном сервере"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        failures += 0 if condition else 1
+
+    print("🧪 Тестируем crawler...")
+    try:
+        with Crawler(per_host=2, delay=0, backoff=0.05, retries=3) as crawler:
+            first = crawler.fetch(f'{base_url}/etag')
+            second = crawler.fetch(f'{base_url}/etag')
+            check("Первая загрузка из сети", first.status_code == 200 and not first.from_cache)
+            check("Повторная загрузка — 304 и тело из кэша",
+                  second.from_cache and second.text == PAGE.decode('utf-8'))
+
+            flaky = crawler.fetch(f'{base_url}/flaky')
+            check("Повтор после 503", flaky is not None and flaky.status_code == 200
+                  and FixtureHandler.hits['/flaky'] == 3)
+
+            missing = crawler.fetch(f'{base_url}/missing')
+            check("404 без повторов", missing.status_code == 404 and FixtureHandler.hits['/missing'] == 1)
+
+            FixtureHandler.max_active = 0
+            started = time.monotonic()
+            pages = crawler.fetch_all(f'{base_url}/slow/{i}' for i in range(6))
+            elapsed = time.monotonic() - started
+            check("Все страницы получены", all(page and page.ok for page in pages.values()))
+            check(f"Не больше 2 запросов к хосту одновременно (было {FixtureHandler.max_active})",
+                  FixtureHandler.max_active <= 2)
+            check(f"Параллельная загрузка ({elapsed:.2f} c < 1.2 c последовательно)", elapsed < 1.0)
+
+        with Crawler(per_host=4, delay=0.1) as crawler:
+            started = time.monotonic()
+            crawler.fetch_all(f'{base_url}/slow/delay-{i}' for i in range(4))
+            elapsed = time.monotonic() - started
+            check(f"Пауза между запусками к одному хосту ({elapsed:.2f} c >= 0.3 c)", elapsed >= 0.3)
+    finally:
+        server.shutdown()
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки crawler пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_crawler()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование бэкапа и восстановления по кускам (db_backup.py) на временных
+SQLite базах: целостность данных, контрольные суммы, порядок по внешним
+ключам и продолжение прерванного восстановления
+"""
+
+import gzip
+import os
+import tempfile
+
+from sqlalchemy import create_engine, text
+
+from db_backup import DatabaseBackup
+
+SCHEMA = [
+    "CREATE TABLE developers (id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT)",
+    "CREATE TABLE complexes (id INTEGER PRIMARY KEY, developer_id INTEGER NOT NULL REFERENCES developers(id), "
+    "name TEXT, price INTEGER)",
+    "CREATE TABLE complex_tags (complex_id INTEGER REFERENCES complexes(id), tag TEXT, PRIMARY KEY (complex_id, tag))",
+]
+DEVELOPERS = 40
+COMPLEXES = 230
+
+
+def create_database(path, with_data):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        if with_data:
+            conn.execute(text("INSERT INTO developers (id, name, description) VALUES (:id, :name, :description)"), [
+                {'id': n * 3 + 1, 'name': f'Застройщик "{n}", ООО',
+                 'description': None if n % 5 == 0 else ('' if n % 7 == 0 else f'Строка 1\nСтрока 2, {n}')}
+                for n in range(DEVELOPERS)
+            ])
+            conn.execute(text("INSERT INTO complexes (id, developer_id, name, price) VALUES (:id, :dev, :name, :price)"), [
+                {'id': n + 1, 'dev': (n % DEVELOPERS) * 3 + 1, 'name': f'ЖК {n}', 'price': None if n % 9 == 0 else n * 1000}
+                for n in range(COMPLEXES)
+            ])
+            conn.execute(text("INSERT INTO complex_tags (complex_id, tag) VALUES (:id, :tag)"), [
+                {'id': n + 1, 'tag': tag} for n in range(COMPLEXES) for tag in ('новостройка', 'ипотека')
+            ])
+    return engine
+
+
+def table_rows(engine):
+    with engine.connect() as conn:
+        return {table: conn.execute(text(f"SELECT * FROM {table} ORDER BY 1, 2")).fetchall()
+                for table in ('developers', 'complexes', 'complex_tags')}
+
+
+def test_db_backup():
+    """Тестируем бэкап и восстановление"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем бэкап и восстановление по кускам...")
+    with tempfile.TemporaryDirectory() as tmp:
+        source = create_database(os.path.join(tmp, 'source.db'), with_data=True)
+        backup_dir = os.path.join(tmp, 'backup')
+
+        backup = DatabaseBackup(f"sqlite:///{os.path.join(tmp, 'source.db')}", jobs=3, chunk_rows=50)
+        manifest = backup.dump(backup_dir)
+        complexes = manifest['tables']['complexes']
+        check(f"Куски по первичному ключу: complexes — {len(complexes['chunks'])} кусков",
+              len(complexes['chunks']) == 5 and complexes['rows'] == COMPLEXES
+              and max(chunk['rows'] for chunk in complexes['chunks']) == 50)
+        check("Таблица без целочисленного ключа — одним куском",
+              len(manifest['tables']['complex_tags']['chunks']) == 1)
+        check("Порядок загрузки по внешним ключам",
+              DatabaseBackup.load_order(manifest['tables']) == [['developers'], ['complexes'], ['complex_tags']])
+        check("Проверка целого бэкапа", backup.verify(backup_dir) == [])
+
+        target_path = os.path.join(tmp, 'target.db')
+        target = create_database(target_path, with_data=False)
+        with target.begin() as conn:
+            conn.execute(text("INSERT INTO developers (id, name) VALUES (999, 'Старые данные')"))
+        restorer = DatabaseBackup(f'sqlite:///{target_path}', jobs=3)
+
+        # Обрыв после двух кусков complexes
+        original_insert = restorer._insert_chunk
+        calls = {'complexes': 0}
+
+        def failing_insert(table, columns, f):
+            if table == 'complexes':
+                calls['complexes'] += 1
+                if calls['complexes'] == 3:
+                    raise RuntimeError('обрыв соединения')
+            return original_insert(table, columns, f)
+
+        restorer._insert_chunk = failing_insert
+        try:
+            restorer.restore(backup_dir)
+            check("Обрыв восстановления поднимает ошибку", False)
+        except RuntimeError:
+            with target.connect() as conn:
+                loaded = conn.execute(text("SELECT COUNT(*) FROM complexes")).scalar()
+            check(f"После обрыва загружены только целые куски ({loaded} строк)", loaded == 100)
+
+        restorer._insert_chunk = original_insert
+        restorer.restore(backup_dir, resume=True)
+        check("Продолжение: данные совпадают с исходной базой без дублей и старых строк",
+              table_rows(target) == table_rows(source))
+        check("NULL и пустая строка различаются",
+              table_rows(target)['developers'][0].description is None
+              and any(row.description == '' for row in table_rows(target)['developers']))
+        check("Файл прогресса удален после успешного восстановления",
+              not os.path.exists(os.path.join(backup_dir, 'restore_progress.json')))
+
+        chunk_path = os.path.join(backup_dir, complexes['chunks'][1]['file'])
+        with gzip.open(chunk_path, 'wb') as f:
+            f.write(b'1,1,tampered,0\n')
+        errors = backup.verify(backup_dir)
+        check("Поврежденный кусок обнаружен до загрузки", len(errors) == 1 and 'контрольная' in errors[0])
+        try:
+            restorer.restore(backup_dir)
+            check("Восстановление поврежденного бэкапа отклонено", False)
+        except ValueError:
+            check("Восстановление поврежденного бэкапа отклонено", table_rows(target) == table_rows(source))
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки бэкапа пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_db_backup()
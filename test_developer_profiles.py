@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование профилей застройщиков (developer_profiles.py): ЖК и комнатность,
+статистика, доступные квартиры, поиск по slug, один запрос на страницу,
+пересборка при сохранении парсером и отрисовка маршрутов
+"""
+
+import json
+
+from sqlalchemy import event, text
+
+from app import app, db, developer_slug
+from developer_profiles import developer_listing, developer_profile, refresh_developer_profiles
+
+ID_BASE = 987000
+DEVELOPER = 'СЗ Тестовый Девелопер'
+EMPTY_DEVELOPER = 'СЗ Без Квартир'
+
+
+def add_property(offset, complex_name, price, area, rooms, building, photos=None, end_year=None):
+    db.session.execute(text("""
+        INSERT INTO excel_properties (inner_id, complex_name, developer_name, object_rooms, object_area, price,
+                                      object_min_floor, object_max_floor, complex_building_id,
+                                      complex_building_end_build_year, complex_building_end_build_quarter,
+                                      complex_end_build_year, complex_end_build_quarter,
+                                      address_short_display_name, photos)
+        VALUES (:id, :complex, :developer, :rooms, :area, :price, 3, 16, :building, 2026, 4, :end_year, :end_quarter,
+                'ул. Тестовая, 1', :photos)
+    """), {'id': ID_BASE + offset, 'complex': complex_name, 'developer': f'  {DEVELOPER.lower()} ', 'rooms': rooms,
+           'area': area, 'price': price, 'building': building, 'end_year': end_year,
+           'end_quarter': 2 if end_year else None, 'photos': photos})
+
+
+def cleanup():
+    db.session.execute(text("DELETE FROM excel_properties WHERE inner_id >= :base AND inner_id < :top"),
+                       {'base': ID_BASE, 'top': ID_BASE + 1000})
+    db.session.execute(text("""
+        DELETE FROM developer_profiles WHERE developer_id IN (SELECT id FROM developers WHERE name IN (:a, :b))
+    """), {'a': DEVELOPER, 'b': EMPTY_DEVELOPER})
+    db.session.execute(text("DELETE FROM developers WHERE name IN (:a, :b)"), {'a': DEVELOPER, 'b': EMPTY_DEVELOPER})
+    db.session.commit()
+
+
+def test_developer_profiles():
+    """Тестируем профили застройщиков"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем профили застройщиков...")
+    with app.app_context():
+        cleanup()
+        try:
+            for name, slug in ((DEVELOPER, 'test-developer'), (EMPTY_DEVELOPER, 'empty-developer')):
+                db.session.execute(text("""
+                    INSERT INTO developers (name, slug, rating, features, is_active)
+                    VALUES (:name, :slug, 4.9, :features, TRUE)
+                """), {'name': name, 'slug': slug, 'features': json.dumps(['Парковка'], ensure_ascii=False)})
+            gallery = json.dumps([f'https://img/{n}.jpg' for n in range(3)])
+            add_property(0, 'ЖК Альфа', 9000000, 80, 3, 1, photos=gallery, end_year=2027)
+            add_property(1, 'ЖК Альфа', 4000000, 30, 0, 1)
+            add_property(2, 'ЖК Альфа', 5000000, 40, 1, 2)
+            add_property(3, 'ЖК Альфа', 6000000, 45, 1, 2)
+            add_property(4, 'ЖК Бета', 3000000, 25, 0, 3)
+            for offset in range(5, 20):
+                add_property(offset, 'ЖК Бета', 10000000 + offset, 60, 2, 3)
+            db.session.commit()
+
+            profiles = refresh_developer_profiles(db.session, developer_slug)
+            db.session.commit()
+            check("Профили собраны для всех застройщиков", profiles >= 2)
+
+            slug = developer_slug(DEVELOPER)
+            statements = []
+
+            def count(*args):
+                statements.append(args[2])
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                page = developer_profile(db.session, slug=slug)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            check(f"Страница — один запрос ({len(statements)})", len(statements) == 1)
+
+            developer = page['developer']
+            check("Статистика по квартирам застройщика",
+                  page['total_properties'] == 20 and developer['complexes_count'] == 2
+                  and developer['min_price'] == 3000000 and page['min_price'] == 3000000)
+            check("Данные застройщика из developers", developer['rating'] == 4.9 and page['features'] == ['Парковка'])
+            complexes = {item['name']: item for item in page['complexes']}
+            check("ЖК по числу квартир", [item['name'] for item in page['complexes']] == ['ЖК Бета', 'ЖК Альфа'])
+            alpha = complexes['ЖК Альфа']
+            check("Сводка ЖК", alpha['apartments_count'] == 4 and alpha['buildings_count'] == 2
+                  and alpha['completion_date'] == '2 кв. 2027' and complexes['ЖК Бета']['completion_date'] == 'Сдан')
+            check("Галерея ЖК из photos", alpha['images'] == [f'https://img/{n}.jpg' for n in range(3)]
+                  and complexes['ЖК Бета']['image'].startswith('https://images.unsplash.com'))
+            check("Распределение по комнатам",
+                  alpha['real_room_distribution'] == {'Студия': 1, '1-комн.': 2, '3-комн.': 1}
+                  and alpha['room_details']['1-комн.'] == {'price_from': 5000000, 'price_to': 6000000,
+                                                            'area_from': 40, 'area_to': 45})
+            apartments = page['apartments']
+            check("12 самых доступных квартир", len(apartments) == 12 and apartments[0]['inner_id'] == ID_BASE + 4
+                  and apartments[0]['object_completion_year'] == 2026)
+
+            listing = {item['name']: item for item in developer_listing(db.session)}
+            check("Список застройщиков", listing[DEVELOPER]['properties_count'] == 20
+                  and listing[DEVELOPER]['stats']['min_price'] == 3000000
+                  and listing[EMPTY_DEVELOPER]['stats']['avg_price'] is None)
+
+            db.session.execute(text("UPDATE developers SET rating = 3.5 WHERE name = :name"), {'name': DEVELOPER})
+            db.session.commit()
+            check("Правка застройщика видна без пересборки",
+                  developer_profile(db.session, slug=slug)['developer']['rating'] == 3.5)
+            check("Поиск по developers.slug", developer_profile(db.session, slug='test-developer') is not None)
+
+            add_property(20, 'ЖК Гамма', 2000000, 20, 0, 4)
+            db.session.commit()
+            developer_id = db.session.execute(text("SELECT id FROM developers WHERE name = :name"),
+                                              {'name': DEVELOPER}).scalar()
+            refresh_developer_profiles(db.session, developer_slug, [developer_id])
+            db.session.commit()
+            page = developer_profile(db.session, slug=slug)
+            check("Пересборка одного застройщика", page['total_properties'] == 21
+                  and page['developer']['complexes_count'] == 3)
+
+            client = app.test_client()
+            response = client.get(f'/developer/{slug}')
+            check(f"Страница /developer/<slug> ({response.status_code})",
+                  response.status_code == 200 and 'ЖК Гамма' in response.get_data(as_text=True))
+            db.session.execute(text("DELETE FROM developer_profiles WHERE developer_id = :id"), {'id': developer_id})
+            db.session.commit()
+            response = client.get(f'/developer/{slug}')
+            check(f"Профиль строится при первом обращении ({response.status_code})",
+                  response.status_code == 200 and developer_profile(db.session, slug=slug) is not None)
+            response = client.get('/developers')
+            check(f"Страница /developers ({response.status_code})",
+                  response.status_code == 200 and DEVELOPER in response.get_data(as_text=True))
+            response = client.get('/developer/net-takogo-zastroyshchika')
+            check("Неизвестный застройщик -> /developers", response.status_code == 302)
+        finally:
+            cleanup()
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки профилей застройщиков пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_developer_profiles()
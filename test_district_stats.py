@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование районов объектов и сводки по районам (district_stats.py):
+определение района по полигону, parsed_district, ближайшей улице и адресу,
+перцентили цены за м², повторное определение только для новых и
+переехавших объектов и страницы районов
+"""
+
+import json
+
+from sqlalchemy import text
+
+from app import app, db
+from district_stats import (DistrictResolver, assign_districts, district_listing, district_page,
+                            normalize_name, refresh_district_stats)
+from models import District, Street
+
+SLUG_PREFIX = 'test-ds-'
+ID_BASE = 987000
+SQUARE = {'test-ds-polygon': [((38.90, 45.00, 38.95, 45.05),
+                               [(38.90, 45.00), (38.95, 45.00), (38.95, 45.05), (38.90, 45.05), (38.90, 45.00)],
+                               [])]}
+
+
+def add_property(offset, price, area, address, parsed_district=None, lat=None, lon=None, complex_name='ЖК Тест'):
+    db.session.execute(text("""
+        INSERT INTO excel_properties (inner_id, complex_name, developer_name, object_rooms, object_area, price,
+                                      object_min_floor, object_max_floor, address_display_name, parsed_district,
+                                      address_position_lat, address_position_lon, complex_building_name)
+        VALUES (:id, :complex, 'СЗ Тест', 1, :area, :price, 2, 12, :address, :parsed, :lat, :lon, 'Литер 1')
+    """), {'id': ID_BASE + offset, 'complex': complex_name, 'area': area, 'price': price, 'address': address,
+           'parsed': parsed_district, 'lat': lat, 'lon': lon})
+
+
+def cleanup():
+    db.session.execute(text("DELETE FROM property_districts WHERE inner_id >= :base AND inner_id < :top"),
+                       {'base': ID_BASE, 'top': ID_BASE + 1000})
+    db.session.execute(text("DELETE FROM excel_properties WHERE inner_id >= :base AND inner_id < :top"),
+                       {'base': ID_BASE, 'top': ID_BASE + 1000})
+    Street.query.filter(Street.slug.like(f'{SLUG_PREFIX}%')).delete(synchronize_session=False)
+    db.session.execute(text("DELETE FROM district_stats WHERE district_id IN "
+                            "(SELECT id FROM districts WHERE slug LIKE :prefix)"), {'prefix': f'{SLUG_PREFIX}%'})
+    District.query.filter(District.slug.like(f'{SLUG_PREFIX}%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def test_district_stats():
+    """Тестируем районы и сводку"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем сводку по районам...")
+    check("Нормализация названий", normalize_name('Кудепста м-н') == 'кудепста'
+          and normalize_name('мкр. Гидростроителей') == 'гидростроителей')
+
+    with app.app_context():
+        cleanup()
+        try:
+            parsed = District(name='Тестовый Парсинг', slug=f'{SLUG_PREFIX}parsed',
+                              infrastructure_data=json.dumps({'medical_count': 3}))
+            polygon = District(name='Тестовый Полигон', slug=f'{SLUG_PREFIX}polygon')
+            address = District(name='Краснодарская Тестовая', slug=f'{SLUG_PREFIX}address')
+            db.session.add_all([parsed, polygon, address])
+            db.session.commit()
+
+            db.session.add(Street(name='Тестовая улица', slug=f'{SLUG_PREFIX}street', district_id=address.id,
+                                  latitude=45.2, longitude=39.2))
+            db.session.commit()
+
+            resolver = DistrictResolver(db.session.execute(text("SELECT id, name, slug FROM districts")).fetchall())
+            check("Район по parsed_district", resolver.by_parsed('Тестовый Парсинг м-н') == parsed.id)
+            check("Часть адреса с 'край' не участвует в поиске района",
+                  resolver.by_address('Россия, Краснодарская Тестовая область, Сочи') is None)
+
+            for n, price in enumerate([4000000, 5000000, 6000000, 7000000, 8000000]):
+                add_property(n, price, 50, 'Россия, Краснодарский край, Краснодар, ул. Тест',
+                             parsed_district='Тестовый Парсинг м-н', lat=45.1, lon=39.1,
+                             complex_name='ЖК Альфа' if n < 3 else 'ЖК Бета')
+            add_property(10, 9000000, 60, 'Россия, Краснодарский край, Краснодар, ул. Поле', lat=45.01, lon=38.91)
+            add_property(11, 3000000, 30, 'Россия, Краснодарский край, Краснодар, Краснодарская Тестовая, 5')
+            add_property(13, 3500000, 35, 'Россия, Краснодарский край, Краснодар', lat=45.2005, lon=39.2)
+            db.session.commit()
+
+            ids = [ID_BASE + n for n in (0, 1, 2, 3, 4, 10, 11, 13)]
+            assign_districts(db.session, ids, boundaries=SQUARE)
+            refresh_district_stats(db.session)
+            db.session.commit()
+
+            methods = dict(db.session.execute(text(
+                "SELECT inner_id, method FROM property_districts WHERE inner_id IN (:a, :b, :c, :d)"),
+                {'a': ID_BASE, 'b': ID_BASE + 10, 'c': ID_BASE + 11, 'd': ID_BASE + 13}).fetchall())
+            check("Способы: parsed_district, полигон, адрес, ближайшая улица",
+                  methods == {ID_BASE: 'parsed', ID_BASE + 10: 'polygon', ID_BASE + 11: 'address',
+                              ID_BASE + 13: 'street'})
+            street = db.session.execute(text(
+                "SELECT s.slug, pd.street_distance_m FROM property_districts pd "
+                "JOIN streets s ON s.id = pd.street_id WHERE pd.inner_id = :id"), {'id': ID_BASE + 13}).fetchone()
+            check("Ближайшая улица и расстояние до нее",
+                  street is not None and street[0] == f'{SLUG_PREFIX}street' and 50 < street[1] < 60)
+
+            page = district_page(db.session, f'{SLUG_PREFIX}parsed')
+            check("Счетчики района", page['properties_count'] == 5 and page['complexes_count'] == 2
+                  and page['developers_count'] == 1)
+            check("Цены и перцентили цены за м²",
+                  page['price_min'] == 4000000 and page['price_max'] == 8000000
+                  and page['price_per_sqm_median'] == 120000 and page['price_per_sqm_p25'] == 100000
+                  and page['price_per_sqm_p75'] == 140000)
+            check("ЖК района с квартирами и ценой от",
+                  [(c['name'], c['apartments_count'], c['price_from']) for c in page['complexes']]
+                  == [('ЖК Альфа', 3, 4000000), ('ЖК Бета', 2, 7000000)])
+            check("Подборка — от дешевых к дорогим, объекты без координат не попадают",
+                  page['sample_property_ids'] == [ID_BASE + n for n in range(5)] and
+                  district_page(db.session, f'{SLUG_PREFIX}address')['sample_property_ids'] == [ID_BASE + 13])
+            check("Инфраструктура уже разобрана", page['infrastructure_data'] == {'medical_count': 3})
+
+            listing = {d['slug']: d for d in district_listing(db.session)}
+            check("Список районов со сводкой", listing[f'{SLUG_PREFIX}address']['properties_count'] == 2)
+
+            # Повторный запуск обрабатывает только новые и переехавшие объекты
+            assign_districts(db.session)  # догоняем объекты базы вне теста
+            check("Без изменений повторный запуск ничего не делает", assign_districts(db.session, boundaries=SQUARE) == 0)
+            add_property(12, 10000000, 100, 'Россия, Краснодарский край, Краснодар', lat=45.02, lon=38.93)
+            db.session.execute(text("UPDATE excel_properties SET parsed_district = NULL WHERE inner_id = :id"),
+                               {'id': ID_BASE})
+            db.session.execute(text("UPDATE excel_properties SET address_position_lat = 45.03, "
+                                    "address_position_lon = 38.94 WHERE inner_id = :id"), {'id': ID_BASE + 1})
+            check("Обработаны новый и переехавший объекты", assign_districts(db.session, boundaries=SQUARE) == 2)
+            refresh_district_stats(db.session)
+            db.session.commit()
+            check("Переехавший объект сменил район, неизмененные назначения сохранены",
+                  district_page(db.session, f'{SLUG_PREFIX}polygon')['properties_count'] == 3
+                  and district_page(db.session, f'{SLUG_PREFIX}parsed')['properties_count'] == 4)
+
+            client = app.test_client()
+            response = client.get(f'/district/{SLUG_PREFIX}parsed')
+            html = response.get_data(as_text=True)
+            check("Страница района", response.status_code == 200 and 'В районе представлено 4 объектов' in html)
+            response = client.get('/districts')
+            check("Страница районов", response.status_code == 200 and 'Тестовый Полигон' in response.get_data(as_text=True))
+        finally:
+            cleanup()
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки сводки по районам пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_district_stats()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование кэша идентификации (identity_cache.py): principal из кэша,
+деактивированные пользователи и менеджеры не проходят login_required,
+manager_required и export_access_required, сброс кэша после смены статуса
+"""
+
+from sqlalchemy import text
+
+from app import app, db, load_user
+from identity_cache import invalidate_principal
+
+USER_EMAIL = 'identity-cache-test@example.com'
+MANAGER_EMAIL = 'identity-cache-manager@example.com'
+
+
+def cleanup():
+    db.session.execute(text("DELETE FROM users WHERE email = :email"), {'email': USER_EMAIL})
+    db.session.execute(text("DELETE FROM managers WHERE email = :email"), {'email': MANAGER_EMAIL})
+    db.session.commit()
+
+
+def set_active(table, kind, principal_id, active):
+    db.session.execute(text(f"UPDATE {table} SET is_active = :active WHERE id = :id"),
+                       {'active': active, 'id': principal_id})
+    db.session.commit()
+    invalidate_principal(kind, principal_id)
+
+
+def test_identity_cache():
+    """Тестируем кэш идентификации"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем кэш идентификации...")
+    with app.app_context():
+        cleanup()
+        try:
+            db.session.execute(text("""
+                INSERT INTO users (email, full_name, user_id, role, is_active)
+                VALUES (:email, 'Тест Кэша', 'CB98700001', 'buyer', TRUE)
+            """), {'email': USER_EMAIL})
+            db.session.execute(text("""
+                INSERT INTO managers (email, password_hash, first_name, last_name, manager_id, is_active)
+                VALUES (:email, 'x', 'Тест', 'Менеджер', 'MNG98700001', TRUE)
+            """), {'email': MANAGER_EMAIL})
+            db.session.commit()
+            user_id = db.session.execute(text("SELECT id FROM users WHERE email = :email"),
+                                         {'email': USER_EMAIL}).scalar()
+            manager_id = db.session.execute(text("SELECT id FROM managers WHERE email = :email"),
+                                            {'email': MANAGER_EMAIL}).scalar()
+
+            with app.test_request_context():
+                identity = load_user(str(user_id))
+                check("Активный пользователь авторизован", identity.is_authenticated and identity.is_active)
+            set_active('users', 'user', user_id, False)
+            with app.test_request_context():
+                identity = load_user(str(user_id))
+                check("Деактивированный пользователь не авторизован", not identity.is_authenticated)
+                identity = load_user(f'm_{manager_id}')
+                check("Менеджер через load_user", identity.is_authenticated)
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(user_id)
+                sess['_fresh'] = True
+            response = client.get('/dashboard')
+            check(f"login_required: деактивированный -> /login ({response.status_code})",
+                  response.status_code == 302 and '/login' in response.headers.get('Location', ''))
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['manager_id'] = manager_id
+                sess['is_manager'] = True
+            response = client.get('/manager/property-comparison')
+            check(f"manager_required: активный менеджер ({response.status_code})", response.status_code == 200)
+            response = client.get('/api/export/clients.csv')
+            check(f"export_access_required: активный менеджер ({response.status_code})", response.status_code == 200)
+            set_active('managers', 'manager', manager_id, False)
+            response = client.get('/api/export/clients.csv')
+            check(f"export_access_required: деактивированный -> 401 ({response.status_code})",
+                  response.status_code == 401)
+            response = client.get('/manager/property-comparison')
+            check(f"manager_required: деактивированный -> вход ({response.status_code})",
+                  response.status_code == 302 and 'manager' in response.headers.get('Location', ''))
+            with client.session_transaction() as sess:
+                check("Сессия менеджера очищена", 'manager_id' not in sess)
+        finally:
+            cleanup()
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки кэша идентификации пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_identity_cache()
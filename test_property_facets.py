@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование счетчиков фасетов фильтров /properties (property_facets.py):
+сверка с прямым перебором снимка, дизъюнктивный подсчет, диапазоны,
+подстроки и время ответа на большом снимке
+"""
+
+import random
+import time
+
+from property_facets import FacetIndex, facet_values
+
+DEVELOPERS = ['ГК Неометрия', 'AVA', 'СЗ КАСКАД', 'ТОЧНО', 'Тестовый 1', 'Тестовый 11']
+DISTRICTS = ['Центральный', 'Прикубанский', 'Карасунский', 'Западный']
+CLASSES = ['Комфорт', 'Бизнес-класс', 'Премиум', '']
+FINISHING = ['Без отделки', 'Чистовая', 'Предчистовая']
+
+
+def make_snapshot(size, seed=7):
+    rng = random.Random(seed)
+    return [{
+        'id': n,
+        'rooms': rng.choice([0, 1, 1, 2, 2, 3, 4, 5]),
+        'developer': rng.choice(DEVELOPERS),
+        'district': rng.choice(DISTRICTS),
+        'completion_year': rng.choice([2024, 2025, 2026, None]),
+        'complex_completion_year': rng.choice([2025, 2028, None]),
+        'total_floors': rng.randint(3, 25),
+        'complex_class': rng.choice(CLASSES),
+        'finishing': rng.choice(FINISHING),
+        'accreditation': rng.random() < 0.5,
+        'green_mortgage_available': rng.random() < 0.2,
+        'government_program': rng.random() < 0.1,
+        'trade_in_available': rng.random() < 0.3,
+        'price': rng.randint(3, 30) * 1000000,
+        'area': round(rng.uniform(20, 120), 1),
+        'floor': rng.randint(1, 25),
+        'address': f"Краснодарский край, {'Сочи' if n % 3 else 'Краснодар'}, ул. {n}",
+        'residential_complex': f'ЖК {n % 40}',
+        'building_name': f'Литер {n % 5}',
+    } for n in range(size)]
+
+
+def brute_force(snapshot, facet, value, others):
+    """Прямой перебор: объекты с value в facet, прошедшие фильтр others"""
+    count = 0
+    for prop in snapshot:
+        values = facet_values(prop)
+        if value in [str(item) for item in values[facet]] and others(prop, values):
+            count += 1
+    return count
+
+
+def test_property_facets():
+    """Тестируем фасеты"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем счетчики фасетов...")
+    snapshot = make_snapshot(3000)
+    index = FacetIndex(snapshot)
+
+    result = index.counts({})
+    check("Без фильтров: всего объектов = размер снимка", result['total'] == len(snapshot))
+    rooms = {option['value']: option['count'] for option in result['facets']['rooms']}
+    check("Комнаты в фиксированном порядке и в сумме дают снимок",
+          list(rooms) == ['студия', '1-комн', '2-комн', '3-комн', '4+-комн'] and sum(rooms.values()) == len(snapshot))
+
+    filters = {'rooms': ['1-комн', '2'], 'developers': ['Тестовый 1'], 'price_min': '5', 'price_max': '20',
+               'features': ['accreditation'], 'completion': ['2025']}
+    result = index.counts(filters)
+
+    def passes(prop, values, skip=None):
+        return ((skip == 'rooms' or values['rooms'][0] in ('1-комн', '2-комн'))
+                and (skip == 'developer' or 'тестовый 1' in prop['developer'].lower())
+                and (skip == 'features' or 'accreditation' in values['features'])
+                and (skip == 'completion' or '2025' in values['completion'])
+                and 5000000 <= prop['price'] <= 20000000)
+
+    total = sum(1 for prop in snapshot if passes(prop, facet_values(prop)))
+    check(f"Итог совпадает с перебором ({total})", result['total'] == total)
+
+    mismatches = []
+    for facet in ('rooms', 'developer', 'completion', 'features', 'district', 'object_class', 'building_type'):
+        for option in result['facets'][facet]:
+            expected = brute_force(snapshot, facet, option['value'],
+                                   lambda prop, values, facet=facet: passes(prop, values, skip=facet))
+            if expected != option['count']:
+                mismatches.append((facet, option['value'], option['count'], expected))
+    check("Каждый счетчик не учитывает выбор в своем фасете, но учитывает остальные", not mismatches)
+
+    developers = {option['value']: option['count'] for option in result['facets']['developer']}
+    check("Соседние варианты выбранного фасета не обнуляются", developers['AVA'] > 0)
+
+    by_class = index.counts({'object_classes': ['бизнес']})
+    check("Класс по подстроке: 'бизнес' -> 'Бизнес-класс'",
+          by_class['total'] == sum(1 for prop in snapshot if prop['complex_class'] == 'Бизнес-класс'))
+    check("'Сдан' снимает фильтр по году", index.counts({'completion': ['Сдан']})['total'] == len(snapshot))
+    check("Поиск по адресу сужает все фасеты",
+          index.counts({'cities': ['Сочи']})['total'] == sum(1 for n in range(len(snapshot)) if n % 3))
+    check("Площадь: широкий диапазон через дополнение",
+          index.counts({'area_min': '21', 'area_max': '119'})['total']
+          == sum(1 for prop in snapshot if 21 <= prop['area'] <= 119))
+
+    big = make_snapshot(30000, seed=11)
+    started = time.perf_counter()
+    big_index = FacetIndex(big)
+    build = (time.perf_counter() - started) * 1000
+    timings = []
+    for _ in range(20):
+        started = time.perf_counter()
+        big_index.counts(filters)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    median = timings[len(timings) // 2] * 1000
+    check(f"Снимок {len(big)} объектов: построение {build:.0f} мс, подсчет медиана {median:.1f} мс", median < 50)
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки фасетов пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_property_facets()
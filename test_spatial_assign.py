@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тестирование пространственной привязки (spatial_assign.py): запросы к
+STRtree, векторная точка-в-полигоне против поточечной, приоритет меньших
+полигонов, дырки, ближайшая улица и время на большом наборе точек
+"""
+
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from spatial_assign import DistrictPolygons, STRtree, SpatialAssigner, StreetIndex, load_boundaries
+
+
+def in_ring(lon, lat, ring):
+    """Поточечный лучевой алгоритм для сверки"""
+    inside = False
+    xj, yj = ring[-1]
+    for xi, yi in ring:
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        xj, yj = xi, yi
+    return inside
+
+
+def square(min_lon, min_lat, size):
+    ring = [(min_lon, min_lat), (min_lon + size, min_lat), (min_lon + size, min_lat + size),
+            (min_lon, min_lat + size), (min_lon, min_lat)]
+    return (min_lon, min_lat, min_lon + size, min_lat + size), ring
+
+
+def test_spatial_assign():
+    """Тестируем пространственную привязку"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        if not condition:
+            failures += 1
+
+    print("🧪 Тестируем пространственную привязку...")
+    rng = random.Random(5)
+
+    boxes = []
+    for n in range(500):
+        x, y = rng.uniform(38, 40), rng.uniform(44, 46)
+        boxes.append(((x, y, x + rng.uniform(0, 0.1), y + rng.uniform(0, 0.1)), n))
+    tree = STRtree(boxes)
+    mismatches = 0
+    for _ in range(200):
+        x, y = rng.uniform(38, 40), rng.uniform(44, 46)
+        query = (x, y, x + 0.05, y + 0.05)
+        expected = {n for box, n in boxes
+                    if box[0] <= query[2] and query[0] <= box[2] and box[1] <= query[3] and query[1] <= box[3]}
+        mismatches += set(tree.query(query)) != expected
+    check("STRtree находит те же прямоугольники, что и перебор", mismatches == 0)
+    check("Пустое дерево", STRtree([]).query((0, 0, 1, 1)) == [])
+
+    # Звездообразный невыпуклый многоугольник
+    star = []
+    for k in range(40):
+        radius = 0.1 if k % 2 else 0.04
+        angle = 2 * np.pi * k / 40
+        star.append((39.0 + radius * np.cos(angle), 45.0 + radius * np.sin(angle)))
+    star.append(star[0])
+    lons_star = [lon for lon, _ in star]
+    lats_star = [lat for _, lat in star]
+    bbox = (min(lons_star), min(lats_star), max(lons_star), max(lats_star))
+    hole = [(38.995, 44.995), (39.005, 44.995), (39.005, 45.005), (38.995, 45.005), (38.995, 44.995)]
+    small_bbox, small = square(39.05, 44.98, 0.02)
+    polygons = DistrictPolygons({'star': [(bbox, star, [hole])], 'small': [(small_bbox, small, [])]},
+                                {'star': 1, 'small': 2})
+
+    lats = np.array([rng.uniform(44.85, 45.15) for _ in range(5000)] + [np.nan])
+    lons = np.array([rng.uniform(38.85, 39.15) for _ in range(5000)] + [39.0])
+    result = polygons.districts(lats, lons)
+    expected = []
+    for lat, lon in zip(lats[:-1], lons[:-1]):
+        if in_ring(lon, lat, small):
+            expected.append(2)
+        elif in_ring(lon, lat, star) and not in_ring(lon, lat, hole):
+            expected.append(1)
+        else:
+            expected.append(-1)
+    check("Векторная точка-в-полигоне совпадает с поточечной",
+          result[:-1].tolist() == expected and 1 in expected and 2 in expected)
+    check("Дырка и точка без координат", polygons.districts(np.array([45.0, np.nan]), np.array([39.0, 39.0])).tolist()
+          == [-1, -1])
+
+    streets = StreetIndex([SimpleNamespace(id=10, district_id=7, latitude=45.0, longitude=39.0),
+                           SimpleNamespace(id=11, district_id=None, latitude=45.01, longitude=39.0),
+                           SimpleNamespace(id=12, district_id=8, latitude=None, longitude=None)])
+    indexes, distances = streets.nearest(np.array([45.001, 45.0095, 45.5]), np.array([39.0, 39.0, 39.0]))
+    check("Ближайшая улица и порог расстояния",
+          streets.ids[indexes[:2]].tolist() == [10, 11] and indexes[2] == -1
+          and abs(distances[0] - 111.2) < 1 and np.isnan(distances[2]))
+
+    assigner = SpatialAssigner([SimpleNamespace(id=3, slug='sq')],
+                               [SimpleNamespace(id=10, district_id=7, latitude=45.0, longitude=39.0)],
+                               {'sq': [(*square(38.9, 44.9, 0.2), [])]})
+    district_ids, street_ids, street_districts, _ = assigner.assign([45.0, None, 46.0], [39.0, 39.0, 39.0])
+    check("Район, улица и район улицы одним проходом",
+          district_ids.tolist() == [3, -1, -1] and street_ids.tolist() == [10, -1, -1]
+          and street_districts.tolist() == [7, -1, -1])
+    check("Границы районов из static/data/districts", all(load_boundaries().values()))
+
+    grid = {f'd{n}': [(*square(38.5 + (n % 20) * 0.05, 44.8 + (n // 20) * 0.05, 0.05), [])] for n in range(400)}
+    big = DistrictPolygons(grid, {slug: n for n, slug in enumerate(grid)})
+    points = 100000
+    lats = np.random.default_rng(3).uniform(44.8, 45.8, points)
+    lons = np.random.default_rng(4).uniform(38.5, 39.5, points)
+    started = time.perf_counter()
+    assigned = big.districts(lats, lons)
+    elapsed = (time.perf_counter() - started) * 1000
+    check(f"{points} точек, {len(grid)} полигонов: {elapsed:.0f} мс", (assigned >= 0).all() and elapsed < 10000)
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Все проверки пространственной привязки пройдены")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    test_spatial_assign()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест Telegram-бота без Telegram: фейковый источник обновлений
+шлет команды сотен чатов параллельно (как Application.concurrent_updates),
+запросы к БД замедлены. Проверяем, что event loop не блокируется и быстрые
+команды не ждут медленные (нет head-of-line blocking).
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import app as app_module
+from app import app, db
+from models import Favorite, User
+import telegram_bot
+from telegram_bot import InBackBot
+
+CHATS = 200
+SLOW_QUERY_SECONDS = 0.3
+CHAT_ID_BASE = 990000000
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+        self.replied_at = None
+
+    async def reply_text(self, text, parse_mode=None):
+        self.replies.append((text, parse_mode))
+        self.replied_at = time.monotonic()
+
+
+def fake_update(chat_id, text):
+    """Обновление с интерфейсом telegram.Update, который используют обработчики"""
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id),
+        effective_user=SimpleNamespace(first_name=f'Чат {chat_id}'),
+        message=FakeMessage(text),
+    )
+
+
+def fake_update_source():
+    """Команды от CHATS чатов: у каждого /favorites (медленный запрос) и /profile,
+    у каждого десятого еще /help"""
+    for n in range(CHATS):
+        chat_id = CHAT_ID_BASE + n
+        yield fake_update(chat_id, '/favorites')
+        yield fake_update(chat_id, '/profile')
+        if n % 10 == 0:
+            yield fake_update(chat_id, '/help')
+
+
+async def dispatch(bot, updates, concurrency):
+    """Разбор команд как в CommandHandler, до concurrency обновлений одновременно"""
+    handlers = {
+        'favorites': bot.favorites_command,
+        'profile': bot.profile_command,
+        'help': bot.help_command,
+        'notifications': bot.notifications_command,
+    }
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(update):
+        command, *args = update.message.text.lstrip('/').split()
+        async with semaphore:
+            update.message.sent_at = time.monotonic()
+            await handlers[command](update, SimpleNamespace(args=args))
+
+    await asyncio.gather(*(process(update) for update in updates))
+
+
+async def measure_loop_lag(stop, interval=0.01):
+    """Максимальная задержка event loop относительно interval"""
+    max_lag = 0.0
+    while not stop.is_set():
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.monotonic() - started - interval)
+    return max_lag
+
+
+def seed_chats():
+    with app.app_context():
+        for n in range(CHATS):
+            user = User(email=f'tg-load-{n}@example.test', full_name=f'Load {n}',
+                        user_id=f'TGLOAD{n}', telegram_id=str(CHAT_ID_BASE + n))
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Favorite(user_id=user.id, property_id=n + 1))
+        db.session.commit()
+
+
+def cleanup_chats():
+    with app.app_context():
+        ids = [user.id for user in User.query.filter(User.email.like('tg-load-%@example.test')).all()]
+        if ids:
+            Favorite.query.filter(Favorite.user_id.in_(ids)).delete(synchronize_session=False)
+            User.query.filter(User.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def test_telegram_bot_load():
+    """Нагрузочный тест обработчиков бота"""
+    failures = 0
+
+    def check(name, condition):
+        nonlocal failures
+        print(f"{'✅' if condition else '❌'} {name}")
+        failures += 0 if condition else 1
+
+    # Медленный поиск объектов: так выглядит /favorites при холодном кэше load_properties()
+    original_lookup = app_module.get_properties_by_ids
+
+    def slow_lookup(property_ids):
+        time.sleep(SLOW_QUERY_SECONDS)
+        return [{'id': property_id, 'title': f'Объект {property_id}', 'price': 5000000,
+                 'location': 'Краснодар'} for property_id in property_ids]
+
+    print(f"🧪 Нагрузочный тест бота: {CHATS} чатов, {telegram_bot.TELEGRAM_DB_WORKERS} потоков БД")
+    cleanup_chats()
+    seed_chats()
+    app_module.get_properties_by_ids = slow_lookup
+    try:
+        bot = InBackBot()
+        updates = list(fake_update_source())
+
+        async def run():
+            stop = asyncio.Event()
+            lag_task = asyncio.create_task(measure_loop_lag(stop))
+            started = time.monotonic()
+            await dispatch(bot, updates, telegram_bot.TELEGRAM_CONCURRENT_UPDATES)
+            elapsed = time.monotonic() - started
+            stop.set()
+            return elapsed, await lag_task
+
+        elapsed, max_lag = asyncio.run(run())
+
+        answered = [update for update in updates if update.message.replies]
+        check(f"Ответ на все {len(updates)} обновлений", len(answered) == len(updates))
+
+        favorites = [update for update in updates if update.message.text == '/favorites']
+        check("Избранное из индекса объектов",
+              all('Объект' in update.message.replies[0][0] for update in favorites))
+
+        sequential = CHATS * SLOW_QUERY_SECONDS
+        check(f"Параллельная обработка: {elapsed:.1f} c (последовательно было бы {sequential:.0f} c)",
+              elapsed < sequential / 2)
+        check(f"Event loop не блокируется: макс. задержка {max_lag * 1000:.0f} мс", max_lag < 0.1)
+
+        help_latency = max(update.message.replied_at - update.message.sent_at
+                           for update in updates if update.message.text == '/help')
+        check(f"/help не ждет медленные запросы: {help_latency * 1000:.0f} мс", help_latency < 0.1)
+    finally:
+        app_module.get_properties_by_ids = original_lookup
+        cleanup_chats()
+
+    if failures:
+        print(f"❌ Ошибок: {failures}")
+    else:
+        print("✅ Нагрузочный тест бота пройден")
+    return failures == 0
+
+
+if __name__ == '__main__':
+    test_telegram_bot_load()
@@ -7,6 +7,7 @@ import json
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from infrastructure_api import get_infrastructure_summary
+from district_stats import refresh_district_stats
 
 def update_infrastructure_data():
     """
@@ -63,6 +64,9 @@ def update_infrastructure_data():
             print(f"  ✅ {name}: {infrastructure['distance_to_center']} км от центра")
             print(f"     Медицина: {infrastructure['medical_count']}, Образование: {infrastructure['education_count']}")
         
+        # Сводка районов хранит уже разобранную инфраструктуру
+        refresh_district_stats(session)
+        
         print("\\n🛣️ Обновление инфраструктуры улиц...")
         
         # Получаем улицы с координатами (ограничиваем для тестирования)
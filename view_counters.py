@@ -0,0 +1,156 @@
+"""
+Буферизованные счетчики просмотров и журнал действий пользователей
+
+Просмотр статьи блога или вакансии выполнял UPDATE ... SET views_count =
+views_count + 1 и COMMIT прямо в запросе, UserActivity.log_activity тоже
+коммитил на каждое действие — под трафиком поисковых роботов страницы только
+для чтения конкурировали за блокировки строк. Здесь:
+
+- increment() копит приращения в памяти процесса: {(таблица, столбец): {id: n}};
+- фоновый поток раз в flush_interval секунд (VIEW_COUNTER_FLUSH_SECONDS,
+  по умолчанию 5) сбрасывает их одной транзакцией — один пакетный UPDATE
+  на столбец, сколько бы ни было просмотров; при аварийной остановке
+  теряется не больше одного интервала;
+- value() — значение из базы плюс еще не записанные приращения, чтобы
+  страница показывала счетчик "почти в реальном времени";
+- log_activity() — пакетная вставка user_activities тем же сбросом.
+
+Приращения суммируются, поэтому у каждого воркера свой буфер.
+Если запись не удалась, приращения возвращаются в буфер до следующего сброса
+(действия пользователей при этом отбрасываются — журнал не критичен).
+"""
+import atexit
+import threading
+from collections import defaultdict
+
+# Только эти счетчики можно увеличивать (имена подставляются в SQL)
+COUNTERS = {
+    ('blog_posts', 'views_count'),
+    ('blog_articles', 'views_count'),
+    ('jobs', 'views_count'),
+}
+
+
+class CounterBuffer:
+    """Приращения счетчиков и записи журнала, ожидающие записи в базу"""
+
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self.app = None
+        self.db = None
+        self._counts = defaultdict(lambda: defaultdict(int))
+        self._activities = []
+        self._inflight = {}  # приращения, которые пишутся текущим сбросом
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self._stop = threading.Event()
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.flush_interval = app.config.get('VIEW_COUNTER_FLUSH_SECONDS', self.flush_interval)
+        app.extensions['view_counters'] = self
+        atexit.register(self.shutdown)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='view-counter-writer', daemon=True)
+        self._worker.start()
+
+    def increment(self, table, row_id, column='views_count', amount=1):
+        if (table, column) not in COUNTERS:
+            raise ValueError(f'Unknown counter {table}.{column}')
+        with self._lock:
+            self._counts[(table, column)][row_id] += amount
+        self._ensure_worker()
+
+    def pending(self, table, row_id, column='views_count'):
+        """Приращение, еще не записанное в базу"""
+        with self._lock:
+            total = 0
+            for counts in (self._counts.get((table, column)), self._inflight.get((table, column))):
+                total += counts.get(row_id, 0) if counts else 0
+            return total
+
+    def value(self, table, row_id, stored, column='views_count'):
+        """Значение счетчика для показа: из базы + ожидающие записи приращения"""
+        return (stored or 0) + self.pending(table, row_id, column)
+
+    def log_activity(self, **fields):
+        """Поставить запись user_activities в очередь на пакетную вставку"""
+        with self._lock:
+            self._activities.append(fields)
+        self._ensure_worker()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing view counters: {e}")
+
+    def _take(self):
+        with self._lock:
+            counts, self._counts = self._counts, defaultdict(lambda: defaultdict(int))
+            activities, self._activities = self._activities, []
+            self._inflight = counts
+        return counts, activities
+
+    def _restore(self, counts):
+        with self._lock:
+            self._inflight = {}
+            for key, deltas in counts.items():
+                for row_id, delta in deltas.items():
+                    self._counts[key][row_id] += delta
+
+    def flush(self):
+        """Записать накопленные приращения и действия. Возвращает (строк счетчиков, действий)."""
+        if self.app is None:
+            return 0, 0
+
+        with self._flush_lock:
+            counts, activities = self._take()
+            if not counts and not activities:
+                return 0, 0
+            with self.app.app_context():
+                return self._write(counts, activities)
+
+    def _write(self, counts, activities):
+        from sqlalchemy import insert, text
+        from models import UserActivity
+
+        session = self.db.session
+        try:
+            rows = 0
+            for (table, column), deltas in counts.items():
+                params = [{'id': row_id, 'delta': delta} for row_id, delta in deltas.items() if delta]
+                if not params:
+                    continue
+                session.execute(text(
+                    f"UPDATE {table} SET {column} = COALESCE({column}, 0) + :delta WHERE id = :id"
+                ), params)
+                rows += len(params)
+            if activities:
+                session.execute(insert(UserActivity), activities)
+            session.commit()
+            with self._lock:
+                self._inflight = {}
+            return rows, len(activities)
+        except Exception as e:
+            session.rollback()
+            self._restore(counts)
+            print(f"Error writing view counters: {e} ({len(activities)} activities dropped)")
+            return 0, 0
+
+    def shutdown(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing view counters on shutdown: {e}")
+
+
+view_counters = CounterBuffer()
@@ -1,23 +1,36 @@
 import trafilatura
-import requests
 from bs4 import BeautifulSoup
 import json
-import time
 from datetime import datetime
 from urllib.parse import urljoin, urlparse
 import re
 from typing import Dict, List, Optional, Tuple
 
+import crawl_store
+from crawler import Crawler, ValidatorCache
+
 class KrasnodarDeveloperScraper:
     """
     Парсер застройщиков Краснодара для получения актуальных данных о ЖК и квартирах
     """
     
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+    def __init__(self, store=None):
+        # Состояние страниц/проектов в базе (crawl_store.py): загружаются только
+        # устаревшие страницы; без контекста приложения — все, как раньше
+        self.store = store
+        self.changes = {'created': 0, 'updated': 0, 'unchanged': 0}
+        
+        # Пул соединений с паузой и ограничением параллельности на хост вместо
+        # requests.Session + time.sleep перед каждой страницей
+        self.crawler = Crawler(
+            headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            },
+            per_host=2,
+            delay=1.0,
+            timeout=10,
+            cache=ValidatorCache('instance/crawler_cache/developer_sites.json'),
+        )
         
         # Основные застройщики Краснодара
         self.developers = {
@@ -62,22 +75,23 @@ class KrasnodarDeveloperScraper:
         try:
             # Главная страница ССК
             main_url = "https://sskuban.ru"
-            response = self.session.get(main_url, timeout=10)
+            response = self.crawler.fetch(main_url)
             
-            if response.status_code == 200:
+            if response is not None and response.status_code == 200:
                 soup = BeautifulSoup(response.content, 'html.parser')
                 
                 # Поиск ЖК на сайте ССК
                 projects_links = soup.find_all('a', href=re.compile(r'/projects/|/zhk/|/complex/'))
                 
+                projects = []
                 for link in projects_links[:5]:  # Ограничиваем первыми 5 для теста
                     project_url = urljoin(main_url, link.get('href'))
                     project_name = link.get_text(strip=True)
                     
                     if project_name and len(project_name) > 3:
-                        project_data = self.parse_project_details(project_url, project_name, 'ССК')
-                        if project_data:
-                            developer_data.append(project_data)
+                        projects.append((project_url, project_name))
+                
+                developer_data.extend(self.parse_projects(projects, 'ССК', 'ssk'))
                             
         except Exception as e:
             print(f"Ошибка при парсинге ССК: {e}")
@@ -94,14 +108,15 @@ class KrasnodarDeveloperScraper:
         try:
             # Страница проектов Неометрии
             projects_url = "https://neometria.ru/projects/"
-            response = self.session.get(projects_url, timeout=10)
+            response = self.crawler.fetch(projects_url)
             
-            if response.status_code == 200:
+            if response is not None and response.status_code == 200:
                 soup = BeautifulSoup(response.content, 'html.parser')
                 
                 # Поиск ЖК
                 project_cards = soup.find_all(['div', 'section'], class_=re.compile(r'project|complex|card'))
                 
+                projects = []
                 for card in project_cards[:5]:  # Ограничиваем для теста
                     link = card.find('a')
                     if link:
@@ -109,9 +124,9 @@ class KrasnodarDeveloperScraper:
                         project_name = card.get_text(strip=True)[:100]  # Ограничиваем длину
                         
                         if project_name and 'ЖК' in project_name or 'жк' in project_name.lower():
-                            project_data = self.parse_project_details(project_url, project_name, 'Неометрия')
-                            if project_data:
-                                developer_data.append(project_data)
+                            projects.append((project_url, project_name))
+                
+                developer_data.extend(self.parse_projects(projects, 'Неометрия', 'neometria'))
                                 
         except Exception as e:
             print(f"Ошибка при парсинге Неометрия: {e}")
@@ -126,15 +141,55 @@ class KrasnodarDeveloperScraper:
         # Заглушка - может потребоваться найти актуальный сайт
         return []
     
-    def parse_project_details(self, url: str, name: str, developer: str) -> Optional[Dict]:
+    def parse_projects(self, projects: List[Tuple[str, str]], developer: str, developer_code: str) -> List[Dict]:
+        """
+        Загрузка страниц проектов параллельно (паузы на хост — в crawler) и их разбор.
+        Свежие страницы не загружаются — берутся проекты из прошлого разбора.
+        """
+        urls = [url for url, _ in projects]
+        to_fetch, reused = self.store.plan(urls) if self.store else (urls, {})
+        pages = self.crawler.fetch_all(to_fetch)
+        
+        developer_data = []
+        for project_url, project_name in projects:
+            if project_url in reused:
+                developer_data.extend(reused[project_url])
+                self.changes['unchanged'] += len(reused[project_url])
+                continue
+            
+            response = pages.get(project_url)
+            if self.store:
+                changed = self.store.record_fetch(project_url, response, kind='project')
+                stored = self.store.entities('project', group_key=project_url)
+                # Страница не изменилась или не загрузилась — данные прошлого разбора
+                if stored and (not changed or response is None or not response.ok):
+                    developer_data.extend(stored)
+                    self.changes['unchanged'] += len(stored)
+                    continue
+            
+            project_data = self.parse_project_details(project_url, project_name, developer,
+                                                      response=response)
+            if project_data:
+                project_data['developer_code'] = developer_code
+                developer_data.append(project_data)
+                if self.store:
+                    diff = self.store.record_entities('project', [project_data],
+                                                      key=lambda data: data['url'], group_key=project_url)
+                    for field in self.changes:
+                        self.changes[field] += len(getattr(diff, field))
+        
+        if self.store:
+            self.store.commit()
+        return developer_data
+    
+    def parse_project_details(self, url: str, name: str, developer: str, response=None) -> Optional[Dict]:
         """
         Детальный парсинг страницы проекта для получения информации о квартирах
         """
         try:
-            time.sleep(1)  # Избегаем блокировки
-            
-            response = self.session.get(url, timeout=10)
-            if response.status_code != 200:
+            if response is None:
+                response = self.crawler.fetch(url)
+            if response is None or response.status_code != 200:
                 return None
             
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -212,6 +267,7 @@ class KrasnodarDeveloperScraper:
         Парсинг всех застройщиков
         """
         all_data = {}
+        self.store = self.store or crawl_store.for_source('developer_sites')
         
         for dev_code, dev_info in self.developers.items():
             print(f"\n{'='*50}")
@@ -226,9 +282,12 @@ class KrasnodarDeveloperScraper:
             except Exception as e:
                 print(f"Ошибка при парсинге {dev_info['name']}: {e}")
                 all_data[dev_code] = []
-            
-            time.sleep(2)  # Пауза между застройщиками
         
+        # Закрываем пул соединений и сохраняем ETag/Last-Modified для следующего запуска
+        self.crawler.close()
+        if self.store:
+            print(f"Проекты: новых {self.changes['created']}, изменилось {self.changes['updated']}, "
+                  f"без изменений {self.changes['unchanged']}")
         return all_data
     
     def save_to_json(self, data: Dict, filename: str = None):